@@ -16,35 +16,155 @@ You should have received a copy of the GNU General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import os
 import requests
+import threading
 import time
 import json
 import base64
+import urllib
 from storageadmin.exceptions import RockStorAPIException
 from storageadmin.models import OauthApp
 from django.conf import settings
 
+# Per process state shared by all APIWrapper instances. Sessions keep their
+# connections alive between calls and are keyed by pid so that forked
+# children(replication Senders/Receivers etc) don't share sockets with the
+# parent. Tokens are keyed by (url, client_id) so that a refresh by one
+# instance is picked up by every other.
+_lock = threading.Lock()
+_sessions = {}
+_tokens = {}
+# client_id -> django User that local calls are made as.
+_local_users = {}
+
+# calltypes that are safe to repeat on connection errors.
+IDEMPOTENT_CALLS = ('get', 'head', 'put', 'delete', )
+
+
+def _session(url):
+    key = (os.getpid(), url)
+    with _lock:
+        if (key not in _sessions):
+            _sessions[key] = requests.Session()
+        return _sessions[key]
+
+
+def _utf8(value):
+    if (isinstance(value, unicode)):
+        return value.encode('utf-8')
+    if (isinstance(value, (list, tuple))):
+        return [_utf8(v) for v in value]
+    return value
+
+
+def _urlencode(data):
+    """
+    urlencode form data as requests does, ie with unicode keys and values
+    encoded to utf-8 rather than ascii.
+    """
+    if (hasattr(data, 'items')):
+        data = data.items()
+    return urllib.urlencode([(_utf8(k), _utf8(v)) for k, v in data],
+                            doseq=True)
+
 
 class APIWrapper(object):
 
-    def __init__(self, client_id=None, client_secret=None, url=None):
+    def __init__(self, client_id=None, client_secret=None, url=None,
+                 retries=0, backoff=0.5, local=None):
+        """
+        :param retries: number of times to retry idempotent calls that
+        failed to connect.
+        :param backoff: seconds to wait before the first retry, doubled for
+        each one after that.
+        :param local: dispatch calls to the api views in this process rather
+        than over http. Defaults to settings.LOCAL_API_DISPATCH for calls to
+        this host, never for remote urls.
+        """
         self.access_token = None
         self.expiration = time.time()
         self.client_id = client_id
         self.client_secret = client_secret
+        self.retries = retries
+        self.backoff = backoff
         # directly connect to gunicorn, bypassing nginx as we are on the same
         # host.
         self.url = 'http://127.0.0.1:8000'
         if (url is not None):
             # for remote urls.
             self.url = url
+        if (local is None):
+            local = (url is None and
+                     getattr(settings, 'LOCAL_API_DISPATCH', False))
+        self.local = local
+
+    @property
+    def session(self):
+        return _session(self.url)
+
+    def _local_user(self):
+        if (self.client_id not in _local_users):
+            if (self.client_id is None):
+                app = OauthApp.objects.get(name=settings.OAUTH_INTERNAL_APP)
+            else:
+                app = OauthApp.objects.get(
+                    application__client_id=self.client_id)
+            # the django user of the application, as authenticated by the
+            # oauth token of remote calls. OauthApp.user is the storageadmin
+            # User, which DRF permissions can't check.
+            _local_users[self.client_id] = app.application.user
+        return _local_users[self.client_id]
+
+    def _local_request(self, calltype, api_url, data=None, headers=None):
+        """
+        Run the api view for api_url in this process, as the user of the
+        OauthApp whose credentials this wrapper was given.
+        :return: (status code, response body)
+        """
+        from django.core.urlresolvers import (resolve, Resolver404)
+        from rest_framework.test import (APIRequestFactory,
+                                         force_authenticate)
+
+        path = api_url[len(self.url):]
+        if (headers is not None and
+                headers.get('content-type') == 'application/json'):
+            body = json.dumps(data)
+            content_type = 'application/json'
+        else:
+            body = _urlencode(data or {})
+            content_type = 'application/x-www-form-urlencoded'
+        try:
+            match = resolve(path.split('?')[0])
+        except Resolver404:
+            return 404, ''
+        request = APIRequestFactory().generic(calltype.upper(), path, body,
+                                              content_type)
+        force_authenticate(request, user=self._local_user())
+        try:
+            response = match.func(request, *match.args, **match.kwargs)
+            if (hasattr(response, 'render')):
+                response.render()
+        except Exception as e:
+            return 500, json.dumps({'detail': e.__str__(), })
+        return response.status_code, response.content
+
+    def _shared_token(self):
+        token = _tokens.get((self.url, self.client_id))
+        if (token is not None and time.time() < token[1]):
+            self.access_token, self.expiration = token
+            return True
+        return False
 
-    def set_token(self):
+    def set_token(self, force=False):
         if (self.client_id is None or self.client_secret is None):
             app = OauthApp.objects.get(name=settings.OAUTH_INTERNAL_APP)
             self.client_id = app.application.client_id
             self.client_secret = app.application.client_secret
 
+        if (not force and self._shared_token()):
+            return
+
         token_request_data = {
             'grant_type': 'client_credentials',
             'client_id': self.client_id,
@@ -57,58 +177,63 @@ class APIWrapper(object):
                         'Basic ' + auth_string.decode("utf-8"), }
         content = None
         try:
-            response = requests.post('%s/o/token/' % self.url,
-                                     data=token_request_data,
-                                     headers=auth_headers, verify=False)
+            response = self.session.post('%s/o/token/' % self.url,
+                                         data=token_request_data,
+                                         headers=auth_headers, verify=False)
             content = json.loads(response.content.decode("utf-8"))
             self.access_token = content['access_token']
             self.expiration = int(time.time()) + content['expires_in'] - 600
+            _tokens[(self.url, self.client_id)] = (self.access_token,
+                                                   self.expiration)
         except Exception as e:
             msg = ('Exception while setting access_token for url(%s): %s. '
                    'content: %s' % (self.url, e.__str__(), content))
             raise Exception(msg)
 
+    def _request(self, calltype, url, **kwargs):
+        call = getattr(self.session, calltype)
+        retries = self.retries if (calltype in IDEMPOTENT_CALLS) else 0
+        backoff = self.backoff
+        while (True):
+            try:
+                return call(url, verify=False, **kwargs)
+            except requests.exceptions.ConnectionError:
+                if (retries == 0):
+                    raise
+                retries -= 1
+                time.sleep(backoff)
+                backoff *= 2
+
     def api_call(self, url, data=None, calltype='get', headers=None,
                  save_error=True):
-        if (self.access_token is None or
-                time.time() > self.expiration):
-            self.set_token()
+        api_url = ('%s/api/%s' % (self.url, url))
+        if (self.local):
+            status_code, text = self._local_request(calltype, api_url,
+                                                    data=data,
+                                                    headers=headers)
+        else:
+            status_code, text = self._remote_request(calltype, api_url,
+                                                     data=data,
+                                                     headers=headers)
 
-        api_auth_header = {'Authorization': 'Bearer ' + self.access_token, }
-        call = getattr(requests, calltype)
-        url = ('%s/api/%s' % (self.url, url))
-        try:
-            if (headers is not None):
-                headers.update(api_auth_header)
-                if (headers['content-type'] == 'application/json'):
-                    r = call(url, verify=False, data=json.dumps(data),
-                             headers=headers)
-                else:
-                    r = call(url, verify=False, data=data,
-                             headers=headers)
-            else:
-                r = call(url, verify=False, headers=api_auth_header, data=data)
-        except requests.exceptions.ConnectionError:
-            print('Error connecting to Rockstor. Is it running?')
-            raise
-
-        if (r.status_code == 404):
-            msg = ('Invalid api end point: %s' % url)
+        if (status_code == 404):
+            msg = ('Invalid api end point: %s' % api_url)
             raise RockStorAPIException(detail=msg)
 
-        if (r.status_code != 200):
+        if (status_code != 200):
             try:
-                error_d = json.loads(r.text)
+                error_d = json.loads(text)
                 if (settings.DEBUG is True and save_error is True):
                     cur_time = str(int(time.time()))
                     err_file = '/tmp/err-%s.html' % cur_time
                     with open(err_file, 'w') as efo:
-                        for line in r.text.split('\n'):
+                        for line in text.split('\n'):
                             efo.write('%s\n' % line)
                         print('Error detail is saved at %s' % err_file)
                 if ('detail' in error_d):
-                    if (error_d['detail'] == 'Authentication credentials were not provided.'):  # noqa E501
-                        self.set_token()
+                    if (error_d['detail'] == 'Authentication credentials were not provided.' and  # noqa E501
+                            not self.local):
+                        self.set_token(force=True)
                         return self.api_call(url, data=data, calltype=calltype,
                                              headers=headers,
                                              save_error=save_error)
@@ -116,10 +241,53 @@ class APIWrapper(object):
             except ValueError as e:
                 raise RockStorAPIException(detail='Internal Server Error: %s'
                                            % e.__str__())
-            r.raise_for_status()
+            if (status_code >= 400):
+                raise requests.exceptions.HTTPError('%d Error for url: %s' %
+                                                    (status_code, api_url))
 
         try:
-            ret_val = r.json()
+            ret_val = json.loads(text)
         except ValueError:
             ret_val = {}
         return ret_val
+
+    def _remote_request(self, calltype, api_url, data=None, headers=None):
+        """
+        :return: (status code, response body)
+        """
+        if (self.access_token is None or
+                time.time() > self.expiration):
+            self.set_token()
+
+        api_auth_header = {'Authorization': 'Bearer ' + self.access_token, }
+        try:
+            if (headers is not None):
+                headers.update(api_auth_header)
+                if (headers['content-type'] == 'application/json'):
+                    r = self._request(calltype, api_url,
+                                      data=json.dumps(data), headers=headers)
+                else:
+                    r = self._request(calltype, api_url, data=data,
+                                      headers=headers)
+            else:
+                r = self._request(calltype, api_url,
+                                  headers=api_auth_header, data=data)
+        except requests.exceptions.ConnectionError:
+            print('Error connecting to Rockstor. Is it running?')
+            raise
+        return r.status_code, r.text
+
+    def api_batch(self, calls):
+        """
+        Issue several api calls back to back over the pooled connection.
+        :param calls: list of dicts of api_call keyword arguments
+        :return: list with the result of each call, or the exception it
+        raised, in the order of calls.
+        """
+        results = []
+        for c in calls:
+            try:
+                results.append(self.api_call(**c))
+            except Exception as e:
+                results.append(e)
+        return results
@@ -0,0 +1,291 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+import BaseHTTPServer
+import SocketServer
+import requests
+from mock import patch
+from django.contrib.auth.models import User as DjangoUser
+from django.core.urlresolvers import (ResolverMatch, Resolver404)
+from oauth2_provider.models import Application
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APITestCase
+from rest_framework.views import APIView
+from cli import api_wrapper
+from cli.api_wrapper import APIWrapper
+from storageadmin.exceptions import RockStorAPIException
+from storageadmin.models import (OauthApp, User)
+from storageadmin.util import handle_exception
+
+# Benchmarks are only run on request, eg:
+# ROCKSTOR_BENCHMARKS=1 ./bin/test ... -p test_api_wrapper*
+BENCHMARKS = os.environ.get('ROCKSTOR_BENCHMARKS') == '1'
+
+
+class FakeRockstorHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Minimal keep-alive stand in for gunicorn: hands out tokens at /o/token/
+    and answers any /api/ call with an empty json object.
+    """
+    protocol_version = 'HTTP/1.1'
+    # buffer the whole reply, split writes stall keep-alive connections on
+    # delayed acks.
+    wbufsize = -1
+
+    def _reply(self, body):
+        length = int(self.headers.getheader('content-length') or 0)
+        if (length > 0):
+            self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def do_POST(self):
+        self.server.connections.add(self.client_address)
+        if (self.path == '/o/token/'):
+            self.server.tokens += 1
+            return self._reply(json.dumps({'access_token': 'token%d' %
+                                           self.server.tokens,
+                                           'expires_in': 36000, }))
+        return self._reply('{}')
+
+    do_GET = do_POST
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeRockstor(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           FakeRockstorHandler)
+        self.tokens = 0
+        self.connections = set()
+        self.url = 'http://127.0.0.1:%d' % self.server_address[1]
+
+
+class APIWrapperTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_api_wrapper*
+    """
+    def setUp(self):
+        self.server = FakeRockstor()
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+        api_wrapper._sessions.clear()
+        api_wrapper._tokens.clear()
+
+    def tearDown(self):
+        for session in api_wrapper._sessions.values():
+            session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wrapper(self, **kwargs):
+        return APIWrapper(client_id='id', client_secret='secret',
+                          url=self.server.url, **kwargs)
+
+    def test_shared_session_and_token(self):
+        aw1 = self.wrapper()
+        aw2 = self.wrapper()
+        self.assertEqual(aw1.api_call('disks'), {})
+        self.assertEqual(aw2.api_call('pools'), {})
+        self.assertTrue(aw1.session is aw2.session)
+        # one token for both wrappers, all over a single connection.
+        self.assertEqual(self.server.tokens, 1)
+        self.assertEqual(aw2.access_token, 'token1')
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_batch(self):
+        aw = self.wrapper()
+        calls = [{'url': 'commands/refresh-%s-state' % r, 'calltype': 'post',
+                  'save_error': False, } for r in ('pool', 'share', )]
+        calls.append({'url': 'disks', 'calltype': 'bogus', })
+        results = aw.api_batch(calls)
+        self.assertEqual(results[:2], [{}, {}])
+        self.assertTrue(isinstance(results[2], Exception))
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_retries(self):
+        aw = self.wrapper(retries=2, backoff=0.01)
+        aw.set_token()
+        error = requests.exceptions.ConnectionError('refused')
+        with patch.object(aw.session, 'get',
+                          side_effect=[error, error, error]) as mock_get:
+            self.assertRaises(requests.exceptions.ConnectionError,
+                              aw.api_call, 'disks')
+            self.assertEqual(mock_get.call_count, 3)
+        # non idempotent calls are never repeated.
+        with patch.object(aw.session, 'post',
+                          side_effect=[error]) as mock_post:
+            self.assertRaises(requests.exceptions.ConnectionError,
+                              aw.api_call, 'disks/scan', calltype='post')
+            self.assertEqual(mock_post.call_count, 1)
+
+    @unittest.skipUnless(BENCHMARKS, 'set ROCKSTOR_BENCHMARKS=1 to run')
+    def test_calls_per_sec_benchmark(self):
+        """
+        Compares a fresh connection per call, as APIWrapper used to make,
+        with the pooled keep-alive session.
+        """
+        aw = self.wrapper()
+        aw.set_token()
+        headers = {'Authorization': 'Bearer ' + aw.access_token, }
+        num = 200
+        t0 = time.time()
+        for i in range(num):
+            requests.get('%s/api/disks' % self.server.url, headers=headers)
+        per_call = num / (time.time() - t0)
+        t0 = time.time()
+        for i in range(num):
+            aw.api_call('disks')
+        pooled = num / (time.time() - t0)
+        sys.stderr.write('\nper call connection: %.0f calls/sec '
+                         'pooled session: %.0f calls/sec' %
+                         (per_call, pooled))
+
+
+class EchoView(APIView):
+    permission_classes = (IsAuthenticated, )
+
+    def post(self, request, name):
+        if (name == 'crash'):
+            raise Exception('crashed')
+        if (name == 'fail'):
+            handle_exception(Exception('failed'), request)
+        return Response({'name': name,
+                         'size': request.data.get('size'),
+                         'user': request.user.username, })
+
+    def get(self, request, name):
+        return Response({'name': name,
+                         'page': request.query_params.get('page'), })
+
+
+class LocalDispatchTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_api_wrapper*
+    """
+    def setUp(self):
+        duser = DjangoUser(id=1, username='admin')
+        app = OauthApp(id=1, name='cliapp',
+                       application=Application(id=1, name='cliapp',
+                                               user=duser),
+                       user=User(id=1, username='admin', user=duser))
+        self.mock_get = patch('cli.api_wrapper.OauthApp.objects.get',
+                              return_value=app).start()
+        patch('django.core.urlresolvers.resolve',
+              side_effect=self._resolve).start()
+        api_wrapper._local_users.clear()
+        self.aw = APIWrapper(local=True)
+
+    def tearDown(self):
+        patch.stopall()
+        api_wrapper._local_users.clear()
+
+    def _resolve(self, path):
+        if (not path.startswith('/api/echo/')):
+            raise Resolver404(path)
+        return ResolverMatch(EchoView.as_view(), (),
+                             {'name': path.split('/')[-1]})
+
+    def test_default(self):
+        with patch.object(api_wrapper.settings, 'LOCAL_API_DISPATCH', True,
+                          create=True):
+            self.assertTrue(APIWrapper().local)
+            self.assertFalse(APIWrapper(url='https://remote').local)
+
+    def test_calls(self):
+        self.assertEqual(self.aw.api_call('echo/a', data={'size': 10},
+                                          calltype='post'),
+                         {'name': 'a', 'size': '10', 'user': 'admin', })
+        self.assertEqual(self.aw.api_call('echo/a', data={'size': 10},
+                                          calltype='post',
+                                          headers={'content-type':
+                                                   'application/json'}),
+                         {'name': 'a', 'size': 10, 'user': 'admin', })
+        self.assertEqual(self.aw.api_call('echo/b?page=2'),
+                         {'name': 'b', 'page': '2', })
+        # non ascii form data.
+        self.assertEqual(self.aw.api_call('echo/c',
+                                          data={'size': u'\xe9t\xe9'},
+                                          calltype='post'),
+                         {'name': 'c', 'size': u'\xe9t\xe9',
+                          'user': 'admin', })
+        # the OauthApp is looked up once, on the first call.
+        self.assertEqual(self.mock_get.call_count, 1)
+
+    def test_errors(self):
+        self.assertRaises(RockStorAPIException, self.aw.api_call, 'bogus')
+        self.assertRaises(RockStorAPIException, self.aw.api_call,
+                          'echo/crash', calltype='post')
+        self.assertRaises(requests.exceptions.HTTPError, self.aw.api_call,
+                          'echo/fail', calltype='post', save_error=False)
+        self.assertRaises(RockStorAPIException, self.aw.api_call, 'echo/a',
+                          calltype='delete')
+
+
+class LocalUserTests(APITestCase):
+    """
+    Local calls are made as the django user of the internal OauthApp in
+    fix1.json. The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_api_wrapper*
+    """
+    fixtures = ['fix1.json']
+
+    def setUp(self):
+        api_wrapper._local_users.clear()
+
+    def tearDown(self):
+        api_wrapper._local_users.clear()
+
+    def test_authenticated(self):
+        with patch.object(api_wrapper.settings, 'OAUTH_INTERNAL_APP',
+                          'cliapp'):
+            user = APIWrapper(local=True)._local_user()
+        self.assertTrue(isinstance(user, DjangoUser))
+        self.assertTrue(user.is_authenticated())
+        self.assertEqual(user.username, 'admin')
+
+    def test_call(self):
+        client_id = OauthApp.objects.get(name='cliapp').client_id()
+        aw = APIWrapper(client_id=client_id, local=True)
+        with patch('django.core.urlresolvers.resolve',
+                   return_value=ResolverMatch(EchoView.as_view(), (),
+                                              {'name': 'a'})):
+            self.assertEqual(aw.api_call('echo/a', data={'size': 10},
+                                         calltype='post'),
+                             {'name': 'a', 'size': '10', 'user': 'admin', })
@@ -25,6 +25,8 @@ from system.osi import run_command, create_tmp_dir, is_share_mounted, \
     get_device_path
 from system.exceptions import (CommandException)
 from pool_scrub import PoolScrub
+import btrfs_ioctl
+from btrfs_ioctl import IoctlException
 from django_ztask.decorators import task
 from django.conf import settings
 import logging
@@ -44,6 +46,27 @@ RMDIR = '/bin/rmdir'
 QID = '2015'
 # The following model/db default setting is also used when quotas are disabled.
 PQGROUP_DEFAULT = settings.MODEL_DEFS['pqgroup']
+# Answer read only queries in process via the btrfs ioctl interface, the btrfs
+# command output parsers remain as the fallback.
+USE_IOCTL = True
+
+
+def ioctl_query(func, *args):
+    """
+    Runs the given fs.btrfs_ioctl query.
+    :param func: query function from fs.btrfs_ioctl
+    :return: the query result or None if the ioctl backend is disabled or the
+    query failed, in which case the caller is expected to fall back to the
+    equivalent btrfs command.
+    """
+    if not USE_IOCTL:
+        return None
+    try:
+        return func(*args)
+    except IoctlException as e:
+        logger.debug('{}. Falling back to btrfs command.'.format(e.__str__()))
+        return None
+
 
 def add_pool(pool, disks):
     """
@@ -130,16 +153,23 @@ def get_pool_info(disk):
 
 def pool_raid(mnt_pt):
     # TODO: propose name change to get_pool_raid_levels(mnt_pt)
-    o, e, rc = run_command([BTRFS, 'fi', 'df', mnt_pt])
+    spaces = ioctl_query(btrfs_ioctl.space_info, mnt_pt)
+    if spaces is not None:
+        blocks = [(sp['type'].lower(), sp['profile'].lower())
+                  for sp in spaces]
+    else:
+        o, e, rc = run_command([BTRFS, 'fi', 'df', mnt_pt])
+        blocks = []
+        for l in o:
+            fields = l.split()
+            if (len(fields) > 1):
+                blocks.append((fields[0][:-1].lower(),
+                               fields[1][:-1].lower()))
     # data, system, metadata, globalreserve
     raid_d = {}
-    for l in o:
-        fields = l.split()
-        if (len(fields) > 1):
-            block = fields[0][:-1].lower()
-            raid = fields[1][:-1].lower()
-            if block not in raid_d and raid is not 'DUP':
-                raid_d[block] = raid
+    for block, raid in blocks:
+        if block not in raid_d and raid is not 'DUP':
+            raid_d[block] = raid
     if (raid_d['metadata'] == 'single'):
         raid_d['data'] = raid_d['metadata']
     return raid_d
@@ -156,6 +186,14 @@ def cur_devices(mnt_pt):
     btrfs mount point in by-id (with full path) format.
     """
     dev_list_byid = []
+    devices = ioctl_query(btrfs_ioctl.dev_info, mnt_pt)
+    if devices is not None:
+        for d in devices:
+            # Missing devices have no path.
+            if d['path'] != '':
+                dev_byid, is_byid = get_dev_byid_name(d['path'])
+                dev_list_byid.append(dev_byid)
+        return dev_list_byid
     o, e, rc = run_command([BTRFS, 'fi', 'show', mnt_pt])
     for l in o:
         l = l.strip()
@@ -384,7 +422,16 @@ def mount_snap(share, snap_name, snap_mnt=None):
 def subvol_list_helper(mnt_pt):
     """
     temporary solution until btrfs is fixed. wait upto 30 secs :(
+    When the ioctl backend is available it's output is rendered in the same
+    "btrfs subvolume list mnt_pt" format, ie:
+    'ID 257 gen 13616 top level 5 path rock-ons-root'
     """
+    subvols = ioctl_query(btrfs_ioctl.subvol_list, mnt_pt)
+    if subvols is not None:
+        out = ['ID %d gen %d top level %d path %s' %
+               (sv['id'], sv['gen'], sv['parent'], sv['path'])
+               for sv in subvols]
+        return out + [''], [''], 0
     num_tries = 0
     while (True):
         try:
@@ -401,6 +448,9 @@ def subvol_list_helper(mnt_pt):
 
 
 def snapshot_list(mnt_pt):
+    subvols = ioctl_query(btrfs_ioctl.subvol_list, mnt_pt)
+    if subvols is not None:
+        return [sv['path'] for sv in subvols if sv['snapshot']]
     o, e, rc = run_command([BTRFS, 'subvolume', 'list', '-s', mnt_pt])
     snaps = []
     for s in o:
@@ -431,6 +481,9 @@ def shares_info(pool):
             # recovered, state gets reconstructed anyway.
             return {}
         raise
+    subvols = ioctl_query(btrfs_ioctl.subvol_list, mnt_pt)
+    if subvols is not None:
+        return shares_info_ioctl(subvols)
     o, e, rc = run_command([BTRFS, 'subvolume', 'list', '-s', mnt_pt])
     snap_idmap = {}
     for l in o:
@@ -475,6 +528,42 @@ def shares_info(pool):
     return shares_d
 
 
+def shares_info_ioctl(subvols):
+    """
+    Counterpart to the btrfs command parsing within shares_info() for the
+    ioctl backend. The subvolume's read only flag is part of the ioctl
+    results so there is no need for a "btrfs property get" per snapshot.
+    :param subvols: list of subvolumes as returned by
+    fs.btrfs_ioctl.subvol_list()
+    :return: see shares_info()
+    """
+    snap_idmap = {}
+    for sv in subvols:
+        if sv['snapshot']:
+            snap_idmap[sv['id']] = sv['path']
+    shares_d = {}
+    share_ids = []
+    for sv in subvols:
+        vol_id = sv['id']
+        if (vol_id in snap_idmap):
+            # if the snapshot directory is direct child of a pool and is rw,
+            # then it's a Share. (aka Rockstor Share clone).
+            if ('/' in snap_idmap[vol_id] or sv['readonly']):
+                continue
+        parent_id = sv['parent']
+        if (parent_id in share_ids):
+            # subvol of subvol. add it so child subvols can also be ignored.
+            share_ids.append(vol_id)
+        elif (parent_id in snap_idmap):
+            # snapshot/subvol of snapshot.
+            # add it so child subvols can also be ignored.
+            snap_idmap[vol_id] = sv['path']
+        else:
+            shares_d[sv['path']] = '0/%d' % vol_id
+            share_ids.append(vol_id)
+    return shares_d
+
+
 def parse_snap_details(mnt_pt, fields):
     writable = True
     snap_name = None
@@ -494,6 +583,9 @@ def parse_snap_details(mnt_pt, fields):
 
 
 def snaps_info(mnt_pt, share_name):
+    subvols = ioctl_query(btrfs_ioctl.subvol_list, mnt_pt)
+    if subvols is not None:
+        return snaps_info_ioctl(subvols, share_name)
     o, e, rc = run_command([BTRFS, 'subvolume', 'list', '-u', '-p', '-q',
                             mnt_pt])
     share_id = share_uuid = None
@@ -529,6 +621,41 @@ def snaps_info(mnt_pt, share_name):
     return snaps_d
 
 
+def snaps_info_ioctl(subvols, share_name):
+    """
+    Counterpart to the btrfs command parsing within snaps_info() for the ioctl
+    backend, see shares_info_ioctl().
+    :param subvols: list of subvolumes as returned by
+    fs.btrfs_ioctl.subvol_list()
+    :param share_name: name of the share whose snapshots are to be found.
+    :return: see snaps_info()
+    """
+    share = None
+    for sv in subvols:
+        if (sv['path'] == share_name):
+            share = sv
+    if (share is None):
+        return {}
+    snaps_d = {}
+    snap_uuids = []
+    for sv in subvols:
+        if (not sv['snapshot']):
+            continue
+        # parent uuid must be share_uuid or another snapshot's uuid
+        if (sv['parent'] != share['id'] and
+                sv['parent_uuid'] != share['uuid'] and
+                sv['parent_uuid'] not in snap_uuids):
+            continue
+        writable = not sv['readonly']
+        if (writable and '/' not in sv['path']):
+            # writable snapshot + direct child of pool.
+            # So we'll treat it as a share.
+            continue
+        snaps_d[sv['path'].split('/')[-1]] = ('0/%d' % sv['id'], writable, )
+        snap_uuids.append(sv['uuid'])
+    return snaps_d
+
+
 def share_id(pool, share_name):
     """
     Returns the subvolume id, becomes the share's uuid.
@@ -687,6 +814,9 @@ def are_quotas_enabled(mnt_pt):
     :param mnt_pt: Mount point of btrfs filesystem
     :return: True on rc = 0 False otherwise.
     """
+    status = ioctl_query(btrfs_ioctl.quota_status, mnt_pt)
+    if status is not None:
+        return status['enabled']
     o, e, rc = run_command([BTRFS, 'qgroup', 'show', '-f', '--raw', mnt_pt])
     if rc == 0:
         return True
@@ -701,6 +831,18 @@ def qgroup_exists(mnt_pt, qgroup):
     :param qgroup: qgroup of the form 2015/n (intended for use with pqgroup)
     :return: True is given qgroup exists in command output, False otherwise.
     """
+    return qgroup in qgroup_ids(mnt_pt)
+
+
+def qgroup_ids(mnt_pt):
+    """
+    :param mnt_pt: btrfs filesystem mount point, usually the pool.
+    :return: list of the qgroups on the filesystem, empty if quotas are
+    disabled.
+    """
+    qgroups = ioctl_query(btrfs_ioctl.qgroup_list, mnt_pt)
+    if qgroups is not None:
+        return list(qgroups)
     o, e, rc = run_command([BTRFS, 'qgroup', 'show', '--raw', mnt_pt])
     # example output:
     # 'qgroupid         rfer         excl '
@@ -710,12 +852,10 @@ def qgroup_exists(mnt_pt, qgroup):
     # '2015/12             0            0 '
     if rc == 0 and len(o) > 2:
         # index from 2 to miss header lines and -1 to skip end blank line = []
-        qgroup_list = [line.split()[0] for line in o[2:-1]]
         # eg from rockstor_rockstor pool we get:
-        # qgroup_list=['0/5', '0/257', '0/258', '0/260', '2015/1', '2015/2']
-        if qgroup in qgroup_list:
-            return True
-    return False
+        # ['0/5', '0/257', '0/258', '0/260', '2015/1', '2015/2']
+        return [line.split()[0] for line in o[2:-1]]
+    return []
 
 
 def qgroup_id(pool, share_name):
@@ -731,6 +871,18 @@ def qgroup_max(mnt_pt):
     :param mnt_pt: A given btrfs mount point.
     :return: -1 if quotas not enabled, else highest 2015/* qgroup found or 0
     """
+    status = ioctl_query(btrfs_ioctl.quota_status, mnt_pt)
+    if status is not None and not status['enabled']:
+        logger.info('Mount Point: {} has Quotas disabled, skipping qgroup '
+                    'show.'.format(mnt_pt))
+        return -1
+    qgroups = ioctl_query(btrfs_ioctl.qgroup_list, mnt_pt)
+    if status is not None and qgroups is not None:
+        res = 0
+        for qgroup in qgroups:
+            if (qgroup.startswith('%s/' % QID)):
+                res = max(res, int(qgroup.split('/')[1]))
+        return res
     try:
         o, e, rc = run_command([BTRFS, 'qgroup', 'show', mnt_pt], log=True)
     except CommandException as e:
@@ -873,23 +1025,40 @@ def qgroup_assign(qid, pqid, mnt_pt):
     except CommandException as e:
         wmsg = 'WARNING: quotas may be inconsistent, rescan needed'
         if (e.rc == 1 and e.err[0] == wmsg):
-            # schedule a rescan if one is not currently running.
-            dmsg = ('Quota inconsistency while assigning %s. Rescan scheduled.'
-                    % qid)
-            try:
-                run_command([BTRFS, 'quota', 'rescan', mnt_pt])
-                return logger.debug(dmsg)
-            except CommandException as e2:
-                emsg = 'ERROR: quota rescan failed: Operation now in progress'
-                if (e2.rc == 1 and e2.err[0] == emsg):
-                    return logger.debug('%s.. Another rescan already in '
-                                        'progress.' % dmsg)
-                logger.exception(e2)
-                raise e2
+            # Coalesced with other rescan requests for this pool, so bursts
+            # of assigns(eg scheduled snapshots) result in a single rescan.
+            from quota_rescan import request_rescan
+            request_rescan(mnt_pt)
+            return logger.debug('Quota inconsistency while assigning %s. '
+                                'Rescan requested.' % qid)
         logger.exception(e)
         raise e
 
 
+def quota_rescan_status(mnt_pt):
+    """
+    Wrapper around 'btrfs quota rescan -s mnt_pt'
+    :param mnt_pt: btrfs filesystem mountpoint (usually the associated pool)
+    :return: dictionary with keys: running, and progress ie the key(extent
+    bytenr) the running rescan has reached or None.
+    """
+    status = ioctl_query(btrfs_ioctl.quota_status, mnt_pt)
+    if status is not None:
+        if status['rescan']:
+            return {'running': True, 'progress': status['rescan_progress'], }
+        return {'running': False, 'progress': None, }
+    o, e, rc = run_command([BTRFS, 'quota', 'rescan', '-s', mnt_pt],
+                           throw=False)
+    # example output:
+    # 'operation running, current key 123456'
+    # 'no rescan pending'
+    for line in o:
+        match = re.search('current key (\d+)', line)
+        if match is not None:
+            return {'running': True, 'progress': int(match.group(1)), }
+    return {'running': False, 'progress': None, }
+
+
 def update_quota(pool, qgroup, size_bytes):
     # TODO: consider changing qgroup to pqgroup if we are only used this way.
     root_pool_mnt = mount_root(pool)
@@ -959,6 +1128,10 @@ def volume_usage(pool, volume_id, pvolume_id=None):
     # Obtain path to share in pool, this preserved because
     # granting pool exists
     root_pool_mnt = mount_root(pool)
+    qgroups = ioctl_query(btrfs_ioctl.qgroup_list, root_pool_mnt)
+    if qgroups is not None:
+        return volume_usage_lookup(qgroup_usage_kib(qgroups), volume_id,
+                                   pvolume_id)
     cmd = [BTRFS, 'subvolume', 'list', root_pool_mnt]
     out, err, rc = run_command(cmd, log=True)
     short_id = volume_id.split('/')[1]
@@ -1004,6 +1177,67 @@ def volume_usage(pool, volume_id, pvolume_id=None):
     return volume_id_sizes + pvolume_id_sizes
 
 
+def volume_usage_map(pool):
+    """
+    Pool level counterpart to volume_usage() intended for callers that need
+    the usage of many volumes (shares and snapshots) on the same pool. The
+    qgroup table is filesystem wide so a single "btrfs qgroup show --raw" on
+    the pool's root mount returns the usage of every volume in one go, rather
+    than one subvolume list and qgroup show per volume.
+    :param pool: Pool object
+    :return: dictionary indexed by qgroupid eg '0/261' or '2015/4' with values
+    of [rfer, excl] in KiB. An empty dictionary is returned if quotas are
+    disabled, leaving lookups to default to 0 usage as volume_usage() does.
+    """
+    root_pool_mnt = mount_root(pool)
+    qgroups = ioctl_query(btrfs_ioctl.qgroup_list, root_pool_mnt)
+    if qgroups is not None:
+        return qgroup_usage_kib(qgroups)
+    cmd = [BTRFS, 'qgroup', 'show', '--raw', root_pool_mnt]
+    out, err, rc = run_command(cmd, log=True, throw=False)
+    usage_map = {}
+    if rc != 0:
+        return usage_map
+    # example output:
+    # 'qgroupid         rfer         excl '
+    # '--------         ----         ---- '
+    # '0/5             16384        16384 '
+    # '2015/4       66060288     66060288 '
+    for line in out:
+        fields = line.split()
+        if (len(fields) > 2 and '/' in fields[0] and fields[1].isdigit() and
+                fields[2].isdigit()):
+            usage_map[fields[0]] = [int(fields[1]) / 1024,
+                                    int(fields[2]) / 1024]
+    return usage_map
+
+
+def qgroup_usage_kib(qgroups):
+    """
+    :param qgroups: dictionary as returned by fs.btrfs_ioctl.qgroup_list()
+    :return: the same in volume_usage_map() form, ie [rfer, excl] in KiB.
+    """
+    return dict((qgroup, [rfer / 1024, excl / 1024])
+                for qgroup, (rfer, excl) in qgroups.items())
+
+
+def volume_usage_lookup(usage_map, volume_id, pvolume_id=None):
+    """
+    Equivalent of volume_usage() but answered from a usage_map as returned by
+    volume_usage_map(). Shares the same 2 personalities regarding the number
+    of values returned.
+    :param usage_map: dictionary as returned by volume_usage_map()
+    :param volume_id: qgroupid eg '0/261'
+    :param pvolume_id: qgroupid eg '2015/4'
+    :return: list of len 2 (when pvolume_id=None) or 4 elements. I.e
+    [rfer, excl, rfer, excl]
+    """
+    volume_id_sizes = list(usage_map.get(volume_id, [0, 0]))
+    if pvolume_id is None:
+        return volume_id_sizes
+    return volume_id_sizes + list(usage_map.get(pvolume_id, [0, 0]))
+
+
 def shares_usage(pool, share_map, snap_map):
     # TODO: currently unused, is this to be deprecated
     # don't mount the pool if at least one share in the map is mounted.
@@ -1034,6 +1268,17 @@ def pool_usage(mnt_pt):
     - All space currently used by data;
     - All space currently allocated for metadata and system data.
     """
+    spaces = ioctl_query(btrfs_ioctl.space_info, mnt_pt)
+    if spaces is not None:
+        used = 0
+        for sp in spaces:
+            if (sp['flags'] & btrfs_ioctl.BTRFS_SPACE_INFO_GLOBAL_RSV):
+                continue
+            if (sp['flags'] & btrfs_ioctl.BTRFS_BLOCK_GROUP_DATA):
+                used += sp['used_bytes']
+            else:
+                used += sp['total_bytes']
+        return used / 1024
     cmd = [BTRFS, 'fi', 'usage', '-b', mnt_pt]
     out, err, rc = run_command(cmd)
 
@@ -0,0 +1,453 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import array
+import errno
+import fcntl
+import os
+import struct
+import uuid
+
+"""
+In process btrfs queries via the kernel's btrfs ioctl interface. These avoid
+the fork/exec of /sbin/btrfs and the parsing of it's human formatted output
+for the read only queries made on every pool / share / snapshot refresh.
+All structure layouts are from the kernel's include/uapi/linux/btrfs.h and
+btrfs_tree.h. Every query requires CAP_SYS_ADMIN and a mounted btrfs
+filesystem; failures are raised as IoctlException so that callers in
+fs.btrfs can fall back to the equivalent btrfs command.
+"""
+
+BTRFS_IOCTL_MAGIC = 0x94
+
+# Tree ids.
+BTRFS_ROOT_TREE_OBJECTID = 1
+BTRFS_FS_TREE_OBJECTID = 5
+BTRFS_QUOTA_TREE_OBJECTID = 8
+BTRFS_FIRST_FREE_OBJECTID = 256
+BTRFS_LAST_FREE_OBJECTID = 2 ** 64 - 256
+U64_MAX = 2 ** 64 - 1
+U32_MAX = 2 ** 32 - 1
+
+# Item key types.
+BTRFS_ROOT_ITEM_KEY = 132
+BTRFS_ROOT_BACKREF_KEY = 144
+BTRFS_QGROUP_STATUS_KEY = 240
+BTRFS_QGROUP_INFO_KEY = 242
+BTRFS_QGROUP_LIMIT_KEY = 244
+BTRFS_QGROUP_RELATION_KEY = 246
+
+BTRFS_ROOT_SUBVOL_RDONLY = 1 << 0
+BTRFS_QGROUP_STATUS_FLAG_ON = 1 << 0
+BTRFS_QGROUP_STATUS_FLAG_RESCAN = 1 << 1
+BTRFS_QGROUP_STATUS_FLAG_INCONSISTENT = 1 << 2
+
+# Block group (space info) flags.
+BTRFS_BLOCK_GROUP_DATA = 1 << 0
+BTRFS_BLOCK_GROUP_SYSTEM = 1 << 1
+BTRFS_BLOCK_GROUP_METADATA = 1 << 2
+BTRFS_SPACE_INFO_GLOBAL_RSV = 1 << 49
+BLOCK_GROUP_PROFILES = ((1 << 3, 'RAID0'), (1 << 4, 'RAID1'),
+                        (1 << 5, 'DUP'), (1 << 6, 'RAID10'),
+                        (1 << 7, 'RAID5'), (1 << 8, 'RAID6'),
+                        (1 << 9, 'RAID1C3'), (1 << 10, 'RAID1C4'), )
+
+# struct btrfs_ioctl_search_key followed by the search result buffer.
+SEARCH_KEY = struct.Struct('=7Q4L4Q')
+SEARCH_HEADER = struct.Struct('=3Q2L')
+SEARCH_ARGS_SIZE = 4096
+# struct btrfs_ioctl_ino_lookup_args
+INO_LOOKUP = struct.Struct('=2Q')
+INO_LOOKUP_ARGS_SIZE = 4096
+# struct btrfs_ioctl_dev_info_args: devid, uuid, bytes_used, total_bytes,
+# unused[379], path[1024].
+DEV_INFO = struct.Struct('=Q16s2Q')
+DEV_INFO_PATH_OFFSET = 3072
+DEV_INFO_ARGS_SIZE = 4096
+# struct btrfs_ioctl_fs_info_args: max_id, num_devices, fsid, nodesize,
+# sectorsize, clone_alignment, ...
+FS_INFO = struct.Struct('=2Q16s3L')
+FS_INFO_ARGS_SIZE = 1024
+# struct btrfs_ioctl_space_args followed by btrfs_ioctl_space_info entries.
+SPACE_ARGS = struct.Struct('=2Q')
+SPACE_INFO = struct.Struct('=3Q')
+# struct btrfs_root_item: generation is found after the embedded 160 byte
+# inode item, the uuids and transids are only present in the (current) 439
+# byte version of the item.
+ROOT_ITEM_SIZE = 439
+ROOT_ITEM_GENERATION = struct.Struct('=Q')
+ROOT_ITEM_FLAGS = struct.Struct('=Q')
+ROOT_ITEM_UUIDS = struct.Struct('=16s16s16s2Q')
+# struct btrfs_root_ref: dirid, sequence, name_len followed by name.
+ROOT_REF = struct.Struct('=2QH')
+# struct btrfs_qgroup_status_item and btrfs_qgroup_info_item
+QGROUP_STATUS = struct.Struct('=4Q')
+QGROUP_INFO = struct.Struct('=5Q')
+
+
+def _ioc(direction, nr, size):
+    return (direction << 30) | (size << 16) | (BTRFS_IOCTL_MAGIC << 8) | nr
+
+
+_IOC_WRITE = 1
+_IOC_READ = 2
+BTRFS_IOC_TREE_SEARCH = _ioc(_IOC_READ | _IOC_WRITE, 17, SEARCH_ARGS_SIZE)
+BTRFS_IOC_INO_LOOKUP = _ioc(_IOC_READ | _IOC_WRITE, 18, INO_LOOKUP_ARGS_SIZE)
+BTRFS_IOC_SPACE_INFO = _ioc(_IOC_READ | _IOC_WRITE, 20, SPACE_ARGS.size)
+BTRFS_IOC_DEV_INFO = _ioc(_IOC_READ | _IOC_WRITE, 30, DEV_INFO_ARGS_SIZE)
+BTRFS_IOC_FS_INFO = _ioc(_IOC_READ, 31, FS_INFO_ARGS_SIZE)
+
+
+class IoctlException(Exception):
+
+    def __init__(self, mnt_pt, err):
+        self.mnt_pt = mnt_pt
+        self.err = err
+
+    def __str__(self):
+        return ('btrfs ioctl query on %s failed: %s' % (self.mnt_pt,
+                                                        self.err))
+
+
+class _Fd(object):
+    """
+    Context manager for a read only directory fd on which to issue ioctls.
+    Any IOError / OSError raised within is re-raised as IoctlException.
+    """
+
+    def __init__(self, mnt_pt):
+        self.mnt_pt = mnt_pt
+        self.fd = None
+
+    def __enter__(self):
+        try:
+            self.fd = os.open(self.mnt_pt, os.O_RDONLY | os.O_DIRECTORY)
+        except (IOError, OSError) as e:
+            raise IoctlException(self.mnt_pt, e)
+        return self.fd
+
+    def __exit__(self, exc_type, exc_value, tb):
+        os.close(self.fd)
+        if exc_type is not None and issubclass(exc_type, (IOError, OSError,
+                                                          struct.error)):
+            raise IoctlException(self.mnt_pt, exc_value)
+        return False
+
+
+def _buffer(size):
+    """
+    :return: zeroed, mutable buffer of size bytes for use as an ioctl arg.
+    """
+    return array.array('B', b'\0' * size)
+
+
+def _cstr(buf, offset, size):
+    return buf[offset:offset + size].tostring().split(b'\0', 1)[0]
+
+
+def _uuid_str(raw):
+    if raw == b'\0' * 16:
+        return '-'
+    return str(uuid.UUID(bytes=raw))
+
+
+def qgroupid_str(qgroupid):
+    """
+    :param qgroupid: 64 bit on disk qgroupid ie level << 48 | id
+    :return: qgroupid in the form used by the btrfs command ie '2015/4'
+    """
+    return '%d/%d' % (qgroupid >> 48, qgroupid & ((1 << 48) - 1))
+
+
+def tree_search(fd, tree_id, min_type, max_type, min_objectid=0,
+                max_objectid=U64_MAX):
+    """
+    Generator wrapping BTRFS_IOC_TREE_SEARCH which yields all items of the
+    given tree within the given objectid and key type range. The kernel
+    returns as many items as fit in a single 4 KiB buffer per call so the
+    search key is advanced past the last item returned until no more items
+    are found.
+    :param fd: open fd within the target btrfs filesystem.
+    :param tree_id: id of the tree to search ie BTRFS_ROOT_TREE_OBJECTID
+    :return: yields (objectid, type, offset, item data) tuples.
+    """
+    key_objectid, key_type, key_offset = min_objectid, min_type, 0
+    while True:
+        buf = _buffer(SEARCH_ARGS_SIZE)
+        SEARCH_KEY.pack_into(buf, 0, tree_id, key_objectid, max_objectid,
+                             key_offset, U64_MAX, 0, U64_MAX, key_type,
+                             max_type, U32_MAX, 0, 0, 0, 0, 0)
+        fcntl.ioctl(fd, BTRFS_IOC_TREE_SEARCH, buf, True)
+        nr_items = SEARCH_KEY.unpack_from(buf, 0)[9]
+        if nr_items == 0:
+            return
+        pos = SEARCH_KEY.size
+        for i in range(nr_items):
+            (transid, objectid, offset, item_type,
+             item_len) = SEARCH_HEADER.unpack_from(buf, pos)
+            pos += SEARCH_HEADER.size
+            data = buf[pos:pos + item_len].tostring()
+            pos += item_len
+            # Keys are compared as a whole so other item types within the
+            # objectid range may also be returned.
+            if min_type <= item_type <= max_type:
+                yield objectid, item_type, offset, data
+        # Advance the search key to just past the last item returned.
+        key_objectid, key_type, key_offset = objectid, item_type, offset
+        if key_offset < U64_MAX:
+            key_offset += 1
+        elif key_type < 255:
+            key_type, key_offset = key_type + 1, 0
+        elif key_objectid < max_objectid:
+            key_objectid, key_type, key_offset = key_objectid + 1, 0, 0
+        else:
+            return
+
+
+def ino_lookup(fd, tree_id, objectid):
+    """
+    Wrapper around BTRFS_IOC_INO_LOOKUP
+    :return: path of the directory objectid within tree tree_id relative to
+    that tree's root, with a trailing '/', or '' for the root directory.
+    """
+    buf = _buffer(INO_LOOKUP_ARGS_SIZE)
+    INO_LOOKUP.pack_into(buf, 0, tree_id, objectid)
+    fcntl.ioctl(fd, BTRFS_IOC_INO_LOOKUP, buf, True)
+    return _cstr(buf, INO_LOOKUP.size, INO_LOOKUP_ARGS_SIZE - INO_LOOKUP.size)
+
+
+def subvol_list(mnt_pt):
+    """
+    In process equivalent of "btrfs subvolume list -p -q -u mnt_pt" built
+    from the ROOT_ITEM and ROOT_BACKREF items of the root tree.
+    :param mnt_pt: mount point of the btrfs filesystem (pool).
+    :return: list, ordered by subvolume id, of dictionaries with keys: id,
+    gen, cgen, parent (parent subvolume id), path (relative to the top level
+    subvolume), uuid, parent_uuid, received_uuid, readonly and snapshot
+    (True when created as a snapshot).
+    """
+    roots = {}
+    with _Fd(mnt_pt) as fd:
+        for objectid, item_type, offset, data in tree_search(
+                fd, BTRFS_ROOT_TREE_OBJECTID, BTRFS_ROOT_ITEM_KEY,
+                BTRFS_ROOT_BACKREF_KEY, BTRFS_FIRST_FREE_OBJECTID,
+                BTRFS_LAST_FREE_OBJECTID):
+            root = roots.setdefault(objectid, {'id': objectid})
+            if item_type == BTRFS_ROOT_ITEM_KEY:
+                root['gen'] = ROOT_ITEM_GENERATION.unpack_from(data, 160)[0]
+                flags = ROOT_ITEM_FLAGS.unpack_from(data, 208)[0]
+                root['readonly'] = bool(flags & BTRFS_ROOT_SUBVOL_RDONLY)
+                # A snapshot's root item key offset records the transid it
+                # was taken at, for plain subvolumes it is 0.
+                root['snapshot'] = offset != 0
+                uuids = (b'\0' * 16, b'\0' * 16, b'\0' * 16, 0, 0)
+                if len(data) >= ROOT_ITEM_SIZE:
+                    uuids = ROOT_ITEM_UUIDS.unpack_from(data, 247)
+                root['uuid'] = _uuid_str(uuids[0])
+                root['parent_uuid'] = _uuid_str(uuids[1])
+                root['received_uuid'] = _uuid_str(uuids[2])
+                root['cgen'] = uuids[4]
+            elif item_type == BTRFS_ROOT_BACKREF_KEY:
+                dirid, sequence, name_len = ROOT_REF.unpack_from(data, 0)
+                name = data[ROOT_REF.size:ROOT_REF.size + name_len]
+                root['parent'] = offset
+                root['dirid'] = dirid
+                root['name'] = name
+        # Deleted but not yet cleaned subvolumes have no back reference.
+        roots = dict((k, v) for k, v in roots.items()
+                     if 'parent' in v and 'gen' in v)
+        paths = {BTRFS_FS_TREE_OBJECTID: ''}
+
+        def resolve(root_id):
+            if root_id not in paths:
+                r = roots.get(root_id)
+                if r is None:
+                    # parent is not reachable, report it relative to itself.
+                    return ''
+                prefix = resolve(r['parent'])
+                if prefix != '':
+                    prefix += '/'
+                paths[root_id] = '%s%s%s' % (prefix,
+                                             ino_lookup(fd, r['parent'],
+                                                        r['dirid']),
+                                             r['name'])
+            return paths[root_id]
+
+        for root_id in roots:
+            roots[root_id]['path'] = resolve(root_id)
+    return [roots[k] for k in sorted(roots)]
+
+
+def quota_status(mnt_pt):
+    """
+    Reads the quota tree's status item.
+    :return: dictionary with keys: enabled, rescan (rescan in progress),
+    rescan_progress (key the rescan has reached), inconsistent, and
+    generation. With quotas disabled there is no quota tree and enabled is
+    False.
+    """
+    status = {'enabled': False, 'rescan': False, 'inconsistent': False,
+              'generation': 0, 'rescan_progress': 0, }
+    with _Fd(mnt_pt) as fd:
+        try:
+            for objectid, item_type, offset, data in tree_search(
+                    fd, BTRFS_QUOTA_TREE_OBJECTID, BTRFS_QGROUP_STATUS_KEY,
+                    BTRFS_QGROUP_STATUS_KEY):
+                version, generation, flags, rescan = \
+                    QGROUP_STATUS.unpack_from(data, 0)
+                status['enabled'] = bool(flags & BTRFS_QGROUP_STATUS_FLAG_ON)
+                status['rescan'] = bool(
+                    flags & BTRFS_QGROUP_STATUS_FLAG_RESCAN)
+                status['inconsistent'] = bool(
+                    flags & BTRFS_QGROUP_STATUS_FLAG_INCONSISTENT)
+                status['generation'] = generation
+                status['rescan_progress'] = rescan
+                break
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+    return status
+
+
+def qgroup_list(mnt_pt):
+    """
+    In process equivalent of "btrfs qgroup show --raw mnt_pt" built from the
+    QGROUP_INFO items of the quota tree.
+    :param mnt_pt: mount point of the btrfs filesystem (pool).
+    :return: dictionary indexed by qgroupid ie '0/257' or '2015/3' of
+    (rfer, excl) in bytes. An empty dictionary if quotas are disabled.
+    """
+    qgroups = {}
+    with _Fd(mnt_pt) as fd:
+        try:
+            for objectid, item_type, offset, data in tree_search(
+                    fd, BTRFS_QUOTA_TREE_OBJECTID, BTRFS_QGROUP_INFO_KEY,
+                    BTRFS_QGROUP_INFO_KEY):
+                generation, rfer, rfer_cmpr, excl, excl_cmpr = \
+                    QGROUP_INFO.unpack_from(data, 0)
+                qgroups[qgroupid_str(offset)] = (rfer, excl)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return {}
+            raise
+    return qgroups
+
+
+def fs_info(mnt_pt):
+    """
+    Wrapper around BTRFS_IOC_FS_INFO
+    :return: dictionary with keys max_id, num_devices, fsid, nodesize and
+    sectorsize.
+    """
+    buf = _buffer(FS_INFO_ARGS_SIZE)
+    with _Fd(mnt_pt) as fd:
+        fcntl.ioctl(fd, BTRFS_IOC_FS_INFO, buf, True)
+    max_id, num_devices, fsid, nodesize, sectorsize, clone_alignment = \
+        FS_INFO.unpack_from(buf, 0)
+    return {'max_id': max_id, 'num_devices': num_devices,
+            'fsid': str(uuid.UUID(bytes=fsid)), 'nodesize': nodesize,
+            'sectorsize': sectorsize, }
+
+
+def dev_info(mnt_pt):
+    """
+    Wrapper around BTRFS_IOC_DEV_INFO for every device id up to the max_id
+    reported by BTRFS_IOC_FS_INFO. Non existent (ie removed) device ids are
+    skipped.
+    :return: list of dictionaries with keys devid, uuid, bytes_used,
+    total_bytes and path ie '/dev/sdb'. Missing devices have a path of ''.
+    """
+    devices = []
+    max_id = fs_info(mnt_pt)['max_id']
+    with _Fd(mnt_pt) as fd:
+        for devid in range(1, max_id + 1):
+            buf = _buffer(DEV_INFO_ARGS_SIZE)
+            DEV_INFO.pack_into(buf, 0, devid, b'\0' * 16, 0, 0)
+            try:
+                fcntl.ioctl(fd, BTRFS_IOC_DEV_INFO, buf, True)
+            except IOError as e:
+                if e.errno == errno.ENODEV:
+                    continue
+                raise
+            devid, dev_uuid, bytes_used, total_bytes = \
+                DEV_INFO.unpack_from(buf, 0)
+            devices.append({'devid': devid,
+                            'uuid': str(uuid.UUID(bytes=dev_uuid)),
+                            'bytes_used': bytes_used,
+                            'total_bytes': total_bytes,
+                            'path': _cstr(buf, DEV_INFO_PATH_OFFSET,
+                                          DEV_INFO_ARGS_SIZE -
+                                          DEV_INFO_PATH_OFFSET), })
+    return devices
+
+
+def space_info(mnt_pt):
+    """
+    Wrapper around BTRFS_IOC_SPACE_INFO, the source of "btrfs fi df". A first
+    call with no slots establishes the number of entries to allocate for.
+    :return: list, in kernel (and so btrfs fi df) order, of dictionaries with
+    keys type ie 'Data', 'Metadata', 'System', 'Data+Metadata' or
+    'GlobalReserve', profile ie 'single' or 'RAID1', flags, total_bytes and
+    used_bytes.
+    """
+    with _Fd(mnt_pt) as fd:
+        buf = _buffer(SPACE_ARGS.size)
+        fcntl.ioctl(fd, BTRFS_IOC_SPACE_INFO, buf, True)
+        total_spaces = SPACE_ARGS.unpack_from(buf, 0)[1]
+        buf = _buffer(SPACE_ARGS.size + SPACE_INFO.size * total_spaces)
+        SPACE_ARGS.pack_into(buf, 0, total_spaces, 0)
+        fcntl.ioctl(fd, BTRFS_IOC_SPACE_INFO, buf, True)
+        total_spaces = SPACE_ARGS.unpack_from(buf, 0)[1]
+    spaces = []
+    for i in range(total_spaces):
+        flags, total_bytes, used_bytes = SPACE_INFO.unpack_from(
+            buf, SPACE_ARGS.size + i * SPACE_INFO.size)
+        spaces.append({'type': block_group_type(flags),
+                       'profile': block_group_profile(flags),
+                       'flags': flags, 'total_bytes': total_bytes,
+                       'used_bytes': used_bytes, })
+    return spaces
+
+
+def block_group_type(flags):
+    """
+    :return: block group type name as used by "btrfs fi df"
+    """
+    if flags & BTRFS_SPACE_INFO_GLOBAL_RSV:
+        return 'GlobalReserve'
+    data = flags & BTRFS_BLOCK_GROUP_DATA
+    metadata = flags & BTRFS_BLOCK_GROUP_METADATA
+    if data and metadata:
+        return 'Data+Metadata'
+    if data:
+        return 'Data'
+    if metadata:
+        return 'Metadata'
+    if flags & BTRFS_BLOCK_GROUP_SYSTEM:
+        return 'System'
+    return 'unknown'
+
+
+def block_group_profile(flags):
+    """
+    :return: block group profile name as used by "btrfs fi df"
+    """
+    for flag, profile in BLOCK_GROUP_PROFILES:
+        if flags & flag:
+            return profile
+    return 'single'
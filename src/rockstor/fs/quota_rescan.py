@@ -0,0 +1,193 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import errno
+import fcntl
+import json
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django_ztask.decorators import task
+from system.exceptions import CommandException
+from system.osi import run_command
+from btrfs import (BTRFS, quota_rescan_status)
+
+logger = logging.getLogger(__name__)
+
+# Per pool rescan state, shared by every process that requests rescans.
+STATE_DIR = '/var/run/rockstor-quota-rescan'
+# Seconds without new requests before a rescan is started.
+DEBOUNCE = getattr(settings, 'QUOTA_RESCAN_DEBOUNCE', 60)
+# Seconds between checks on a running rescan.
+POLL_INTERVAL = 30
+# A check overdue by this many seconds is assumed lost, eg ztaskd restarted.
+LOST_AFTER = 600
+
+IDLE = 'idle'
+PENDING = 'pending'
+RUNNING = 'running'
+
+
+def _state_path(mnt_pt):
+    pool_name = os.path.basename(os.path.normpath(mnt_pt))
+    return os.path.join(STATE_DIR, '%s.json' % pool_name)
+
+
+@contextmanager
+def _state(mnt_pt):
+    """
+    Locked read, modify and write of a pool's rescan state.
+    """
+    try:
+        os.makedirs(STATE_DIR)
+    except OSError as e:
+        if (e.errno != errno.EEXIST):
+            raise
+    with open(_state_path(mnt_pt), 'a+') as sfo:
+        fcntl.flock(sfo, fcntl.LOCK_EX)
+        sfo.seek(0)
+        try:
+            state = json.loads(sfo.read())
+        except ValueError:
+            state = {}
+        orig = dict(state)
+        yield state
+        if (state != orig):
+            sfo.seek(0)
+            sfo.truncate()
+            sfo.write(json.dumps(state))
+            sfo.flush()
+
+
+def _schedule(delay, mnt_pt):
+    rescan_check.after(int(math.ceil(delay)), mnt_pt)
+
+
+def request_rescan(mnt_pt):
+    """
+    Ask for a quota rescan of the pool mounted at mnt_pt. Requests are
+    coalesced: the rescan starts once no new request has come in for
+    DEBOUNCE seconds, and never while another rescan is running on the pool.
+    Requests made while a rescan runs get one more rescan after it.
+    :param mnt_pt: pool mount point
+    """
+    now = time.time()
+    with _state(mnt_pt) as s:
+        s['requested'] = now
+        if (s.get('state', IDLE) == IDLE):
+            s['state'] = PENDING
+        if (s.get('next_check', 0) + LOST_AFTER > now):
+            # a check is already scheduled and will pick up this request.
+            return
+        s['next_check'] = now + DEBOUNCE
+    _schedule(DEBOUNCE, mnt_pt)
+
+
+@task()
+def rescan_check(mnt_pt):
+    """
+    Run by ztaskd until every request for this pool is covered by a
+    finished rescan, rescheduling itself as needed.
+    """
+    now = time.time()
+    with _state(mnt_pt) as s:
+        status = quota_rescan_status(mnt_pt)
+        if (status['running']):
+            # ours or one started by hand, either way wait for it.
+            s['progress'] = status['progress']
+            delay = POLL_INTERVAL
+        else:
+            if (s.get('state') == RUNNING):
+                s['finished'] = now
+            s['progress'] = None
+            requested = s.get('requested', 0)
+            if (requested <= s.get('started', 0)):
+                s['state'] = IDLE
+                s['next_check'] = 0
+                return
+            wait = requested + DEBOUNCE - now
+            if (wait > 0):
+                s['state'] = PENDING
+                delay = wait
+            else:
+                try:
+                    run_command([BTRFS, 'quota', 'rescan', mnt_pt], log=True)
+                except CommandException as e:
+                    emsg = ('ERROR: quota rescan failed: Operation now in '
+                            'progress')
+                    if (e.rc != 1 or e.err[0] != emsg):
+                        s['state'] = IDLE
+                        s['next_check'] = 0
+                        logger.exception(e)
+                        return
+                s['state'] = RUNNING
+                s['started'] = now
+                delay = POLL_INTERVAL
+        s['next_check'] = now + delay
+    _schedule(delay, mnt_pt)
+
+
+def _lost(s, now):
+    return (s.get('state', IDLE) != IDLE and
+            s.get('next_check', 0) + LOST_AFTER < now)
+
+
+def recover_rescan(mnt_pt):
+    """
+    Reschedule the check of a pending or running rescan if it was lost, eg
+    ztaskd restarted, as nothing would ever move the pool out of pending or
+    running otherwise. Run periodically by the data collector, see
+    PoolUsageNamespace. request_rescan does the same for new requests.
+    :param mnt_pt: pool mount point
+    :return: True if the check was rescheduled.
+    """
+    now = time.time()
+    with _state(mnt_pt) as s:
+        if (not _lost(s, now)):
+            return False
+        logger.error('Quota rescan check of %s is overdue. Rescheduling.' %
+                     mnt_pt)
+        s['next_check'] = now
+    _schedule(0, mnt_pt)
+    return True
+
+
+def rescan_state(mnt_pt):
+    """
+    Read only, so it's cheap enough for every pool api response.
+    :param mnt_pt: pool mount point
+    :return: dictionary with keys: state (idle, pending or running), stale
+    ie quota usage should not be trusted until the rescan completes,
+    requested, started and finished timestamps and progress of a running
+    rescan.
+    """
+    try:
+        with open(_state_path(mnt_pt)) as sfo:
+            s = json.loads(sfo.read())
+    except (IOError, ValueError):
+        s = {}
+    state = s.get('state', IDLE)
+    return {'state': state,
+            'stale': state != IDLE,
+            'requested': s.get('requested'),
+            'started': s.get('started'),
+            'finished': s.get('finished'),
+            'progress': s.get('progress'), }
@@ -15,7 +15,8 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import unittest
 from fs.btrfs import (pool_raid, is_subvol, volume_usage, balance_status,
-                      share_id, device_scan, scrub_status)
+                      share_id, device_scan, scrub_status, volume_usage_map,
+                      volume_usage_lookup)
 from mock import patch
 
 
@@ -43,6 +44,9 @@ class BTRFSTests(unittest.TestCase):
         # some procedures use os.path.exists so setup mock
         self.patch_os_path_exists = patch('os.path.exists')
         self.mock_os_path_exists = self.patch_os_path_exists.start()
+        # exercise the btrfs command parsers rather than the ioctl backend.
+        self.patch_use_ioctl = patch('fs.btrfs.USE_IOCTL', False)
+        self.patch_use_ioctl.start()
 
     def tearDown(self):
         patch.stopall()
@@ -311,6 +315,47 @@ class BTRFSTests(unittest.TestCase):
                          expected_results_rogue_pvolume_id,
                          msg='Failed to handle bogus pvolume_id')
 
+    def test_volume_usage_map(self):
+        """
+        Moc the return value of "btrfs qgroup show --raw pool_mount_pt" to
+        assess the pool wide qgroupid to [rfer, excl] index and the lookups
+        made against it.
+        """
+        o = ['qgroupid         rfer         excl ',
+             '--------         ----         ---- ',
+             '0/5             16384        16384 ',
+             '0/261        66741248     66741248 ',
+             '0/263       204808192       507904 ',
+             '2015/1              0            0 ',
+             '2015/4        66060288     66060288 ', '']
+        e = ['']
+        rc = 0
+        self.mock_mount_root.return_value = '/mnt2/test-pool'
+        self.mock_run_command.return_value = (o, e, rc)
+        pool = Pool(raid='raid0', name='test-pool')
+        usage_map = volume_usage_map(pool)
+        self.mock_run_command.assert_called_once_with(
+            ['/sbin/btrfs', 'qgroup', 'show', '--raw', '/mnt2/test-pool'],
+            log=True, throw=False)
+        self.assertEqual(usage_map, {'0/5': [16, 16],
+                                     '0/261': [65177, 65177],
+                                     '0/263': [200008, 496],
+                                     '2015/1': [0, 0],
+                                     '2015/4': [64512, 64512]})
+        # share with pqgroup
+        self.assertEqual(volume_usage_lookup(usage_map, '0/261', '2015/4'),
+                         [65177, 65177, 64512, 64512])
+        # snapshot
+        self.assertEqual(volume_usage_lookup(usage_map, '0/263'),
+                         [200008, 496])
+        # unknown and rogue ids default to 0 but keep the return value count.
+        self.assertEqual(volume_usage_lookup(usage_map, '0/999', '-1/-1'),
+                         [0, 0, 0, 0])
+        # quotas disabled leaves an empty map.
+        self.mock_run_command.return_value = (
+            [''], ["ERROR: can't list qgroups: quotas not enabled", ''], 1)
+        self.assertEqual(volume_usage_map(pool), {})
+
 
 # TODO: add test_balance_status_finished
 
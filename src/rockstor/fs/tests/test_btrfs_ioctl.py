@@ -0,0 +1,269 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import errno
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import unittest
+import uuid
+from fs import btrfs_ioctl
+from fs.btrfs_ioctl import (subvol_list, qgroup_list, quota_status,
+                            space_info, IoctlException, qgroupid_str)
+from fs.btrfs import (shares_info_ioctl, snaps_info_ioctl, shares_info,
+                      snaps_info, volume_usage_map, pool_raid, pool_usage)
+from mock import patch
+
+BTRFS = '/sbin/btrfs'
+MKFS_BTRFS = '/sbin/mkfs.btrfs'
+
+
+def root_item(generation=7, flags=0, uuid_=None, parent_uuid=None):
+    item = bytearray(btrfs_ioctl.ROOT_ITEM_SIZE)
+    struct.pack_into('=Q', item, 160, generation)
+    struct.pack_into('=Q', item, 208, flags)
+    struct.pack_into('=16s16s16s', item, 247,
+                     uuid_ or uuid.uuid4().bytes,
+                     parent_uuid or b'\0' * 16, b'\0' * 16)
+    return bytes(item)
+
+
+def root_ref(name, dirid=256):
+    return struct.pack('=2QH', dirid, 0, len(name)) + name
+
+
+class FakeKernel(object):
+    """
+    Minimal stand in for the btrfs ioctl interface. Trees are lists of
+    ((objectid, type, offset), data) and at most max_items are returned per
+    tree search so that search key advancing is exercised.
+    """
+
+    def __init__(self, trees, dirs=None, max_items=2):
+        self.trees = trees
+        self.dirs = dirs or {}
+        self.max_items = max_items
+
+    def ioctl(self, fd, request, buf, mutate):
+        if request == btrfs_ioctl.BTRFS_IOC_TREE_SEARCH:
+            return self.tree_search(buf)
+        if request == btrfs_ioctl.BTRFS_IOC_INO_LOOKUP:
+            treeid, objectid = struct.unpack_from('=2Q', buf, 0)
+            path = self.dirs.get((treeid, objectid), '')
+            for i, c in enumerate(path):
+                buf[16 + i] = ord(c)
+            return 0
+        raise IOError(errno.ENOTTY, 'unexpected ioctl')
+
+    def tree_search(self, buf):
+        key = btrfs_ioctl.SEARCH_KEY.unpack_from(buf, 0)
+        tree_id = key[0]
+        if tree_id not in self.trees:
+            raise IOError(errno.ENOENT, 'No such file or directory')
+        min_key = (key[1], key[7], key[3])
+        max_key = (key[2], key[8], key[4])
+        pos = btrfs_ioctl.SEARCH_KEY.size
+        nr_items = 0
+        for item_key, data in sorted(self.trees[tree_id]):
+            if not (min_key <= item_key <= max_key):
+                continue
+            if nr_items == self.max_items:
+                break
+            btrfs_ioctl.SEARCH_HEADER.pack_into(buf, pos, 1, item_key[0],
+                                                item_key[2], item_key[1],
+                                                len(data))
+            pos += btrfs_ioctl.SEARCH_HEADER.size
+            for i, c in enumerate(bytearray(data)):
+                buf[pos + i] = c
+            pos += len(data)
+            nr_items += 1
+        struct.pack_into('=L', buf, 64, nr_items)
+        return 0
+
+
+class BTRFSIoctlTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_btrfs_ioctl*
+    """
+    def setUp(self):
+        self.patch_open = patch('fs.btrfs_ioctl.os.open', return_value=99)
+        self.patch_open.start()
+        self.patch_close = patch('fs.btrfs_ioctl.os.close')
+        self.patch_close.start()
+        share_uuid = uuid.uuid4().bytes
+        snap_uuid = uuid.uuid4().bytes
+        # pool with:
+        # share1 (257), share1/nested (258), .snapshots/share1/snap1 (259,
+        # ro snapshot of share1), .snapshots/share1/snap2 (260, rw snapshot
+        # of snap1), clone1 (261, rw snapshot directly under the pool).
+        # .snapshots and .snapshots/share1 are directories in the top level.
+        root_tree = [
+            ((257, 132, 0), root_item(uuid_=share_uuid)),
+            ((257, 144, 5), root_ref(b'share1')),
+            ((258, 132, 0), root_item()),
+            ((258, 144, 257), root_ref(b'nested')),
+            ((259, 132, 10), root_item(flags=1, uuid_=snap_uuid,
+                                       parent_uuid=share_uuid)),
+            ((259, 144, 5), root_ref(b'snap1', dirid=300)),
+            ((260, 132, 11), root_item(parent_uuid=snap_uuid)),
+            ((260, 144, 5), root_ref(b'snap2', dirid=300)),
+            ((261, 132, 12), root_item(parent_uuid=share_uuid)),
+            ((261, 144, 5), root_ref(b'clone1')),
+            # deleted subvolume awaiting cleanup has no back reference.
+            ((262, 132, 0), root_item()),
+        ]
+        quota_tree = [
+            ((0, 240, 0), struct.pack('=4Q', 1, 9, 1, 0)),
+            ((0, 242, 5), struct.pack('=5Q', 9, 16384, 16384, 16384, 16384)),
+            ((0, 242, 257), struct.pack('=5Q', 9, 1048576, 1048576, 4096,
+                                        4096)),
+            ((0, 242, (2015 << 48) | 3),
+             struct.pack('=5Q', 9, 2097152, 2097152, 2097152, 2097152)),
+            ((0, 244, 257), struct.pack('=5Q', 0, 0, 0, 0, 0)),
+            ((257, 246, (2015 << 48) | 3), b''),
+        ]
+        self.kernel = FakeKernel({1: root_tree, 8: quota_tree},
+                                 dirs={(5, 300): '.snapshots/share1/'})
+        self.patch_ioctl = patch('fs.btrfs_ioctl.fcntl.ioctl',
+                                 side_effect=self.kernel.ioctl)
+        self.patch_ioctl.start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_subvol_list(self):
+        subvols = subvol_list('/mnt2/test-pool')
+        self.assertEqual([sv['id'] for sv in subvols],
+                         [257, 258, 259, 260, 261])
+        paths = dict((sv['id'], sv['path']) for sv in subvols)
+        self.assertEqual(paths, {257: 'share1', 258: 'share1/nested',
+                                 259: '.snapshots/share1/snap1',
+                                 260: '.snapshots/share1/snap2',
+                                 261: 'clone1'})
+        by_id = dict((sv['id'], sv) for sv in subvols)
+        self.assertFalse(by_id[257]['snapshot'])
+        self.assertTrue(by_id[259]['snapshot'])
+        self.assertTrue(by_id[259]['readonly'])
+        self.assertFalse(by_id[260]['readonly'])
+        self.assertEqual(by_id[258]['parent'], 257)
+        self.assertEqual(by_id[259]['parent_uuid'], by_id[257]['uuid'])
+        self.assertEqual(by_id[257]['parent_uuid'], '-')
+        self.assertEqual(by_id[257]['gen'], 7)
+
+    def test_shares_and_snaps_info(self):
+        subvols = subvol_list('/mnt2/test-pool')
+        self.assertEqual(shares_info_ioctl(subvols),
+                         {'share1': '0/257', 'clone1': '0/261'})
+        self.assertEqual(snaps_info_ioctl(subvols, 'share1'),
+                         {'snap1': ('0/259', False),
+                          'snap2': ('0/260', True)})
+        self.assertEqual(snaps_info_ioctl(subvols, 'no-such-share'), {})
+
+    def test_qgroups(self):
+        self.assertEqual(qgroup_list('/mnt2/test-pool'),
+                         {'0/5': (16384, 16384), '0/257': (1048576, 4096),
+                          '2015/3': (2097152, 2097152)})
+        status = quota_status('/mnt2/test-pool')
+        self.assertTrue(status['enabled'])
+        self.assertFalse(status['rescan'])
+        self.assertEqual(qgroupid_str((2015 << 48) | 12), '2015/12')
+        # quotas disabled, ie no quota tree.
+        del self.kernel.trees[8]
+        self.assertEqual(qgroup_list('/mnt2/test-pool'), {})
+        self.assertFalse(quota_status('/mnt2/test-pool')['enabled'])
+
+    def test_failures_raise_ioctl_exception(self):
+        self.patch_ioctl.stop()
+        patch('fs.btrfs_ioctl.fcntl.ioctl',
+              side_effect=IOError(errno.ENOTTY, 'not btrfs')).start()
+        self.assertRaises(IoctlException, subvol_list, '/mnt2/test-pool')
+        self.assertRaises(IoctlException, space_info, '/mnt2/test-pool')
+
+
+def loop_btrfs_available():
+    if os.geteuid() != 0 or not os.path.exists(MKFS_BTRFS):
+        return False
+    with open('/proc/filesystems') as pfo:
+        return 'btrfs' in pfo.read()
+
+
+@unittest.skipUnless(loop_btrfs_available(),
+                     'requires root, btrfs-progs and btrfs kernel support')
+class BTRFSIoctlLoopTests(unittest.TestCase):
+    """
+    Compares the ioctl backend with the btrfs command parsers against a real
+    btrfs filesystem on a loopback mounted image file.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.img = os.path.join(cls.tmp, 'btrfs.img')
+        cls.mnt = os.path.join(cls.tmp, 'test-pool')
+        os.mkdir(cls.mnt)
+        with open(cls.img, 'wb') as ifo:
+            ifo.truncate(256 * 1024 * 1024)
+        cmds = [[MKFS_BTRFS, '-f', cls.img],
+                ['mount', '-o', 'loop', cls.img, cls.mnt],
+                [BTRFS, 'quota', 'enable', cls.mnt],
+                [BTRFS, 'subvolume', 'create', '%s/share1' % cls.mnt],
+                [BTRFS, 'subvolume', 'create', '%s/share1/nested' % cls.mnt],
+                ['mkdir', '-p', '%s/.snapshots/share1' % cls.mnt],
+                [BTRFS, 'subvolume', 'snapshot', '-r', '%s/share1' % cls.mnt,
+                 '%s/.snapshots/share1/snap1' % cls.mnt],
+                [BTRFS, 'subvolume', 'snapshot', '%s/share1' % cls.mnt,
+                 '%s/clone1' % cls.mnt],
+                [BTRFS, 'qgroup', 'create', '2015/1', cls.mnt],
+                ['sync'], ]
+        for cmd in cmds:
+            subprocess.check_call(cmd)
+
+    @classmethod
+    def tearDownClass(cls):
+        subprocess.call(['umount', cls.mnt])
+        shutil.rmtree(cls.tmp)
+
+    def setUp(self):
+        patch('fs.btrfs.mount_root', return_value=self.mnt).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def both(self, func, *args):
+        native = func(*args)
+        with patch('fs.btrfs.USE_IOCTL', False):
+            return native, func(*args)
+
+    def test_shares_and_snaps(self):
+        pool = type('Pool', (object, ), {'name': 'test-pool'})()
+        native, cli = self.both(shares_info, pool)
+        self.assertEqual(native, cli)
+        self.assertEqual(sorted(native.keys()), ['clone1', 'share1'])
+        native, cli = self.both(snaps_info, self.mnt, 'share1')
+        self.assertEqual(native, cli)
+        self.assertEqual(native.keys(), ['snap1'])
+
+    def test_usage_and_raid(self):
+        pool = type('Pool', (object, ), {'name': 'test-pool'})()
+        native, cli = self.both(volume_usage_map, pool)
+        self.assertEqual(native, cli)
+        self.assertTrue('2015/1' in native)
+        native, cli = self.both(pool_raid, self.mnt)
+        self.assertEqual(native, cli)
+        native, cli = self.both(pool_usage, self.mnt)
+        self.assertEqual(native, cli)
@@ -0,0 +1,125 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import shutil
+import tempfile
+import unittest
+from mock import patch
+from fs.quota_rescan import (request_rescan, rescan_check, rescan_state,
+                             recover_rescan, DEBOUNCE, POLL_INTERVAL,
+                             LOST_AFTER)
+from system.exceptions import CommandException
+
+MNT_PT = '/mnt2/test-pool'
+
+
+class QuotaRescanTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_quota_rescan*
+    """
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        patch('fs.quota_rescan.STATE_DIR', self.tmp).start()
+        self.now = 1000.0
+        patch('fs.quota_rescan.time.time',
+              side_effect=lambda: self.now).start()
+        self.schedule = patch('fs.quota_rescan._schedule').start()
+        self.running = False
+        patch('fs.quota_rescan.quota_rescan_status',
+              side_effect=lambda mnt_pt: {'running': self.running,
+                                          'progress': 42}).start()
+        self.run_command = patch('fs.quota_rescan.run_command').start()
+
+    def tearDown(self):
+        patch.stopall()
+        shutil.rmtree(self.tmp)
+
+    def check(self, at):
+        self.now = 1000.0 + at
+        self.schedule.reset_mock()
+        rescan_check(MNT_PT)
+
+    def test_coalesce(self):
+        self.assertEqual(rescan_state(MNT_PT)['state'], 'idle')
+        # a burst of requests, ie snapshots of many shares.
+        for i in range(5):
+            self.now = 1000.0 + i
+            request_rescan(MNT_PT)
+        self.schedule.assert_called_once_with(DEBOUNCE, MNT_PT)
+        self.assertTrue(rescan_state(MNT_PT)['stale'])
+        # the first check is within DEBOUNCE of the last request.
+        self.check(DEBOUNCE)
+        self.schedule.assert_called_once_with(4, MNT_PT)
+        self.assertEqual(self.run_command.call_count, 0)
+        self.check(DEBOUNCE + 4)
+        self.assertEqual(self.run_command.call_count, 1)
+        self.schedule.assert_called_once_with(POLL_INTERVAL, MNT_PT)
+        self.assertEqual(rescan_state(MNT_PT)['state'], 'running')
+        # a request while running is left to the scheduled check.
+        self.running = True
+        self.now = 1070.0
+        self.schedule.reset_mock()
+        request_rescan(MNT_PT)
+        self.assertEqual(self.schedule.call_count, 0)
+        self.check(94)
+        self.assertEqual(rescan_state(MNT_PT)['progress'], 42)
+        self.assertEqual(self.run_command.call_count, 1)
+        # done, and one more rescan covers the request made meanwhile.
+        self.running = False
+        self.check(124 + DEBOUNCE)
+        self.assertEqual(self.run_command.call_count, 2)
+        self.check(154 + DEBOUNCE)
+        self.assertEqual(self.schedule.call_count, 0)
+        state = rescan_state(MNT_PT)
+        self.assertEqual((state['state'], state['stale']), ('idle', False))
+        self.assertEqual(state['finished'], 1154.0 + DEBOUNCE)
+
+    def test_in_progress_and_lost_checks(self):
+        request_rescan(MNT_PT)
+        self.run_command.side_effect = CommandException(
+            ['btrfs'], [''],
+            ['ERROR: quota rescan failed: Operation now in progress'], 1)
+        self.check(DEBOUNCE)
+        self.assertEqual(rescan_state(MNT_PT)['state'], 'running')
+        # the scheduled check never runs, a later request reschedules.
+        self.now += DEBOUNCE + LOST_AFTER
+        self.schedule.reset_mock()
+        request_rescan(MNT_PT)
+        self.assertEqual(self.schedule.call_count, 1)
+
+    def test_lost_check_recovered(self):
+        request_rescan(MNT_PT)
+        self.check(DEBOUNCE)
+        self.assertEqual(rescan_state(MNT_PT)['state'], 'running')
+        self.schedule.reset_mock()
+        self.assertFalse(recover_rescan(MNT_PT))
+        # ztaskd restarted and the scheduled check was lost. Reading the
+        # state doesn't reschedule it, recovery does, once.
+        self.now += POLL_INTERVAL + LOST_AFTER + 1
+        self.assertTrue(rescan_state(MNT_PT)['stale'])
+        self.assertEqual(self.schedule.call_count, 0)
+        self.assertTrue(recover_rescan(MNT_PT))
+        self.schedule.assert_called_once_with(0, MNT_PT)
+        self.assertFalse(recover_rescan(MNT_PT))
+        self.assertEqual(self.schedule.call_count, 1)
+        # the check finds the rescan done.
+        self.check(self.now - 1000.0)
+        state = rescan_state(MNT_PT)
+        self.assertEqual((state['state'], state['stale']), ('idle', False))
@@ -54,7 +54,7 @@ def main():
             aw = APIWrapper()
             time.sleep(2)
             aw.api_call('network')
-            aw.api_call('commands/bootstrap', calltype='post')
+            timings = aw.api_call('commands/bootstrap', calltype='post')
             break
         except Exception as e:
             # Retry on every exception, primarily because of django-oauth
@@ -69,7 +69,7 @@ def main():
                   'wait 2 seconds and try again. Exception: %s' % e.__str__())
             time.sleep(2)
             num_attempts += 1
-    print('Bootstrapping complete')
+    print('Bootstrapping complete. Phase timings(seconds): %s' % timings)
 
     try:
         print('Running qgroup cleanup. %s' % QGROUP_CLEAN)
@@ -1,31 +1,87 @@
-
 import datetime
+import time
+from django.conf import settings
 from smart_manager.models import (NFSDCallDistribution,
                                   NFSDClientDistribution,
                                   NFSDShareDistribution,
                                   NFSDShareClientDistribution,
-                                  SProbe, NFSDUidGidDistribution)
+                                  NFSDUidGidDistribution)
 from django.utils.timezone import utc
 
+# rows per INSERT statement.
+BATCH_SIZE = getattr(settings, 'SPROBE_BATCH_SIZE', 500)
+# seconds between ingestion rate log entries of each model.
+RATE_INTERVAL = 60
+
 
 def get_datetime(ts):
     return datetime.datetime.utcfromtimestamp(float(ts)).replace(tzinfo=utc)
 
 
-def process_nfsd_calls(output, rid, l):
+class IngestRate(object):
+    """
+    Rows written per model, logged every RATE_INTERVAL seconds so that a
+    probe whose writes fall behind it's output can be spotted.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.rows = 0
+        self.secs = 0.0
+        self.since = time.time()
+
+    def add(self, model, rows, secs, l):
+        self.total += rows
+        self.rows += rows
+        self.secs += secs
+        now = time.time()
+        if (now - self.since >= RATE_INTERVAL):
+            l.info('%s: ingested %d rows at %.1f rows/s, %.1f rows/s while '
+                   'writing. %d rows in total.' %
+                   (model.__name__, self.rows, self.rows / (now - self.since),
+                    self.rows / max(self.secs, 0.001), self.total))
+            self.rows = 0
+            self.secs = 0.0
+            self.since = now
+
+
+_rates = {}
+
 
-    ro = SProbe.objects.get(id=rid)
+def _save(objects, l):
+    """
+    Insert the rows of a chunk of probe output with one bulk_create per
+    model rather than a save() per row.
+    """
+    by_model = {}
+    for o in objects:
+        by_model.setdefault(o.__class__, []).append(o)
+    for model, rows in by_model.items():
+        start = time.time()
+        model.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        _rates.setdefault(model, IngestRate()).add(
+            model, len(rows), time.time() - start, l)
+    return len(objects)
+
+
+def _fields(output, num_fields, l):
     for line in output.split('\n'):
         if (line == ''):
             continue
         fields = line.split()
-        if (len(fields) < 9):
+        if (len(fields) < num_fields):
             l.info('ignoring incomplete sprobe output: %s' % repr(fields))
             continue
+        yield fields
+
+
+def process_nfsd_calls(output, rid, l):
+
+    objects = []
+    for fields in _fields(output, 9, l):
         fields[0] = get_datetime(fields[0])
-        no = None
         if (len(fields) == 10):
-            no = NFSDClientDistribution(rid=ro, ts=fields[0],
+            no = NFSDClientDistribution(rid_id=rid, ts=fields[0],
                                         ip=fields[1],
                                         num_lookup=fields[2],
                                         num_read=fields[3],
@@ -36,74 +92,61 @@ def process_nfsd_calls(output, rid, l):
                                         sum_read=fields[8],
                                         sum_write=fields[9])
         else:
-            no = NFSDCallDistribution(rid=ro, ts=fields[0],
+            no = NFSDCallDistribution(rid_id=rid, ts=fields[0],
                                       num_lookup=fields[1], num_read=fields[2],
                                       num_write=fields[3],
                                       num_create=fields[4],
                                       num_commit=fields[5],
                                       num_remove=fields[6], sum_read=fields[7],
                                       sum_write=fields[8])
-        no.save()
+        objects.append(no)
+    return _save(objects, l)
 
 
 def share_distribution(output, rid, l):
 
-    ro = SProbe.objects.get(id=rid)
-    for line in output.split('\n'):
-        if (line == ''):
-            continue
-        fields = line.split()
-        if (len(fields) < 10):
-            l.info('ignoring incomplete sprobe output: %s' % repr(fields))
-            continue
-        no = NFSDShareDistribution(rid=ro, ts=get_datetime(fields[0]),
-                                   share=fields[1], num_lookup=fields[2],
-                                   num_read=fields[3], num_write=fields[4],
-                                   num_create=fields[5], num_commit=fields[6],
-                                   num_remove=fields[7], sum_read=fields[8],
-                                   sum_write=fields[9])
-        no.save()
+    objects = []
+    for fields in _fields(output, 10, l):
+        objects.append(
+            NFSDShareDistribution(rid_id=rid, ts=get_datetime(fields[0]),
+                                  share=fields[1], num_lookup=fields[2],
+                                  num_read=fields[3], num_write=fields[4],
+                                  num_create=fields[5], num_commit=fields[6],
+                                  num_remove=fields[7], sum_read=fields[8],
+                                  sum_write=fields[9]))
+    return _save(objects, l)
 
 
 def share_client_distribution(output, rid, l):
 
-    ro = SProbe.objects.get(id=rid)
-    for line in output.split('\n'):
-        if (line == ''):
-            continue
-        fields = line.split()
-        if (len(fields) < 11):
-            l.info('ignoring incomplete sprobe output: %s' % repr(fields))
-            continue
-        no = NFSDShareClientDistribution(rid=ro, ts=get_datetime(fields[0]),
-                                         share=fields[1], client=fields[2],
-                                         num_lookup=fields[3],
-                                         num_read=fields[4],
-                                         num_write=fields[5],
-                                         num_create=fields[6],
-                                         num_commit=fields[7],
-                                         num_remove=fields[8],
-                                         sum_read=fields[9],
-                                         sum_write=fields[10])
-        no.save()
+    objects = []
+    for fields in _fields(output, 11, l):
+        objects.append(
+            NFSDShareClientDistribution(rid_id=rid,
+                                        ts=get_datetime(fields[0]),
+                                        share=fields[1], client=fields[2],
+                                        num_lookup=fields[3],
+                                        num_read=fields[4],
+                                        num_write=fields[5],
+                                        num_create=fields[6],
+                                        num_commit=fields[7],
+                                        num_remove=fields[8],
+                                        sum_read=fields[9],
+                                        sum_write=fields[10]))
+    return _save(objects, l)
 
 
 def nfs_uid_gid_distribution(output, rid, l):
 
-    ro = SProbe.objects.get(id=rid)
-    for line in output.split('\n'):
-        if (line == ''):
-            continue
-        fields = line.split()
-        if (len(fields) < 13):
-            l.info('ignoring incomplete sprobe output: %s' % repr(fields))
-            continue
-        no = NFSDUidGidDistribution(rid=ro, ts=get_datetime(fields[0]),
-                                    share=fields[1], client=fields[2],
-                                    uid=fields[3], gid=fields[4],
-                                    num_lookup=fields[5], num_read=fields[6],
-                                    num_write=fields[7], num_create=fields[8],
-                                    num_commit=fields[9],
-                                    num_remove=fields[10], sum_read=fields[11],
-                                    sum_write=fields[12])
-        no.save()
+    objects = []
+    for fields in _fields(output, 13, l):
+        objects.append(
+            NFSDUidGidDistribution(rid_id=rid, ts=get_datetime(fields[0]),
+                                   share=fields[1], client=fields[2],
+                                   uid=fields[3], gid=fields[4],
+                                   num_lookup=fields[5], num_read=fields[6],
+                                   num_write=fields[7], num_create=fields[8],
+                                   num_commit=fields[9],
+                                   num_remove=fields[10], sum_read=fields[11],
+                                   sum_write=fields[12]))
+    return _save(objects, l)
@@ -44,7 +44,9 @@ from datetime import (datetime, timedelta)  # noqa E402
 import time  # noqa E402
 from django.utils.timezone import utc  # noqa E402
 from storageadmin.models import Disk  # noqa E402
-from smart_manager.models import Service  # noqa E402
+from smart_manager.models import (Service, CPUMetric, DiskStat,  # noqa E402
+                                  NetStat, MemInfo, LoadAvg, PoolUsage)
+from smart_manager.metric_store import MetricStore  # noqa E402
 from system.services import service_status  # noqa E402
 from cli.api_wrapper import APIWrapper  # noqa E402
 from system.pkg_mgmt import (update_check, yum_check)  # noqa E402
@@ -541,249 +543,463 @@ class LogManagerNamespace(RockstorIO):
         self.spawn(file_size, sid, logfile)
 
 
-class DisksWidgetNamespace(RockstorIO):
+class SamplerNamespace(RockstorIO):
+    """
+    Base class for widget namespaces whose data is the same for every
+    connected client. Rather than a sampling greenlet per connection, a single
+    sampler greenlet per namespace reads it's source once per interval,
+    computes any deltas once, and emits the result to all subscribers via a
+    shared room. The sampler is started by the first subscriber and stopped
+    when the last one disconnects, unless the namespace records it's samples
+    or is a background one, in which case it runs for the life of the data
+    collector.
+    """
+    room = 'subscribers'
+    # seconds between samples.
+    interval = 1
+    # number of samples between refreshes of db derived state, ie the names
+    # of the disks or network interfaces we report on.
+    refresh_interval = 30
+    # (model, series key field) samples are recorded to, if any.
+    metric = None
+    # sample without subscribers, ie for samples saved by sample() itself.
+    background = False
 
-    switch = False
-    byid_disk_map = {}
+    def __init__(self, *args, **kwargs):
+
+        super(SamplerNamespace, self).__init__(*args, **kwargs)
+        self.subscribers = set()
+        self.sampler = None
+        self.store = None
+        if self.metric is not None:
+            self.store = MetricStore(*self.metric)
+
+    @property
+    def persistent(self):
+
+        return self.background or self.store is not None
+
+    def start(self):
+
+        if self.sampler is None:
+            self.sampler = gevent.spawn(self.run_sampler)
 
     def on_connect(self, sid, environ):
 
-        self.byid_disk_map = get_byid_name_map()
-        self.switch = True
-        self.spawn(self.send_top_disks, sid)
+        self.enter_room(sid, self.room)
+        self.subscribers.add(sid)
+        self.start()
 
     def on_disconnect(self, sid):
 
+        self.subscribers.discard(sid)
         self.cleanup(sid)
-        self.switch = False
-
-    def send_top_disks(self):
-
-        def disk_stats(prev_stats):
-
-            disks_stats = []
-            # invoke body of disk_stats with empty cur_stats
-            stats_file_path = '/proc/diskstats'
-            cur_stats = {}
-            interval = 1
-            # Build a list of our db's disk names, now in by-id type format.
-            disks = [d.name for d in Disk.objects.all()]
-            # /proc/diskstats has lines of the following form:
-            #  8      64 sde 1034 0 9136 702 0 0 0 0 0 548 702
-            #  8      65 sde1 336 0 2688 223 0 0 0 0 0 223 223
-            with open(stats_file_path) as stats_file:
-                for line in stats_file.readlines():
-                    fields = line.split()
-                    # As the /proc/diskstats lines contain transient type names
-                    # we need to convert those to our by-id db names.
-                    byid_name = self.byid_disk_map[fields[2]]
-                    if byid_name not in disks:
-                        # the disk name in this line is not one in our db so
-                        # ignore it and move to the next line.
-                        continue
-                    cur_stats[byid_name] = fields[3:]
-            for disk in cur_stats.keys():
-                if (disk in prev_stats):
-                    prev = prev_stats[disk]
-                    cur = cur_stats[disk]
-                    data = []
-                    for i in range(0, len(prev)):
-                        if (i == 8):
-                            avg_ios = (float(cur[i]) + float(prev[i]))/2
-                            data.append(avg_ios)
-                            continue
-                        datum = None
-                        if (cur[i] < prev[i]):
-                            datum = float(cur[i])/interval
-                        else:
-                            datum = (float(cur[i]) - float(prev[i]))/interval
-                        data.append(datum)
-                    disks_stats.append({
-                        'name': disk,
-                        'reads_completed': data[0],
-                        'reads_merged': data[1],
-                        'sectors_read': data[2],
-                        'ms_reading': data[3],
-                        'writes_completed': data[4],
-                        'writes_merged': data[5],
-                        'sectors_written': data[6],
-                        'ms_writing': data[7],
-                        'ios_progress': data[8],
-                        'ms_ios': data[9],
-                        'weighted_ios': data[10],
-                        'ts': str(datetime.utcnow().replace(tzinfo=utc).isoformat())  # noqa E501
-                        })
-
-            self.emit('top_disks',
-                      {
-                          'key': 'diskWidget:top_disks',
-                          'data': disks_stats
-                      })
-            return cur_stats
+        if (not self.subscribers and not self.persistent and
+                self.sampler is not None):
+            gevent.kill(self.sampler)
+            self.sampler = None
 
-        def get_stats():
-            cur_disk_stats = {}
-            while self.switch:
-                cur_disk_stats = disk_stats(cur_disk_stats)
-                gevent.sleep(1)
-        # Kick things off
-        get_stats()
+    def broadcast(self, event, data):
 
+        if self.subscribers:
+            self.emit(event, data, room=self.room)
 
-class CPUWidgetNamespace(RockstorIO):
+    def record(self, rows):
 
-    send_cpu = False
+        if self.store is not None:
+            self.store.add(rows)
 
-    def on_connect(self, sid, environ):
+    def run_sampler(self):
 
-        # Switch for emitting cpu data
-        self.send_cpu = True
-        self.spawn(self.send_cpu_data, sid)
+        prev_stats = None
+        count = 0
+        while self.subscribers or self.persistent:
+            try:
+                if count % self.refresh_interval == 0:
+                    self.refresh()
+                prev_stats = self.sample(prev_stats)
+            except Exception as e:
+                logger.error('Exception in %s sampler: %s' %
+                             (self.__class__.__name__, e.__str__()))
+                prev_stats = None
+            count += 1
+            gevent.sleep(self.interval)
+
+    def refresh(self):
+        """
+        Refresh any (slow changing) state used by sample().
+        """
+        pass
+
+    def sample(self, prev_stats):
+        """
+        Read the source once, broadcast the result and return the state
+        required by the next call to compute deltas. Subclasses override
+        this, the base samples nothing.
+        """
+        return prev_stats
+
+
+class DisksWidgetNamespace(SamplerNamespace):
+
+    metric = (DiskStat, 'name')
+    byid_disk_map = {}
+    disks = []
 
-    def on_disconnect(self, sid):
+    def refresh(self):
 
-        self.cleanup(sid)
-        self.send_cpu = False
-
-    def send_cpu_data(self):
-
-        while self.send_cpu:
-            cpu_stats = {}
-            cpu_stats['results'] = []
-            vals = psutil.cpu_times_percent(percpu=True)
-            ts = datetime.utcnow().replace(tzinfo=utc).isoformat()
-            for i, val in enumerate(vals):
-                name = 'cpu%d' % i
-                cpu_stats['results'].append({
-                    'name': name, 'umode': val.user,
-                    'umode_nice': val.nice, 'smode': val.system,
-                    'idle': val.idle, 'ts': str(ts)
-                })
-            self.emit('cpudata', {
-                'key': 'cpuWidget:cpudata', 'data': cpu_stats
+        self.byid_disk_map = get_byid_name_map()
+        # Build a list of our db's disk names, now in by-id type format.
+        self.disks = [d.name for d in Disk.objects.all()]
+
+    def sample(self, prev_stats):
+
+        if prev_stats is None:
+            prev_stats = {}
+        disks_stats = []
+        # invoke body of disk_stats with empty cur_stats
+        stats_file_path = '/proc/diskstats'
+        cur_stats = {}
+        interval = self.interval
+        # /proc/diskstats has lines of the following form:
+        #  8      64 sde 1034 0 9136 702 0 0 0 0 0 548 702
+        #  8      65 sde1 336 0 2688 223 0 0 0 0 0 223 223
+        with open(stats_file_path) as stats_file:
+            for line in stats_file.readlines():
+                fields = line.split()
+                # As the /proc/diskstats lines contain transient type names
+                # we need to convert those to our by-id db names.
+                byid_name = self.byid_disk_map.get(fields[2])
+                if byid_name not in self.disks:
+                    # the disk name in this line is not one in our db so
+                    # ignore it and move to the next line.
+                    continue
+                cur_stats[byid_name] = fields[3:]
+        for disk in cur_stats.keys():
+            if (disk in prev_stats):
+                prev = prev_stats[disk]
+                cur = cur_stats[disk]
+                data = []
+                for i in range(0, len(prev)):
+                    if (i == 8):
+                        avg_ios = (float(cur[i]) + float(prev[i]))/2
+                        data.append(avg_ios)
+                        continue
+                    datum = None
+                    if (cur[i] < prev[i]):
+                        datum = float(cur[i])/interval
+                    else:
+                        datum = (float(cur[i]) - float(prev[i]))/interval
+                    data.append(datum)
+                disks_stats.append({
+                    'name': disk,
+                    'reads_completed': data[0],
+                    'reads_merged': data[1],
+                    'sectors_read': data[2],
+                    'ms_reading': data[3],
+                    'writes_completed': data[4],
+                    'writes_merged': data[5],
+                    'sectors_written': data[6],
+                    'ms_writing': data[7],
+                    'ios_progress': data[8],
+                    'ms_ios': data[9],
+                    'weighted_ios': data[10],
+                    'ts': str(datetime.utcnow().replace(tzinfo=utc).isoformat())  # noqa E501
+                    })
+
+        self.record(disks_stats)
+        self.broadcast('top_disks',
+                       {
+                           'key': 'diskWidget:top_disks',
+                           'data': disks_stats
+                       })
+        return cur_stats
+
+
+class CPUWidgetNamespace(SamplerNamespace):
+
+    metric = (CPUMetric, 'name')
+
+    def sample(self, prev_stats):
+
+        cpu_stats = {}
+        cpu_stats['results'] = []
+        # Percentages are relative to the previous call, which with a single
+        # sampler is the previous sample.
+        vals = psutil.cpu_times_percent(percpu=True)
+        ts = datetime.utcnow().replace(tzinfo=utc).isoformat()
+        for i, val in enumerate(vals):
+            name = 'cpu%d' % i
+            cpu_stats['results'].append({
+                'name': name, 'umode': val.user,
+                'umode_nice': val.nice, 'smode': val.system,
+                'idle': val.idle, 'ts': str(ts)
             })
-            gevent.sleep(1)
+        self.record(cpu_stats['results'])
+        self.broadcast('cpudata', {
+            'key': 'cpuWidget:cpudata', 'data': cpu_stats
+        })
 
 
-class NetworkWidgetNamespace(RockstorIO):
+class NetworkWidgetNamespace(SamplerNamespace):
 
-    send = False
+    metric = (NetStat, 'device')
+    interfaces = []
 
-    def on_connect(self, sid, environ):
+    def refresh(self):
 
-        self.send = True
-        self.spawn(self.network_stats, sid)
+        from storageadmin.models import NetworkDevice
+        self.interfaces = [i.name for i in NetworkDevice.objects.all()]
+
+    def sample(self, prev_stats):
+
+        interval = self.interval
+        cur_stats = {}
+        with open('/proc/net/dev') as sfo:
+            sfo.readline()
+            sfo.readline()
+            for l in sfo.readlines():
+                fields = l.split()
+                if (fields[0][:-1] not in self.interfaces):
+                    continue
+                cur_stats[fields[0][:-1]] = fields[1:]
+        ts = datetime.utcnow().replace(tzinfo=utc).isoformat()
+        if (isinstance(prev_stats, dict)):
+            results = []
+            for interface in cur_stats.keys():
+                if (interface in prev_stats):
+                    data = map(lambda x, y: float(x)/interval if x < y else
+                               (float(x) - float(y))/interval,
+                               cur_stats[interface], prev_stats[interface])
+                    results.append({
+                        'device': interface, 'kb_rx': data[0],
+                        'packets_rx': data[1], 'errs_rx': data[2],
+                        'drop_rx': data[3], 'fifo_rx': data[4],
+                        'frame': data[5], 'compressed_rx': data[6],
+                        'multicast_rx': data[7], 'kb_tx': data[8],
+                        'packets_tx': data[9], 'errs_tx': data[10],
+                        'drop_tx': data[11], 'fifo_tx': data[12],
+                        'colls': data[13], 'carrier': data[14],
+                        'compressed_tx': data[15], 'ts': str(ts)
+                    })
+            if len(results) > 0:
+                self.record(results)
+                self.broadcast('network',
+                               {
+                                   'key': 'networkWidget:network',
+                                   'data': {'results': results}
+                               })
+        return cur_stats
+
+
+class MemoryWidgetNamespace(SamplerNamespace):
+
+    metric = (MemInfo, None)
+
+    def sample(self, prev_stats):
+
+        stats_file = '/proc/meminfo'
+        (total, free, buffers, cached, swap_total, swap_free, active,
+         inactive, dirty,) = (None,) * 9
+        with open(stats_file) as sfo:
+            for l in sfo.readlines():
+                if (re.match('MemTotal:', l) is not None):
+                    total = int(l.split()[1])
+                elif (re.match('MemFree:', l) is not None):
+                    free = int(l.split()[1])
+                elif (re.match('Buffers:', l) is not None):
+                    buffers = int(l.split()[1])
+                elif (re.match('Cached:', l) is not None):
+                    cached = int(l.split()[1])
+                elif (re.match('SwapTotal:', l) is not None):
+                    swap_total = int(l.split()[1])
+                elif (re.match('SwapFree:', l) is not None):
+                    swap_free = int(l.split()[1])
+                elif (re.match('Active:', l) is not None):
+                    active = int(l.split()[1])
+                elif (re.match('Inactive:', l) is not None):
+                    inactive = int(l.split()[1])
+                elif (re.match('Dirty:', l) is not None):
+                    dirty = int(l.split()[1])
+                    break  # no need to look at lines after dirty.
+        ts = datetime.utcnow().replace(tzinfo=utc).isoformat()
+        results = [{
+            'total': total, 'free': free, 'buffers': buffers,
+            'cached': cached, 'swap_total': swap_total,
+            'swap_free': swap_free, 'active': active,
+            'inactive': inactive, 'dirty': dirty, 'ts': str(ts)
+        }]
+        self.record(results)
+        self.broadcast('memory', {
+            'key': 'memoryWidget:memory', 'data': {'results': results}
+        })
 
-    def on_disconnect(self, sid):
 
-        self.cleanup(sid)
-        self.send = False
+class LoadAvgNamespace(SamplerNamespace):
+
+    metric = (LoadAvg, None)
+
+    def sample(self, prev_stats):
+
+        # /proc/loadavg is of the form: 0.25 0.13 0.09 1/325 5212
+        with open('/proc/loadavg') as lfo:
+            fields = lfo.readline().split()
+        with open('/proc/uptime') as ufo:
+            idle_seconds = int(float(ufo.readline().split()[1]))
+        active_threads, total_threads = fields[3].split('/')
+        ts = datetime.utcnow().replace(tzinfo=utc).isoformat()
+        results = [{
+            'load_1': float(fields[0]), 'load_5': float(fields[1]),
+            'load_15': float(fields[2]),
+            'active_threads': int(active_threads),
+            'total_threads': int(total_threads),
+            'latest_pid': int(fields[4]), 'idle_seconds': idle_seconds,
+            'ts': str(ts)
+        }]
+        self.record(results)
+        self.broadcast('loadavg', {
+            'key': 'loadAvgWidget:loadavg', 'data': {'results': results}
+        })
 
-    def network_stats(self):
 
-        from storageadmin.models import NetworkDevice
+class PoolUsageNamespace(SamplerNamespace):
 
-        def retrieve_network_stats(prev_stats):
-
-            interfaces = [i.name for i in NetworkDevice.objects.all()]
-            interval = 1
-            cur_stats = {}
-            with open('/proc/net/dev') as sfo:
-                sfo.readline()
-                sfo.readline()
-                for l in sfo.readlines():
-                    fields = l.split()
-                    if (fields[0][:-1] not in interfaces):
-                        continue
-                    cur_stats[fields[0][:-1]] = fields[1:]
-            ts = datetime.utcnow().replace(tzinfo=utc).isoformat()
-            if (isinstance(prev_stats, dict)):
-                results = []
-                for interface in cur_stats.keys():
-                    if (interface in prev_stats):
-                        data = map(lambda x, y: float(x)/interval if x < y else
-                                   (float(x) - float(y))/interval,
-                                   cur_stats[interface], prev_stats[interface])
-                        results.append({
-                            'device': interface, 'kb_rx': data[0],
-                            'packets_rx': data[1], 'errs_rx': data[2],
-                            'drop_rx': data[3], 'fifo_rx': data[4],
-                            'frame': data[5], 'compressed_rx': data[6],
-                            'multicast_rx': data[7], 'kb_tx': data[8],
-                            'packets_tx': data[9], 'errs_tx': data[10],
-                            'drop_tx': data[11], 'fifo_tx': data[12],
-                            'colls': data[13], 'carrier': data[14],
-                            'compressed_tx': data[15], 'ts': str(ts)
-                        })
-                if len(results) > 0:
-                    self.emit('network',
-                              {
-                                  'key': 'networkWidget:network',
-                                  'data': {'results': results}
-                              })
-            return cur_stats
-
-        def send_network_stats():
-
-            cur_stats = {}
-            while self.send:
-                cur_stats = retrieve_network_stats(cur_stats)
-                gevent.sleep(1)
-        send_network_stats()
-
-
-class MemoryWidgetNamespace(RockstorIO):
-
-    switch = False
+    metric = (PoolUsage, 'pool')
+    interval = 60
+    refresh_interval = 1
+
+    pools = []
+
+    def refresh(self):
+
+        from storageadmin.models import Pool
+        self.pools = list(Pool.objects.all())
+
+    def sample(self, prev_stats):
+
+        from fs.quota_rescan import recover_rescan
+        ts = datetime.utcnow().replace(tzinfo=utc).isoformat()
+        results = []
+        for pool in self.pools:
+            if not pool.is_mounted:
+                continue
+            results.append({'pool': pool.name, 'free': pool.free,
+                            'reclaimable': pool.reclaimable, 'ts': str(ts)})
+            try:
+                recover_rescan('%s%s' % (settings.MNT_PT, pool.name))
+            except Exception as e:
+                logger.error('Failed to check the quota rescan of pool(%s): '
+                             '%s' % (pool.name, e.__str__()))
+        self.record(results)
+        self.broadcast('pool_usage', {
+            'key': 'poolUsageWidget:pool_usage', 'data': {'results': results}
+        })
+
+
+class PoolBalanceNamespace(SamplerNamespace):
+    """
+    Progress of the pool balances in progress, pushed to subscribers rather
+    than polled from the pool balance api.
+    """
+    interval = 5
+
+    def sample(self, prev_stats):
+
+        from storageadmin.pool_balance import (active_pools, update_status)
+        from storageadmin.serializers import PoolBalanceSerializer
+        results = []
+        for pool in active_pools():
+            ps = update_status(pool)
+            data = PoolBalanceSerializer(ps).data
+            data['pool_name'] = pool.name
+            results.append(data)
+        self.broadcast('pool_balance', {
+            'key': 'poolBalance:pool_balance', 'data': {'results': results}
+        })
+
+
+class SMARTNamespace(SamplerNamespace):
+    """
+    Low priority background sampler of the SMART attributes tracked by
+    storageadmin.smart_history. smartctl is run on one disk at a time, with
+    the disks spread over half the interval, and disks in standby are
+    skipped.
+    Subscribers get the drives at risk after each round and on connect,
+    those seen in the saved history until the first round completes.
+    """
+    interval = getattr(settings, 'SMART_SAMPLE_INTERVAL', 3600)
+    refresh_interval = 1
+    background = True
+
+    disks = []
+    at_risk = []
+
+    def start(self):
+
+        if self.sampler is None:
+            from storageadmin.smart_history import drives_at_risk
+            try:
+                self.at_risk = drives_at_risk()
+            except Exception as e:
+                logger.error('Failed to read the drives at risk from SMART '
+                             'history: %s' % e.__str__())
+        super(SMARTNamespace, self).start()
 
     def on_connect(self, sid, environ):
 
-        self.switch = True
-        self.spawn(self.send_meminfo_data, sid)
+        super(SMARTNamespace, self).on_connect(sid, environ)
+        self.emit('drives_at_risk', self._message(), room=sid)
 
-    def on_disconnect(self, sid):
+    def _message(self):
 
-        self.cleanup(sid)
-        self.switch = False
-
-    def send_meminfo_data(self):
-
-        while self.switch:
-            stats_file = '/proc/meminfo'
-            (total, free, buffers, cached, swap_total, swap_free, active,
-             inactive, dirty,) = (None,) * 9
-            with open(stats_file) as sfo:
-                for l in sfo.readlines():
-                    if (re.match('MemTotal:', l) is not None):
-                        total = int(l.split()[1])
-                    elif (re.match('MemFree:', l) is not None):
-                        free = int(l.split()[1])
-                    elif (re.match('Buffers:', l) is not None):
-                        buffers = int(l.split()[1])
-                    elif (re.match('Cached:', l) is not None):
-                        cached = int(l.split()[1])
-                    elif (re.match('SwapTotal:', l) is not None):
-                        swap_total = int(l.split()[1])
-                    elif (re.match('SwapFree:', l) is not None):
-                        swap_free = int(l.split()[1])
-                    elif (re.match('Active:', l) is not None):
-                        active = int(l.split()[1])
-                    elif (re.match('Inactive:', l) is not None):
-                        inactive = int(l.split()[1])
-                    elif (re.match('Dirty:', l) is not None):
-                        dirty = int(l.split()[1])
-                        break  # no need to look at lines after dirty.
-            ts = datetime.utcnow().replace(tzinfo=utc).isoformat()
-            self.emit('memory', {
-                'key': 'memoryWidget:memory', 'data': {'results': [{
-                    'total': total, 'free': free, 'buffers': buffers,
-                    'cached': cached, 'swap_total': swap_total,
-                    'swap_free': swap_free, 'active': active,
-                    'inactive': inactive, 'dirty': dirty, 'ts': str(ts)
-                    }]
-                }
-            })
-            gevent.sleep(1)
+        return {'key': 'smartWidget:drives_at_risk',
+                'data': {'results': self.at_risk}}
+
+    def refresh(self):
+
+        from storageadmin.smart_history import sample_disks
+        self.disks = list(sample_disks())
+
+    def sample(self, prev_stats):
+
+        from storageadmin.smart_history import (sample, prune,
+                                                drives_at_risk)
+        pace = float(self.interval) / 2 / max(len(self.disks), 1)
+        for i, disk in enumerate(self.disks):
+            if i > 0:
+                gevent.sleep(pace)
+            try:
+                if sample(disk) is None:
+                    logger.debug('Skipped SMART sample of disk(%s) in '
+                                 'standby' % disk.name)
+            except Exception as e:
+                logger.error('Failed to sample SMART attributes of '
+                             'disk(%s): %s' % (disk.name, e.__str__()))
+        prune()
+        self.at_risk = drives_at_risk()
+        self.broadcast('drives_at_risk', self._message())
+
+
+def record_metrics(stores):
+    """
+    Write the samples recorded by the widget namespaces in one batch per
+    model every METRIC_FLUSH_INTERVAL seconds, and drop those past their
+    retention once a minute.
+    """
+    interval = getattr(settings, 'METRIC_FLUSH_INTERVAL', 10)
+    prune_every = max(1, 60 // interval)
+    count = 0
+    while True:
+        gevent.sleep(interval)
+        count += 1
+        for store in stores:
+            try:
+                store.flush()
+                if count % prune_every == 0:
+                    store.prune()
+            except Exception as e:
+                logger.error('Failed to record %s samples: %s' %
+                             (store.model.__name__, e.__str__()))
 
 
 class ServicesNamespace(RockstorIO):
@@ -917,13 +1133,12 @@ class SysinfoNamespace(RockstorIO):
                          {'url': 'commands/refresh-snapshot-state',
                           'success': 'Snapshot state updated successfully',
                           'error': 'Failed to update snapshot state.'}, ]
-            for r in resources:
-                try:
-                    self.aw.api_call(r['url'], data=None, calltype='post',
-                                     save_error=False)
-                except Exception as e:
+            calls = [{'url': r['url'], 'calltype': 'post',
+                      'save_error': False, } for r in resources]
+            for r, res in zip(resources, self.aw.api_batch(calls)):
+                if (isinstance(res, Exception)):
                     logger.error('%s. exception: %s'
-                                 % (r['error'], e.__str__()))
+                                 % (r['error'], res.__str__()))
             gevent.sleep(60)
 
     def update_check(self):
@@ -1010,12 +1225,22 @@ def main():
         MemoryWidgetNamespace('/memory_widget'),
         NetworkWidgetNamespace('/network_widget'),
         DisksWidgetNamespace('/disk_widget'),
+        LoadAvgNamespace('/load_avg'),
+        PoolUsageNamespace('/pool_usage'),
+        PoolBalanceNamespace('/pool_balance'),
+        SMARTNamespace('/smart_widget'),
         LogManagerNamespace('/logmanager'),
         PincardManagerNamespace('/pincardmanager')
     ]
     sio_server = socketio.Server(async_mode='gevent')
+    stores = []
     for namespace in sio_namespaces:
         sio_server.register_namespace(namespace)
+        if getattr(namespace, 'store', None) is not None:
+            stores.append(namespace.store)
+        if getattr(namespace, 'persistent', False):
+            namespace.start()
+    gevent.spawn(record_metrics, stores)
     app = socketio.Middleware(sio_server)
     logger.debug('Python-socketio listening on port http://127.0.0.1:8001')
     pywsgi.WSGIServer(('', 8001), app,
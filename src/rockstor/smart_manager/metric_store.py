@@ -0,0 +1,155 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import calendar
+from datetime import (datetime, timedelta)
+from django.conf import settings
+from django.db import models
+from django.utils.timezone import utc
+
+# Time series models keep every resolution in the same table, told apart by
+# their resolution field: the seconds averaged into each row. Each tier is
+# (resolution, retention) in seconds, finest first.
+TIERS = getattr(settings, 'METRIC_TIERS',
+                ((1, 3600), (60, 7 * 24 * 3600), (3600, 365 * 24 * 3600)))
+RAW = TIERS[0][0]
+
+
+def _now():
+    return datetime.utcnow().replace(tzinfo=utc)
+
+
+def _epoch(ts):
+    return calendar.timegm(ts.utctimetuple())
+
+
+def is_tiered(model):
+    return 'resolution' in [f.name for f in model._meta.fields]
+
+
+def resolution_for(t1, now=None):
+    """
+    :param t1: aware datetime, start of a range query.
+    :return: the finest resolution whose retention still covers t1.
+    """
+    if (now is None):
+        now = _now()
+    for res, retention in TIERS:
+        if (t1 >= now - timedelta(seconds=retention)):
+            return res
+    return TIERS[-1][0]
+
+
+class MetricStore(object):
+    """
+    Write buffer for one time series model. Samples are kept in memory as
+    they are added, along with running averages for each coarser tier, and
+    written by flush() in a single bulk insert. A tier's average is written
+    once the first sample of the next minute/hour arrives.
+    """
+
+    def __init__(self, model, key=None):
+        """
+        :param model: time series model with ts and resolution fields.
+        :param key: name of the field that tells series apart, eg the disk
+        name, or None if the model holds a single series.
+        """
+        self.model = model
+        self.key = key
+        self.fields = {}
+        for f in model._meta.fields:
+            if (isinstance(f, (models.IntegerField, models.FloatField)) and
+                    f.name not in ('resolution', 'count')):
+                self.fields[f.name] = isinstance(f, models.IntegerField)
+        self.counted = 'count' in [f.name for f in model._meta.fields]
+        self.pending = []
+        # resolution: [bucket start, {key: {field: [samples, sum]}}]
+        self.buckets = dict((res, [None, {}]) for res, r in TIERS[1:])
+
+    def add(self, rows, ts=None):
+        """
+        :param rows: list of dicts, one per series. Keys that are not numeric
+        fields of the model or the key field are ignored.
+        :param ts: aware datetime of the sample, now by default.
+        """
+        if (ts is None):
+            ts = _now()
+        epoch = _epoch(ts)
+        for res, bucket in self.buckets.items():
+            start = epoch - epoch % res
+            if (bucket[0] != start):
+                self._close(res)
+                bucket[0] = start
+            for row in rows:
+                acc = bucket[1].setdefault(row.get(self.key), {})
+                for f in self.fields:
+                    if (row.get(f) is None):
+                        continue
+                    total = acc.setdefault(f, [0, 0.0])
+                    total[0] += 1
+                    total[1] += row[f]
+        for row in rows:
+            values = self._values(row)
+            self.pending.append(self.model(ts=ts, resolution=RAW, **values))
+
+    def _values(self, row):
+        values = dict((f, row[f]) for f in self.fields
+                      if row.get(f) is not None)
+        if (self.key is not None):
+            values[self.key] = row.get(self.key)
+        return values
+
+    def _close(self, res):
+        start, series = self.buckets[res]
+        if (start is None):
+            return
+        ts = datetime.utcfromtimestamp(start).replace(tzinfo=utc)
+        for key, acc in series.items():
+            row = {self.key: key}
+            for f, (n, total) in acc.items():
+                row[f] = total / n
+                if (self.fields[f]):
+                    row[f] = int(round(row[f]))
+            values = self._values(row)
+            if (self.counted):
+                values['count'] = max([n for n, t in acc.values()] or [0])
+            self.pending.append(self.model(ts=ts, resolution=res, **values))
+        series.clear()
+        self.buckets[res][0] = None
+
+    def flush(self):
+        """
+        Write all pending rows in one bulk insert. Rows are dropped if the
+        write fails so memory does not grow while the db is unavailable.
+        :return: number of rows written.
+        """
+        pending, self.pending = self.pending, []
+        if (len(pending) > 0):
+            self.model.objects.bulk_create(pending)
+        return len(pending)
+
+    def prune(self, now=None):
+        """
+        Delete rows older than the retention of their tier.
+        """
+        if (now is None):
+            now = _now()
+        for res, retention in TIERS:
+            self.model.objects.filter(
+                resolution=res,
+                ts__lt=now - timedelta(seconds=retention)).delete()
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_manager', '0002_auto_20170216_1212'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receivetrail',
+            name='kb_per_sec',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='replicatrail',
+            name='kb_per_sec',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
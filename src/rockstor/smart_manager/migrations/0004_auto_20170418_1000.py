@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_manager', '0003_auto_20170416_1100'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receivetrail',
+            name='kb_on_wire',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='replica',
+            name='compression',
+            field=models.CharField(default=b'none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='replica',
+            name='compression_level',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='replicatrail',
+            name='kb_on_wire',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
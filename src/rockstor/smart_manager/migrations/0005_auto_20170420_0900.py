@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_manager', '0004_auto_20170418_1000'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replicatrail',
+            name='kb_acked',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='replicatrail',
+            name='kb_resumed',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
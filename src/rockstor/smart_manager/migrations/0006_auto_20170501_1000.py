@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_manager', '0005_auto_20170420_0900'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cpumetric',
+            name='ts',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='loadavg',
+            name='ts',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='meminfo',
+            name='ts',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='poolusage',
+            name='ts',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AddField(
+            model_name='cpumetric',
+            name='resolution',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='diskstat',
+            name='resolution',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='loadavg',
+            name='resolution',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='meminfo',
+            name='resolution',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='netstat',
+            name='resolution',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='poolusage',
+            name='resolution',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AlterIndexTogether(
+            name='cpumetric',
+            index_together=set([('resolution', 'ts')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='diskstat',
+            index_together=set([('resolution', 'ts')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='loadavg',
+            index_together=set([('resolution', 'ts')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='meminfo',
+            index_together=set([('resolution', 'ts')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='netstat',
+            index_together=set([('resolution', 'ts')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='poolusage',
+            index_together=set([('resolution', 'ts')]),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_manager', '0006_auto_20170501_1000'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shareusage',
+            name='ts',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AddField(
+            model_name='shareusage',
+            name='resolution',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AlterIndexTogether(
+            name='shareusage',
+            index_together=set([('name', 'ts'), ('resolution', 'ts')]),
+        ),
+    ]
@@ -26,7 +26,10 @@ class CPUMetric(models.Model):
     umode_nice = models.IntegerField()
     smode = models.IntegerField()
     idle = models.IntegerField()
-    ts = models.DateTimeField(auto_now=True, db_index=True)
+    ts = models.DateTimeField(db_index=True)
+    # seconds averaged into this sample, see smart_manager.metric_store
+    resolution = models.IntegerField(default=1)
 
     class Meta:
         app_label = 'smart_manager'
+        index_together = ('resolution', 'ts')
@@ -34,6 +34,9 @@ class DiskStat(models.Model):
     ms_ios = models.FloatField()
     weighted_ios = models.FloatField()
     ts = models.DateTimeField(db_index=True)
+    # seconds averaged into this sample, see smart_manager.metric_store
+    resolution = models.IntegerField(default=1)
 
     class Meta:
         app_label = 'smart_manager'
+        index_together = ('resolution', 'ts')
@@ -28,7 +28,9 @@ class LoadAvg(models.Model):
     total_threads = models.IntegerField()
     latest_pid = models.IntegerField()
     idle_seconds = models.IntegerField()
-    ts = models.DateTimeField(auto_now=True, db_index=True)
+    ts = models.DateTimeField(db_index=True)
+    # seconds averaged into this sample, see smart_manager.metric_store
+    resolution = models.IntegerField(default=1)
 
     @property
     def uptime(self, *args, **kwargs):
@@ -37,3 +39,4 @@ class LoadAvg(models.Model):
 
     class Meta:
         app_label = 'smart_manager'
+        index_together = ('resolution', 'ts')
@@ -31,7 +31,10 @@ class MemInfo(models.Model):
     active = models.BigIntegerField(default=0)
     inactive = models.BigIntegerField(default=0)
     dirty = models.BigIntegerField(default=0)
-    ts = models.DateTimeField(auto_now=True, db_index=True)
+    ts = models.DateTimeField(db_index=True)
+    # seconds averaged into this sample, see smart_manager.metric_store
+    resolution = models.IntegerField(default=1)
 
     class Meta:
         app_label = 'smart_manager'
+        index_together = ('resolution', 'ts')
@@ -40,6 +40,9 @@ class NetStat(models.Model):
     carrier = models.BigIntegerField(default=0)
     compressed_tx = models.BigIntegerField(default=0)
     ts = models.DateTimeField(db_index=True)
+    # seconds averaged into this sample, see smart_manager.metric_store
+    resolution = models.IntegerField(default=1)
 
     class Meta:
         app_label = 'smart_manager'
+        index_together = ('resolution', 'ts')
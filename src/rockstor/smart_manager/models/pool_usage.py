@@ -24,8 +24,11 @@ class PoolUsage(models.Model):
     pool = models.CharField(max_length=4096)
     free = models.BigIntegerField(default=0)
     reclaimable = models.BigIntegerField(default=0)
-    ts = models.DateTimeField(auto_now=True, db_index=True)
+    ts = models.DateTimeField(db_index=True)
+    # seconds averaged into this sample, see smart_manager.metric_store
+    resolution = models.IntegerField(default=1)
     count = models.BigIntegerField(default=1)
 
     class Meta:
         app_label = 'smart_manager'
+        index_together = ('resolution', 'ts')
@@ -37,6 +37,9 @@ class Replica(models.Model):
     ts = models.DateTimeField(null=True, db_index=True)
     crontab = models.CharField(max_length=64, null=True)
     replication_ip = models.CharField(max_length=4096, null=True)
+    """on the wire compression of fsdata, see replication/compression.py"""
+    compression = models.CharField(max_length=10, default='none')
+    compression_level = models.IntegerField(null=True)
 
     class Meta:
         app_label = 'smart_manager'
@@ -52,6 +55,14 @@ class ReplicaTrail(models.Model):
     replica = models.ForeignKey(Replica)
     snap_name = models.CharField(max_length=1024)
     kb_sent = models.BigIntegerField(default=0)
+    """kb_sent after compression"""
+    kb_on_wire = models.BigIntegerField(default=0)
+    """checkpoint: offset(KB) into the stream acknowledged by the receiver"""
+    kb_acked = models.BigIntegerField(default=0)
+    """offset(KB) this send resumed from, 0 if it started from scratch"""
+    kb_resumed = models.BigIntegerField(default=0)
+    """average transfer rate of the send in KB/sec"""
+    kb_per_sec = models.BigIntegerField(default=0)
     snapshot_created = models.DateTimeField(null=True)
     snapshot_failed = models.DateTimeField(null=True)
     send_pending = models.DateTimeField(null=True)
@@ -97,6 +108,10 @@ class ReceiveTrail(models.Model):
     rshare = models.ForeignKey(ReplicaShare)
     snap_name = models.CharField(max_length=1024)
     kb_received = models.BigIntegerField(default=0)
+    """kb_received before decompression"""
+    kb_on_wire = models.BigIntegerField(default=0)
+    """average transfer rate of the receive in KB/sec"""
+    kb_per_sec = models.BigIntegerField(default=0)
     receive_pending = models.DateTimeField(null=True)
     receive_succeeded = models.DateTimeField(null=True)
     receive_failed = models.DateTimeField(null=True)
@@ -26,8 +26,13 @@ class ShareUsage(models.Model):
     r_usage = models.BigIntegerField(default=0)
     """exclusive usage in KB"""
     e_usage = models.BigIntegerField(default=0)
-    ts = models.DateTimeField(auto_now=True, db_index=True)
+    ts = models.DateTimeField(db_index=True)
+    """number of refreshes this usage was seen by"""
     count = models.BigIntegerField(default=1)
+    """1 for refresh samples, 86400 for daily rollups, see
+    smart_manager.usage_history"""
+    resolution = models.IntegerField(default=1)
 
     class Meta:
         app_label = 'smart_manager'
+        index_together = (('name', 'ts'), ('resolution', 'ts'))
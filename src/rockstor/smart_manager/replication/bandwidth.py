@@ -0,0 +1,74 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import multiprocessing
+import time
+
+
+class TokenBucket(object):
+    """
+    Bandwidth budget shared by all Sender processes forked after it is
+    created. State lives in shared memory, so a Sender taking tokens is seen
+    by every other Sender drawing from the same bucket.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: bytes per second. 0 means unlimited.
+        :param burst: bytes that can be taken at once after being idle.
+        Defaults to one second worth of rate.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.lock = multiprocessing.Lock()
+        self.tokens = multiprocessing.RawValue('d', self.burst)
+        self.ts = multiprocessing.RawValue('d', time.time())
+
+    @property
+    def unlimited(self):
+        return self.rate <= 0
+
+    def reserve(self, num):
+        """
+        Take num tokens, going into debt if there aren't enough. Debt is
+        paid off before anyone else gets tokens, so concurrent Senders share
+        the rate instead of starving each other.
+        :param num: number of bytes
+        :return: seconds to wait before sending num bytes
+        """
+        if (self.unlimited):
+            return 0
+        with self.lock:
+            now = time.time()
+            tokens = min(self.burst,
+                         self.tokens.value + (now - self.ts.value) * self.rate)
+            tokens -= num
+            self.tokens.value = tokens
+            self.ts.value = now
+        if (tokens >= 0):
+            return 0
+        return -tokens / self.rate
+
+
+def reserve(buckets, num):
+    """
+    :param buckets: TokenBuckets that num bytes are charged against
+    :param num: number of bytes
+    :return: seconds to wait to stay within all of the buckets
+    """
+    return max([b.reserve(num) for b in buckets] or [0])
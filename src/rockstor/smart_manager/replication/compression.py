@@ -0,0 +1,137 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import zlib
+import logging
+logger = logging.getLogger(__name__)
+
+# zstd and lz4 bindings are optional. Replicas configured with a codec that
+# is not installed on either end fall back to an uncompressed stream.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
+NONE = 'none'
+# codec -> (default level, (min level, max level))
+LEVELS = {'zlib': (6, (1, 9)),
+          'lz4': (0, (0, 16)),
+          'zstd': (3, (1, 22)), }
+CHOICES = (NONE, 'zlib', 'lz4', 'zstd', )
+
+
+def available():
+    """
+    :return: list of codec names usable on this system
+    """
+    codecs = [NONE, 'zlib', ]
+    if (lz4frame is not None):
+        codecs.append('lz4')
+    if (zstandard is not None):
+        codecs.append('zstd')
+    return codecs
+
+
+def validate(algo, level=None):
+    """
+    Check a codec and level for use on this system.
+    :param algo: one of CHOICES
+    :param level: compression level or None for the codec's default
+    :return: (algo, level) with level None for no compression
+    """
+    if (algo not in CHOICES):
+        raise Exception('Unknown compression(%s). Valid choices are: %s' %
+                        (algo, ', '.join(CHOICES)))
+    if (algo not in available()):
+        raise Exception('Compression(%s) is not available on this system.'
+                        % algo)
+    if (algo == NONE):
+        return algo, None
+    default, (low, high) = LEVELS[algo]
+    if (level is None):
+        return algo, default
+    try:
+        level = int(level)
+    except (TypeError, ValueError):
+        level = low - 1
+    if (level < low or level > high):
+        raise Exception('Compression level for %s must be between %d and %d'
+                        % (algo, low, high))
+    return algo, level
+
+
+class Codec(object):
+    """
+    One shot compression of independent fsdata chunks, so every chunk can be
+    decompressed on its own by the Receiver.
+    """
+
+    def __init__(self, algo=NONE, level=None):
+        self.algo, self.level = validate(algo, level)
+        if (self.algo == 'zstd'):
+            self._zc = zstandard.ZstdCompressor(level=self.level)
+            self._zd = zstandard.ZstdDecompressor()
+
+    @property
+    def enabled(self):
+        return self.algo != NONE
+
+    def offer(self):
+        """
+        :return: dict describing this codec, as carried in the greetings.
+        """
+        return {'algo': self.algo, 'level': self.level, }
+
+    def compress(self, data):
+        if (self.algo == 'zlib'):
+            return zlib.compress(data, self.level)
+        if (self.algo == 'lz4'):
+            return lz4frame.compress(data, compression_level=self.level)
+        if (self.algo == 'zstd'):
+            return self._zc.compress(data)
+        return data
+
+    def decompress(self, data):
+        if (self.algo == 'zlib'):
+            return zlib.decompress(data)
+        if (self.algo == 'lz4'):
+            return lz4frame.decompress(data)
+        if (self.algo == 'zstd'):
+            return self._zd.decompress(data)
+        return data
+
+
+def negotiate(offer):
+    """
+    Receiver side of the compression handshake.
+    :param offer: compression dict from the sender-ready greeting or None
+    :return: Codec to use for the stream. Unknown or unavailable codecs
+    are declined, ie the stream is sent uncompressed.
+    """
+    if (offer is None):
+        return Codec()
+    try:
+        return Codec(offer.get('algo', NONE), offer.get('level'))
+    except Exception as e:
+        logger.error('Declining compression offer(%s): %s' %
+                     (offer, e.__str__()))
+        return Codec()
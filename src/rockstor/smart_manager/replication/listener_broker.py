@@ -21,12 +21,15 @@ import zmq
 import os
 import json
 import time
+from datetime import datetime
+from django.utils.timezone import utc
 from storageadmin.models import (NetworkConnection, Appliance)
 from smart_manager.models import (ReplicaTrail, ReplicaShare, Replica, Service)
 from django.conf import settings
 from sender import Sender
 from receiver import Receiver
 from util import ReplicationMixin
+from bandwidth import TokenBucket
 from cli import APIWrapper
 import logging
 logger = logging.getLogger(__name__)
@@ -42,6 +45,17 @@ class ReplicaScheduler(ReplicationMixin, Process):
         self.MAX_ATTEMPTS = settings.REPLICATION.get('max_send_attempts')
         self.uuid = self.listener_interface = self.listener_port = None
         self.trail_prune_time = None
+        # Replication Tasks waiting for a Sender slot. rid -> time queued.
+        self.queue = {}
+        # rid -> (time started, seconds spent in the queue) of running ones.
+        self.started = {}
+        self.max_senders = settings.REPLICATION.get('max_concurrent_sends')
+        # KB/sec, 0 for unlimited.
+        self.bandwidth_limit = settings.REPLICATION.get('bandwidth_limit')
+        self.target_bandwidth_limit = settings.REPLICATION.get(
+            'target_bandwidth_limit')
+        self.global_budget = None
+        self.target_budgets = {}  # receiver ip -> TokenBucket
         super(ReplicaScheduler, self).__init__()
 
     def _prune_workers(self, workers):
@@ -52,15 +66,114 @@ class ReplicaScheduler(ReplicationMixin, Process):
                     logger.debug('deleted worker: %s' % w)
         return workers
 
-    def _prune_senders(self):
+    def _prune_senders(self, verbose=True):
         for s in self.senders.keys():
             ecode = self.senders[s].exitcode
             if (ecode is not None):
                 del self.senders[s]
+                self.started.pop(self.senders_rid(s), None)
                 logger.debug('Sender(%s) exited. exitcode: %s' % (s, ecode))
-        if (len(self.senders) > 0):
+        if (verbose and len(self.senders) > 0):
             logger.debug('Active Senders: %s' % self.senders.keys())
 
+    def senders_rid(self, sender_key):
+        return int(sender_key.rsplit('_', 1)[1])
+
+    def _budgets(self, receiver_ip):
+        budgets = []
+        if (not self.global_budget.unlimited):
+            budgets.append(self.global_budget)
+        if (self.target_bandwidth_limit > 0):
+            if (receiver_ip not in self.target_budgets):
+                self.target_budgets[receiver_ip] = TokenBucket(
+                    self.target_bandwidth_limit * 1024)
+            budgets.append(self.target_budgets[receiver_ip])
+        return budgets
+
+    def _staleness(self, rid, now):
+        # seconds since the last succeeded send. Never replicated ones are
+        # the most stale of all.
+        try:
+            rt = ReplicaTrail.objects.filter(
+                replica_id=rid, status='succeeded').latest('id')
+        except ReplicaTrail.DoesNotExist:
+            return None
+        if (rt.end_ts is None):
+            return None
+        return (now - rt.end_ts).total_seconds()
+
+    def _queue_order(self):
+        """
+        :return: list of (rid, staleness) of queued Replication Tasks, most
+        stale first and in the order they were queued otherwise.
+        """
+        now = datetime.utcnow().replace(tzinfo=utc)
+        order = []
+        for rid, queued in self.queue.items():
+            staleness = self._staleness(rid, now)
+            key = (0 if (staleness is None) else 1, -(staleness or 0), queued)
+            order.append((key, rid, staleness))
+        return [o[1:] for o in sorted(order)]
+
+    def _enqueue(self, replica):
+        sender_key = ('%s_%s' % (self.uuid, replica.id))
+        if (sender_key in self.senders and
+                self.senders[sender_key].exitcode is None):
+            raise Exception('There is live sender for(%s). Will not start '
+                            'a new one.' % sender_key)
+        if (replica.id in self.queue):
+            raise Exception('Replication Task(%d) is already queued.' %
+                            replica.id)
+        self.queue[replica.id] = time.time()
+        return ('Replication Task(%d) queued. Tasks waiting: %d. Running: '
+                '%d/%d.' % (replica.id, len(self.queue), len(self.senders),
+                            self.max_senders))
+
+    def _dispatch(self):
+        # Start Senders for queued Replication Tasks while there are free
+        # slots.
+        if (len(self.queue) == 0):
+            return
+        self._prune_senders(verbose=False)
+        for rid, staleness in self._queue_order():
+            if (len(self.senders) >= self.max_senders):
+                break
+            queued = self.queue.pop(rid)
+            try:
+                replica = Replica.objects.get(id=rid)
+                if (not replica.enabled):
+                    logger.debug('Replication Task(%d) was disabled while '
+                                 'queued. Dropping it.' % rid)
+                    continue
+                self._process_send(replica)
+                wait = time.time() - queued
+                self.started[rid] = (time.time(), wait)
+                logger.debug('Sender for Replication Task(%d) started after '
+                             '%.1f seconds in the queue.' % (rid, wait))
+            except Exception as e:
+                logger.error('Failed to start a new Sender for Replication '
+                             'Task(%d). Exception: %s' % (rid, e.__str__()))
+
+    def _queue_status(self):
+        now = time.time()
+        queued = []
+        for position, (rid, staleness) in enumerate(self._queue_order()):
+            queued.append({'rid': rid,
+                           'position': position + 1,
+                           'wait': now - self.queue[rid],
+                           'staleness': staleness, })
+        running = []
+        for rid, (started, wait) in self.started.items():
+            running.append({'rid': rid,
+                            'wait': wait,
+                            'running': now - started, })
+        return {'max_concurrent_sends': self.max_senders,
+                'bandwidth_limit': self.bandwidth_limit,
+                'target_bandwidth_limit': self.target_bandwidth_limit,
+                'queue_depth': len(queued),
+                'queued': queued,
+                'running': running, }
+
     def _delete_receivers(self):
         active_msgs = []
         for r in self.local_receivers.keys():
@@ -106,15 +219,17 @@ class ReplicaScheduler(ReplicationMixin, Process):
                                 'a new one.' % sender_key)
 
         receiver_ip = self._get_receiver_ip(replica)
+        budgets = self._budgets(receiver_ip)
         rt_qs = ReplicaTrail.objects.filter(replica=replica).order_by('-id')
         last_rt = rt_qs[0] if (len(rt_qs) > 0) else None
         if (last_rt is None):
             logger.debug('Starting a new Sender(%s).' % sender_key)
-            self.senders[sender_key] = Sender(self.uuid, receiver_ip, replica)
+            self.senders[sender_key] = Sender(self.uuid, receiver_ip, replica,
+                                              budgets=budgets)
         elif (last_rt.status == 'succeeded'):
             logger.debug('Starting a new Sender(%s)' % sender_key)
             self.senders[sender_key] = Sender(self.uuid, receiver_ip, replica,
-                                              last_rt)
+                                              last_rt, budgets=budgets)
         elif (last_rt.status == 'pending'):
             msg = ('Replica trail shows a pending Sender(%s), but it is not '
                    'alive. Marking it as failed. Will not start a new one.' %
@@ -154,7 +269,8 @@ class ReplicaScheduler(ReplicationMixin, Process):
                              sender_key)
                 last_success_rt = None
             self.senders[sender_key] = Sender(self.uuid, receiver_ip, replica,
-                                              last_success_rt)
+                                              last_success_rt,
+                                              budgets=budgets)
         else:
             msg = ('Unexpected ReplicaTrail status(%s) for Sender(%s). '
                    'Will not start a new one.' % (last_rt.status, sender_key))
@@ -171,6 +287,12 @@ class ReplicaScheduler(ReplicationMixin, Process):
             so = Service.objects.get(name='replication')
             config_d = json.loads(so.config)
             self.listener_port = int(config_d['listener_port'])
+            self.max_senders = int(config_d.get('max_concurrent_sends',
+                                                self.max_senders))
+            self.bandwidth_limit = int(config_d.get('bandwidth_limit',
+                                                    self.bandwidth_limit))
+            self.target_bandwidth_limit = int(config_d.get(
+                'target_bandwidth_limit', self.target_bandwidth_limit))
             nco = NetworkConnection.objects.get(
                 name=config_d['network_interface'])
             self.listener_interface = nco.ipaddr
@@ -188,9 +310,12 @@ class ReplicaScheduler(ReplicationMixin, Process):
                    'Exception: %s' % e.__str__())
             return logger.error(msg)
 
+        # created before any Sender is forked, so that all of them share it.
+        self.global_budget = TokenBucket(self.bandwidth_limit * 1024)
         ctx = zmq.Context()
         frontend = ctx.socket(zmq.ROUTER)
-        frontend.set_hwm(10)
+        # Senders keep up to send_window fsdata messages in flight.
+        frontend.set_hwm(settings.REPLICATION.get('send_window') * 2)
         frontend.bind('tcp://%s:%d'
                       % (self.listener_interface, self.listener_port))
 
@@ -202,13 +327,44 @@ class ReplicaScheduler(ReplicationMixin, Process):
         poller.register(backend, zmq.POLLIN)
         self.local_receivers = {}
 
-        iterations = 10
         poll_interval = 6000  # 6 seconds
+        # seconds between prunes of exited workers.
+        prune_interval = 60
         msg_count = 0
+        dispatch_ts = prune_ts = time.time()
         while True:
+            # Exited workers are pruned on a timer rather than when the
+            # sockets go quiet, which they may never do while data is coming
+            # in.
+            if (time.time() - prune_ts >= prune_interval):
+                prune_ts = time.time()
+                self._prune_senders()
+                self._delete_receivers()
+                if (self.trail_prune_time is None or
+                        (prune_ts - self.trail_prune_time) > 3600):
+                    # prune send/receive trails every hour or so.
+                    self.trail_prune_time = prune_ts
+                    map(self.prune_replica_trail, Replica.objects.filter())
+                    map(self.prune_receive_trail,
+                        ReplicaShare.objects.filter())
+                    logger.debug('Replica trails are truncated '
+                                 'successfully.')
+
+                if (os.getppid() != self.ppid):
+                    logger.error('Parent exited. Aborting.')
+                    ctx.destroy()
+                    # do some cleanup of senders before quitting?
+                    break
+
+            # Queued Replication Tasks get a look in at most once a second,
+            # however busy the sockets are.
+            if (time.time() - dispatch_ts >= 1):
+                self._dispatch()
+                dispatch_ts = time.time()
             # This loop may still continue even if replication service
             # is terminated, as long as data is coming in.
-            socks = dict(poller.poll(timeout=poll_interval))
+            socks = dict(poller.poll(
+                timeout=1000 if (len(self.queue) > 0) else poll_interval))
             if (frontend in socks and socks[frontend] == zmq.POLLIN):
                 address, command, msg = frontend.recv_multipart()
                 if (address not in self.remote_senders):
@@ -273,9 +429,7 @@ class ReplicaScheduler(ReplicationMixin, Process):
                     try:
                         replica = Replica.objects.get(id=rid)
                         if (replica.enabled):
-                            self._process_send(replica)
-                            msg = ('A new Sender started successfully for '
-                                   'Replication Task(%d).' % rid)
+                            msg = self._enqueue(replica)
                             rcommand = 'SUCCESS'
                         else:
                             msg = ('Failed to start a new Sender for '
@@ -287,6 +441,10 @@ class ReplicaScheduler(ReplicationMixin, Process):
                         logger.error(msg)
                     finally:
                         backend.send_multipart([address, rcommand, str(msg)])
+                    self._dispatch()
+                elif (command == 'queue-status'):
+                    backend.send_multipart([address, 'SUCCESS', json.dumps(
+                        self._queue_status())])
                 elif (address in self.remote_senders):
                     if (command in ('receiver-ready', 'receiver-error', 'btrfs-recv-finished')):  # noqa E501
                         logger.debug('Identitiy: %s command: %s'
@@ -296,29 +454,6 @@ class ReplicaScheduler(ReplicationMixin, Process):
                         # must be waiting
                     frontend.send_multipart([address, command, msg])
 
-            else:
-                iterations -= 1
-                if (iterations == 0):
-                    iterations = 10
-                    self._prune_senders()
-                    self._delete_receivers()
-                    cur_time = time.time()
-                    if (self.trail_prune_time is None or
-                            (cur_time - self.trail_prune_time) > 3600):
-                        # prune send/receive trails every hour or so.
-                        self.trail_prune_time = cur_time
-                        map(self.prune_replica_trail, Replica.objects.filter())
-                        map(self.prune_receive_trail,
-                            ReplicaShare.objects.filter())
-                        logger.debug('Replica trails are truncated '
-                                     'successfully.')
-
-                    if (os.getppid() != self.ppid):
-                        logger.error('Parent exited. Aborting.')
-                        ctx.destroy()
-                        # do some cleanup of senders before quitting?
-                        break
-
 
 def main():
     rs = ReplicaScheduler()
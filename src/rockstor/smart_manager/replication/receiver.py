@@ -27,6 +27,10 @@ from django.conf import settings
 from django import db
 from contextlib import contextmanager
 from util import ReplicationMixin
+from transport import (grant_credits, send_keepalive, Spool, spool_path,
+                       FSDATA_COMPRESSED, KEEPALIVE,
+                       RESUME_MISMATCH)
+from compression import negotiate
 from fs.btrfs import (get_oldest_snap, remove_share, set_property, is_subvol)
 from system.osi import run_command
 from storageadmin.models import (Pool, Appliance)
@@ -60,9 +64,16 @@ class Receiver(ReplicationMixin, Process):
         self.num_retain_snaps = 5
         self.ctx = zmq.Context()
         self.rp = None
+        self.spool = None
         self.raw = None
         self.ack = False
         self.total_bytes_received = 0
+        self.wire_bytes_received = 0
+        # Senders predating compression don't offer it and expect a plain
+        # snapshot name in receiver-ready.
+        self.legacy_sender = 'compression' not in self.meta
+        self.codec = negotiate(self.meta.get('compression'))
+        self.window = settings.REPLICATION.get('send_window')
         # close all db connections prior to fork.
         db.close_old_connections()
         super(Receiver, self).__init__()
@@ -139,6 +150,31 @@ class Receiver(ReplicationMixin, Process):
                      (self.identity, command, rcommand))
         return rcommand, rmsg
 
+    def _prepare_spool(self, snap_fp):
+        # A spool left behind by an earlier attempt at this snapshot is
+        # replayed. Its partially received subvolume has to go first. Spools
+        # of any other snapshot received into this share are stale. They
+        # are named from the receive trails rather than matched by prefix,
+        # which would also match the spools of other shares, eg foo_bar's
+        # for share foo.
+        spath = spool_path(self.dest_pool, self.sname, self.snap_name)
+        for snap_name in ReceiveTrail.objects.filter(
+                rshare__id=self.rid).values_list('snap_name', flat=True):
+            fp = spool_path(self.dest_pool, self.sname, snap_name)
+            if (fp != spath and os.path.exists(fp)):
+                logger.debug('Id: %s. Removing stale spool: %s' %
+                             (self.identity, fp))
+                os.remove(fp)
+        if (os.path.exists(spath)):
+            if (self.legacy_sender):
+                # can't resume.
+                os.remove(spath)
+            elif (is_subvol(snap_fp)):
+                logger.debug('Id: %s. Deleting partially received '
+                             'Snapshot(%s)' % (self.identity, snap_fp))
+                run_command([BTRFS, 'subvolume', 'delete', snap_fp])
+        return spath
+
     def _latest_snap(self, rso):
         for snap in ReceiveTrail.objects.filter(
                 rshare=rso, status='succeeded').order_by('-id'):
@@ -160,7 +196,8 @@ class Receiver(ReplicationMixin, Process):
             self.poll = zmq.Poller()
             self.dealer = self.ctx.socket(zmq.DEALER)
             self.dealer.setsockopt_string(zmq.IDENTITY, u'%s' % self.identity)
-            self.dealer.set_hwm(10)
+            # room for a full window of fsdata plus control messages.
+            self.dealer.set_hwm(self.window * 2)
             self.dealer.connect('ipc://%s'
                                 % settings.REPLICATION.get('ipc_socket'))
             self.poll.register(self.dealer, zmq.POLLIN)
@@ -235,6 +272,9 @@ class Receiver(ReplicationMixin, Process):
             run_command(['/usr/bin/mkdir', '-p', self.snap_dir])
             snap_fp = ('%s/%s' % (self.snap_dir, self.snap_name))
 
+            self.msg = ('Failed to prepare the spool for %s' % snap_fp)
+            spath = self._prepare_spool(snap_fp)
+
             # If the snapshot already exists, presumably from the previous
             # attempt and the sender tries to send the same, reply back with
             # snap_exists and do not start the btrfs-receive
@@ -251,19 +291,36 @@ class Receiver(ReplicationMixin, Process):
             self.rp = subprocess.Popen(cmd, shell=False, stdin=subprocess.PIPE,
                                        stdout=subprocess.PIPE,
                                        stderr=subprocess.PIPE)
+            self.msg = ('Failed to start feeding the spool(%s) to btrfs '
+                        'receive' % spath)
+            self.spool = Spool(spath)
+            self.spool.start(self.rp.stdin)
 
             self.msg = ('Failed to send receiver-ready')
-            rcommand, rmsg = self._send_recv('receiver-ready',
-                                             latest_snap or '')
+            ready = latest_snap or ''
+            if (not self.legacy_sender):
+                ready = {'snap': ready,
+                         'compression': self.codec.offer(), }
+                if (self.spool.offset > 0):
+                    offset, md5 = self.spool.tail_md5()
+                    logger.info('Id: %s. Resuming %s from offset %d.' %
+                                (self.identity, snap_fp, offset))
+                    ready['resume'] = {'offset': offset, 'md5': md5, }
+                ready = json.dumps(ready)
+            rcommand, rmsg = self._send_recv('receiver-ready', ready)
             if (rcommand is None):
                 logger.error('Id: %s. No response from the broker for '
                              'receiver-ready command. Aborting.'
                              % self.identity)
                 self._sys_exit(3)
+            # open the send window. The Sender won't transmit without credits
+            self.msg = ('Failed to grant the initial send window')
+            grant_credits(self.dealer, self.window)
 
             term_commands = ('btrfs-send-init-error',
                              'btrfs-send-unexpected-termination-error',
-                             'btrfs-send-nonzero-termination-error',)
+                             'btrfs-send-nonzero-termination-error',
+                             RESUME_MISMATCH, )
             num_tries = 10
             poll_interval = 6000  # 6 seconds
             num_msgs = 0
@@ -275,10 +332,16 @@ class Receiver(ReplicationMixin, Process):
                     # milliseconds) for every message
                     num_tries = 10
                     command, message = self.dealer.recv_multipart()
+                    if (command == KEEPALIVE):
+                        continue
                     if (command == 'btrfs-send-stream-finished'):
                         # this command concludes fsdata transfer. After this,
                         # btrfs-recev process should be
-                        # terminated(.communicate).
+                        # terminated(.communicate) once it has consumed the
+                        # spool.
+                        self.msg = ('Failed to feed the spool to btrfs-recv')
+                        while (not self.spool.finish()):
+                            send_keepalive(self.dealer)
                         if (self.rp.poll() is None):
                             self.msg = ('Failed to terminate btrfs-recv '
                                         'command')
@@ -294,13 +357,18 @@ class Receiver(ReplicationMixin, Process):
                                         'exitcode(%s). ' % self.rp.returncode)
                             raise Exception(self.msg)
                         self._send_recv('btrfs-recv-finished')
+                        self.spool.remove()
                         self.refresh_share_state()
                         self.refresh_snapshot_state()
 
                         self.msg = ('Failed to update receive trail for '
                                     'rtid: %d' % self.rtid)
-                        self.update_receive_trail(self.rtid, {'status':
-                                                              'succeeded', })
+                        data = {'status': 'succeeded',
+                                'kb_received': self.total_bytes_received / 1024,  # noqa E501
+                                'kb_on_wire': self.wire_bytes_received / 1024,
+                                'kb_per_sec': self.transfer_rate(
+                                    self.total_bytes_received, t0), }
+                        self.update_receive_trail(self.rtid, data)
                         dsize, drate = self.size_report(
                             self.total_bytes_received, t0)
                         logger.debug('Id: %s. Receive complete. Total data '
@@ -311,29 +379,44 @@ class Receiver(ReplicationMixin, Process):
                     if (command in term_commands):
                         self.msg = ('Terminal command(%s) received from the '
                                     'sender. Aborting.' % command)
+                        if (command == RESUME_MISMATCH):
+                            # start from scratch next time.
+                            self.spool.remove()
                         raise Exception(self.msg)
 
-                    if (self.rp.poll() is None):
-                        self.rp.stdin.write(message)
-                        self.rp.stdin.flush()
-                        # @todo: implement advanced credit request system.
-                        self.dealer.send_multipart([b'send-more', ''])
+                    if (self.rp.poll() is None and self.spool.alive()):
+                        self.wire_bytes_received += len(message)
+                        if (command == FSDATA_COMPRESSED):
+                            self.msg = ('Failed to decompress fsdata(%s)' %
+                                        self.codec.algo)
+                            message = self.codec.decompress(message)
+                        self.msg = ('Failed to write fsdata to the spool')
+                        self.spool.append(message)
+                        # the credit acks the chunk, so it's only returned
+                        # once the chunk is in the spool file and so counts
+                        # towards the offset a resume starts from.
+                        grant_credits(self.dealer)
                         num_msgs += 1
                         self.total_bytes_received += len(message)
                         if (num_msgs == 1000):
                             num_msgs = 0
+                            self.spool.checkpoint()
                             dsize, drate = self.size_report(
                                 self.total_bytes_received, t0)
                             logger.debug('Id: %s. Receiver alive. Data '
                                          'transferred: %s. Rate: %s/sec.' %
                                          (self.identity, dsize, drate))
                     else:
+                        if (self.rp.poll() is None):
+                            # the spool feeder died under it.
+                            self.rp.terminate()
                         out, err = self.rp.communicate()
                         out = out.split('\n')
                         err = err.split('\n')
                         logger.error('Id: %s. btrfs-recv died unexpectedly. '
-                                     'cmd: %s out: %s. err: %s' %
-                                     (self.identity, cmd, out, err))
+                                     'cmd: %s out: %s. err: %s spool: %s' %
+                                     (self.identity, cmd, out, err,
+                                      self.spool.error))
                         msg = ('Low level system error from btrfs receive '
                                'command. cmd: %s out: %s err: %s for rtid: %s'
                                % (cmd, out, err, self.rtid))
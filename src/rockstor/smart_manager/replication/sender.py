@@ -21,12 +21,15 @@ import os
 import sys
 import zmq
 import subprocess
-import fcntl
+import tempfile
 import json
 import time
 from django.conf import settings
 from contextlib import contextmanager
 from util import ReplicationMixin
+from transport import (SendStream, send_keepalive, KEEPALIVE_INTERVAL)
+from bandwidth import reserve
+from compression import (Codec, negotiate)
 from fs.btrfs import (get_oldest_snap, is_subvol)
 from smart_manager.models import ReplicaTrail
 from cli import APIWrapper
@@ -39,7 +42,7 @@ BTRFS = '/sbin/btrfs'
 
 class Sender(ReplicationMixin, Process):
 
-    def __init__(self, uuid, receiver_ip, replica, rt=None):
+    def __init__(self, uuid, receiver_ip, replica, rt=None, budgets=()):
         self.uuid = uuid
         self.receiver_ip = receiver_ip
         self.receiver_port = replica.data_port
@@ -61,6 +64,20 @@ class Sender(ReplicationMixin, Process):
         self.total_bytes_sent = 0
         self.ppid = os.getpid()
         self.max_snap_retain = settings.REPLICATION.get('max_snap_retain')
+        self.checkpoint_interval = 30  # seconds
+        self.chunk_size = settings.REPLICATION.get('chunk_size')
+        # offered in the greeting. Replaced by what the Receiver accepts.
+        self.codec = negotiate({'algo': replica.compression,
+                                'level': replica.compression_level, })
+        self.t0 = None
+        self.stream = None
+        # Receiver's spool offset and md5 of its tail, for resumed sends.
+        self.resume = {}
+        self.checkpoint_ts = None
+        # bandwidth.TokenBuckets shared with other Senders, charged per byte
+        # on the wire.
+        self.budgets = budgets
+        self.wire_charged = 0
         db.close_old_connections()
         super(Sender, self).__init__()
 
@@ -75,6 +92,8 @@ class Sender(ReplicationMixin, Process):
                 try:
                     data = {'status': 'failed',
                             'error': '%s. Exception: %s' % (self.msg, e.__str__())}  # noqa E501
+                    if (self.stream is not None):
+                        data['kb_acked'] = self.stream.acked_bytes / 1024
                     self.update_replica_status(self.rt2_id, data)
                 except Exception as e:
                     logger.error('Id: %s. Exception occured while updating '
@@ -89,6 +108,11 @@ class Sender(ReplicationMixin, Process):
         self.ctx.destroy(linger=0)
         sys.exit(code)
 
+    def _send_stderr(self):
+        # whatever btrfs send wrote to stderr so far.
+        self.send_err.seek(0)
+        return self.send_err.read()
+
     def _init_greeting(self):
         self.send_req = self.ctx.socket(zmq.DEALER)
         self.send_req.setsockopt_string(zmq.IDENTITY, self.identity)
@@ -98,7 +122,8 @@ class Sender(ReplicationMixin, Process):
                'share': self.replica.share,
                'snap': self.snap_name,
                'incremental': self.rt is not None,
-               'uuid': self.uuid, }
+               'uuid': self.uuid,
+               'compression': self.codec.offer(), }
         msg_str = json.dumps(msg)
         self.send_req.send_multipart(['sender-ready', b'%s' % msg_str])
         logger.debug('Id: %s Initial greeting: %s' % (self.identity, msg))
@@ -122,6 +147,52 @@ class Sender(ReplicationMixin, Process):
                           command, rcommand))
         return rcommand, rmsg
 
+    def _parse_ready(self, reply):
+        # receiver-ready carries the latest snapshot on the Receiver and the
+        # compression it accepted. Older Receivers reply with just the
+        # snapshot name and don't decompress.
+        try:
+            ready = json.loads(reply)
+        except ValueError:
+            ready = None
+        if (not isinstance(ready, dict)):
+            ready = {'snap': reply, 'compression': None, }
+        self.resume = ready.get('resume') or {}
+        offer = ready.get('compression') or {}
+        self.codec = Codec(offer.get('algo', 'none'), offer.get('level'))
+        logger.debug('Id: %s. Compression: %s' %
+                     (self.identity, self.codec.offer()))
+        return ready.get('snap') or ''
+
+    def _throttle(self, stream):
+        wait = reserve(self.budgets, stream.wire_bytes - self.wire_charged)
+        self.wire_charged = stream.wire_bytes
+        while (wait > 0):
+            time.sleep(min(wait, KEEPALIVE_INTERVAL))
+            wait -= KEEPALIVE_INTERVAL
+            if (wait > 0):
+                send_keepalive(self.send_req)
+
+    def _on_chunk(self, stream):
+        if (len(self.budgets) > 0):
+            self._throttle(stream)
+        if (time.time() - self.checkpoint_ts > self.checkpoint_interval):
+            # how far the Receiver got, should this attempt fail.
+            self.checkpoint_ts = time.time()
+            self.update_replica_status(self.rt2_id, {
+                'status': 'pending',
+                'kb_acked': stream.acked_bytes / 1024, })
+        if (stream.num_chunks % 1000 == 0):
+            dsize, drate = self.size_report(stream.total_bytes, self.t0)
+            logger.debug('Id: %s Sender alive. Data transferred: '
+                         '%s. Rate: %s/sec.'
+                         % (self.identity, dsize, drate))
+        if (os.getppid() != self.ppid):
+            logger.error('Id: %s. Scheduler exited. Sender for %s '
+                         'cannot go on. '
+                         'Aborting.' % (self.identity, self.snap_id))
+            self._sys_exit(3)
+
     def _delete_old_snaps(self, share_path):
         oldest_snap = get_oldest_snap(share_path, self.max_snap_retain,
                                       regex='_replication_')
@@ -237,6 +308,7 @@ class Sender(ReplicationMixin, Process):
                     retries_left = 10
                     command, reply = self.send_req.recv_multipart()
                     if (command == 'receiver-ready'):
+                        reply = self._parse_ready(reply)
                         if (self.rt is not None):
                             self.rlatest_snap = reply
                             self.rt = self._refresh_rt()
@@ -294,86 +366,59 @@ class Sender(ReplicationMixin, Process):
                 logger.info('Id: %s. Sending full replica: %s'
                             % (self.identity, snap_path))
 
+            # stderr goes to a file rather than a pipe that is only read
+            # once the stream ends, so a chatty send can't block on it.
+            self.send_err = tempfile.TemporaryFile()
             try:
                 self.sp = subprocess.Popen(cmd, shell=False,
                                            stdout=subprocess.PIPE,
-                                           stderr=subprocess.PIPE)
-                fcntl.fcntl(self.sp.stdout.fileno(), fcntl.F_SETFL,
-                            os.O_NONBLOCK)
+                                           stderr=self.send_err)
             except Exception as e:
                 self.msg = ('Failed to start the low level btrfs send '
-                            'command(%s). Aborting. Exception: '
+                            'command(%s). Aborting. Exception: %s'
                             % (cmd, e.__str__()))
                 logger.error('Id: %s. %s' % (self.identity, self.msg))
                 self._send_recv('btrfs-send-init-error')
                 self._sys_exit(3)
 
-            alive = True
-            num_msgs = 0
-            t0 = time.time()
-            while (alive):
-                try:
-                    if (self.sp.poll() is not None):
-                        logger.debug('Id: %s. send process finished '
-                                     'for %s. rc: %d. stderr: %s'
-                                     % (self.identity, self.snap_id,
-                                        self.sp.returncode,
-                                        self.sp.stderr.read()))
-                        alive = False
-                    fs_data = self.sp.stdout.read()
-                except IOError:
-                    continue
-                except Exception as e:
-                    self.msg = ('Exception occured while reading low '
-                                'level btrfs '
-                                'send data for %s. Aborting.' % self.snap_id)
-                    if (alive):
-                        self.sp.terminate()
-                    self.update_trail = True
-                    self._send_recv('btrfs-send-unexpected-termination-error')
-                    self._sys_exit(3)
-
-                self.msg = ('Failed to send fsdata to the receiver for %s. '
-                            'Aborting.' % (self.snap_id))
-                self.update_trail = True
-                command, message = self._send_recv('', fs_data)
-                self.total_bytes_sent += len(fs_data)
-                num_msgs += 1
-                if (num_msgs == 1000):
-                    num_msgs = 0
-                    dsize, drate = self.size_report(self.total_bytes_sent, t0)
-                    logger.debug('Id: %s Sender alive. Data transferred: '
-                                 '%s. Rate: %s/sec.'
-                                 % (self.identity, dsize, drate))
-                if (command is None or command == 'receiver-error'):
-                    # command is None when the remote side vanishes.
-                    self.msg = ('Got null or error command(%s) message(%s) '
-                                'from the Receiver while'
-                                ' transmitting fsdata. Aborting.'
-                                % (command, message))
-                    raise Exception(message)
-
-                if (not alive):
-                    if (self.sp.returncode != 0):
-                        # do we mark failed?
-                        command, message = self._send_recv(
-                            'btrfs-send-nonzero-termination-error')
-                    else:
-                        command, message = self._send_recv(
-                            'btrfs-send-stream-finished')
-
-                if (os.getppid() != self.ppid):
-                    logger.error('Id: %s. Scheduler exited. Sender for %s '
-                                 'cannot go on. '
-                                 'Aborting.' % (self.identity, self.snap_id))
-                    self._sys_exit(3)
+            self.msg = ('Failed to send fsdata to the receiver for %s. '
+                        'Aborting.' % (self.snap_id))
+            self.t0 = self.checkpoint_ts = time.time()
+            stream = self.stream = SendStream(
+                self.send_req, self.poll, self.chunk_size, codec=self.codec,
+                skip=self.resume.get('offset', 0),
+                skip_md5=self.resume.get('md5'))
+            if (stream.skip > 0):
+                logger.info('Id: %s. Resuming from offset %d of the stream.'
+                            % (self.identity, stream.skip))
+                self.update_replica_status(self.rt2_id, {
+                    'status': 'pending', 'kb_resumed': stream.skip / 1024, })
+            try:
+                self.total_bytes_sent = stream.run(self.sp, self._on_chunk)
+            except Exception as e:
+                if (self.sp.poll() is None):
+                    self.sp.terminate()
+                    self.send_req.send_multipart(
+                        ['btrfs-send-unexpected-termination-error', ''])
+                self.msg = ('%s Chunks sent: %d. stderr: %s' %
+                            (self.msg, stream.num_chunks,
+                             self._send_stderr()))
+                raise e
+            logger.debug('Id: %s. send process finished for %s. rc: %d. '
+                         'stderr: %s' % (self.identity, self.snap_id,
+                                         self.sp.returncode,
+                                         self._send_stderr()))
 
             data = {'status': 'succeeded',
-                    'kb_sent': self.total_bytes_sent / 1024, }
+                    'kb_sent': self.total_bytes_sent / 1024,
+                    'kb_on_wire': stream.wire_bytes / 1024,
+                    'kb_acked': stream.acked_bytes / 1024,
+                    'kb_per_sec': self.transfer_rate(self.total_bytes_sent,
+                                                     self.t0), }
             self.msg = ('Failed to update final replica status for %s'
                         '. Aborting.' % self.snap_id)
             self.update_replica_status(self.rt2_id, data)
-            dsize, drate = self.size_report(self.total_bytes_sent, t0)
+            dsize, drate = self.size_report(self.total_bytes_sent, self.t0)
             logger.debug('Id: %s. Send complete. Total data transferred: %s.'
                          ' Rate: %s/sec.' % (self.identity, dsize, drate))
             self._sys_exit(0)
@@ -0,0 +1,445 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import fcntl
+import hashlib
+import os
+import threading
+import time
+import zmq
+from Queue import Queue
+from collections import deque
+from django.conf import settings
+import logging
+logger = logging.getLogger(__name__)
+
+# Linux specific fcntl to resize a pipe. Not exposed by the py2 fcntl module.
+F_SETPIPE_SZ = 1031
+
+# fsdata chunks are sent with an empty command, or this one if compressed.
+FSDATA = ''
+FSDATA_COMPRESSED = 'fsdata-compressed'
+CREDIT = 'send-more'
+STREAM_FINISHED = 'btrfs-send-stream-finished'
+STREAM_ERROR = 'btrfs-send-nonzero-termination-error'
+RECV_FINISHED = 'btrfs-recv-finished'
+RECV_ERROR = 'receiver-error'
+# Sent by the Sender instead of the stream when the btrfs send output it
+# skipped over does not match the Receiver's spool.
+RESUME_MISMATCH = 'btrfs-send-resume-mismatch'
+# Either side sends this when it has been busy without talking to the other
+# for KEEPALIVE_INTERVAL seconds, ie skipping or draining a spool.
+KEEPALIVE = 'keepalive'
+KEEPALIVE_INTERVAL = 5
+# size of the spool tail that must match for a resume to go ahead.
+RESUME_TAIL = 1024 * 1024
+
+
+def grant_credits(sock, num=None, address=None):
+    """
+    Allow the Sender on the other end of sock to put more fsdata chunks in
+    flight. The receiving end of the stream decides the window size by
+    granting all of it upfront and then acknowledging every chunk it has
+    consumed, which also returns that chunk's credit.
+    :param sock: zmq socket connected (directly or via the broker) to Sender
+    :param num: number of credits to grant or None to acknowledge a chunk
+    :param address: routing identity if sock is a ROUTER
+    """
+    frames = [CREDIT, '' if (num is None) else str(num)]
+    if (address is not None):
+        frames.insert(0, address)
+    sock.send_multipart(frames)
+
+
+def num_credits(message):
+    """
+    :param message: payload of a send-more command
+    :return: number of credits it grants. An empty payload acknowledges a
+    chunk and returns its credit.
+    """
+    if (len(message) == 0):
+        return 1
+    return int(message)
+
+
+def send_keepalive(sock, address=None):
+    frames = [KEEPALIVE, '']
+    if (address is not None):
+        frames.insert(0, address)
+    sock.send_multipart(frames)
+
+
+def spool_path(pool, share, snap_name):
+    """
+    :return: path of the spool file for the receive of snap_name into share
+    """
+    return ('%s/%s_%s' % (spool_dir(pool), share, snap_name))
+
+
+def spool_dir(pool):
+    return ('%s%s/.replication_spool' % (settings.MNT_PT, pool))
+
+
+class Spool(object):
+    """
+    Receiver side copy of a btrfs send stream. fsdata is appended to a file
+    on the destination pool and a feeder thread follows that file into btrfs
+    receive. If the receive fails midway the file survives and the next
+    attempt replays it, so that the Sender only has to send what's missing.
+    """
+
+    def __init__(self, path, chunk_size=RESUME_TAIL):
+        """
+        :param path: spool file. Created if it doesn't exist.
+        :param chunk_size: size of reads when feeding btrfs receive
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        sdir = os.path.dirname(path)
+        if (not os.path.isdir(sdir)):
+            os.makedirs(sdir)
+        self.wfd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                           0600)
+        self.offset = os.fstat(self.wfd).st_size
+        self.resumed_from = self.offset
+        self.cond = threading.Condition()
+        self.done = False
+        self.error = None
+        self.fed = 0
+        self.feeder = None
+
+    def tail_md5(self, size=RESUME_TAIL):
+        """
+        :return: (offset, md5 hexdigest of the last size bytes before it)
+        """
+        size = min(size, self.offset)
+        with open(self.path, 'rb') as sfo:
+            sfo.seek(self.offset - size)
+            return self.offset, hashlib.md5(sfo.read(size)).hexdigest()
+
+    def start(self, out):
+        """
+        Start feeding the spool, from the beginning, to out.
+        :param out: file object, ie stdin of btrfs receive
+        """
+        self.feeder = threading.Thread(target=self._feed, args=(out, ))
+        self.feeder.daemon = True
+        self.feeder.start()
+
+    def _feed(self, out):
+        rfd = os.open(self.path, os.O_RDONLY)
+        try:
+            while (True):
+                data = os.read(rfd, self.chunk_size)
+                if (len(data) > 0):
+                    out.write(data)
+                    out.flush()
+                    self.fed += len(data)
+                    continue
+                with self.cond:
+                    if (self.done and self.fed == self.offset):
+                        break
+                    if (self.fed == self.offset):
+                        self.cond.wait(1)
+        except Exception as e:
+            self.error = e
+        finally:
+            os.close(rfd)
+
+    def append(self, data):
+        while (len(data) > 0):
+            written = os.write(self.wfd, data)
+            data = data[written:]
+            with self.cond:
+                self.offset += written
+                self.cond.notify()
+
+    def checkpoint(self):
+        os.fsync(self.wfd)
+
+    def alive(self):
+        return self.error is None and self.feeder.is_alive()
+
+    def finish(self, timeout=KEEPALIVE_INTERVAL):
+        """
+        Mark the end of the stream and wait up to timeout seconds for the
+        feeder to drain the spool. out is left open for the caller to close.
+        :return: True once the whole spool has been fed.
+        """
+        with self.cond:
+            self.done = True
+            self.cond.notify()
+        self.feeder.join(timeout)
+        if (self.error is not None):
+            raise self.error
+        return not self.feeder.is_alive()
+
+    def close(self):
+        os.close(self.wfd)
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+
+
+class SendStreamException(Exception):
+    """
+    Raised by SendStream on errors, reply is the last command received from
+    the Receiver, if any.
+    """
+    def __init__(self, msg, reply=None):
+        self.reply = reply
+        super(SendStreamException, self).__init__(msg)
+
+
+class Compressor(threading.Thread):
+    """
+    Compresses chunks off the main loop of a SendStream. Results are handed
+    back in submission order over an inproc PAIR socket so that the main loop
+    can keep polling on sockets alone. zlib and friends release the GIL, so
+    compression overlaps with reading btrfs send output and the network.
+    """
+
+    def __init__(self, ctx, codec):
+        self.codec = codec
+        self.queue = Queue()
+        self.address = 'inproc://compressor-%d' % id(self)
+        self.pair = ctx.socket(zmq.PAIR)
+        self.pair.bind(self.address)
+        self.ctx = ctx
+        super(Compressor, self).__init__()
+        self.daemon = True
+
+    def run(self):
+        pair = self.ctx.socket(zmq.PAIR)
+        pair.connect(self.address)
+        try:
+            while (True):
+                chunk = self.queue.get()
+                if (chunk is None):
+                    break
+                data = self.codec.compress(chunk)
+                if (len(data) < len(chunk)):
+                    pair.send_multipart([FSDATA_COMPRESSED, data])
+                else:
+                    # incompressible. Spare the Receiver the work.
+                    pair.send_multipart([FSDATA, chunk])
+        finally:
+            pair.close(linger=0)
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+        self.pair.close(linger=0)
+
+
+class SendStream(object):
+    """
+    Pipelined transport of btrfs send output to a Receiver. stdout of the
+    send process is read only when poll reports it ready and is sliced into
+    fixed size chunks. Up to the number of credits granted by the Receiver
+    are in flight at any time, so throughput is bound by the link and the
+    slower of the two btrfs processes rather than by the round trip time.
+    """
+
+    def __init__(self, sock, poll, chunk_size, timeout=60000, codec=None,
+                 skip=0, skip_md5=None):
+        """
+        :param sock: zmq DEALER socket connected to the Receiver's broker
+        :param poll: zmq.Poller that sock is already registered with
+        :param chunk_size: size in bytes of each fsdata message. Only the
+        last one of the stream may be shorter.
+        :param timeout: milliseconds to wait for credits or data before
+        giving up on the Receiver.
+        :param codec: compression.Codec negotiated with the Receiver, if any
+        :param skip: number of leading bytes of the stream the Receiver
+        already has in its spool. They are read and dropped.
+        :param skip_md5: md5 of the RESUME_TAIL bytes before skip, as
+        reported by the Receiver.
+        """
+        self.sock = sock
+        self.poll = poll
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.codec = codec
+        self.compressor = None
+        self.pending = 0
+        self.credits = 0
+        self.total_bytes = 0
+        self.wire_bytes = 0
+        self.num_chunks = 0
+        self.returncode = None
+        self.skip = skip
+        self.skip_md5 = skip_md5
+        self.skipped = 0
+        # logical size of every chunk not yet acknowledged, oldest first.
+        self.unacked = deque()
+        self.acked_bytes = skip
+        self.last_send = time.time()
+
+    def _resize_pipe(self, fd):
+        # A pipe holds 64KB by default, so a larger one means fewer wakeups
+        # per chunk. Best effort, capped by /proc/sys/fs/pipe-max-size.
+        try:
+            fcntl.fcntl(fd, F_SETPIPE_SZ, self.chunk_size)
+        except IOError:
+            pass
+
+    def _recv(self, finished):
+        command, message = self.sock.recv_multipart()
+        if (command == CREDIT):
+            self.credits += num_credits(message)
+            if (len(message) == 0):
+                self.acked_bytes += self.unacked.popleft()
+            return False
+        if (command == KEEPALIVE):
+            return False
+        if (command == RECV_FINISHED and finished == STREAM_FINISHED):
+            return True
+        if (finished == STREAM_ERROR):
+            raise SendStreamException(
+                'Send process exited with a nonzero return code(%s). '
+                'Receiver replied with command(%s) message(%s).'
+                % (self.returncode, command, message), command)
+        raise SendStreamException(
+            'Unexpected command(%s) message(%s) from the Receiver while '
+            'transmitting fsdata.' % (command, message), command)
+
+    def _send_chunk(self, command, data):
+        self.sock.send_multipart([command, data])
+        self.wire_bytes += len(data)
+        self.last_send = time.time()
+
+    def _skip(self, fd):
+        # Drop the part of the stream the Receiver already has, checking the
+        # tail of it against the Receiver's spool.
+        data = os.read(fd, min(self.chunk_size, self.skip - self.skipped))
+        if (len(data) == 0):
+            raise self._mismatch('Stream ended at %d bytes, before the '
+                                 'resume offset' % self.skipped)
+        tail_start = self.skip - min(self.skip, RESUME_TAIL)
+        end = self.skipped + len(data)
+        if (end > tail_start):
+            self.tail.update(data[max(tail_start - self.skipped, 0):])
+        self.skipped = end
+        if (self.skipped == self.skip and
+                self.tail.hexdigest() != self.skip_md5):
+            raise self._mismatch('Stream differs from the Receiver\'s spool')
+        if (time.time() - self.last_send > KEEPALIVE_INTERVAL):
+            send_keepalive(self.sock)
+            self.last_send = time.time()
+
+    def _mismatch(self, msg):
+        self.sock.send_multipart([RESUME_MISMATCH, ''])
+        return SendStreamException('Cannot resume from offset %d. %s.' %
+                                   (self.skip, msg), RESUME_MISMATCH)
+
+    def _submit(self, chunk):
+        if (self.compressor is None):
+            return self._send_chunk(FSDATA, chunk)
+        self.pending += 1
+        self.compressor.queue.put(chunk)
+
+    def _forward(self):
+        command, data = self.compressor.pair.recv_multipart()
+        self.pending -= 1
+        self._send_chunk(command, data)
+
+    def run(self, proc, on_chunk=None):
+        """
+        Stream stdout of proc until EOF, tell the Receiver how it ended and
+        wait for it to finish up.
+        :param proc: subprocess.Popen object of btrfs send(or a stand in)
+        :param on_chunk: optional callable invoked after every chunk sent
+        :return: total number of bytes sent, before compression
+        """
+        if (self.codec is not None and self.codec.enabled):
+            self.compressor = Compressor(self.sock.context, self.codec)
+            self.compressor.start()
+            self.poll.register(self.compressor.pair, zmq.POLLIN)
+        try:
+            return self._run(proc, on_chunk)
+        finally:
+            if (self.compressor is not None):
+                self.poll.unregister(self.compressor.pair)
+                self.compressor.stop()
+
+    def _run(self, proc, on_chunk):
+        fd = proc.stdout.fileno()
+        self._resize_pipe(fd)
+        self.tail = hashlib.md5()
+        pieces = []
+        buffered = 0
+        eof = False
+        reading = False
+        finished = None
+        while (True):
+            skipping = self.skipped < self.skip
+            want_read = (not eof and buffered < self.chunk_size and
+                         (skipping or self.credits > 0))
+            if (want_read != reading):
+                if (want_read):
+                    self.poll.register(fd, zmq.POLLIN)
+                else:
+                    self.poll.unregister(fd)
+                reading = want_read
+            socks = dict(self.poll.poll(self.timeout))
+            if (len(socks) == 0):
+                raise SendStreamException(
+                    'Neither fsdata nor a reply from the Receiver in %d '
+                    'seconds. Credits: %d Chunks sent: %d.'
+                    % (self.timeout / 1000, self.credits, self.num_chunks))
+            if (socks.get(self.sock) == zmq.POLLIN and self._recv(finished)):
+                break
+            if (self.compressor is not None and
+                    socks.get(self.compressor.pair) == zmq.POLLIN):
+                self._forward()
+            if (fd in socks and skipping):
+                self._skip(fd)
+            elif (fd in socks):
+                # EOF on a pipe is reported as POLLHUP(zmq.POLLERR), not
+                # POLLIN. Either way a read won't block.
+                data = os.read(fd, self.chunk_size - buffered)
+                if (len(data) == 0):
+                    eof = True
+                else:
+                    pieces.append(data)
+                    buffered += len(data)
+            if (self.credits > 0 and
+                    (buffered == self.chunk_size or (eof and buffered > 0))):
+                chunk = pieces[0] if (len(pieces) == 1) else ''.join(pieces)
+                self._submit(chunk)
+                self.unacked.append(len(chunk))
+                pieces = []
+                buffered = 0
+                self.credits -= 1
+                self.total_bytes += len(chunk)
+                self.num_chunks += 1
+                if (on_chunk is not None):
+                    on_chunk(self)
+            if (eof and buffered == 0 and self.pending == 0 and
+                    finished is None):
+                if (reading):
+                    self.poll.unregister(fd)
+                    reading = False
+                self.returncode = proc.wait()
+                finished = STREAM_FINISHED
+                if (self.returncode != 0):
+                    finished = STREAM_ERROR
+                self.sock.send_multipart([finished, ''])
+        return self.total_bytes
@@ -175,3 +175,7 @@ class ReplicationMixin(object):
         dsize = self.humanize_bytes(float(num))
         drate = self.humanize_bytes(float(num/(t1 - t0)))
         return dsize, drate
+
+    def transfer_rate(self, num, t0):
+        # KB/sec, as recorded on send and receive trails.
+        return int(num / 1024 / max(time.time() - t0, 0.001))
@@ -21,7 +21,7 @@ from .models import (CPUMetric, LoadAvg, MemInfo, ServiceStatus,
                      SProbe, NFSDCallDistribution,
                      NFSDClientDistribution,
                      NFSDShareDistribution,
-                     DiskStat, NetStat,
+                     DiskStat, NetStat, ShareUsage,
                      NFSDShareClientDistribution,
                      NFSDUidGidDistribution, TaskDefinition, Task,
                      Replica, ReplicaTrail, ReplicaShare,
@@ -55,6 +55,11 @@ class NetStatSerializer(serializers.ModelSerializer):
         model = NetStat
 
 
+class ShareUsageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ShareUsage
+
+
 class ServiceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Service
@@ -29,6 +29,13 @@ import logging
 logger = logging.getLogger(__name__)
 
 STAP_RUN = '/usr/bin/staprun'
+# lines of probe output per message to the sink.
+BATCH_SIZE = getattr(settings, 'SPROBE_BATCH_SIZE', 500)
+# lines of probe output buffered while the sink is behind. Once full, the
+# probe's output is left in the pipe until the sink catches up.
+BUFFER_LINES = getattr(settings, 'SPROBE_BUFFER_LINES', 50000)
+# messages queued by zmq for the sink before sends would block.
+SINK_HWM = getattr(settings, 'SPROBE_SINK_HWM', 100)
 
 
 class StapWorker(Process):
@@ -42,6 +49,7 @@ class StapWorker(Process):
         try:
             ctx = zmq.Context()
             sink_socket = ctx.socket(zmq.PUSH)
+            sink_socket.setsockopt(zmq.SNDHWM, SINK_HWM)
             sink_socket.connect('tcp://%s:%d' % settings.SPROBE_SINK)
         except Exception as e:
             msg = ('Exception while creating initial sockets. Aborting.')
@@ -67,6 +75,12 @@ class StapWorker(Process):
         probe_stopped = False
         sink_data = {'cb': TAP_MAP[self.task['tap']]['cb'],
                      'rid': self.task['roid'], }
+        # complete lines of output not yet accepted by the sink, and the
+        # incomplete last line of the latest read. Only whole lines are sent
+        # so that no row is split across messages.
+        lines = []
+        partial = ''
+        throttled = False
         while True:
             if (os.getppid() != self.ppid):
                 logger.error('Parent process(stap dispatcher) exited.')
@@ -76,12 +90,32 @@ class StapWorker(Process):
                 logger.error('I am exiting too.')
                 retval = -1
                 break
+            out = ''
             try:
-                sink_data['part_out'] = rp.stdout.read()
-                sink_socket.send_json(sink_data)
+                if (len(lines) < BUFFER_LINES):
+                    out = rp.stdout.read()
+                    parts = (partial + out).split('\n')
+                    partial = parts.pop()
+                    lines.extend([p for p in parts if p != ''])
+                elif (not throttled):
+                    logger.warning('Sink is behind by %d lines of output '
+                                   'for rid: %s. Pausing reads from the '
+                                   'probe.' % (len(lines), self.task['roid']))
+                    throttled = True
             except IOError:
                 pass
             finally:
+                while (len(lines) > 0):
+                    sink_data['part_out'] = '\n'.join(lines[:BATCH_SIZE])
+                    try:
+                        sink_socket.send_json(sink_data, zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    del lines[:BATCH_SIZE]
+                if (throttled and len(lines) < BUFFER_LINES):
+                    logger.info('Sink caught up with rid: %s. Resuming '
+                                'reads from the probe.' % self.task['roid'])
+                    throttled = False
                 if (not self.task['queue'].empty()):
                     # stop or pause received.
                     msg = self.task['queue'].get()
@@ -97,5 +131,7 @@ class StapWorker(Process):
                                            rp.stderr.read()))
                     logger.error(msg)
                 break
-            time.sleep(.5)
+            if (out == ''):
+                # only wait for more output once the pipe is drained.
+                time.sleep(.5)
         return retval
@@ -0,0 +1,98 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from datetime import (datetime, timedelta)
+from django.utils.timezone import utc
+from mock import patch
+from smart_manager.metric_store import (MetricStore, resolution_for, TIERS)
+from smart_manager.models import (CPUMetric, MemInfo, PoolUsage)
+
+T0 = datetime(2017, 5, 1, 10, 59, 0, tzinfo=utc)
+
+
+class MetricStoreTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_metric_store*
+    """
+
+    def rows(self, store, resolution):
+        return [r for r in store.pending if r.resolution == resolution]
+
+    def test_rollup(self):
+        store = MetricStore(CPUMetric, 'name')
+        # two cpus sampled every second for 2 minutes, crossing an hour.
+        for s in range(120):
+            store.add([{'name': 'cpu0', 'umode': s % 2, 'umode_nice': 0,
+                        'smode': 10, 'idle': 90, 'ts': 'ignored'},
+                       {'name': 'cpu1', 'umode': 4, 'umode_nice': 0,
+                        'smode': 20, 'idle': 76}],
+                      ts=T0 + timedelta(seconds=s))
+        self.assertEqual(len(self.rows(store, 1)), 240)
+        # the second minute is still open. Integer fields are rounded.
+        minutes = sorted(self.rows(store, 60), key=lambda r: r.name)
+        self.assertEqual([(r.name, r.ts) for r in minutes],
+                         [('cpu0', T0), ('cpu1', T0)])
+        self.assertEqual([(r.umode, r.smode, r.idle) for r in minutes],
+                         [(1, 10, 90), (4, 20, 76)])
+        hours = self.rows(store, 3600)
+        self.assertEqual(len(hours), 2)
+        self.assertEqual(hours[0].ts, T0.replace(minute=0))
+
+        with patch('smart_manager.models.CPUMetric.objects') as mock_objects:
+            self.assertEqual(store.flush(), 244)
+            self.assertEqual(store.flush(), 0)
+            self.assertEqual(mock_objects.bulk_create.call_count, 1)
+
+    def test_missing_values_and_count(self):
+        store = MetricStore(MemInfo)
+        store.add([{'total': 100, 'free': None}], ts=T0)
+        store.add([{'total': 200, 'free': 50}], ts=T0 + timedelta(seconds=1))
+        store.add([{'total': 0, 'free': 0}], ts=T0 + timedelta(minutes=1))
+        self.assertEqual(store.pending[0].free, 0)
+        minute = self.rows(store, 60)[0]
+        self.assertEqual((minute.total, minute.free), (150, 50))
+
+        store = MetricStore(PoolUsage, 'pool')
+        for s in range(3):
+            store.add([{'pool': 'pool1', 'free': 1000 * s,
+                        'reclaimable': 0}],
+                      ts=T0 + timedelta(seconds=30 * s))
+        self.assertEqual(sorted([(r.resolution, r.free, r.count)
+                                 for r in store.pending
+                                 if r.resolution != 1]),
+                         [(60, 500, 2), (3600, 500, 2)])
+
+    def test_resolution_for(self):
+        now = T0
+        self.assertEqual(resolution_for(now - timedelta(minutes=30), now), 1)
+        self.assertEqual(resolution_for(now - timedelta(hours=2), now), 60)
+        self.assertEqual(resolution_for(now - timedelta(days=30), now), 3600)
+        self.assertEqual(resolution_for(now - timedelta(days=900), now),
+                         TIERS[-1][0])
+
+    def test_prune(self):
+        store = MetricStore(CPUMetric, 'name')
+        with patch('smart_manager.models.CPUMetric.objects') as mock_objects:
+            store.prune(now=T0)
+        calls = [c[1] for c in mock_objects.filter.call_args_list]
+        self.assertEqual(calls, [
+            {'resolution': res, 'ts__lt': T0 - timedelta(seconds=retention)}
+            for res, retention in TIERS])
@@ -0,0 +1,65 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from mock import (patch, MagicMock)
+from smart_manager.agents import (process_nfsd_calls,
+                                  share_client_distribution)
+
+
+class NFSDCallsTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_nfsd_calls*
+    """
+    def setUp(self):
+        self.logger = MagicMock()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_process_nfsd_calls(self):
+        calls = patch('smart_manager.agents.nfsd_calls.'
+                      'NFSDCallDistribution.objects').start()
+        clients = patch('smart_manager.agents.nfsd_calls.'
+                        'NFSDClientDistribution.objects').start()
+        output = ('1493632800 1 2 3 4 5 6 7 8\n'
+                  '1493632800 10.0.0.1 1 2 3 4 5 6 7 8\n'
+                  '1493632801 1 2 3\n'
+                  '1493632801 1 2 3 4 5 6 7 8\n')
+        self.assertEqual(process_nfsd_calls(output, 3, self.logger), 3)
+        self.assertEqual(calls.bulk_create.call_count, 1)
+        self.assertEqual(clients.bulk_create.call_count, 1)
+        rows = calls.bulk_create.call_args[0][0]
+        self.assertEqual([(r.rid_id, r.num_lookup) for r in rows],
+                         [(3, '1'), (3, '1')])
+        self.assertEqual(clients.bulk_create.call_args[0][0][0].ip,
+                         '10.0.0.1')
+        self.assertEqual(self.logger.info.call_count, 1)
+
+    def test_share_client_distribution(self):
+        objects = patch('smart_manager.agents.nfsd_calls.'
+                        'NFSDShareClientDistribution.objects').start()
+        output = '\n'.join(['1493632800 share%d 10.0.0.1 1 2 3 4 5 6 7 8' %
+                            i for i in range(1000)])
+        self.assertEqual(
+            share_client_distribution(output, 3, self.logger), 1000)
+        self.assertEqual(objects.bulk_create.call_count, 1)
+        self.assertEqual(objects.bulk_create.call_args[1],
+                         {'batch_size': 500})
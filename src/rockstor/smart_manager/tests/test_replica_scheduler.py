@@ -0,0 +1,114 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from mock import (patch, MagicMock)
+from smart_manager.replication.bandwidth import (TokenBucket, reserve)
+from smart_manager.replication.listener_broker import ReplicaScheduler
+
+
+class TokenBucketTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_replica_scheduler*
+    """
+    def setUp(self):
+        self.now = 1000.0
+        patch('smart_manager.replication.bandwidth.time.time',
+              side_effect=lambda: self.now).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_reserve(self):
+        tb = TokenBucket(100)
+        # a full burst is available upfront.
+        self.assertEqual(tb.reserve(100), 0)
+        # then it's debt, paid off at rate.
+        self.assertEqual(tb.reserve(50), 0.5)
+        self.assertEqual(tb.reserve(50), 1.0)
+        self.now += 1
+        self.assertEqual(tb.reserve(0), 0)
+        self.now += 10
+        # never more than a burst after idling.
+        self.assertEqual(tb.tokens.value, 0)
+        self.assertEqual(tb.reserve(200), 1.0)
+
+    def test_unlimited_and_multiple(self):
+        self.assertEqual(TokenBucket(0).reserve(10 ** 9), 0)
+        tb1 = TokenBucket(100)
+        tb2 = TokenBucket(50)
+        self.assertEqual(reserve([tb1, tb2], 100), 1.0)
+        self.assertEqual(reserve([], 100), 0)
+
+
+class ReplicaSchedulerQueueTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_replica_scheduler*
+    """
+    def setUp(self):
+        self.rs = ReplicaScheduler()
+        self.rs.uuid = 'uuid'
+        self.rs.max_senders = 2
+        # seconds since the last success, None for never replicated.
+        self.staleness = {1: 60, 2: 3600, 3: None, 4: 600}
+        patch.object(self.rs, '_staleness',
+                     side_effect=lambda rid, now: self.staleness[rid]).start()
+        self.process_send = patch.object(
+            self.rs, '_process_send', side_effect=self._start).start()
+        mock_replica = patch('smart_manager.replication.listener_broker.'
+                             'Replica').start()
+        mock_replica.objects.get.side_effect = self._replica
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _replica(self, id):
+        return MagicMock(id=id, enabled=True)
+
+    def _start(self, replica):
+        sender = MagicMock(exitcode=None)
+        self.rs.senders['uuid_%d' % replica.id] = sender
+
+    def test_queue_order(self):
+        for rid in (1, 2, 3, 4):
+            self.rs._enqueue(self._replica(rid))
+        self.assertEqual([rid for rid, s in self.rs._queue_order()],
+                         [3, 2, 4, 1])
+        self.assertRaises(Exception, self.rs._enqueue, self._replica(1))
+
+    def test_dispatch(self):
+        for rid in (1, 2, 3, 4):
+            self.rs._enqueue(self._replica(rid))
+        self.rs._dispatch()
+        self.assertEqual(sorted(self.rs.senders.keys()), ['uuid_2', 'uuid_3'])
+        self.assertEqual(sorted(self.rs.queue.keys()), [1, 4])
+        status = self.rs._queue_status()
+        self.assertEqual(status['queue_depth'], 2)
+        self.assertEqual([j['rid'] for j in status['queued']], [4, 1])
+        self.assertEqual(sorted(j['rid'] for j in status['running']), [2, 3])
+        # a live sender can't be queued again.
+        self.assertRaises(Exception, self.rs._enqueue, self._replica(2))
+        # a slot frees up.
+        self.rs.senders['uuid_3'].exitcode = 0
+        self.rs._dispatch()
+        self.assertEqual(sorted(self.rs.senders.keys()), ['uuid_2', 'uuid_4'])
+        self.assertEqual(self.rs.queue.keys(), [1])
@@ -0,0 +1,322 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import tempfile
+import unittest
+import zmq
+from smart_manager.replication.transport import (
+    SendStream, SendStreamException, Spool, grant_credits, FSDATA,
+    FSDATA_COMPRESSED, STREAM_FINISHED, RECV_FINISHED, RECV_ERROR, KEEPALIVE,
+    RESUME_MISMATCH)
+from smart_manager.replication.compression import (Codec, negotiate,
+                                                   available, validate)
+
+# Stand in for btrfs send. Writes argv[1] MB of a repeating pattern to stdout
+# in odd sized writes and exits with argv[2].
+FAKE_SEND = """
+import os, sys
+block = ''.join(chr(i % 251) for i in range(1 << 20))
+for i in range(int(sys.argv[1])):
+    for j in range(0, len(block), 200000):
+        os.write(1, block[j:j + 200000])
+sys.exit(int(sys.argv[2]))
+"""
+
+
+def fake_send(size_mb, rc=0):
+    return subprocess.Popen([sys.executable, '-c', FAKE_SEND, str(size_mb),
+                             str(rc)], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+
+
+# Benchmarks stream hundreds of MB and are only run on request, eg:
+# ROCKSTOR_BENCHMARKS=1 ./bin/test ... -p test_replication_transport*
+BENCHMARKS = os.environ.get('ROCKSTOR_BENCHMARKS') == '1'
+
+
+def expected_digest(size_mb):
+    block = ''.join(chr(i % 251) for i in range(1 << 20))
+    md5 = hashlib.md5()
+    for i in range(size_mb):
+        md5.update(block)
+    return md5.hexdigest()
+
+
+class LoopbackReceiver(threading.Thread):
+    """
+    Plays the part of the broker and Receiver on a ROUTER socket: grants the
+    window, returns a credit per chunk and replies btrfs-recv-finished or
+    receiver-error at the end of the stream.
+    """
+    def __init__(self, ctx, window, codec=None):
+        self.sock = ctx.socket(zmq.ROUTER)
+        self.port = self.sock.bind_to_random_port('tcp://127.0.0.1')
+        self.window = window
+        self.codec = codec or Codec()
+        self.md5 = hashlib.md5()
+        self.chunk_sizes = []
+        self.wire_bytes = 0
+        self.end = None
+        super(LoopbackReceiver, self).__init__()
+        self.daemon = True
+
+    def run(self):
+        address, command, msg = self.sock.recv_multipart()
+        grant_credits(self.sock, self.window, address)
+        while (True):
+            address, command, msg = self.sock.recv_multipart()
+            if (command == KEEPALIVE):
+                continue
+            if (command in (FSDATA, FSDATA_COMPRESSED)):
+                grant_credits(self.sock, address=address)
+                self.wire_bytes += len(msg)
+                if (command == FSDATA_COMPRESSED):
+                    msg = self.codec.decompress(msg)
+                self.md5.update(msg)
+                self.chunk_sizes.append(len(msg))
+                continue
+            self.end = command
+            reply = RECV_FINISHED if (command == STREAM_FINISHED) else \
+                RECV_ERROR
+            self.sock.send_multipart([address, reply, ''])
+            break
+        self.sock.close(linger=1000)
+
+
+def loopback_transfer(ctx, proc, window, chunk_size, codec=None, **kwargs):
+    """
+    Run a SendStream of proc's stdout against a LoopbackReceiver. kwargs are
+    passed on to SendStream.
+    :return: (SendStream, LoopbackReceiver, seconds taken)
+    """
+    receiver = LoopbackReceiver(ctx, window, codec)
+    receiver.start()
+    sock = ctx.socket(zmq.DEALER)
+    sock.connect('tcp://127.0.0.1:%d' % receiver.port)
+    sock.send_multipart(['sender-ready', ''])
+    poll = zmq.Poller()
+    poll.register(sock, zmq.POLLIN)
+    stream = SendStream(sock, poll, chunk_size, timeout=10000, codec=codec,
+                        **kwargs)
+    t0 = time.time()
+    try:
+        stream.run(proc)
+    finally:
+        elapsed = time.time() - t0
+        receiver.join(10)
+    return stream, receiver, elapsed
+
+
+class ReplicationTransportTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_replication_transport*
+    """
+    def setUp(self):
+        self.ctx = zmq.Context()
+
+    def tearDown(self):
+        self.ctx.destroy(linger=0)
+
+    def transfer(self, size_mb, window, chunk_size, rc=0):
+        return loopback_transfer(self.ctx, fake_send(size_mb, rc), window,
+                                 chunk_size)
+
+    def test_stream(self):
+        chunk_size = 256 * 1024
+        stream, receiver, elapsed = self.transfer(5, 4, chunk_size)
+        self.assertEqual(stream.total_bytes, 5 << 20)
+        self.assertEqual(receiver.end, STREAM_FINISHED)
+        self.assertEqual(receiver.md5.hexdigest(), expected_digest(5))
+        self.assertEqual(set(receiver.chunk_sizes), set([chunk_size]))
+        # every credit granted was returned.
+        self.assertEqual(stream.credits, 4)
+        self.assertEqual(stream.acked_bytes, 5 << 20)
+
+    def test_short_last_chunk(self):
+        stream, receiver, elapsed = self.transfer(3, 2, 2 * 1024 * 1024)
+        self.assertEqual(receiver.chunk_sizes, [2 << 20, 1 << 20])
+        self.assertEqual(receiver.md5.hexdigest(), expected_digest(3))
+
+    def test_nonzero_exit(self):
+        with self.assertRaises(SendStreamException) as cm:
+            self.transfer(1, 4, 1024 * 1024, rc=1)
+        self.assertEqual(cm.exception.reply, RECV_ERROR)
+
+    def test_resume(self):
+        block = ''.join(chr(i % 251) for i in range(1 << 20))
+        md5 = hashlib.md5(block).hexdigest()
+        stream, receiver, elapsed = loopback_transfer(
+            self.ctx, fake_send(5), 4, 1 << 20, skip=3 << 20, skip_md5=md5)
+        self.assertEqual(receiver.end, STREAM_FINISHED)
+        self.assertEqual(receiver.md5.hexdigest(), expected_digest(2))
+        self.assertEqual(stream.total_bytes, 2 << 20)
+        self.assertEqual(stream.acked_bytes, 5 << 20)
+
+    def test_resume_mismatch(self):
+        with self.assertRaises(SendStreamException) as cm:
+            loopback_transfer(self.ctx, fake_send(5), 4, 1 << 20,
+                              skip=3 << 20, skip_md5='0' * 32)
+        self.assertEqual(cm.exception.reply, RESUME_MISMATCH)
+        # stream shorter than the offset.
+        with self.assertRaises(SendStreamException) as cm:
+            loopback_transfer(self.ctx, fake_send(2), 4, 1 << 20,
+                              skip=3 << 20, skip_md5='0' * 32)
+        self.assertEqual(cm.exception.reply, RESUME_MISMATCH)
+
+    def test_spool(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'spool', 'share_snap_1')
+            out_path = os.path.join(tmp, 'out')
+            spool = Spool(path, chunk_size=1000)
+            self.assertEqual(spool.offset, 0)
+            spool.append('a' * 2500)
+            spool.close()
+            # an earlier attempt left 2500 bytes behind.
+            spool = Spool(path, chunk_size=1000)
+            self.assertEqual(spool.resumed_from, 2500)
+            self.assertEqual(spool.tail_md5(1000),
+                             (2500, hashlib.md5('a' * 1000).hexdigest()))
+            with open(out_path, 'wb') as out:
+                spool.start(out)
+                spool.append('b' * 1500)
+                while (not spool.finish(1)):
+                    pass
+            with open(out_path) as ofo:
+                self.assertEqual(ofo.read(), 'a' * 2500 + 'b' * 1500)
+            spool.remove()
+            self.assertFalse(os.path.exists(path))
+        finally:
+            shutil.rmtree(tmp)
+
+    @unittest.skipUnless(BENCHMARKS, 'set ROCKSTOR_BENCHMARKS=1 to run')
+    def test_loopback_benchmark(self):
+        """
+        Full pipeline with a fake btrfs send producer. Compares the old
+        stop and wait behaviour(window of 1) with the default window.
+        """
+        from django.conf import settings
+        window = settings.REPLICATION.get('send_window')
+        chunk_size = settings.REPLICATION.get('chunk_size')
+        size_mb = 256
+        for w in (1, window):
+            stream, receiver, elapsed = self.transfer(size_mb, w, chunk_size)
+            self.assertEqual(receiver.md5.hexdigest(),
+                             expected_digest(size_mb))
+            sys.stderr.write('\nwindow: %d chunk: %d KB rate: %.2f MB/sec'
+                             % (w, chunk_size / 1024, size_mb / elapsed))
+
+
+def sample_send_stream(path, text_mb=8, random_mb=2):
+    """
+    Stand in for a recorded btrfs send stream: mostly source files, which
+    compress well, with some incompressible data mixed in.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    text = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for f in sorted(filenames):
+            if (f.endswith('.py')):
+                with open(os.path.join(dirpath, f)) as sfo:
+                    text.append(sfo.read())
+    text = ''.join(text)
+    with open(path, 'wb') as sfo:
+        for i in range(text_mb):
+            sfo.write((text * (1 + (1 << 20) / len(text)))[:1 << 20])
+            if (i < random_mb):
+                sfo.write(os.urandom(1 << 20))
+    return (text_mb + random_mb) << 20
+
+
+class ReplicationCompressionTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_replication_transport*
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.sample = tempfile.NamedTemporaryFile()
+        cls.sample_size = sample_send_stream(cls.sample.name)
+        with open(cls.sample.name, 'rb') as sfo:
+            cls.sample_md5 = hashlib.md5(sfo.read()).hexdigest()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sample.close()
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+
+    def tearDown(self):
+        self.ctx.destroy(linger=0)
+
+    def test_validate_and_negotiate(self):
+        self.assertEqual(validate('none', 9), ('none', None))
+        self.assertEqual(validate('zlib'), ('zlib', 6))
+        self.assertEqual(validate('zlib', '2'), ('zlib', 2))
+        self.assertRaises(Exception, validate, 'zlib', 10)
+        self.assertRaises(Exception, validate, 'bzip2')
+        self.assertEqual(negotiate(None).offer(),
+                         {'algo': 'none', 'level': None})
+        self.assertEqual(negotiate({'algo': 'bzip2'}).offer(),
+                         {'algo': 'none', 'level': None})
+        self.assertEqual(negotiate({'algo': 'zlib', 'level': 1}).offer(),
+                         {'algo': 'zlib', 'level': 1})
+
+    def stream_sample(self, codec, window=16, chunk_size=1 << 20):
+        proc = subprocess.Popen(['cat', self.sample.name],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return loopback_transfer(self.ctx, proc, window, chunk_size, codec)
+
+    def test_compressed_stream(self):
+        codec = Codec('zlib', 1)
+        stream, receiver, elapsed = self.stream_sample(codec)
+        self.assertEqual(receiver.end, STREAM_FINISHED)
+        self.assertEqual(receiver.md5.hexdigest(), self.sample_md5)
+        self.assertEqual(stream.total_bytes, self.sample_size)
+        self.assertEqual(stream.wire_bytes, receiver.wire_bytes)
+        self.assertTrue(stream.wire_bytes < stream.total_bytes)
+        # random chunks go uncompressed, so they are at most their own size.
+        self.assertTrue(stream.wire_bytes > (2 << 20))
+
+    def test_available_codecs(self):
+        """
+        Every codec available round trips the sample stream, and all but
+        none put fewer bytes on the wire than they read.
+        """
+        for algo in available():
+            stream, receiver, elapsed = self.stream_sample(Codec(algo))
+            self.assertEqual(receiver.end, STREAM_FINISHED)
+            self.assertEqual(receiver.md5.hexdigest(), self.sample_md5)
+            self.assertEqual(stream.total_bytes, self.sample_size)
+            self.assertEqual(stream.wire_bytes, receiver.wire_bytes)
+            if (algo == 'none'):
+                self.assertEqual(stream.wire_bytes, stream.total_bytes)
+            else:
+                self.assertTrue(stream.wire_bytes < stream.total_bytes,
+                                msg=algo)
@@ -0,0 +1,107 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+import gevent
+from mock import patch
+# the test runner's db connection doesn't survive monkey patching.
+with patch('gevent.monkey.patch_all'):
+    from smart_manager.data_collector import (SamplerNamespace,
+                                              SMARTNamespace)
+
+
+class CountingNamespace(SamplerNamespace):
+    interval = 0.01
+
+    def __init__(self, *args, **kwargs):
+        super(CountingNamespace, self).__init__(*args, **kwargs)
+        self.samples = 0
+
+    def sample(self, prev_stats):
+        self.samples += 1
+        self.broadcast('sample', self.samples)
+
+
+class BackgroundNamespace(CountingNamespace):
+    background = True
+
+
+class SamplerNamespaceTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_sampler_namespace*
+    """
+    def setUp(self):
+        patch.object(SamplerNamespace, 'enter_room').start()
+        self.emit = patch.object(SamplerNamespace, 'emit').start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_lifecycle(self):
+        ns = CountingNamespace('/counting')
+        self.assertTrue(ns.sampler is None)
+        ns.on_connect('sid1', {})
+        sampler = ns.sampler
+        self.assertFalse(sampler is None)
+        # one sampler shared by all subscribers.
+        ns.on_connect('sid2', {})
+        self.assertTrue(ns.sampler is sampler)
+        gevent.sleep(0.05)
+        self.assertTrue(ns.samples > 0)
+        self.assertTrue(self.emit.called)
+        ns.on_disconnect('sid1')
+        self.assertTrue(ns.sampler is sampler)
+        # stopped by the last subscriber leaving.
+        ns.on_disconnect('sid2')
+        self.assertTrue(ns.sampler is None)
+        gevent.sleep(0.05)
+        self.assertTrue(sampler.dead)
+        samples = ns.samples
+        gevent.sleep(0.05)
+        self.assertEqual(ns.samples, samples)
+
+    def test_background(self):
+        ns = BackgroundNamespace('/background')
+        ns.on_connect('sid1', {})
+        ns.on_disconnect('sid1')
+        # keeps sampling without subscribers, without broadcasting.
+        self.assertFalse(ns.sampler is None)
+        self.emit.reset_mock()
+        samples = ns.samples
+        gevent.sleep(0.05)
+        self.assertTrue(ns.samples > samples)
+        self.assertFalse(self.emit.called)
+        gevent.kill(ns.sampler)
+
+    def test_smart_seeded_from_history(self):
+        at_risk = [{'id': 1, 'name': 'sda', 'serial': 'serial1',
+                    'reasons': ['8 pending sectors']}]
+        patch('storageadmin.smart_history.drives_at_risk',
+              return_value=at_risk).start()
+        patch.object(SMARTNamespace, 'run_sampler').start()
+        ns = SMARTNamespace('/smart_widget')
+        ns.start()
+        # known before the first round of samples.
+        self.assertEqual(ns.at_risk, at_risk)
+        ns.on_connect('sid1', {})
+        self.emit.assert_called_with(
+            'drives_at_risk', {'key': 'smartWidget:drives_at_risk',
+                               'data': {'results': at_risk}}, room='sid1')
+        gevent.kill(ns.sampler)
@@ -0,0 +1,109 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from datetime import (datetime, timedelta)
+from django.utils.timezone import utc
+from mock import (patch, MagicMock)
+from smart_manager import usage_history
+from smart_manager.models import ShareUsage
+from smart_manager.usage_history import (record, rollup, growth_rate, DAILY)
+
+NOW = datetime(2017, 5, 20, 12, 0, 0, tzinfo=utc)
+
+
+class UsageHistoryTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_usage_history*
+    """
+    def setUp(self):
+        self.objects = patch(
+            'smart_manager.usage_history.ShareUsage.objects').start()
+        patch('smart_manager.usage_history.transaction').start()
+        patch('smart_manager.usage_history.router').start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_record(self):
+        self.objects.filter.return_value.values.return_value.annotate.\
+            return_value = [{'name': 'share1', 'id__max': 10},
+                            {'name': 'share2', 'id__max': 11}]
+        latest = [ShareUsage(id=10, name='share1', r_usage=100, e_usage=10),
+                  ShareUsage(id=11, name='share2', r_usage=200, e_usage=20)]
+        self.objects.filter.side_effect = [
+            self.objects.filter.return_value, latest, MagicMock()]
+        # a rollup was done recently.
+        usage_history._last_rollup = 1000.0
+        with patch('smart_manager.usage_history.time.time',
+                   return_value=1060.0):
+            self.assertEqual(record({'share1': (100, 10),
+                                     'share2': (250, 20),
+                                     'share3': (5, 5)}, ts=NOW), 2)
+        # one update for the unchanged share, one insert for the others.
+        self.assertEqual(self.objects.filter.call_args_list[2][1],
+                         {'id__in': [10]})
+        new = self.objects.bulk_create.call_args[0][0]
+        self.assertEqual(sorted([(su.name, su.r_usage) for su in new]),
+                         [('share2', 250), ('share3', 5)])
+        self.assertEqual(record({}), 0)
+
+    @patch('smart_manager.usage_history.rollup')
+    @patch('smart_manager.usage_history.rollup_task')
+    def test_record_queues_rollup(self, mock_task, mock_rollup):
+        self.objects.filter.return_value.values.return_value.annotate.\
+            return_value = []
+        self.objects.filter.side_effect = [
+            self.objects.filter.return_value, []]
+        usage_history._last_rollup = 0
+        with patch('smart_manager.usage_history.time.time',
+                   return_value=1000000.0):
+            record({'share1/snap1': (1, 1), 'share2/snap1': (2, 2)}, ts=NOW)
+        # handed to ztaskd, never run in the caller.
+        mock_task.async.assert_called_once_with()
+        self.assertEqual(mock_rollup.call_count, 0)
+        new = self.objects.bulk_create.call_args[0][0]
+        self.assertEqual(sorted([su.name for su in new]),
+                         ['share1/snap1', 'share2/snap1'])
+
+    def test_rollup(self):
+        old = NOW - timedelta(days=10)
+        raw = [ShareUsage(name='share1', r_usage=u, e_usage=u, count=2,
+                          ts=old + timedelta(hours=h))
+               for h, u in ((0, 1), (1, 2), (25, 3))]
+        self.objects.filter.return_value.order_by.return_value.iterator.\
+            return_value = iter(raw)
+        self.assertEqual(rollup(now=NOW), 2)
+        daily = sorted(self.objects.bulk_create.call_args[0][0],
+                       key=lambda su: su.ts)
+        self.assertEqual([(su.r_usage, su.count, su.resolution)
+                          for su in daily],
+                         [(2, 4, DAILY), (3, 2, DAILY)])
+        cutoff = datetime(2017, 5, 13, tzinfo=utc)
+        self.assertEqual(self.objects.filter.call_args_list[0][1],
+                         {'resolution': 1, 'ts__lt': cutoff})
+
+    def test_growth_rate(self):
+        points = [(NOW - timedelta(days=d), 1000 - 10 * d) for d in range(5)]
+        with patch('smart_manager.usage_history.history') as mock_history:
+            mock_history.return_value.values_list.return_value = points
+            self.assertAlmostEqual(growth_rate('share1', now=NOW), 10)
+            mock_history.return_value.values_list.return_value = points[:1]
+            self.assertEqual(growth_rate('share1', now=NOW), None)
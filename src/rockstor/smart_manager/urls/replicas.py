@@ -22,7 +22,7 @@ from smart_manager.views import (ReplicaListView, ReplicaTrailListView,
                                  ReplicaShareListView, ReplicaShareDetailView,
                                  ReceiveTrailListView, ReceiveTrailDetailView,
                                  ReplicaTrailDetailView, ReplicaDetailView,
-                                 ReceiverPoolListView)
+                                 ReceiverPoolListView, ReplicaQueueView)
 share_regex = settings.SHARE_REGEX
 
 urlpatterns = patterns(
@@ -32,6 +32,7 @@ urlpatterns = patterns(
         name='replica-view'),
     url(r'^share/(?P<sname>%s)$' % share_regex, ReplicaDetailView.as_view(),
         name='replica-view'),
+    url(r'^queue$', ReplicaQueueView.as_view(), name='replica-view'),
 
     url(r'^trail$', ReplicaTrailListView.as_view(), name='replica-view'),
     url(r'^trail/replica/(?P<rid>[0-9]+)', ReplicaTrailListView.as_view(),
@@ -16,13 +16,17 @@ You should have received a copy of the GNU General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+from django.conf import settings
 from django.conf.urls import patterns, url
 from smart_manager.views import (SProbeView, MemInfoView, NetStatView,
                                  DiskStatView, NFSDistribView,
                                  NFSDClientDistribView, NFSDShareDistribView,
                                  NFSDShareClientDistribView, CPUMetricView,
                                  NFSDUidGidDistributionView, LoadAvgView,
-                                 SProbeMetadataView, SProbeMetadataDetailView,)
+                                 SProbeMetadataView, SProbeMetadataDetailView,
+                                 ShareUsageView, ShareUsageGrowthView,)
+
+share_regex = settings.SHARE_REGEX
 
 
 urlpatterns = patterns(
@@ -42,6 +46,16 @@ urlpatterns = patterns(
         name='netstat-view'),
     url(r'^cpumetric/$', CPUMetricView.as_view(), name='cpumetric-view'),
     url(r'^loadavg$', LoadAvgView.as_view(), name='loadavg-view'),
+    url(r'^shareusage/(?P<sname>%s)$' % share_regex,
+        ShareUsageView.as_view(), name='shareusage-view'),
+    url(r'^shareusage/(?P<sname>%s)/growth$' % share_regex,
+        ShareUsageGrowthView.as_view(), name='shareusage-growth-view'),
+    url(r'^shareusage/(?P<sname>%s)/snapshots/(?P<snap_name>%s)$' %
+        (share_regex, share_regex), ShareUsageView.as_view(),
+        name='snapusage-view'),
+    url(r'^shareusage/(?P<sname>%s)/snapshots/(?P<snap_name>%s)/growth$' %
+        (share_regex, share_regex), ShareUsageGrowthView.as_view(),
+        name='snapusage-growth-view'),
 
 
     # Advanced smart probes
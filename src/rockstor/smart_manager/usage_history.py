@@ -0,0 +1,174 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import calendar
+import logging
+import time
+from datetime import (datetime, timedelta)
+from django.conf import settings
+from django.db import (router, transaction)
+from django.db.models import (F, Max)
+from django.utils.timezone import utc
+from django_ztask.decorators import task
+from smart_manager.models import ShareUsage
+
+logger = logging.getLogger(__name__)
+
+# Share and snapshot usage history is run length encoded: a row is only
+# added when a subvol's usage changes, otherwise the latest row gets the new
+# ts and one more count. Rows older than ROLLUP_AFTER days are reduced to
+# the last one of each day, which are then kept for RETENTION days.
+# Snapshots are recorded under snapshot_name() as their names are only
+# unique within a share.
+RAW = 1
+DAILY = 24 * 3600
+ROLLUP_AFTER = getattr(settings, 'SHARE_USAGE_ROLLUP_AFTER', 7)
+RETENTION = getattr(settings, 'SHARE_USAGE_RETENTION', 730)
+# seconds between the rollups record() hands to ztaskd.
+ROLLUP_INTERVAL = 3600
+
+_last_rollup = 0
+
+
+def _now():
+    return datetime.utcnow().replace(tzinfo=utc)
+
+
+def snapshot_name(share_name, snap_name):
+    """
+    :return: name a snapshot's usage is recorded under.
+    """
+    return '%s/%s' % (share_name, snap_name)
+
+
+def record(usages, ts=None):
+    """
+    Record the current usage of a batch of subvols, ie those of a pool,
+    with a fixed number of queries regardless of the batch size.
+    :param usages: dict of subvol name: (rusage, eusage) in KB.
+    :param ts: aware datetime of the refresh, now by default.
+    :return: number of rows added.
+    """
+    if (len(usages) == 0):
+        return 0
+    if (ts is None):
+        ts = _now()
+    latest_ids = [d['id__max'] for d in ShareUsage.objects.filter(
+        name__in=usages.keys(), resolution=RAW).values(
+        'name').annotate(Max('id'))]
+    latest = dict((su.name, su) for su in
+                  ShareUsage.objects.filter(id__in=latest_ids))
+    unchanged = []
+    new = []
+    for name, (rusage, eusage) in usages.items():
+        su = latest.get(name)
+        if (su is not None and su.r_usage == rusage and
+                su.e_usage == eusage):
+            unchanged.append(su.id)
+        else:
+            new.append(ShareUsage(name=name, r_usage=rusage, e_usage=eusage,
+                                  ts=ts))
+    if (len(unchanged) > 0):
+        ShareUsage.objects.filter(id__in=unchanged).update(
+            ts=ts, count=F('count') + 1)
+    if (len(new) > 0):
+        ShareUsage.objects.bulk_create(new, batch_size=500)
+    global _last_rollup
+    if (time.time() - _last_rollup > ROLLUP_INTERVAL):
+        # the first rollup after an upgrade goes through all of the
+        # history, so it's never run in the caller's request.
+        _last_rollup = time.time()
+        try:
+            rollup_task.async()
+        except Exception as e:
+            logger.error('Failed to queue share usage history rollup: %s' %
+                         e.__str__())
+    return len(new)
+
+
+@task()
+def rollup_task():
+    try:
+        rollup()
+    except Exception as e:
+        logger.error('Failed to rollup share usage history: %s' %
+                     e.__str__())
+        logger.exception(e)
+
+
+def rollup(now=None):
+    """
+    Replace the raw rows of whole days older than ROLLUP_AFTER with the last
+    row of each subvol and day, carrying the total count, and delete daily
+    rows older than RETENTION.
+    :return: number of daily rows added.
+    """
+    if (now is None):
+        now = _now()
+    cutoff = (now - timedelta(days=ROLLUP_AFTER)).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    days = {}
+    for su in ShareUsage.objects.filter(
+            resolution=RAW, ts__lt=cutoff).order_by('ts').iterator():
+        key = (su.name, su.ts.date())
+        if (key in days):
+            su.count += days[key].count
+        days[key] = su
+    daily = [ShareUsage(name=su.name, r_usage=su.r_usage,
+                        e_usage=su.e_usage, ts=su.ts, count=su.count,
+                        resolution=DAILY) for su in days.values()]
+    with transaction.atomic(using=router.db_for_write(ShareUsage)):
+        ShareUsage.objects.bulk_create(daily, batch_size=500)
+        ShareUsage.objects.filter(resolution=RAW, ts__lt=cutoff).delete()
+        ShareUsage.objects.filter(
+            resolution=DAILY,
+            ts__lt=now - timedelta(days=RETENTION)).delete()
+    return len(daily)
+
+
+def history(name, days=30, now=None):
+    """
+    :param name: share name or snapshot_name().
+    :return: queryset of the subvol's usage rows over the last days, oldest
+    first.
+    """
+    if (now is None):
+        now = _now()
+    return ShareUsage.objects.filter(
+        name=name, ts__gte=now - timedelta(days=days)).order_by('ts')
+
+
+def growth_rate(name, days=30, field='r_usage', now=None):
+    """
+    Least squares fit of a subvol's usage over the last days.
+    :param name: share name or snapshot_name().
+    :param field: r_usage (referenced) or e_usage (exclusive).
+    :return: growth in KB per day, or None with less than two points.
+    """
+    points = [(calendar.timegm(ts.utctimetuple()) / float(DAILY), usage)
+              for ts, usage in history(name, days, now).values_list(
+                  'ts', field)]
+    if (len(points) < 2):
+        return None
+    n = float(len(points))
+    mean_t = sum([t for t, u in points]) / n
+    mean_u = sum([u for t, u in points]) / n
+    var = sum([(t - mean_t) ** 2 for t, u in points])
+    if (var == 0):
+        return None
+    return sum([(t - mean_t) * (u - mean_u) for t, u in points]) / var
@@ -26,12 +26,13 @@ from nfs_share_client_distrib import NFSDShareClientDistribView  # noqa E501
 from cpu_util import CPUMetricView  # noqa E501
 from nfs_uid_gid import NFSDUidGidDistributionView  # noqa E501
 from load_avg import LoadAvgView  # noqa E501
+from share_usage import (ShareUsageView, ShareUsageGrowthView)  # noqa E501
 from sprobe_metadata import (SProbeMetadataView, SProbeMetadataDetailView)  # noqa E501
 from base_service import (BaseServiceView, BaseServiceDetailView)  # noqa E501
 from nis_service import NISServiceView  # noqa E501
 from samba_service import SambaServiceView  # noqa E501
 from nfs_service import NFSServiceView  # noqa E501
-from replication import (ReplicaListView, ReplicaDetailView)  # noqa E501
+from replication import (ReplicaListView, ReplicaDetailView, ReplicaQueueView)  # noqa E501
 from replica_trail import (ReplicaTrailListView, ReplicaTrailDetailView)  # noqa E501
 from replication_service import ReplicationServiceView  # noqa E501
 from ntp_service import NTPServiceView  # noqa E501
@@ -18,12 +18,30 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from django.conf import settings
 from django.db.models import Count
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import (is_naive, make_aware, utc)
+from smart_manager.metric_store import (is_tiered, resolution_for, RAW)
 import rest_framework_custom as rfc
 
 
 class GenericSProbeView(rfc.GenericView):
     content_negotiation_class = rfc.IgnoreClient
 
+    def _objects(self, t1=None):
+        # Time series models hold all resolutions in one table. Range queries
+        # get the finest one still retained at t1, everything else raw
+        # samples.
+        if (not is_tiered(self.model_obj)):
+            return self.model_obj.objects.all()
+        resolution = RAW
+        if (t1 is not None):
+            ts = parse_datetime(t1)
+            if (ts is not None):
+                if (is_naive(ts)):
+                    ts = make_aware(ts, utc)
+                resolution = resolution_for(ts)
+        return self.model_obj.objects.filter(resolution=resolution)
+
     def get_queryset(self):
         limit = self.request.query_params.get(
             'limit', settings.REST_FRAMEWORK['MAX_LIMIT'])
@@ -33,15 +51,15 @@ class GenericSProbeView(rfc.GenericView):
         group_field = self.request.query_params.get('group', None)
         if (group_field is not None):
             qs = []
-            distinct_fields = self.model_obj.objects.values(
+            distinct_fields = self._objects().values(
                 group_field).annotate(c=Count(group_field))
             filter_field = ('%s__exact' % group_field)
             for d in distinct_fields:
-                qs.extend(self.model_obj.objects.filter(
+                qs.extend(self._objects().filter(
                     **{filter_field: d[group_field]}).order_by('-ts')[0:limit])
             return qs
         if (t1 is not None and t2 is not None):
-            return self.model_obj.objects.filter(ts__gt=t1, ts__lte=t2)
+            return self._objects(t1).filter(ts__gt=t1, ts__lte=t2)
 
         sort_col = self.request.query_params.get('sortby', None)
         if (sort_col is not None):
@@ -51,4 +69,4 @@ class GenericSProbeView(rfc.GenericView):
             else:
                 reverse = False
             return self._sorted_results(sort_col, reverse)
-        return self.model_obj.objects.all().order_by('-ts')[0:limit]
+        return self._objects().order_by('-ts')[0:limit]
@@ -16,12 +16,11 @@ You should have received a copy of the GNU General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
-from rest_framework import generics
 from smart_manager.models import LoadAvg
 from smart_manager.serializers import LoadAvgSerializer
+from generic_sprobe import GenericSProbeView
 
 
-class LoadAvgView(generics.ListAPIView):
-    paginate_by = 0
+class LoadAvgView(GenericSProbeView):
     serializer_class = LoadAvgSerializer
-    queryset = LoadAvg.objects.all()
+    model_obj = LoadAvg
@@ -87,6 +87,8 @@ class ReceiveTrailDetailView(rfc.GenericView):
             rt.status = request.data.get('status', rt.status)
             rt.error = request.data.get('error', rt.error)
             rt.kb_received = request.data.get('kb_received', rt.kb_received)
+            rt.kb_per_sec = request.data.get('kb_per_sec', rt.kb_per_sec)
+            rt.kb_on_wire = request.data.get('kb_on_wire', rt.kb_on_wire)
             if (rt.status in ('succeeded', 'failed',)):
                 rt.end_ts = ts
                 rt.receive_succeeded = ts
@@ -81,8 +81,10 @@ class ReplicaTrailDetailView(rfc.GenericView):
             rt.status = request.data['status']
             if ('error' in request.data):
                 rt.error = request.data['error']
-            if ('kb_sent' in request.data):
-                rt.kb_sent = request.data['kb_sent']
+            for f in ('kb_sent', 'kb_on_wire', 'kb_per_sec', 'kb_acked',
+                      'kb_resumed',):
+                if (f in request.data):
+                    setattr(rt, f, request.data[f])
             if (rt.status in ('failed', 'succeeded',)):
                 ts = datetime.utcnow().replace(tzinfo=utc)
                 rt.end_ts = ts
@@ -23,10 +23,13 @@ from django.db import transaction
 from storageadmin.models import (Share, Appliance, EmailClient)
 from smart_manager.models import (Replica, ReplicaTrail)
 from smart_manager.serializers import ReplicaSerializer
+from smart_manager.replication import compression
 from storageadmin.util import handle_exception
 from datetime import datetime
 from django.utils.timezone import utc
 from django.conf import settings
+import json
+import zmq
 import rest_framework_custom as rfc
 import logging
 logger = logging.getLogger(__name__)
@@ -68,6 +71,13 @@ class ReplicaMixin(object):
             handle_exception(Exception(e_msg), request)
         return port
 
+    @staticmethod
+    def _validate_compression(algo, level, request):
+        try:
+            return compression.validate(algo, level)
+        except Exception as e:
+            handle_exception(e, request)
+
 
 class ReplicaListView(ReplicaMixin, rfc.GenericView):
 
@@ -103,12 +113,16 @@ class ReplicaListView(ReplicaMixin, rfc.GenericView):
             if (replication_ip is not None and
                     len(replication_ip.strip()) == 0):
                 replication_ip = None
+            algo, level = self._validate_compression(
+                request.data.get('compression', compression.NONE),
+                request.data.get('compression_level'), request)
             ts = datetime.utcnow().replace(tzinfo=utc)
             r = Replica(task_name=task_name, share=sname,
                         appliance=appliance.uuid, pool=share.pool.name,
                         dpool=dpool, enabled=True, crontab=crontab,
                         data_port=data_port, ts=ts,
-                        replication_ip=replication_ip)
+                        replication_ip=replication_ip, compression=algo,
+                        compression_level=level)
             r.save()
             self._refresh_crontab()
             return Response(ReplicaSerializer(r).data)
@@ -164,6 +178,12 @@ class ReplicaDetailView(ReplicaMixin, rfc.GenericView):
             r.replication_ip = replication_ip
             r.data_port = self._validate_port(
                 request.data.get('listener_port', r.data_port), request)
+            if ('compression' in request.data or
+                    'compression_level' in request.data):
+                r.compression, r.compression_level = \
+                    self._validate_compression(
+                        request.data.get('compression', r.compression),
+                        request.data.get('compression_level'), request)
             ts = datetime.utcnow().replace(tzinfo=utc)
             r.ts = ts
             r.save()
@@ -187,3 +207,32 @@ class ReplicaDetailView(ReplicaMixin, rfc.GenericView):
             r.delete()
             self._refresh_crontab()
             return Response()
+
+
+class ReplicaQueueView(rfc.GenericView):
+
+    def get(self, request, *args, **kwargs):
+        """
+        Replication Tasks queued and running in the replication service,
+        with how long they've waited for a Sender slot.
+        """
+        with self._handle_exception(request):
+            ctx = zmq.Context()
+            try:
+                req = ctx.socket(zmq.DEALER)
+                req.connect('ipc://%s' %
+                            settings.REPLICATION.get('ipc_socket'))
+                req.send_multipart(['queue-status', ''])
+                if (req.poll(5000) != zmq.POLLIN):
+                    e_msg = ('No response from the Replication service. '
+                             'Check that it is running.')
+                    handle_exception(Exception(e_msg), request)
+                rcommand, reply = req.recv_multipart()
+                status = json.loads(reply)
+            finally:
+                ctx.destroy(linger=0)
+            names = dict(Replica.objects.filter().values_list(
+                'id', 'task_name'))
+            for job in status['queued'] + status['running']:
+                job['task_name'] = names.get(job['rid'])
+            return Response(status)
@@ -48,6 +48,19 @@ class ReplicationServiceView(BaseServiceDetailView):
                 if (listener_port < 0 or listener_port > 65535):
                     raise Exception('Invalid listener port(%d)'
                                     % listener_port)
+                # optional, settings.REPLICATION has the defaults.
+                for k, low in (('max_concurrent_sends', 1),
+                               ('bandwidth_limit', 0),
+                               ('target_bandwidth_limit', 0),):
+                    if (k not in config):
+                        continue
+                    try:
+                        config[k] = int(config[k])
+                    except (TypeError, ValueError):
+                        config[k] = low - 1
+                    if (config[k] < low):
+                        raise Exception('%s must be a number, %d or more.'
+                                        % (k, low))
                 ni = config['network_interface']
                 if (not NetworkConnection.objects.filter(name=ni).exists()):
                     raise Exception('Network Interface(%s) does not exist.'
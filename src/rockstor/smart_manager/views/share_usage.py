@@ -0,0 +1,66 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from rest_framework.response import Response
+from smart_manager.serializers import ShareUsageSerializer
+from smart_manager.usage_history import (history, growth_rate,
+                                         snapshot_name)
+from storageadmin.models import Share
+from storageadmin.util import days_param
+import rest_framework_custom as rfc
+
+
+class ShareUsageMixin(object):
+
+    @staticmethod
+    def _name(sname, snap_name=None):
+        if (snap_name is None):
+            return sname
+        return snapshot_name(sname, snap_name)
+
+
+class ShareUsageView(ShareUsageMixin, rfc.GenericView):
+    serializer_class = ShareUsageSerializer
+
+    def get_queryset(self, *args, **kwargs):
+        return history(self._name(self.kwargs['sname'],
+                                  self.kwargs.get('snap_name')),
+                       days_param(self.request, 30))
+
+
+class ShareUsageGrowthView(ShareUsageMixin, rfc.GenericView):
+
+    def get(self, request, sname, snap_name=None):
+        """
+        Growth of a share or snapshot's referenced usage (KB per day) over
+        the last days, and for shares the days left until that rate fills
+        the share's size.
+        """
+        with self._handle_exception(request):
+            days = days_param(request, 30)
+            name = self._name(sname, snap_name)
+            growth = growth_rate(name, days)
+            data = {'name': name, 'days': days, 'growth': growth,
+                    'days_to_full': None, }
+            share = None
+            if (snap_name is None):
+                share = Share.objects.filter(name=sname).first()
+            if (share is not None and growth is not None and growth > 0):
+                data['days_to_full'] = max(
+                    0, (share.size - share.rusage) / growth)
+            return Response(data)
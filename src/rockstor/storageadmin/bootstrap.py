@@ -0,0 +1,154 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Boot time bring up of pools, shares, snapshots and their exports. Mounts
+# are mostly waiting on mount(8) and btrfs, so independent ones are run
+# concurrently by an Executor while db writes stay in the calling thread.
+# Worker threads use their own db connection, and so only see what the
+# caller has committed.
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class Executor(object):
+    """
+    Runs tasks on a bounded pool of worker threads, each one as soon as all
+    the tasks it depends on have succeeded. Tasks that depend on a failed
+    task are skipped.
+    """
+
+    def __init__(self, workers=None):
+        if (workers is None):
+            workers = getattr(settings, 'BOOTSTRAP_WORKERS', 8)
+        self.workers = workers
+        self.tasks = OrderedDict()
+
+    def add(self, key, func, *args, **kwargs):
+        """
+        :param key: unique name of the task, used in log messages.
+        :param func: called with args in a worker thread.
+        :param deps: keyword only, keys of previously added tasks that must
+        succeed before this one is run.
+        """
+        deps = kwargs.pop('deps', ())
+        for d in deps:
+            if (d not in self.tasks):
+                raise Exception('Unknown dependency(%s) of task(%s).' %
+                                (d, key))
+        self.tasks[key] = (func, args, deps)
+
+    def _call(self, key, func, args, done):
+        try:
+            value = func(*args)
+        except Exception as e:
+            logger.error('Bootstrap task(%s) failed. Moving on: %s' %
+                         (key, e.__str__()))
+            logger.exception(e)
+            done(key, False, e)
+        else:
+            done(key, True, value)
+        finally:
+            connection.close()
+
+    def run(self):
+        """
+        Run all tasks and wait for them to finish.
+        :return: dict of key: (True, return value) for tasks that succeeded,
+        (False, exception) for tasks that failed and (False, None) for tasks
+        that were skipped.
+        """
+        results = {}
+        if (len(self.tasks) == 0):
+            return results
+        pending = OrderedDict(self.tasks)
+        running = set()
+        cv = threading.Condition()
+
+        def done(key, ok, value):
+            with cv:
+                results[key] = (ok, value)
+                running.discard(key)
+                cv.notify()
+
+        pool = ThreadPool(min(self.workers, len(self.tasks)))
+        try:
+            with cv:
+                while (len(pending) > 0 or len(running) > 0):
+                    skipped = False
+                    for key, (func, args, deps) in pending.items():
+                        if (any(d not in results for d in deps)):
+                            continue
+                        del pending[key]
+                        if (not all(results[d][0] for d in deps)):
+                            logger.error('Skipping bootstrap task(%s) as a '
+                                         'task it depends on failed.' % key)
+                            results[key] = (False, None)
+                            skipped = True
+                            continue
+                        running.add(key)
+                        pool.apply_async(self._call,
+                                         (key, func, args, done))
+                    if (not skipped and len(running) > 0):
+                        cv.wait()
+        finally:
+            pool.close()
+            pool.join()
+        return results
+
+
+class Phases(object):
+    """
+    Wall clock time of each phase of a multi step operation, eg:
+    with phases('pools'):
+        ...
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.timings = OrderedDict()
+        self.name = None
+        self.since = None
+
+    def __call__(self, name):
+        self.name = name
+        return self
+
+    def __enter__(self):
+        self.since = time.time()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.timings[self.name] = round(time.time() - self.since, 3)
+        logger.info('Bootstrap phase(%s) took %.3f seconds.' %
+                    (self.name, self.timings[self.name]))
+
+    def mark(self, name):
+        """
+        Record the time elapsed since the start under name, eg once exports
+        are served.
+        """
+        self.timings[name] = round(time.time() - self.start, 3)
+        logger.info('Bootstrap %s after %.3f seconds.' %
+                    (name, self.timings[name]))
@@ -17,6 +17,7 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 from system.osi import run_command
+from storageadmin import probe_cache
 from django.conf import settings
 
 import logging
@@ -34,3 +35,28 @@ class ProdExceptionMiddleware(object):
         run_command(['/usr/bin/tar', '-c', '-z', '-f',
                      settings.ROOT_DIR + 'src/rockstor/logs/error.tgz',
                      settings.ROOT_DIR + 'var/log'])
+
+
+class ProbeCacheMiddleware(object):
+    """
+    Scopes the probe cache to read only requests. Any other request may
+    change what the probes report, so it runs without the cache and drops
+    what this process has cached when it's done.
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', )
+
+    def process_request(self, request):
+        if (request.method in self.SAFE_METHODS):
+            probe_cache.begin()
+
+    def process_response(self, request, response):
+        self._finish(request)
+        return response
+
+    def process_exception(self, request, exception):
+        self._finish(request)
+
+    def _finish(self, request):
+        probe_cache.end()
+        if (request.method not in self.SAFE_METHODS):
+            probe_cache.invalidate()
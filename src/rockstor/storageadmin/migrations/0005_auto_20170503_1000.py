@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storageadmin', '0004_auto_20170523_1140'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SMARTSample',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),  # noqa E501
+                ('aid', models.IntegerField()),
+                ('raw_value', models.BigIntegerField()),
+                ('normed_value', models.IntegerField()),
+                ('ts', models.DateTimeField(db_index=True)),
+                ('disk', models.ForeignKey(to='storageadmin.Disk')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='smartsample',
+            index_together=set([('disk', 'aid', 'ts')]),
+        ),
+    ]
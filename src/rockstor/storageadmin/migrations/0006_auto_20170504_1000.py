@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storageadmin', '0005_auto_20170503_1000'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskHandle',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),  # noqa E501
+                ('kind', models.CharField(max_length=64)),
+                ('object_id', models.IntegerField()),
+                ('state', models.CharField(default=b'pending', max_length=16)),  # noqa E501
+                ('message', models.CharField(max_length=1024, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('end_time', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='taskhandle',
+            index_together=set([('kind', 'object_id', 'state')]),
+        ),
+        migrations.AddField(
+            model_name='poolbalance',
+            name='handle',
+            field=models.ForeignKey(to='storageadmin.TaskHandle', null=True),
+        ),
+    ]
@@ -21,6 +21,7 @@ from django.db import models
 from storageadmin.models import Pool
 from system.osi import get_disk_power_status, read_hdparm_setting, \
     get_disk_APM_level, get_dev_temp_name
+from storageadmin.probe_cache import probe
 
 
 class AttachedManager(models.Manager):
@@ -83,28 +84,32 @@ class Disk(models.Model):
     @property
     def power_state(self, *args, **kwargs):
         try:
-            return get_disk_power_status(str(self.name))
+            return probe(('power_state', self.name), get_disk_power_status,
+                         str(self.name))
         except:
             return None
 
     @property
     def hdparm_setting(self, *args, **kwargs):
         try:
-            return read_hdparm_setting(str(self.name))
+            return probe(('hdparm_setting', self.name), read_hdparm_setting,
+                         str(self.name))
         except:
             return None
 
     @property
     def apm_level(self, *args, **kwargs):
         try:
-            return get_disk_APM_level(str(self.name))
+            return probe(('apm_level', self.name), get_disk_APM_level,
+                         str(self.name))
         except:
             return None
 
     @property
     def temp_name(self, *args, **kwargs):
         try:
-            return get_dev_temp_name(str(self.name))
+            return probe(('temp_name', self.name), get_dev_temp_name,
+                         str(self.name))
         except:
             return None
 
@@ -20,7 +20,9 @@ from django.db import models
 from django.conf import settings
 from fs.btrfs import pool_usage, usage_bound, \
     are_quotas_enabled
+from fs.quota_rescan import rescan_state
 from system.osi import mount_status
+from storageadmin.probe_cache import probe
 
 RETURN_BOOLEAN = True
 
@@ -46,7 +48,8 @@ class Pool(models.Model):
         # less code. For share usage, this type of logic could slow things
         # down quite a bit because there can be 100's of Shares, but number
         # of Pools even on a large instance is usually no more than a few.
-        return self.size - pool_usage('%s%s' % (settings.MNT_PT, self.name))
+        mnt_pt = '%s%s' % (settings.MNT_PT, self.name)
+        return self.size - probe(('pool_usage', mnt_pt), pool_usage, mnt_pt)
 
     @property
     def reclaimable(self, *args, **kwargs):
@@ -79,9 +82,21 @@ class Pool(models.Model):
     def quotas_enabled(self, *args, **kwargs):
         # Calls are_quotas_enabled for boolean response
         try:
-            return are_quotas_enabled('%s%s' % (settings.MNT_PT, self.name))
+            mnt_pt = '%s%s' % (settings.MNT_PT, self.name)
+            return probe(('quotas_enabled', mnt_pt), are_quotas_enabled,
+                         mnt_pt)
         except:
             return False
 
+    @property
+    def quota_rescan(self, *args, **kwargs):
+        # State of coalesced quota rescans, see fs/quota_rescan.py. Share
+        # usage is stale until a pending or running rescan completes.
+        try:
+            mnt_pt = '%s%s' % (settings.MNT_PT, self.name)
+            return probe(('quota_rescan', mnt_pt), rescan_state, mnt_pt)
+        except:
+            return None
+
     class Meta:
         app_label = 'storageadmin'
@@ -17,15 +17,16 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 from django.db import models
-from storageadmin.models import Pool
+from storageadmin.models import (Pool, TaskHandle)
 
 
 class PoolBalance(models.Model):
 
     pool = models.ForeignKey(Pool)
     status = models.CharField(max_length=10, default='started')
-    # django ztask uuid
+    # django ztask uuid, of balances started before task handles.
     tid = models.CharField(max_length=36, null=True)
+    handle = models.ForeignKey(TaskHandle, null=True)
     message = models.CharField(max_length=1024, null=True)
     start_time = models.DateTimeField(auto_now=True)
     end_time = models.DateTimeField(null=True)
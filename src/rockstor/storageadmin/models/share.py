@@ -21,9 +21,10 @@ from django.db import models
 from django.db.models.signals import (post_save, post_delete)
 from django.dispatch import receiver
 
-from fs.btrfs import qgroup_exists
+from fs.btrfs import qgroup_ids
 from storageadmin.models import Pool
 from system.osi import mount_status
+from storageadmin.probe_cache import probe
 from .netatalk_share import NetatalkShare
 from system.services import (systemctl, refresh_afp_config)
 
@@ -89,9 +90,10 @@ class Share(models.Model):
             if str(self.pqgroup) == '-1/-1':
                 return False
             else:
-                return qgroup_exists(
-                    '%s%s' % (settings.MNT_PT, self.pool.name),
-                    '%s' % self.pqgroup)
+                # One qgroup listing per pool for all of its shares.
+                mnt_pt = '%s%s' % (settings.MNT_PT, self.pool.name)
+                return ('%s' % self.pqgroup) in probe(('qgroup_ids', mnt_pt),
+                                                      qgroup_ids, mnt_pt)
         except:
             return False
 
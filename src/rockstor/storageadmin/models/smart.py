@@ -129,6 +129,20 @@ class SMARTIdentity(models.Model):
         app_label = 'storageadmin'
 
 
+class SMARTSample(models.Model):
+    """periodic sample of a tracked SMART attribute, see
+    storageadmin.smart_history"""
+    disk = models.ForeignKey(Disk)
+    aid = models.IntegerField()
+    raw_value = models.BigIntegerField()
+    normed_value = models.IntegerField()
+    ts = models.DateTimeField(db_index=True)
+
+    class Meta:
+        app_label = 'storageadmin'
+        index_together = (('disk', 'aid', 'ts'),)
+
+
 class SMARTInfo(models.Model):
     disk = models.ForeignKey(Disk)
     toc = models.DateTimeField(auto_now=True)
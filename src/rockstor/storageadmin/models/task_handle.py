@@ -0,0 +1,39 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from django.db import models
+
+
+class TaskHandle(models.Model):
+    """
+    Handle of an asynchronous(django ztask) task, created on submission so
+    it's id can be returned synchronously and the task's state looked up by
+    kind and object, ie a pool or rock-on id. See storageadmin.task_handles
+    """
+    STATES = ('pending', 'running', 'finished', 'failed', )
+    # eg 'balance'
+    kind = models.CharField(max_length=64)
+    object_id = models.IntegerField()
+    state = models.CharField(max_length=16, default='pending')
+    message = models.CharField(max_length=1024, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    end_time = models.DateTimeField(null=True)
+
+    class Meta:
+        app_label = 'storageadmin'
+        index_together = (('kind', 'object_id', 'state'),)
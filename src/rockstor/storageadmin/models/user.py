@@ -46,6 +46,8 @@ class User(models.Model):
     def groupname(self, *args, **kwargs):
         if (self.group is not None):
             return self.group.groupname
+        if (getattr(self, 'sys_groupname', None) is not None):
+            return self.sys_groupname
         if (self.gid is not None):
             groupname = grp.getgrgid(self.gid).gr_name
             charset = chardet.detect(groupname)
@@ -53,6 +55,10 @@ class User(models.Model):
             return groupname
         return None
 
+    @groupname.setter
+    def groupname(self, val, *args, **kwargs):
+        self.sys_groupname = val
+
     @property
     def managed_user(self, *args, **kwargs):
         return getattr(self, 'editable', True)
@@ -0,0 +1,110 @@
+"""Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Pool balance status, shared by the pool balance api and the data
+# collector's pool balance feed.
+
+from django_ztask.models import Task
+from storageadmin.models import (PoolBalance, TaskHandle)
+from storageadmin.task_handles import create
+from fs.btrfs import (balance_status, mount_root, start_balance)
+
+# balance states in which it's status is followed.
+ACTIVE = ('started', 'running', 'cancelling', 'pausing', 'paused', )
+
+
+def start(pool, force=False, convert=None):
+    """
+    Start a balance of the pool in the background. The balance task is only
+    queued by task_handles.send(call), once the caller's transaction is
+    committed.
+    :return: (the new PoolBalance, whose handle tracks the balance task, call
+    to send).
+    """
+    handle, call = create('balance', pool.id, start_balance,
+                          mount_root(pool), force=force, convert=convert)
+    ps = PoolBalance(pool=pool, handle=handle)
+    ps.save()
+    return ps, call
+
+
+def _task_failure(ps):
+    # (end time, message) of the balance's failed task, if it failed.
+    if (ps.handle_id is not None):
+        th = TaskHandle.objects.get(id=ps.handle_id)
+        if (th.state == 'failed'):
+            return (th.end_time, th.message)
+        return None
+    # balances started before task handles.
+    if (ps.tid is not None and Task.objects.filter(uuid=ps.tid).exists()):
+        to = Task.objects.get(uuid=ps.tid)
+        if (to.failed is not None):
+            to.delete()
+            return (to.failed, to.last_exception)
+    return None
+
+
+def update_status(pool):
+    """
+    Update the pool's last PoolBalance with the current balance status.
+    :return: the PoolBalance, None if the pool was never balanced.
+    """
+    try:
+        # acquire a handle on the last pool balance status db entry
+        ps = PoolBalance.objects.filter(pool=pool).order_by('-id')[0]
+    except IndexError:
+        # return empty handed if we have no 'last entry' to update
+        return None
+    # Check if the task which started our last pool balance failed.
+    if (ps.status != 'failed'):
+        failure = _task_failure(ps)
+        if (failure is not None):
+            ps.status = 'failed'
+            ps.end_time, ps.message = failure
+            ps.save()
+            return ps
+    # Get the current status of balance on this pool, irrespective of
+    # a running balance task, ie command line intervention.
+    cur_status = balance_status(pool)
+    previous_status = ps.status
+    # TODO: future "Balance Cancel" button should call us to have these
+    # TODO: values updated in the db table ready for display later.
+    if previous_status == 'cancelling' \
+            and cur_status['status'] == 'finished':
+        # override current status as 'cancelled'
+        cur_status['status'] = 'cancelled'
+        cur_status['message'] = \
+            'cancelled at %s%% complete' % ps.percent_done
+        # and retain prior percent finished value
+        cur_status['percent_done'] = ps.percent_done
+    if previous_status not in ('finished', 'cancelled', 'failed'):
+        # update the last pool balance status with current status info.
+        PoolBalance.objects.filter(id=ps.id).update(**cur_status)
+        for k, v in cur_status.items():
+            setattr(ps, k, v)
+    return ps
+
+
+def active_pools():
+    """
+    :return: list of the pools whose last balance is in progress.
+    """
+    last = {}
+    for ps in PoolBalance.objects.filter(
+            status__in=ACTIVE).select_related('pool').order_by('id'):
+        last[ps.pool_id] = ps.pool
+    return [pool for pid, pool in sorted(last.items())]
@@ -0,0 +1,91 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Memoization of the system probes(btrfs, hdparm, /proc/mounts etc) behind
+# Pool, Share and Disk model properties. Serializing a list of shares reads
+# the same pool and disk properties over and over, so within a read only
+# request each probe runs at most once per pool or device. Results are also
+# kept for settings.PROBE_CACHE_TTL seconds across read only requests.
+# Outside of a read only request, ie in views that change state, scripts and
+# daemons, probes always run.
+# The cache is per process. A state changing request only invalidates the
+# cache of the gunicorn worker that served it, other workers may answer with
+# what they cached before the change for up to PROBE_CACHE_TTL seconds.
+
+import threading
+import time
+from django.conf import settings
+
+_local = threading.local()
+_lock = threading.Lock()
+# key -> (expiry time, value), shared by requests in this process.
+_shared = {}
+
+
+def _ttl():
+    return getattr(settings, 'PROBE_CACHE_TTL', 0)
+
+
+def probe(key, func, *args):
+    """
+    :param key: tuple identifying the probe, eg ('pool_usage', mnt_pt)
+    :param func: the probe, called as func(*args)
+    :return: func(*args), memoized between begin() and end().
+    """
+    cache = getattr(_local, 'cache', None)
+    if (cache is None):
+        return func(*args)
+    if (key in cache):
+        return cache[key]
+    shared = _ttl() > 0
+    now = time.time()
+    if (shared):
+        with _lock:
+            entry = _shared.get(key)
+        if (entry is not None and entry[0] > now):
+            cache[key] = entry[1]
+            return entry[1]
+    val = func(*args)
+    cache[key] = val
+    if (shared):
+        with _lock:
+            _shared[key] = (now + _ttl(), val)
+    return val
+
+
+def invalidate():
+    """
+    Drop what this process has cached.
+    """
+    with _lock:
+        _shared.clear()
+    cache = getattr(_local, 'cache', None)
+    if (cache is not None):
+        cache.clear()
+
+
+def begin():
+    """
+    Memoize probes made in this thread until end(), see
+    ProbeCacheMiddleware.
+    """
+    _local.cache = {}
+
+
+def end():
+    _local.cache = None
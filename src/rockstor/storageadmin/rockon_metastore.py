@@ -0,0 +1,175 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Rock-on profiles of the remote metastore. Rock-on metadata is updated each
+# time a browser connects (see SysinfoNamespace), so the root and profiles
+# are kept in an on-disk cache along with their ETag and Last-Modified
+# validators, and only revalidated afterwards. Digests of the profiles last
+# applied to the db are kept alongside, so that only rock-ons whose profile
+# changed need updating.
+
+import hashlib
+import json
+import logging
+import os
+from multiprocessing.pool import ThreadPool
+from tempfile import mkstemp
+import requests
+
+logger = logging.getLogger(__name__)
+
+# profiles downloaded concurrently.
+WORKERS = 8
+# seconds
+TIMEOUT = 10
+APPLIED = 'applied.json'
+
+
+def digest(profile):
+    return hashlib.sha1(json.dumps(profile, sort_keys=True)).hexdigest()
+
+
+class MetaStore(object):
+    """
+    Remote metastore, with conditional fetches against an optional on-disk
+    cache.
+    """
+
+    def __init__(self, url_root, root_name, cache_dir=None, workers=WORKERS,
+                 timeout=TIMEOUT):
+        """
+        :param url_root: url of the remote metastore.
+        :param root_name: name of it's root, which lists the profiles.
+        :param cache_dir: directory of the cache, created if needed. Nothing
+        is cached if None.
+        """
+        self.url_root = url_root
+        self.root_name = root_name
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.timeout = timeout
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _load(self, name):
+        if (self.cache_dir is None):
+            return None
+        try:
+            with open(self._path(name)) as cfo:
+                return json.load(cfo)
+        except (IOError, ValueError):
+            return None
+
+    def _store(self, name, entry):
+        if (self.cache_dir is None):
+            return
+        try:
+            if (not os.path.isdir(self.cache_dir)):
+                os.makedirs(self.cache_dir)
+            fh, npath = mkstemp(dir=self.cache_dir)
+            with os.fdopen(fh, 'w') as tfo:
+                json.dump(entry, tfo)
+            os.rename(npath, self._path(name))
+        except (IOError, OSError) as e:
+            logger.error('Failed to cache %s: %s' % (name, e.__str__()))
+
+    def fetch(self, url):
+        """
+        Conditional GET of a json document, served from the cache when the
+        server reports it as not modified.
+        :return: the parsed document.
+        """
+        name = '%s.json' % hashlib.sha1(url.encode('utf-8')).hexdigest()
+        cached = self._load(name)
+        headers = {}
+        if (cached is not None):
+            if (cached.get('etag') is not None):
+                headers['If-None-Match'] = cached['etag']
+            if (cached.get('last_modified') is not None):
+                headers['If-Modified-Since'] = cached['last_modified']
+        response = requests.get(url, timeout=self.timeout, headers=headers)
+        if (response.status_code == 304 and cached is not None):
+            return cached['data']
+        if (response.status_code != 200):
+            response.raise_for_status()
+        data = response.json()
+        self._store(name, {'url': url,
+                           'etag': response.headers.get('ETag'),
+                           'last_modified': response.headers.get(
+                               'Last-Modified'),
+                           'data': data})
+        return data
+
+    def _fetch(self, url):
+        try:
+            return self.fetch(url), None
+        except Exception as e:
+            return None, e
+
+    def profiles(self):
+        """
+        Fetch the root and then all of it's profiles concurrently.
+        :return: dict of rock-on name: profile.
+        """
+        remote_root = '%s/%s' % (self.url_root, self.root_name)
+        data, e = self._fetch(remote_root)
+        if (e is not None):
+            raise Exception('Error while processing remote metastore at %s. '
+                            'Lower level exception: %s' %
+                            (remote_root, e.__str__()))
+        urls = ['%s/%s' % (self.url_root, v) for v in data.values()]
+        if (len(urls) == 0):
+            return {}
+        pool = ThreadPool(min(self.workers, len(urls)))
+        try:
+            results = pool.map(self._fetch, urls)
+        finally:
+            pool.close()
+            pool.join()
+        meta_cfg = {}
+        for url, (data, e) in zip(urls, results):
+            if (e is not None):
+                raise Exception('Error while processing Rock-on profile at '
+                                '%s. Lower level exception: %s' %
+                                (url, e.__str__()))
+            meta_cfg.update(data)
+        return meta_cfg
+
+    def changed(self, profiles, known):
+        """
+        :param profiles: dict of rock-on name: profile.
+        :param known: names of the rock-ons in the db.
+        :return: names of the rock-ons that are not known or whose profile
+        differs from the one last recorded as applied.
+        """
+        applied = self._load(APPLIED) or {}
+        known = set(known)
+        return [name for name, profile in profiles.items()
+                if (name not in known or
+                    applied.get(name) != digest(profile))]
+
+    def record(self, profiles):
+        """
+        Record profiles as applied to the db.
+        :param profiles: dict of rock-on name: profile.
+        """
+        applied = self._load(APPLIED) or {}
+        for name, profile in profiles.items():
+            applied[name] = digest(profile)
+        self._store(APPLIED, applied)
@@ -52,6 +52,7 @@ class PoolInfoSerializer(serializers.ModelSerializer):
     mount_status = serializers.CharField()
     is_mounted = serializers.BooleanField()
     quotas_enabled = serializers.BooleanField()
+    quota_rescan = serializers.DictField()
 
     class Meta:
         model = Pool
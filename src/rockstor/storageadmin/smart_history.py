@@ -0,0 +1,183 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# History of the few SMART attributes that predict drive failure, sampled
+# periodically by the data collector (see SMARTNamespace) rather than on
+# demand. Each sample is one small SMARTSample row per tracked attribute, so
+# a year of hourly samples of a few hundred drives stays cheap to query for
+# trends. smartctl is run at idle priority, and skips drives in standby
+# rather than spin them up.
+
+import re
+from datetime import (datetime, timedelta)
+from django.conf import settings
+from django.db.models import Count
+from django.utils.timezone import utc
+from storageadmin.models import (Disk, SMARTInfo, SMARTSample)
+from system.smart import sample_attributes
+
+REALLOCATED = 5
+REPORTED_UNCORRECT = 187
+COMMAND_TIMEOUT = 188
+PENDING = 197
+OFFLINE_UNCORRECTABLE = 198
+CRC_ERRORS = 199
+AIRFLOW_TEMPERATURE = 190
+TEMPERATURE = 194
+TRACKED = (REALLOCATED, REPORTED_UNCORRECT, COMMAND_TIMEOUT, PENDING,
+           OFFLINE_UNCORRECTABLE, CRC_ERRORS, AIRFLOW_TEMPERATURE,
+           TEMPERATURE)
+# attributes whose raw value should never grow on a healthy drive.
+COUNTERS = {
+    REALLOCATED: 'reallocated sectors',
+    REPORTED_UNCORRECT: 'reported uncorrectable errors',
+    COMMAND_TIMEOUT: 'command timeouts',
+    CRC_ERRORS: 'interface CRC errors',
+}
+# attributes whose raw value should be 0 on a healthy drive.
+NONZERO = {
+    PENDING: 'pending sectors',
+    OFFLINE_UNCORRECTABLE: 'offline uncorrectable sectors',
+}
+
+
+def _now():
+    return datetime.utcnow().replace(tzinfo=utc)
+
+
+def _raw(value):
+    # raw values can carry extra details, eg "32 (Min/Max 20/45)".
+    m = re.match(r'\d+', value)
+    if (m is None):
+        return None
+    return int(m.group())
+
+
+def sample_disks():
+    """
+    :return: queryset of the disks SMART history is sampled from.
+    """
+    return Disk.objects.filter(offline=False, smart_available=True,
+                               smart_enabled=True)
+
+
+def sample(disk, ts=None):
+    """
+    Save the current values of the tracked SMART attributes of a disk,
+    unless it is spun down.
+    :param disk: Disk object
+    :param ts: aware datetime of the sample, now by default.
+    :return: number of samples saved, None if the disk was not sampled.
+    """
+    attributes = sample_attributes(disk.name, disk.smart_options)
+    if (attributes is None):
+        return None
+    if (ts is None):
+        ts = _now()
+    samples = []
+    for fields in attributes.values():
+        try:
+            aid = int(fields[0])
+            normed_value = int(fields[3])
+        except ValueError:
+            continue
+        raw_value = _raw(fields[9])
+        if (aid not in TRACKED or raw_value is None):
+            continue
+        samples.append(SMARTSample(disk=disk, aid=aid, raw_value=raw_value,
+                                   normed_value=normed_value, ts=ts))
+    SMARTSample.objects.bulk_create(samples)
+    return len(samples)
+
+
+def prune(now=None):
+    """
+    Delete samples older than SMART_HISTORY_RETENTION days and all but the
+    latest SMART_INFO_KEEP SMART info snapshots of each disk.
+    """
+    if (now is None):
+        now = _now()
+    SMARTSample.objects.filter(ts__lt=now - timedelta(
+        days=settings.SMART_HISTORY_RETENTION)).delete()
+    keep = settings.SMART_INFO_KEEP
+    for d in SMARTInfo.objects.values('disk').annotate(
+            c=Count('id')).filter(c__gt=keep):
+        old = SMARTInfo.objects.filter(disk=d['disk']).order_by(
+            '-toc').values_list('id', flat=True)[keep:]
+        SMARTInfo.objects.filter(id__in=list(old)).delete()
+
+
+def history(disk, days=30, now=None):
+    """
+    :param disk: Disk object or id.
+    :return: queryset of the disk's samples over the last days, oldest
+    first.
+    """
+    if (now is None):
+        now = _now()
+    return SMARTSample.objects.filter(
+        disk=disk, ts__gte=now - timedelta(days=days)).order_by('ts')
+
+
+def trends(days=7, now=None):
+    """
+    :return: dict of disk id: dict of attribute id: (first, last) raw values
+    within the last days.
+    """
+    if (now is None):
+        now = _now()
+    result = {}
+    for disk_id, aid, raw_value in SMARTSample.objects.filter(
+            ts__gte=now - timedelta(days=days)).order_by('ts').values_list(
+            'disk', 'aid', 'raw_value').iterator():
+        attrs = result.setdefault(disk_id, {})
+        if (aid in attrs):
+            attrs[aid] = (attrs[aid][0], raw_value)
+        else:
+            attrs[aid] = (raw_value, raw_value)
+    return result
+
+
+def drives_at_risk(days=7, now=None):
+    """
+    Simple trend detection over the last days of samples: a drive is at risk
+    when any of the failure counters grew, it has pending or offline
+    uncorrectable sectors, or it runs hotter than SMART_TEMP_LIMIT.
+    :return: list of dicts with the disk's name, serial and reasons.
+    """
+    at_risk = {}
+    for disk_id, attrs in trends(days, now).items():
+        reasons = []
+        for aid, desc in sorted(COUNTERS.items()):
+            if (aid in attrs and attrs[aid][1] > attrs[aid][0]):
+                reasons.append('%d new %s' % (attrs[aid][1] - attrs[aid][0],
+                                              desc))
+        for aid, desc in sorted(NONZERO.items()):
+            if (aid in attrs and attrs[aid][1] > 0):
+                reasons.append('%d %s' % (attrs[aid][1], desc))
+        temp = attrs.get(TEMPERATURE, attrs.get(AIRFLOW_TEMPERATURE))
+        if (temp is not None and temp[1] >= settings.SMART_TEMP_LIMIT):
+            reasons.append('temperature of %d C' % temp[1])
+        if (len(reasons) > 0):
+            at_risk[disk_id] = reasons
+    if (len(at_risk) == 0):
+        return []
+    return [{'id': d.id, 'name': d.name, 'serial': d.serial,
+             'reasons': at_risk[d.id]}
+            for d in Disk.objects.filter(id__in=at_risk.keys()).order_by(
+                'name')]
@@ -105,7 +105,7 @@ DisksView = RockstorLayoutView.extend({
     setupDisks: function () {
         var _this = this;
         $.ajax({
-            url: '/api/disks/scan',
+            url: '/api/disks/rescan',
             type: 'POST'
         }).done(function () {
             // reset the current page
@@ -114,6 +114,12 @@ PoolDetailsLayoutView = RockstorLayoutView.extend({
         this.$('#ph-pool-scrubs').html(this.subviews['pool-scrubs'].render().el);
         this.$('#ph-pool-rebalances').html(this.subviews['pool-rebalances'].render().el);
         this.renderDataTables();
+        RockStorSocket.poolBalance = io.connect('/pool_balance', {
+            'secure': true,
+            'force new connection': true
+        });
+        RockStorSocket.addListener(this.subviews['pool-rebalances'].balanceProgress,
+            this.subviews['pool-rebalances'], 'poolBalance:pool_balance');
 
 
         this.$('#ph-compression-info').html(this.compression_info_template({
@@ -353,6 +359,9 @@ PoolDetailsLayoutView = RockstorLayoutView.extend({
         if (!_.isUndefined(this.statusIntervalId)) {
             window.clearInterval(this.statusIntervalId);
         }
+        if (!_.isUndefined(RockStorSocket.poolBalance)) {
+            RockStorSocket.removeOneListener('poolBalance');
+        }
     },
 
     initHandlebarHelpers: function() {
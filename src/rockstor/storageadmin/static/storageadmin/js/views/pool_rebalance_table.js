@@ -107,6 +107,29 @@ PoolRebalanceTableModule = RockstorModuleView.extend({
         this.render();
     },
 
+    // Progress of the balances in progress, pushed by the /pool_balance
+    // namespace.
+    balanceProgress: function(data) {
+        var _this = this;
+        var poolName = this.pool.get('name');
+        var refetch = false;
+        _.each(data.results, function(balance) {
+            if (balance.pool_name != poolName) return;
+            var poolrebalance = _this.collection.get(balance.id);
+            if (_.isUndefined(poolrebalance)) {
+                refetch = true;
+                return;
+            }
+            poolrebalance.set(balance);
+        });
+        if (refetch) {
+            this.collection.fetch();
+        } else if (this.$('#pool-rebalance-form').length == 0) {
+            // don't throw away the start form while it's filled in.
+            this.render();
+        }
+    },
+
     initHandlebarHelpers: function() {
         Handlebars.registerHelper('display_poolRebalance_table', function() {
             var html = '';
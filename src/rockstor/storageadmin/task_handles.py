@@ -0,0 +1,117 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Asynchronous tasks with a handle. django ztask only creates it's Task, and
+# so it's uuid, once ztaskd receives the task, and finding it afterwards
+# means unpickling the args of every Task. Instead a TaskHandle is saved
+# before the task is queued, the task runs wrapped by run_handle which
+# records it's progress on the handle, and handles are looked up by their
+# indexed kind, object and state.
+
+import logging
+import time
+from datetime import datetime
+from importlib import import_module
+from django.utils.timezone import utc
+from django_ztask.decorators import task
+from storageadmin.models import TaskHandle
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = ('pending', 'running', )
+# seconds run_handle waits for the handle to be committed, in case it was
+# submitted within a transaction rather than sent after it. A task whose
+# handle never shows up, ie its transaction was rolled back, is not run.
+COMMIT_WAIT = 20
+
+
+def _now():
+    return datetime.utcnow().replace(tzinfo=utc)
+
+
+def create(kind, object_id, func, *args, **kwargs):
+    """
+    Save a new handle for func(*args, **kwargs) without queuing it, for
+    callers within a transaction. Once committed, send() queues it.
+    :param kind: kind of task, eg 'balance'.
+    :param object_id: id of the object the task is about, eg a pool's.
+    :param func: module level function, ie a @task() one.
+    :return: (the saved TaskHandle, call to pass to send()).
+    """
+    th = TaskHandle.objects.create(kind=kind, object_id=object_id)
+    return th, (th.id, '%s.%s' % (func.__module__, func.__name__), args,
+                kwargs)
+
+
+def send(call):
+    """
+    Queue a task from create() on ztaskd.
+    :param call: as returned by create().
+    """
+    run_handle.async(*call)
+
+
+def submit(kind, object_id, func, *args, **kwargs):
+    """
+    Queue func(*args, **kwargs) on ztaskd with a new handle, see create().
+    :return: the saved TaskHandle.
+    """
+    th, call = create(kind, object_id, func, *args, **kwargs)
+    send(call)
+    return th
+
+
+@task()
+def run_handle(hid, function_name, args, kwargs):
+    """
+    ztaskd entry point of submitted tasks. Failures are recorded on the
+    handle rather than retried by ztaskd.
+    """
+    module_name, func_name = function_name.rsplit('.', 1)
+    func = getattr(import_module(module_name), func_name)
+    for i in range(COMMIT_WAIT):
+        if (TaskHandle.objects.filter(id=hid).update(state='running') > 0):
+            break
+        logger.debug('waiting for task handle(%d). num_tries = %d' %
+                     (hid, i))
+        time.sleep(1)
+    else:
+        logger.error('Task handle(%d) of %s was not committed within %d '
+                     'seconds. Not running it.' %
+                     (hid, function_name, COMMIT_WAIT))
+        return
+    try:
+        func(*args, **kwargs)
+    except Exception as e:
+        logger.exception(e)
+        TaskHandle.objects.filter(id=hid).update(
+            state='failed', message=e.__str__()[:1024], end_time=_now())
+        return
+    TaskHandle.objects.filter(id=hid).update(state='finished',
+                                             end_time=_now())
+
+
+def active(kind, object_id=None):
+    """
+    :return: queryset of the pending or running handles of a kind, and of an
+    object if given.
+    """
+    handles = TaskHandle.objects.filter(kind=kind, state__in=ACTIVE)
+    if (object_id is not None):
+        handles = handles.filter(object_id=object_id)
+    return handles
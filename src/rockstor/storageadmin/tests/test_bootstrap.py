@@ -0,0 +1,76 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import time
+import unittest
+from mock import patch
+from storageadmin.bootstrap import Executor
+
+
+class ExecutorTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_bootstrap*
+    """
+    def setUp(self):
+        patch('storageadmin.bootstrap.connection').start()
+        self.lock = threading.Lock()
+        self.order = []
+        self.running = 0
+        self.max_running = 0
+
+    def tearDown(self):
+        patch.stopall()
+
+    def task(self, name, fail=False):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+            self.order.append(name)
+        if (fail):
+            raise Exception('%s failed' % name)
+        return name
+
+    def test_dependencies(self):
+        executor = Executor(workers=2)
+        for p in ('pool1', 'pool2', 'pool3'):
+            executor.add(p, self.task, p)
+        executor.add('share1', self.task, 'share1', deps=('pool1',))
+        executor.add('share2', self.task, 'share2', True, deps=('pool2',))
+        executor.add('snap2', self.task, 'snap2', deps=('share2',))
+        results = executor.run()
+        self.assertEqual(self.max_running, 2)
+        self.assertTrue(self.order.index('share1') >
+                        self.order.index('pool1'))
+        self.assertEqual(results['share1'], (True, 'share1'))
+        self.assertFalse(results['share2'][0])
+        self.assertEqual(results['share2'][1].__str__(), 'share2 failed')
+        # skipped as share2 failed.
+        self.assertEqual(results['snap2'], (False, None))
+        self.assertFalse('snap2' in self.order)
+        self.assertEqual(len(results), 6)
+
+    def test_unknown_dependency(self):
+        executor = Executor()
+        with self.assertRaises(Exception):
+            executor.add('share1', self.task, 'share1', deps=('pool1',))
@@ -90,6 +90,11 @@ class CommandTests(APITestMixin, APITestCase):
             'storageadmin.views.command.import_snapshots')
         cls.mock_import_snapshots = cls.patch_import_snapshots.start()
 
+        cls.patch_volume_usage_map = patch(
+            'storageadmin.views.command.volume_usage_map')
+        cls.mock_volume_usage_map = cls.patch_volume_usage_map.start()
+        cls.mock_volume_usage_map.return_value = {}
+
     @classmethod
     def tearDownClass(cls):
         super(CommandTests, cls).tearDownClass()
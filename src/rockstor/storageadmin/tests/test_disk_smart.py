@@ -32,23 +32,14 @@ class DiskSmartTests(APITestMixin, APITestCase):
         super(DiskSmartTests, cls).setUpClass()
 
         # post mocks
-        cls.patch_extended_info = patch(
-            'storageadmin.views.disk_smart.extended_info')
-        cls.mock_extended_info = cls.patch_extended_info.start()
+        cls.patch_all_info = patch('storageadmin.views.disk_smart.all_info')
+        cls.mock_all_info = cls.patch_all_info.start()
+        cls.mock_all_info.return_value = {
+            'info': [''] * 16, 'extended_info': {}, 'capabilities': {},
+            'error_logs': ({}, []), 'test_logs': ({}, []), }
 
-        cls.patch_capabilities = patch(
-            'storageadmin.views.disk_smart.capabilities')
-        cls.mock_capabilities = cls.patch_capabilities.start()
-
-        cls.patch_info = patch('storageadmin.views.disk_smart.info')
-        cls.mock_info = cls.patch_info.start()
-
-        cls.patch_error_logs = patch(
-            'storageadmin.views.disk_smart.error_logs')
-        cls.mock_error_logs = cls.patch_error_logs.start()
-
-        cls.patch_test_logs = patch('storageadmin.views.disk_smart.test_logs')
-        cls.mock_test_logs = cls.patch_test_logs.start()
+        cls.patch_run_test = patch('storageadmin.views.disk_smart.run_test')
+        cls.mock_run_test = cls.patch_run_test.start()
 
     @classmethod
     def tearDownClass(cls):
@@ -80,8 +71,8 @@ class DiskSmartTests(APITestMixin, APITestCase):
         self.assertEqual(response.status_code,
                          status.HTTP_500_INTERNAL_SERVER_ERROR,
                          msg=response.data)
-        e_msg = ('Unknown command: invalid. Only valid commands are info '
-                 'and test')
+        e_msg = ('Unknown command: invalid. Only valid commands are info, '
+                 'test and refresh')
         self.assertEqual(response.data['detail'], e_msg)
 
         # unsupported self test
@@ -103,3 +94,13 @@ class DiskSmartTests(APITestMixin, APITestCase):
         response = self.client.post('%s/info/sdd' % self.BASE_URL)
         self.assertEqual(response.status_code,
                          status.HTTP_200_OK, msg=response.data)
+
+    def test_refresh(self):
+        # smartctl runs once per disk, failures are reported per disk.
+        self.mock_all_info.reset_mock()
+        response = self.client.post('%s/refresh' % self.BASE_URL)
+        self.assertEqual(response.status_code,
+                         status.HTTP_200_OK, msg=response.data)
+        self.assertEqual(len(response.data['refreshed']),
+                         self.mock_all_info.call_count)
+        self.assertEqual(response.data['failed'], {})
@@ -15,6 +15,7 @@ General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
+from django.conf import settings
 from rest_framework import status
 from rest_framework.test import APITestCase
 from mock import patch
@@ -62,6 +63,13 @@ class DiskTests(APITestMixin, APITestCase):
                                     format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_disk_rescan(self):
+        response = self.client.post(('%s/rescan' % self.BASE_URL), data=None,
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.mock_scan_disks.assert_called_with(settings.MIN_DISK_SIZE,
+                                                rescan=True)
+
     def test_invaid_disk_wipe(self):
         url = ('%s/invalid/wipe' % self.BASE_URL)
         response = self.client.post(url, data=None, format='json')
@@ -32,7 +32,7 @@ class PoolBalanceTests(APITestMixin, APITestCase):
 
         # post mocks
 
-        cls.patch_balance_status = patch('storageadmin.views.pool_balance.'
+        cls.patch_balance_status = patch('storageadmin.pool_balance.'
                                          'balance_status')
         cls.mock_balance_status = cls.patch_balance_status.start()
         cls.mock_balance_status.return_value = {'status': 'finished',
@@ -0,0 +1,124 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from mock import (patch, MagicMock)
+from storageadmin import probe_cache
+from storageadmin.middleware import ProbeCacheMiddleware
+from storageadmin.models import (Pool, Share, Disk)
+from storageadmin.probe_cache import (probe, begin, end)
+
+
+class ProbeCacheTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_probe_cache*
+    """
+    def setUp(self):
+        probe_cache.invalidate()
+        self.probe = MagicMock(side_effect=lambda *args: len(args))
+        self.now = 1000.0
+        patch('storageadmin.probe_cache.time.time',
+              side_effect=lambda: self.now).start()
+
+    def tearDown(self):
+        patch.stopall()
+        end()
+        probe_cache.invalidate()
+
+    def test_scope(self):
+        # no caching outside of a request.
+        probe(('a', ), self.probe, 1)
+        probe(('a', ), self.probe, 1)
+        self.assertEqual(self.probe.call_count, 2)
+        begin()
+        self.assertEqual(probe(('a', ), self.probe, 1, 2), 2)
+        self.assertEqual(probe(('a', ), self.probe, 1, 2), 2)
+        probe(('b', ), self.probe, 1)
+        end()
+        self.assertEqual(self.probe.call_count, 4)
+        probe(('a', ), self.probe, 1, 2)
+        self.assertEqual(self.probe.call_count, 5)
+
+    def test_shared(self):
+        for ttl, calls in ((0, 2), (5, 1), ):
+            probe_cache.invalidate()
+            self.probe.reset_mock()
+            with patch.object(probe_cache.settings, 'PROBE_CACHE_TTL', ttl):
+                for i in range(2):
+                    begin()
+                    probe(('a', ), self.probe)
+                    end()
+            self.assertEqual(self.probe.call_count, calls)
+        # expired.
+        self.now += 6
+        with patch.object(probe_cache.settings, 'PROBE_CACHE_TTL', 5):
+            begin()
+            probe(('a', ), self.probe)
+            end()
+        self.assertEqual(self.probe.call_count, 2)
+
+    def test_middleware(self):
+        mw = ProbeCacheMiddleware()
+        with patch.object(probe_cache.settings, 'PROBE_CACHE_TTL', 5):
+            get = MagicMock(method='GET')
+            mw.process_request(get)
+            probe(('a', ), self.probe)
+            probe(('a', ), self.probe)
+            mw.process_response(get, None)
+            self.assertEqual(self.probe.call_count, 1)
+            # a state changing request: never cached and drops shared
+            # results.
+            post = MagicMock(method='POST')
+            mw.process_request(post)
+            probe(('a', ), self.probe)
+            mw.process_response(post, None)
+            self.assertEqual(self.probe.call_count, 2)
+            mw.process_request(get)
+            probe(('a', ), self.probe)
+            mw.process_exception(get, Exception())
+            self.assertEqual(self.probe.call_count, 3)
+
+    @patch('storageadmin.models.share.qgroup_ids')
+    @patch('storageadmin.models.pool.rescan_state')
+    @patch('storageadmin.models.pool.pool_usage')
+    @patch('storageadmin.models.disk.get_disk_power_status')
+    def test_models(self, mock_power, mock_usage, mock_rescan,
+                    mock_qgroups):
+        mock_qgroups.return_value = ['0/5', '2015/1', '2015/2']
+        mock_usage.return_value = 1024
+        mock_rescan.return_value = {'state': 'idle', 'stale': False}
+        mock_power.return_value = 'active/idle'
+        pool = Pool(name='pool1', size=4096)
+        shares = [Share(pool=pool, name='share%d' % i,
+                        pqgroup='2015/%d' % i) for i in range(1, 4)]
+        disk = Disk(name='ata-disk1', pool=pool)
+        begin()
+        self.assertEqual([s.pqgroup_exist for s in shares],
+                         [True, True, False])
+        self.assertEqual([s.pool.free for s in shares], [3072] * 3)
+        self.assertEqual([s.pool.quota_rescan['stale'] for s in shares],
+                         [False] * 3)
+        self.assertEqual([disk.power_state for s in shares],
+                         ['active/idle'] * 3)
+        end()
+        self.assertEqual(mock_qgroups.call_count, 1)
+        self.assertEqual(mock_usage.call_count, 1)
+        self.assertEqual(mock_rescan.call_count, 1)
+        self.assertEqual(mock_power.call_count, 1)
@@ -0,0 +1,145 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from BaseHTTPServer import (HTTPServer, BaseHTTPRequestHandler)
+from mock import (patch, MagicMock)
+from storageadmin.rockon_metastore import MetaStore
+from storageadmin.views.rockon import RockOnView
+
+DOCUMENTS = {
+    '/rockons/root.json': {'Plex': 'plex.json',
+                           'Syncthing': 'syncthing.json'},
+    '/rockons/plex.json': {'Plex': {'description': 'Plex media server',
+                                    'version': '1.0'}},
+    '/rockons/syncthing.json': {'Syncthing': {'description': 'Syncthing',
+                                              'version': '1.0'}},
+}
+
+
+class MetaStoreHandler(BaseHTTPRequestHandler):
+    """
+    Serves DOCUMENTS with an ETag of their version, as the remote metastore
+    does.
+    """
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if (self.path not in self.server.documents):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(self.server.documents[self.path])
+        etag = '"%d"' % hash(body)
+        if (self.headers.get('If-None-Match') == etag):
+            self.server.not_modified.append(self.path)
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MetaStoreTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_rockon_metastore*
+    """
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), MetaStoreHandler)
+        self.server.documents = json.loads(json.dumps(DOCUMENTS))
+        self.server.requests = []
+        self.server.not_modified = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.cache_dir = tempfile.mkdtemp()
+        self.metastore = MetaStore(
+            'http://127.0.0.1:%d/rockons' % self.server.server_port,
+            'root.json', cache_dir=self.cache_dir)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_revalidation(self):
+        profiles = self.metastore.profiles()
+        self.assertEqual(sorted(profiles.keys()), ['Plex', 'Syncthing'])
+        self.assertEqual(len(self.server.not_modified), 0)
+        self.assertEqual(sorted(self.metastore.changed(profiles, [])),
+                         ['Plex', 'Syncthing'])
+        self.metastore.record(profiles)
+        self.assertEqual(self.metastore.changed(profiles,
+                                                ['Plex', 'Syncthing']), [])
+
+        # a new version of one profile.
+        self.server.documents['/rockons/plex.json']['Plex']['version'] = '2.0'
+        self.server.not_modified = []
+        profiles = self.metastore.profiles()
+        self.assertEqual(profiles['Plex']['version'], '2.0')
+        self.assertEqual(sorted(self.server.not_modified),
+                         ['/rockons/root.json', '/rockons/syncthing.json'])
+        self.assertEqual(self.metastore.changed(profiles,
+                                                ['Plex', 'Syncthing']),
+                         ['Plex'])
+        self.metastore.record({'Plex': profiles['Plex']})
+        # a rock-on deleted from the db is updated again.
+        self.assertEqual(self.metastore.changed(profiles, ['Plex']),
+                         ['Syncthing'])
+
+    def test_profile_error(self):
+        self.server.documents['/rockons/root.json']['OwnCloud'] = \
+            'owncloud.json'
+        with self.assertRaises(Exception) as cm:
+            self.metastore.profiles()
+        self.assertTrue('owncloud.json' in cm.exception.__str__())
+
+
+class RockOnUpdateTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_rockon_metastore*
+    """
+    @patch('storageadmin.views.rockon.RockOn.objects')
+    def test_partial_update_not_recorded(self, mock_rockons):
+        metastore = MagicMock()
+        metastore.changed.return_value = ['Plex', 'Syncthing']
+        profiles = {'Plex': {'version': '2.0'},
+                    'Syncthing': {'version': '2.0'}}
+        view = RockOnView()
+        # Syncthing is installed, so only part of it's profile is applied.
+        with patch.multiple(RockOnView, _metastore=MagicMock(
+                return_value=metastore),
+                _get_available=MagicMock(return_value=profiles),
+                _delete_deprecated=MagicMock(),
+                _create_update_meta=MagicMock(side_effect=[True, False])):
+            view.post(MagicMock(), 'update')
+        metastore.record.assert_called_once_with({'Plex': profiles['Plex']})
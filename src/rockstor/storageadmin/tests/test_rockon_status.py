@@ -0,0 +1,71 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from mock import patch
+from storageadmin.models import (RockOn, DContainer)
+from storageadmin.views.rockon_helpers import rockon_statuses
+
+INSPECT = [
+    '/plex-linuxserver.io Dead:false,Error:,ExitCode:0,Running:true,',
+    '/transmission Dead:false,Error:,ExitCode:0,Running:false,',
+    '/syncthing Dead:false,Error:oci runtime error,ExitCode:128,'
+    'Running:false,',
+    '',
+]
+
+
+class RockOnStatusTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_rockon_status*
+    """
+    def setUp(self):
+        self.run_command = patch(
+            'storageadmin.views.rockon_utils.run_command',
+            return_value=(INSPECT, ['Error: No such object: owncloud'],
+                          1)).start()
+        self.objects = patch(
+            'storageadmin.views.rockon_helpers.DContainer.objects').start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_rockon_statuses(self):
+        rockons = [RockOn(id=i, name=n) for i, n in
+                   enumerate(('Plex', 'Transmission', 'Syncthing',
+                              'OwnCloud'), 1)]
+        # last launched container first.
+        self.objects.filter.return_value.order_by.return_value = [
+            DContainer(rockon_id=1, name='plex-linuxserver.io',
+                       launch_order=1),
+            DContainer(rockon_id=2, name='transmission', launch_order=1),
+            DContainer(rockon_id=3, name='syncthing', launch_order=1),
+            DContainer(rockon_id=4, name='owncloud', launch_order=2),
+            DContainer(rockon_id=4, name='owncloud-postgres',
+                       launch_order=1)]
+        self.assertEqual(rockon_statuses(rockons), {
+            1: 'started', 2: 'stopped',
+            3: 'exitcode: 128 error: oci runtime error',
+            4: 'unknown_error'})
+        # a single docker inspect of the last container of each rockon.
+        self.assertEqual(self.run_command.call_count, 1)
+        self.assertEqual(
+            sorted(self.run_command.call_args[0][0][4:]),
+            ['owncloud', 'plex-linuxserver.io', 'syncthing', 'transmission'])
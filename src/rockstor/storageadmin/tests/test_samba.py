@@ -40,18 +40,9 @@ class SambaTests(APITestMixin, APITestCase):
         cls.mock_is_share_mounted = cls.patch_is_share_mounted.start()
         cls.mock_is_share_mounted.return_value = False
 
-        cls.patch_status = patch('storageadmin.views.samba.status')
-        cls.mock_status = cls.patch_status.start()
-        cls.mock_status.return_value = 'out', 'err', 0
-
-        cls.patch_restart_samba = patch('storageadmin.views.samba.'
-                                        'restart_samba')
-        cls.mock_status = cls.patch_restart_samba.start()
-
-        cls.patch_refresh_smb_config = patch('storageadmin.views.samba.'
-                                             'refresh_smb_config')
-        cls.mock_refresh_smb_config = cls.patch_refresh_smb_config.start()
-        cls.mock_refresh_smb_config.return_value = 'smbconfig'
+        cls.patch_share_config = patch('storageadmin.views.samba.'
+                                       'share_config')
+        cls.mock_share_config = cls.patch_share_config.start()
 
     @classmethod
     def tearDownClass(cls):
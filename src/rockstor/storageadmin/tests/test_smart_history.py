@@ -0,0 +1,89 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from datetime import datetime
+from django.utils.timezone import utc
+from mock import patch
+from storageadmin.models import Disk
+from storageadmin.smart_history import (sample, drives_at_risk)
+
+NOW = datetime(2017, 5, 20, 12, 0, 0, tzinfo=utc)
+
+ATTRIBUTES = {
+    'Raw_Read_Error_Rate': ['1', 'Raw_Read_Error_Rate', '0x002f', '200',
+                            '200', '051', 'Pre-fail', 'Always', '-', '0'],
+    'Reallocated_Sector_Ct': ['5', 'Reallocated_Sector_Ct', '0x0033', '200',
+                              '200', '140', 'Pre-fail', 'Always', '-', '8'],
+    'Temperature_Celsius': ['194', 'Temperature_Celsius', '0x0022', '118',
+                            '106', '000', 'Old_age', 'Always', '-',
+                            '32 (Min/Max 20/45)'],
+}
+
+
+class SMARTHistoryTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_smart_history*
+    """
+    def setUp(self):
+        self.objects = patch(
+            'storageadmin.smart_history.SMARTSample.objects').start()
+        self.disk_objects = patch(
+            'storageadmin.smart_history.Disk.objects').start()
+        self.attributes = patch(
+            'storageadmin.smart_history.sample_attributes',
+            return_value=ATTRIBUTES).start()
+        self.disk = Disk(id=1, name='sda', serial='WD-1')
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_sample(self):
+        self.assertEqual(sample(self.disk, ts=NOW), 2)
+        samples = self.objects.bulk_create.call_args[0][0]
+        self.assertEqual(sorted([(s.aid, s.raw_value, s.normed_value)
+                                 for s in samples]),
+                         [(5, 8, 200), (194, 32, 118)])
+
+    def test_standby_not_sampled(self):
+        self.attributes.return_value = None
+        self.assertEqual(sample(self.disk, ts=NOW), None)
+        self.assertFalse(self.objects.bulk_create.called)
+
+    def test_drives_at_risk(self):
+        # (disk, aid, raw_value) oldest first.
+        self.objects.filter.return_value.order_by.return_value.values_list.\
+            return_value.iterator.return_value = iter([
+                (1, 5, 8), (2, 5, 0), (3, 194, 40), (3, 199, 2),
+                (1, 5, 12), (2, 5, 0), (2, 197, 3), (3, 194, 56),
+                (3, 199, 2)])
+        self.disk_objects.filter.return_value.order_by.return_value = [
+            Disk(id=1, name='sda', serial='WD-1'),
+            Disk(id=2, name='sdb', serial='WD-2'),
+            Disk(id=3, name='sdc', serial='WD-3')]
+        self.assertEqual(drives_at_risk(now=NOW), [
+            {'id': 1, 'name': 'sda', 'serial': 'WD-1',
+             'reasons': ['4 new reallocated sectors']},
+            {'id': 2, 'name': 'sdb', 'serial': 'WD-2',
+             'reasons': ['3 pending sectors']},
+            {'id': 3, 'name': 'sdc', 'serial': 'WD-3',
+             'reasons': ['temperature of 56 C']}])
+        self.assertEqual(sorted(
+            self.disk_objects.filter.call_args[1]['id__in']), [1, 2, 3])
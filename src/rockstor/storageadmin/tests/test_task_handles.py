@@ -0,0 +1,121 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from mock import (patch, MagicMock)
+from storageadmin.models import (Pool, PoolBalance, TaskHandle)
+from storageadmin.pool_balance import update_status
+from storageadmin.task_handles import (create, send, submit, run_handle)
+
+calls = []
+
+
+def fake_task(*args, **kwargs):
+    calls.append((args, kwargs))
+    if (kwargs.get('fail')):
+        raise Exception('balance failed')
+
+
+class TaskHandleTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_task_handles*
+    """
+    def setUp(self):
+        self.objects = patch(
+            'storageadmin.task_handles.TaskHandle.objects').start()
+        self.objects.filter.return_value.update.return_value = 1
+        del calls[:]
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_submit(self):
+        self.objects.create.return_value = TaskHandle(id=7, kind='balance',
+                                                      object_id=2)
+        with patch('storageadmin.task_handles.run_handle') as mock_run:
+            th = submit('balance', 2, fake_task, '/mnt2/pool1', force=True)
+        self.assertEqual(th.id, 7)
+        self.objects.create.assert_called_with(kind='balance', object_id=2)
+        mock_run.async.assert_called_with(
+            7, 'storageadmin.tests.test_task_handles.fake_task',
+            ('/mnt2/pool1', ), {'force': True})
+
+    def test_create_and_send(self):
+        self.objects.create.return_value = TaskHandle(id=7, kind='balance',
+                                                      object_id=2)
+        with patch('storageadmin.task_handles.run_handle') as mock_run:
+            th, call = create('balance', 2, fake_task, '/mnt2/pool1')
+            self.assertEqual(th.id, 7)
+            # nothing is queued until the call is sent, ie once the
+            # caller's transaction is committed.
+            self.assertEqual(mock_run.async.call_count, 0)
+            send(call)
+        mock_run.async.assert_called_once_with(
+            7, 'storageadmin.tests.test_task_handles.fake_task',
+            ('/mnt2/pool1', ), {})
+
+    def test_run_handle(self):
+        name = 'storageadmin.tests.test_task_handles.fake_task'
+        run_handle(7, name, ('/mnt2/pool1', ), {})
+        self.assertEqual(calls, [(('/mnt2/pool1', ), {})])
+        updates = [c[1] for c in
+                   self.objects.filter.return_value.update.call_args_list]
+        self.assertEqual([u['state'] for u in updates],
+                         ['running', 'finished'])
+
+        self.objects.filter.return_value.update.reset_mock()
+        run_handle(7, name, ('/mnt2/pool1', ), {'fail': True})
+        updates = [c[1] for c in
+                   self.objects.filter.return_value.update.call_args_list]
+        self.assertEqual(updates[-1]['state'], 'failed')
+        self.assertEqual(updates[-1]['message'], 'balance failed')
+
+    @patch('storageadmin.task_handles.time.sleep')
+    def test_run_handle_rolled_back(self, mock_sleep):
+        # the handle's transaction was rolled back, so it never shows up.
+        self.objects.filter.return_value.update.return_value = 0
+        run_handle(7, 'storageadmin.tests.test_task_handles.fake_task',
+                   ('/mnt2/pool1', ), {})
+        self.assertEqual(calls, [])
+        updates = [c[1] for c in
+                   self.objects.filter.return_value.update.call_args_list]
+        self.assertTrue(all(u == {'state': 'running'} for u in updates))
+
+    @patch('storageadmin.pool_balance.balance_status')
+    @patch('storageadmin.pool_balance.TaskHandle.objects')
+    @patch('storageadmin.pool_balance.PoolBalance.objects')
+    def test_update_status(self, mock_balances, mock_handles,
+                           mock_balance_status):
+        pool = Pool(id=2, name='pool1')
+        ps = PoolBalance(id=3, pool=pool, handle_id=7, status='started')
+        mock_balances.filter.return_value.order_by.return_value = [ps]
+        mock_handles.get.return_value = TaskHandle(id=7, state='running')
+        mock_balance_status.return_value = {'status': 'running',
+                                            'percent_done': 40}
+        self.assertEqual(update_status(pool).percent_done, 40)
+        mock_balances.filter.return_value.update.assert_called_with(
+            status='running', percent_done=40)
+
+        mock_handles.get.return_value = TaskHandle(
+            id=7, state='failed', message='balance failed')
+        ps.save = MagicMock()
+        self.assertEqual(update_status(pool).status, 'failed')
+        self.assertEqual(ps.message, 'balance failed')
+        self.assertEqual(ps.save.call_count, 1)
@@ -0,0 +1,47 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from mock import MagicMock
+from storageadmin.exceptions import RockStorAPIException
+from storageadmin.util import days_param
+
+
+class DaysParamTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_util*
+    """
+    @staticmethod
+    def _request(**query_params):
+        request = MagicMock()
+        request.query_params = query_params
+        return request
+
+    def test_days(self):
+        self.assertEqual(days_param(self._request(), 7), 7)
+        self.assertEqual(days_param(self._request(days='3'), 7), 3)
+
+    def test_invalid_days(self):
+        for days in ('a', '1.5', '0', '-2'):
+            with self.assertRaises(RockStorAPIException) as cm:
+                days_param(self._request(days=days), 7)
+            self.assertEqual(cm.exception.status_code, 400)
+            self.assertEqual(cm.exception.detail[0],
+                             'days must be a positive integer')
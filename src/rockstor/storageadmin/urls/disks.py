@@ -18,16 +18,19 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from django.conf.urls import patterns, url
 from storageadmin.views import (DiskListView, DiskDetailView,
-                                DiskSMARTDetailView)
+                                DiskSMARTDetailView, DiskSMARTHistoryView)
 
 disk_regex = '[A-Za-z0-9]+[A-Za-z0-9:_-]*'
 
 urlpatterns = patterns(
     '',
     url(r'^$', DiskListView.as_view()),
+    url(r'^/smart/at-risk$', DiskSMARTHistoryView.as_view()),
+    url(r'^/smart/history/(?P<did>\d+)$', DiskSMARTHistoryView.as_view()),
     url(r'^/smart/(?P<command>.+)/(?P<did>\d+)$',
         DiskSMARTDetailView.as_view()),
-    url(r'^/(?P<command>scan)$', DiskListView.as_view()),
+    url(r'^/smart/(?P<command>refresh)$', DiskSMARTDetailView.as_view()),
+    url(r'^/(?P<command>scan|rescan)$', DiskListView.as_view()),
     url(r'^/(?P<did>\d+)$', DiskDetailView.as_view()),
     url(r'^/(?P<did>\d+)/(?P<command>.+)$', DiskDetailView.as_view()),
 )
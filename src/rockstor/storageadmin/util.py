@@ -45,3 +45,23 @@ def handle_exception(e, request, e_msg=None, status_code=500):
     logger.debug('Current Rockstor version: %s' % version)
     raise RockStorAPIException(status_code=status_code, detail=e_msg,
                                trace=traceback.format_exc())
+
+
+def days_param(request, default):
+    """
+    The positive number of days in the days query parameter of a history
+    request.
+    :param request: request whose days is validated. An invalid value is
+    raised as a 400.
+    :param default: number of days if the parameter isn't given.
+    :return: int
+    """
+    days = request.query_params.get('days', default)
+    try:
+        days = int(days)
+    except (TypeError, ValueError):
+        days = None
+    if (days is None or days <= 0):
+        e_msg = ('days must be a positive integer')
+        handle_exception(Exception(e_msg), request, status_code=400)
+    return days
@@ -27,7 +27,7 @@ from rest_framework.permissions import IsAuthenticated
 from storageadmin.views import DiskMixin
 from system.osi import (uptime, kernel_info)
 from fs.btrfs import (mount_share, mount_root, get_pool_info,
-                      pool_raid, mount_snap)
+                      pool_raid, mount_snap, volume_usage_map)
 from system.ssh import (sftp_mount_map, sftp_mount)
 from system.services import systemctl
 from system.osi import (system_shutdown, system_reboot,
@@ -40,10 +40,12 @@ from django.utils.timezone import utc
 from django.conf import settings
 from django.db import transaction
 from share_helpers import (sftp_snap_toggle, import_shares, import_snapshots)
+from smart_manager.usage_history import record as record_usage
 from rest_framework_custom.oauth_wrapper import RockstorOAuth2Authentication
 from system.pkg_mgmt import (auto_update, current_version, update_check,
                              update_run, auto_update_status)
 from nfs_exports import NFSExportMixin
+from storageadmin.bootstrap import (Executor, Phases)
 import logging
 logger = logging.getLogger(__name__)
 
@@ -55,8 +57,19 @@ class CommandView(DiskMixin, NFSExportMixin, APIView):
     permission_classes = (IsAuthenticated,)
 
     @staticmethod
+    def _pool_state(p, dev_name):
+        mount_root(p)
+        pool_info = get_pool_info(dev_name)
+        raid = pool_raid('%s%s' % (settings.MNT_PT, pool_info['label']))
+        return pool_info['label'], raid['data']
+
+    @classmethod
     @transaction.atomic
-    def _refresh_pool_state():
+    def _refresh_pool_state(cls):
+        # Pools are mounted and queried concurrently, then saved here.
+        # Returns the ids of the pools that were mounted and refreshed.
+        executor = Executor()
+        pools = []
         for p in Pool.objects.all():
             # If our pool has no disks, detached included, then delete it.
             # We leave pools with all detached members in place intentionally.
@@ -69,74 +82,93 @@ class CommandView(DiskMixin, NFSExportMixin, APIView):
                              'are no attached devices. Moving on.' %
                              p.name)
                 continue
+            first_attached_dev = p.disk_set.attached().first()
+            # Observe any redirect role by using target_name.
+            executor.add('pool(%s)' % p.name, cls._pool_state, p,
+                         first_attached_dev.target_name)
+            pools.append(p)
+        results = executor.run()
+        pool_ids = []
+        for p in pools:
+            ok, state = results['pool(%s)' % p.name]
+            if (not ok):
+                continue
+            p.name, p.raid = state
+            p.size = p.usage_bound()
+            p.save()
+            pool_ids.append(p.id)
+        return pool_ids
+
+    @staticmethod
+    def _import_snapshots(pool_ids):
+        # Snapshot import only reconciles the db with the pools, and with it
+        # the usage of all shares and snapshots, so it's left until exports
+        # are served.
+        pool_names = {}
+        executor = Executor()
+        for p in Pool.objects.filter(id__in=pool_ids):
+            executor.add('usage(%s)' % p.name, volume_usage_map, p)
+            pool_names[p.id] = p.name
+        usage_maps = executor.run()
+        usages = {}
+        for share in Share.objects.filter(
+                pool__id__in=pool_ids).select_related('pool'):
+            ok, usage_map = usage_maps['usage(%s)' %
+                                       pool_names[share.pool.id]]
             try:
-                mount_root(p)
-                first_attached_dev = p.disk_set.attached().first()
-                # Observe any redirect role by using target_name.
-                pool_info = get_pool_info(first_attached_dev.target_name)
-                p.name = pool_info['label']
-                p.raid = pool_raid('%s%s' % (settings.MNT_PT, p.name))['data']
-                p.size = p.usage_bound()
-                p.save()
+                with transaction.atomic():
+                    import_snapshots(share, usage_map if ok else None,
+                                     usages)
             except Exception as e:
-                logger.error('Exception while refreshing state for '
-                             'Pool(%s). Moving on: %s' %
-                             (p.name, e.__str__()))
+                e_msg = ('Exception while importing Snapshots of '
+                         'Share(%s): %s' % (share.name, e.__str__()))
+                logger.error(e_msg)
                 logger.exception(e)
+        record_usage(usages)
 
-    @transaction.atomic
-    def post(self, request, command, rtcepoch=None):
-        if (command == 'bootstrap'):
+    def _bootstrap(self, request):
+        # Not one transaction, so that concurrent mounts see the refreshed
+        # disk and pool state. See storageadmin/bootstrap.py
+        phases = Phases()
+        with phases('disks'):
             self._update_disk_state()
-            self._refresh_pool_state()
-            for p in Pool.objects.all():
-                if p.disk_set.attached().count() == 0:
-                    continue
+        with phases('pools'):
+            pool_ids = self._refresh_pool_state()
+        # Shares, their mounts and exports are only brought up for pools
+        # that were mounted above. The rest are logged there and skipped.
+        with phases('shares'):
+            for p in Pool.objects.filter(id__in=pool_ids):
                 # Import / update db shares counterpart for managed pool.
-                import_shares(p, request)
-
-            for share in Share.objects.all():
-                if share.pool.disk_set.attached().count() == 0:
-                    continue
-                try:
-                    if not share.is_mounted:
-                        mnt_pt = ('%s%s' % (settings.MNT_PT, share.name))
-                        mount_share(share, mnt_pt)
-                except Exception as e:
-                    e_msg = ('Exception while mounting a share(%s) during '
-                             'bootstrap: %s' % (share.name, e.__str__()))
-                    logger.error(e_msg)
-                    logger.exception(e)
-
-                try:
-                    import_snapshots(share)
-                except Exception as e:
-                    e_msg = ('Exception while importing Snapshots of '
-                             'Share(%s): %s' % (share.name, e.__str__()))
-                    logger.error(e_msg)
-                    logger.exception(e)
-
-            for snap in Snapshot.objects.all():
-                if (snap.uvisible):
-                    try:
-                        mount_snap(snap.share, snap.real_name)
-                    except Exception as e:
-                        e_msg = ('Failed to make the Snapshot(%s) visible. '
-                                 'Exception: %s' %
-                                 (snap.real_name, e.__str__()))
-                        logger.error(e_msg)
-
+                with transaction.atomic():
+                    import_shares(p, request)
+
+        # Each share is mounted concurrently with all others, and then it's
+        # visible snapshots and SFTP export.
+        with phases('mounts'):
+            executor = Executor()
+            shares = Share.objects.filter(
+                pool__id__in=pool_ids).select_related('pool')
+            for share in shares:
+                mnt_pt = ('%s%s' % (settings.MNT_PT, share.name))
+                executor.add('share(%s)' % share.name, mount_share, share,
+                             mnt_pt)
+            for snap in Snapshot.objects.filter(
+                    uvisible=True, share__pool__id__in=pool_ids
+            ).select_related('share__pool'):
+                executor.add('snapshot(%s/%s)' % (snap.share.name,
+                                                  snap.real_name),
+                             mount_snap, snap.share, snap.real_name,
+                             deps=('share(%s)' % snap.share.name,))
             mnt_map = sftp_mount_map(settings.SFTP_MNT_ROOT)
-            for sftpo in SFTP.objects.all():
-                try:
-                    sftp_mount(sftpo.share, settings.MNT_PT,
-                               settings.SFTP_MNT_ROOT, mnt_map, sftpo.editable)
-                    sftp_snap_toggle(sftpo.share)
-                except Exception as e:
-                    e_msg = ('Exception while exportin a sftp share during '
-                             'bootstrap: %s' % e.__str__())
-                    logger.error(e_msg)
-
+            for sftpo in SFTP.objects.filter(
+                    share__pool__id__in=pool_ids).select_related(
+                    'share__pool'):
+                executor.add('sftp(%s)' % sftpo.share.name,
+                             self._sftp_mount, sftpo, mnt_map,
+                             deps=('share(%s)' % sftpo.share.name,))
+            executor.run()
+
+        with phases('nfs'):
             try:
                 adv_entries = [a.export_str for a in
                                AdvancedNFSExport.objects.all()]
@@ -144,12 +176,15 @@ class CommandView(DiskMixin, NFSExportMixin, APIView):
                                                              request)
                 exports = self.create_nfs_export_input(NFSExport.objects.all())
                 exports.update(exports_d)
-                self.refresh_wrapper(exports, request, logger)
+                # export bind mounts don't survive a reboot, so re-apply
+                # all exports.
+                self.refresh_wrapper(exports, request, logger, full=True)
             except Exception as e:
                 e_msg = ('Exception while bootstrapping NFS: %s' % e.__str__())
                 logger.error(e_msg)
 
-            #  bootstrap services
+        #  bootstrap services
+        with phases('services'):
             try:
                 systemctl('firewalld', 'stop')
                 systemctl('firewalld', 'disable')
@@ -162,10 +197,28 @@ class CommandView(DiskMixin, NFSExportMixin, APIView):
                          'bootstrap: %s' % e.__str__())
                 logger.error(e_msg)
                 handle_exception(Exception(e_msg), request)
+        phases.mark('serving')
 
-            logger.debug('Bootstrap operations completed')
-            return Response()
+        with phases('snapshots'):
+            self._import_snapshots(pool_ids)
+        phases.mark('completed')
 
+        logger.debug('Bootstrap operations completed')
+        return Response(phases.timings)
+
+    @staticmethod
+    def _sftp_mount(sftpo, mnt_map):
+        sftp_mount(sftpo.share, settings.MNT_PT, settings.SFTP_MNT_ROOT,
+                   mnt_map, sftpo.editable)
+        sftp_snap_toggle(sftpo.share)
+
+    def post(self, request, command, rtcepoch=None):
+        if (command == 'bootstrap'):
+            return self._bootstrap(request)
+        return self._post(request, command, rtcepoch)
+
+    @transaction.atomic
+    def _post(self, request, command, rtcepoch=None):
         if (command == 'utcnow'):
             return Response(datetime.utcnow().replace(tzinfo=utc))
 
@@ -317,6 +370,11 @@ class CommandView(DiskMixin, NFSExportMixin, APIView):
             return Response()
 
         if (command == 'refresh-snapshot-state'):
+            usage_maps = {}
+            usages = {}
             for share in Share.objects.all():
-                import_snapshots(share)
+                if share.pool.id not in usage_maps:
+                    usage_maps[share.pool.id] = volume_usage_map(share.pool)
+                import_snapshots(share, usage_maps[share.pool.id], usages)
+            record_usage(usages)
             return Response()
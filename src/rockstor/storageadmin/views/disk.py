@@ -21,10 +21,11 @@ from rest_framework.response import Response
 from django.db import transaction
 from storageadmin.models import (Disk, Pool, Share)
 from fs.btrfs import (enable_quota, mount_root,
-                      get_pool_info, pool_raid)
+                      get_pool_info, pool_raid, volume_usage_map)
 from storageadmin.serializers import DiskInfoSerializer
 from storageadmin.util import handle_exception
 from share_helpers import (import_shares, import_snapshots)
+from smart_manager.usage_history import record as record_usage
 from django.conf import settings
 import rest_framework_custom as rfc
 from system import smart
@@ -35,6 +36,7 @@ from system.osi import set_disk_spindown, enter_standby, get_dev_byid_name, \
     wipe_disk, blink_disk, scan_disks, get_whole_dev_uuid, get_byid_name_map, \
     trigger_systemd_update, systemd_name_escape
 from system.services import systemctl
+from system.udev import disk_index
 from copy import deepcopy
 import uuid
 import json
@@ -57,7 +59,7 @@ class DiskMixin(object):
 
     @staticmethod
     @transaction.atomic
-    def _update_disk_state():
+    def _update_disk_state(rescan=False):
         """
         A db atomic method to update the database of attached disks / drives.
         Works only on device serial numbers for drive identification.
@@ -69,10 +71,11 @@ class DiskMixin(object):
         marked as offline. All offline drives have their SMART availability and
         activation status removed and all attached drives have their SMART
         availability assessed and activated if available.
+        :param rescan: bypass scan_disks() cached results, ie a full rescan.
         :return: serialized models of attached and missing disks via serial num
         """
         # Acquire a list (namedtupil collection) of attached drives > min size
-        disks = scan_disks(settings.MIN_DISK_SIZE)
+        disks = scan_disks(settings.MIN_DISK_SIZE, rescan=rescan)
         # Acquire a list of uuid's for currently unlocked LUKS containers.
         # Although we could tally these as we go by noting fstype crypt_LUKS
         # and then loop through our db Disks again updating all matching
@@ -383,6 +386,8 @@ class DiskListView(DiskMixin, rfc.GenericView):
         with self._handle_exception(request):
             if (command == 'scan'):
                 return self._update_disk_state()
+            if (command == 'rescan'):
+                return self._update_disk_state(rescan=True)
 
         e_msg = ('Unsupported command(%s).' % command)
         handle_exception(Exception(e_msg), request)
@@ -537,6 +542,8 @@ class DiskDetailView(rfc.GenericView):
                      % (disk.name, disk.name, disk_name, reverse_name))
             raise Exception(e_msg)
         wipe_disk(disk_name)
+        # don't wait on udev for the next scan_disks() to see the wipe.
+        disk_index.invalidate()
         disk.parted = isPartition
         # Rather than await the next _update_disk_state() we update our role.
         roles = {}
@@ -637,6 +644,7 @@ class DiskDetailView(rfc.GenericView):
                      % disk.name)
             raise Exception(e_msg)
         luks_format_disk(disk_name, passphrase)
+        disk_index.invalidate()
         disk.parted = isPartition  # should be False by now.
         # The following value may well be updated with a more informed truth
         # from the next scan_disks() run via _update_disk_state()
@@ -712,8 +720,11 @@ class DiskDetailView(rfc.GenericView):
             # TODO: enable_quota could well break an import from a ro pool.
             enable_quota(po)
             import_shares(po, request)
+            usage_map = volume_usage_map(po)
+            usages = {}
             for share in Share.objects.filter(pool=po):
-                import_snapshots(share)
+                import_snapshots(share, usage_map, usages)
+            record_usage(usages)
             return Response(DiskInfoSerializer(disk).data)
         except Exception as e:
             e_msg = ('Failed to import any pool on this device(%s). Error: %s'
@@ -23,11 +23,13 @@ from storageadmin.models import Disk, SMARTInfo, SMARTAttribute, \
     SMARTCapability, SMARTErrorLog, SMARTErrorLogSummary, SMARTTestLog, \
     SMARTTestLogDetail, SMARTIdentity
 from storageadmin.serializers import SMARTInfoSerializer
-from storageadmin.util import handle_exception
+from storageadmin.util import (handle_exception, days_param)
 import rest_framework_custom as rfc
-from system.smart import extended_info, capabilities, info, error_logs, \
-    test_logs, run_test
+from system.smart import all_info, run_test
+from storageadmin.smart_history import (drives_at_risk, history)
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
+from django.conf import settings
 from django.utils.timezone import utc
 
 import logging
@@ -56,32 +58,46 @@ class DiskSMARTDetailView(rfc.GenericView):
 
     @staticmethod
     @transaction.atomic
-    def _info(disk):
-        attributes = extended_info(disk.name, disk.smart_options)
-        cap = capabilities(disk.name, disk.smart_options)
-        e_summary, e_lines = error_logs(disk.name, disk.smart_options)
-        smartid = info(disk.name, disk.smart_options)
-        test_d, log_lines = test_logs(disk.name, disk.smart_options)
+    def _info(disk, smart=None):
+        """
+        Save a new SMARTInfo for the disk along with all of it's details.
+        :param disk: Disk object
+        :param smart: the disk's system.smart.all_info(), retrieved if None.
+        :return: the new SMARTInfo object
+        """
+        if (smart is None):
+            smart = all_info(disk.name, disk.smart_options)
+        attributes = smart['extended_info']
+        cap = smart['capabilities']
+        e_summary, e_lines = smart['error_logs']
+        smartid = smart['info']
+        test_d, log_lines = smart['test_logs']
         ts = datetime.utcnow().replace(tzinfo=utc)
         si = SMARTInfo(disk=disk, toc=ts)
         si.save()
+        sas = []
         for k in sorted(attributes.keys(), reverse=True):
             t = attributes[k]
-            sa = SMARTAttribute(info=si, aid=t[0], name=t[1], flag=t[2],
-                                normed_value=t[3], worst=t[4], threshold=t[5],
-                                atype=t[6], updated=t[7], failed=t[8],
-                                raw_value=t[9])
-            sa.save()
-        for c in sorted(cap.keys(), reverse=True):
-            t = cap[c]
-            SMARTCapability(info=si, name=c, flag=t[0],
-                            capabilities=t[1]).save()
+            sas.append(SMARTAttribute(info=si, aid=t[0], name=t[1],
+                                      flag=t[2], normed_value=t[3],
+                                      worst=t[4], threshold=t[5],
+                                      atype=t[6], updated=t[7], failed=t[8],
+                                      raw_value=t[9]))
+        SMARTAttribute.objects.bulk_create(sas)
+        SMARTCapability.objects.bulk_create(
+            [SMARTCapability(info=si, name=c, flag=cap[c][0],
+                             capabilities=cap[c][1])
+             for c in sorted(cap.keys(), reverse=True)])
+        sums = []
         for enum in sorted(e_summary.keys(), key=int, reverse=True):
             l = e_summary[enum]
-            SMARTErrorLogSummary(info=si, error_num=enum, lifetime_hours=l[0],
-                                 state=l[1], etype=l[2], details=l[3]).save()
-        for l in e_lines:
-            SMARTErrorLog(info=si, line=l).save()
+            sums.append(SMARTErrorLogSummary(info=si, error_num=enum,
+                                             lifetime_hours=l[0], state=l[1],
+                                             etype=l[2], details=l[3]))
+        SMARTErrorLogSummary.objects.bulk_create(sums)
+        SMARTErrorLog.objects.bulk_create(
+            [SMARTErrorLog(info=si, line=line) for line in e_lines])
+        tests = []
         for tnum in sorted(test_d.keys()):
             t = test_d[tnum]
             tlen = len(t)
@@ -92,11 +108,13 @@ class DiskSMARTDetailView(rfc.GenericView):
                     t[i] = int(t[i])
                 except:
                     t[i] = -1
-            SMARTTestLog(info=si, test_num=tnum, description=t[0], status=t[1],
-                         pct_completed=t[2], lifetime_hours=t[3],
-                         lba_of_first_error=t[4]).save()
-        for l in log_lines:
-            SMARTTestLogDetail(info=si, line=l).save()
+            tests.append(SMARTTestLog(info=si, test_num=tnum,
+                                      description=t[0], status=t[1],
+                                      pct_completed=t[2], lifetime_hours=t[3],
+                                      lba_of_first_error=t[4]))
+        SMARTTestLog.objects.bulk_create(tests)
+        SMARTTestLogDetail.objects.bulk_create(
+            [SMARTTestLogDetail(info=si, line=line) for line in log_lines])
 
         SMARTIdentity(info=si, model_family=smartid[0],
                       device_model=smartid[1], serial_number=smartid[2],
@@ -107,13 +125,51 @@ class DiskSMARTDetailView(rfc.GenericView):
                       scanned_on=smartid[11], supported=smartid[12],
                       enabled=smartid[13], version=smartid[14],
                       assessment=smartid[15]).save()
-        return Response(SMARTInfoSerializer(si).data)
+        return si
 
-    def post(self, request, did, command):
+    def _refresh_all(self):
+        """
+        Refresh the SMART info of all attached SMART enabled disks. smartctl
+        is run on up to SMART_REFRESH_CONCURRENCY disks at a time, while the
+        results are saved from this thread.
+        """
+        disks = list(Disk.objects.filter(offline=False, smart_available=True,
+                                         smart_enabled=True))
+
+        def poll(disk):
+            try:
+                return (disk, all_info(disk.name, disk.smart_options), None)
+            except Exception as e:
+                return (disk, None, e.__str__())
+
+        results = []
+        if (len(disks) > 0):
+            workers = ThreadPool(min(len(disks),
+                                     settings.SMART_REFRESH_CONCURRENCY))
+            try:
+                results = workers.map(poll, disks)
+            finally:
+                workers.close()
+                workers.join()
+        refreshed = []
+        failed = {}
+        for disk, smart, error in results:
+            if (smart is None):
+                logger.error('Failed to retrieve SMART info of disk(%s): %s'
+                             % (disk.name, error))
+                failed[disk.name] = error
+                continue
+            self._info(disk, smart)
+            refreshed.append(disk.name)
+        return Response({'refreshed': refreshed, 'failed': failed, })
+
+    def post(self, request, command, did=None):
         with self._handle_exception(request):
+            if (command == 'refresh'):
+                return self._refresh_all()
             disk = self._validate_disk(did, request)
             if (command == 'info'):
-                return self._info(disk)
+                return Response(SMARTInfoSerializer(self._info(disk)).data)
             elif (command == 'test'):
                 test_type = request.data.get('test_type')
                 if (re.search('short', test_type, re.IGNORECASE) is not None):
@@ -125,8 +181,31 @@ class DiskSMARTDetailView(rfc.GenericView):
                 else:
                     raise Exception('Unsupported Self-Test: %s' % test_type)
                 run_test(disk.name, test_type, disk.smart_options)
-                return self._info(disk)
+                return Response(SMARTInfoSerializer(self._info(disk)).data)
 
-            e_msg = ('Unknown command: %s. Only valid commands are info and '
-                     'test' % command)
+            e_msg = ('Unknown command: %s. Only valid commands are info, '
+                     'test and refresh' % command)
             handle_exception(Exception(e_msg), request)
+
+
+class DiskSMARTHistoryView(rfc.GenericView):
+
+    def get(self, *args, **kwargs):
+        """
+        Without a disk, the drives at risk according to the trends of their
+        SMART history over the last days(7 by default). Otherwise the
+        disk's SMART history over the last days(30 by default) as a dict of
+        attribute id: list of [ts, raw value, normalized value].
+        """
+        with self._handle_exception(self.request):
+            if ('did' not in kwargs):
+                return Response(drives_at_risk(days_param(self.request, 7)))
+            disk = DiskSMARTDetailView._validate_disk(kwargs['did'],
+                                                      self.request)
+            attributes = {}
+            for aid, ts, raw_value, normed_value in history(
+                    disk, days_param(self.request, 30)).values_list(
+                    'aid', 'ts', 'raw_value', 'normed_value'):
+                attributes.setdefault(aid, []).append(
+                    [ts, raw_value, normed_value])
+            return Response(attributes)
@@ -35,8 +35,11 @@ class GroupListView(rfc.GenericView):
     serializer_class = GroupSerializer
 
     def get_queryset(self, *args, **kwargs):
+        # paginated, see REST_FRAMEWORK settings. ?search= filters by
+        # groupname.
         with self._handle_exception(self.request):
-            return combined_groups()
+            return combined_groups(
+                self.request.query_params.get('search', None))
 
     @transaction.atomic
     def post(self, request):
@@ -133,9 +133,12 @@ class NFSExportMixin(object):
             handle_exception(Exception(e_msg), request)
 
     @staticmethod
-    def refresh_wrapper(exports, request, logger):
+    def refresh_wrapper(exports, request, logger, full=False):
         try:
-            refresh_nfs_exports(exports)
+            if (full):
+                refresh_nfs_exports(exports, full=True)
+            else:
+                refresh_nfs_exports(exports)
         except Exception as e:
             e_msg = ('A lower level error occured while refreshing '
                      'NFS exports: %s' % e.__str__())
@@ -18,8 +18,6 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 
 import re
-import pickle
-import time
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view
@@ -27,13 +25,15 @@ from django.db import transaction
 from storageadmin.serializers import PoolInfoSerializer
 from storageadmin.models import (Disk, Pool, Share, PoolBalance)
 from fs.btrfs import (add_pool, pool_usage, resize_pool, umount_root,
-                      btrfs_uuid, mount_root, start_balance, usage_bound,
-                      remove_share)
+                      btrfs_uuid, usage_bound, remove_share)
+from storageadmin.pool_balance import start as start_balance
+from storageadmin.task_handles import send
 from system.osi import remount, trigger_udev_update
+from system.mounts import mount_table
+from system.udev import disk_index
 from storageadmin.util import handle_exception
 from django.conf import settings
 import rest_framework_custom as rfc
-from django_ztask.models import Task
 import json
 
 import logging
@@ -171,22 +171,21 @@ class PoolMixin(object):
         if (re.search('compress-force', mnt_options) is None):
             mnt_options = ('%s,compress=%s' % (mnt_options, compression))
 
-        with open('/proc/mounts') as mfo:
-            mount_map = {}
-            for l in mfo.readlines():
-                share_name = None
-                if (re.search(
-                        '%s|%s' % (settings.NFS_EXPORT_ROOT, settings.MNT_PT),
-                        l) is not None):
-                    share_name = l.split()[1].split('/')[2]
-                elif (re.search(settings.SFTP_MNT_ROOT, l) is not None):
-                    share_name = l.split()[1].split('/')[3]
-                else:
-                    continue
-                if (share_name not in mount_map):
-                    mount_map[share_name] = [l.split()[1], ]
-                else:
-                    mount_map[share_name].append(l.split()[1])
+        mount_map = {}
+        for entry in mount_table.entries():
+            share_name = None
+            if (re.search(
+                    '%s|%s' % (settings.NFS_EXPORT_ROOT, settings.MNT_PT),
+                    entry.mnt_pt) is not None):
+                share_name = entry.mnt_pt.split('/')[2]
+            elif (re.search(settings.SFTP_MNT_ROOT, entry.mnt_pt) is not None):
+                share_name = entry.mnt_pt.split('/')[3]
+            else:
+                continue
+            if (share_name not in mount_map):
+                mount_map[share_name] = [entry.mnt_pt, ]
+            else:
+                mount_map[share_name].append(entry.mnt_pt)
         failed_remounts = []
         try:
             pool_mnt = '/mnt2/%s' % pool.name
@@ -210,19 +209,19 @@ class PoolMixin(object):
             handle_exception(Exception(e_msg), request)
         return Response(PoolInfoSerializer(pool).data)
 
-    def _balance_start(self, pool, force=False, convert=None):
-        mnt_pt = mount_root(pool)
-        start_balance.async(mnt_pt, force=force, convert=convert)
-        tid = 0
-        count = 0
-        while (tid == 0 and count < 25):
-            for t in Task.objects.all():
-                if (pickle.loads(t.args)[0] == mnt_pt):
-                    tid = t.uuid
-            time.sleep(0.2)
-            count += 1
-        logger.debug('balance tid = %s' % tid)
-        return tid
+    @staticmethod
+    def _balance_start(pool, force=False, convert=None):
+        # the balance is only queued by _balance_send(), once committed.
+        # Returns (PoolBalance, call to send).
+        return start_balance(pool, force=force, convert=convert)
+
+    @staticmethod
+    def _balance_send(calls):
+        # Django 1.8 has no on_commit hook, so callers send the balances
+        # they started after leaving their atomic block. ztaskd would
+        # otherwise race the transaction for the balance's handle.
+        for call in calls:
+            send(call)
 
 
 class PoolListView(PoolMixin, rfc.GenericView):
@@ -313,6 +312,9 @@ class PoolListView(PoolMixin, rfc.GenericView):
                 d.pool = p
                 d.save()
             add_pool(p, dnames)
+            # don't wait on udev for the next scan_disks() to see the new
+            # btrfs members.
+            disk_index.invalidate()
             p.size = p.usage_bound()
             p.uuid = btrfs_uuid(dnames[0])
             p.save()
@@ -331,7 +333,6 @@ class PoolDetailView(PoolMixin, rfc.GenericView):
         except Pool.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
-    @transaction.atomic
     def put(self, request, pid, command):
         """
         resize a pool.
@@ -339,6 +340,13 @@ class PoolDetailView(PoolMixin, rfc.GenericView):
         @command: 'add' - add a list of disks and hence expand the pool
                   'remove' - remove a list of disks and hence shrink the pool
         """
+        calls = []
+        response = self._put(request, pid, command, calls)
+        self._balance_send(calls)
+        return response
+
+    @transaction.atomic
+    def _put(self, request, pid, command, calls):
         with self._handle_exception(request):
             try:
                 pool = Pool.objects.get(id=pid)
@@ -404,9 +412,9 @@ class PoolDetailView(PoolMixin, rfc.GenericView):
                     handle_exception(Exception(e_msg), request)
 
                 resize_pool(pool, dnames)
-                tid = self._balance_start(pool, convert=new_raid)
-                ps = PoolBalance(pool=pool, tid=tid)
-                ps.save()
+                disk_index.invalidate()
+                calls.append(
+                    self._balance_start(pool, convert=new_raid)[1])
 
                 pool.raid = new_raid
                 for d_o in disks:
@@ -468,9 +476,8 @@ class PoolDetailView(PoolMixin, rfc.GenericView):
                     handle_exception(Exception(e_msg), request)
 
                 resize_pool(pool, dnames, add=False)
-                tid = self._balance_start(pool)
-                ps = PoolBalance(pool=pool, tid=tid)
-                ps.save()
+                disk_index.invalidate()
+                calls.append(self._balance_start(pool)[1])
 
                 for d in disks:
                     d.pool = None
@@ -510,6 +517,7 @@ class PoolDetailView(PoolMixin, rfc.GenericView):
             pool_path = ('%s%s' % (settings.MNT_PT, pool.name))
             umount_root(pool_path)
             pool.delete()
+            disk_index.invalidate()
             try:
                 # TODO: this call fails as the inheritance of disks was removed
                 # We need another method to invoke this as self no good now.
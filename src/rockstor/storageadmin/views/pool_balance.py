@@ -18,12 +18,11 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from rest_framework.response import Response
 from django.db import transaction
-from django_ztask.models import Task
 from storageadmin.util import handle_exception
 from storageadmin.serializers import PoolBalanceSerializer
 from storageadmin.models import (Pool, PoolBalance)
+from storageadmin.pool_balance import update_status
 import rest_framework_custom as rfc
-from fs.btrfs import balance_status
 from pool import PoolMixin
 
 import logging
@@ -44,58 +43,27 @@ class PoolBalanceView(PoolMixin, rfc.GenericView):
     def get_queryset(self, *args, **kwargs):
         with self._handle_exception(self.request):
             pool = self._validate_pool(self.kwargs['pid'], self.request)
-            self._balance_status(pool)
+            update_status(pool)
             return PoolBalance.objects.filter(pool=pool).order_by('-id')
 
-    @staticmethod
-    @transaction.atomic
-    def _balance_status(pool):
-        try:
-            # acquire a handle on the last pool balance status db entry
-            ps = PoolBalance.objects.filter(pool=pool).order_by('-id')[0]
-        except:
-            # return empty handed if we have no 'last entry' to update
-            return Response()
-        # Check if we have a running task which matches our last pool status
-        # tid
-        if (Task.objects.filter(uuid=ps.tid).exists()):
-            to = Task.objects.get(uuid=ps.tid)
-            if (to.failed is not None):
-                ps.status = 'failed'
-                ps.message = to.last_exception
-                ps.end_time = to.failed
-                ps.save()
-                to.delete()
-                return ps
-        # Get the current status of balance on this pool, irrespective of
-        # a running balance task, ie command line intervention.
-        cur_status = balance_status(pool)
-        previous_status = ps.status
-        # TODO: future "Balance Cancel" button should call us to have these
-        # TODO: values updated in the db table ready for display later.
-        if previous_status == 'cancelling' \
-                and cur_status['status'] == 'finished':
-            # override current status as 'cancelled'
-            cur_status['status'] = 'cancelled'
-            cur_status['message'] = \
-                'cancelled at %s%% complete' % ps.percent_done
-            # and retain prior percent finished value
-            cur_status['percent_done'] = ps.percent_done
-        if previous_status != 'finished' and previous_status != 'cancelled':
-            # update the last pool balance status with current status info.
-            PoolBalance.objects.filter(id=ps.id).update(**cur_status)
-        return ps
+    def post(self, request, pid, command=None):
+        calls = []
+        response = self._post(request, pid, command, calls)
+        self._balance_send(calls)
+        return response
 
     @transaction.atomic
-    def post(self, request, pid, command=None):
+    def _post(self, request, pid, command, calls):
         pool = self._validate_pool(pid, request)
         if (command is not None and command != 'status'):
             e_msg = ('Unknown balance command: %s' % command)
             handle_exception(Exception(e_msg), request)
 
         with self._handle_exception(request):
-            ps = self._balance_status(pool)
+            ps = update_status(pool)
             if (command == 'status'):
+                if (ps is None):
+                    return Response()
                 return Response(PoolBalanceSerializer(ps).data)
             force = request.data.get('force', False)
             if ((PoolBalance.objects.filter(pool=pool,
@@ -111,8 +79,8 @@ class PoolBalanceView(PoolMixin, rfc.GenericView):
                     e_msg = ('A Balance process is already running for '
                              'pool(%s).' % pool.name)
                     handle_exception(Exception(e_msg), request)
-
-            tid = self._balance_start(pool, force=force)
-            ps = PoolBalance(pool=pool, tid=tid)
-            ps.save()
+            # The new balance's handle is returned right away, it's progress
+            # is pushed to /pool_balance subscribers by the data collector.
+            ps, call = self._balance_start(pool, force=force)
+            calls.append(call)
             return Response(PoolBalanceSerializer(ps).data)
@@ -17,20 +17,19 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 import os
-import requests
 from rest_framework.response import Response
 from django.db import transaction
 from smart_manager.models import Service
 from storageadmin.models import (RockOn, DImage, DContainer, DPort, DVolume,
                                  ContainerOption, DCustomConfig,
-                                 DContainerLink, DContainerEnv)
+                                 DContainerLink, DContainerEnv, TaskHandle)
 from storageadmin.serializers import RockOnSerializer
 from storageadmin.util import handle_exception
 import rest_framework_custom as rfc
-from rockon_helpers import (docker_status, rockon_status)
-from django_ztask.models import Task
+from rockon_helpers import (docker_status, rockon_statuses)
+from storageadmin.task_handles import active
+from storageadmin.rockon_metastore import MetaStore
 from django.conf import settings
-import pickle
 import re
 import json
 import logging
@@ -43,49 +42,37 @@ class RockOnView(rfc.GenericView):
     @transaction.atomic
     def get_queryset(self, *args, **kwargs):
         if (docker_status()):
-            pending_rids = {}
-            failed_rids = {}
-            for t in Task.objects.filter(function_name__regex='rockon_helpers'):  # noqa E501
-                rid = pickle.loads(t.args)[0]
-                if (t.retry_count == 0 and t.failed is not None):
-                    failed_rids[rid] = t
-                else:
-                    pending_rids[rid] = t
-            # Remove old failed attempts @todo: we should prune all failed
-            # tasks of the past, not here though.
-            for rid in pending_rids.keys():
-                if (rid in failed_rids):
-                    pt = pending_rids[rid]
-                    ft = failed_rids[rid]
-                    if (failed_rids[rid].created > pending_rids[rid].created):
-                        # this should never be the case. pending tasks either
-                        # succeed and get deleted or they are marked failed.
-                        msg = ('Found a failed Task(%s) in the future of a '
-                               'pending Task(%s).' % (ft.uuid, pt.uuid))
-                        handle_exception(Exception(msg), self.request)
-                    failed_rids[rid].delete()
-                    del failed_rids[rid]
-            for ro in RockOn.objects.all():
+            # Rock-on tasks are submitted with a handle, see RockOnIdView.
+            pending_rids = set(active('rockon').values_list('object_id',
+                                                            flat=True))
+            rockons = list(RockOn.objects.all())
+            statuses = rockon_statuses(
+                [ro for ro in rockons if (ro.state == 'installed' and
+                                          ro.id not in pending_rids)])
+            for ro in rockons:
+                state, status = ro.state, ro.status
                 if (ro.state == 'installed'):
                     # update current running status of installed rockons.
                     if (ro.id not in pending_rids):
-                        ro.status = rockon_status(ro.name)
+                        ro.status = statuses[ro.id]
                 elif (re.search('pending', ro.state) is not None):
-                    if (ro.id in failed_rids):
-                        # we update the status on behalf of the task runner
-                        func_name = t.function_name.split('.')[-1]
-                        ro.state = '%s_failed' % func_name
-                    elif (ro.id not in pending_rids):
-                        logger.error('Rockon(%s) is in pending state but '
-                                     'there is no pending or failed task '
-                                     'for it. ' % ro.name)
+                    if (ro.id not in pending_rids):
+                        # the task either failed or ended without updating
+                        # the state, so we do on behalf of the task runner.
+                        if (not TaskHandle.objects.filter(
+                                kind='rockon', object_id=ro.id,
+                                state='failed').exists()):
+                            logger.error('Rockon(%s) is in pending state but '
+                                         'there is no pending or failed task '
+                                         'for it. ' % ro.name)
                         ro.state = '%s_failed' % ro.state.split('_')[1]
                     else:
                         logger.debug('Rockon(%s) is in pending state'
                                      % ro.name)
                 elif (ro.state == 'uninstall_failed'):
                     ro.state = 'installed'
-                ro.save()
+                if (ro.state != state or ro.status != status):
+                    ro.save()
         return RockOn.objects.filter().order_by('name')
 
     @transaction.atomic
@@ -96,17 +83,23 @@ class RockOnView(rfc.GenericView):
     def post(self, request, command=None):
         with self._handle_exception(request):
             if (command == 'update'):
-                rockons = self._get_available()
+                metastore = self._metastore()
+                rockons = self._get_available(metastore)
                 # Delete metadata for apps no longer in metastores.
                 self._delete_deprecated(rockons)
 
                 error_str = ''
-                for r in rockons:
+                applied = {}
+                # Only apps whose profile changed since it was last applied.
+                for r in metastore.changed(rockons, RockOn.objects.values_list(
+                        'name', flat=True)):
                     try:
-                        self._create_update_meta(r, rockons[r])
+                        if (self._create_update_meta(r, rockons[r])):
+                            applied[r] = rockons[r]
                     except Exception as e:
                         error_str = ('%s: %s' % (r, e.__str__()))
                         logger.exception(e)
+                metastore.record(applied)
                 if (len(error_str) > 0):
                     e_msg = ('Errors occurred while processing updates '
                              'for following Rock-ons. %s' % error_str)
@@ -135,6 +128,9 @@ class RockOnView(rfc.GenericView):
         # Update our application state with any changes from hosted app
         # profiles(app.json files). Some attributes cannot be updated if the
         # Rock-on is currently installed. These will be logged and ignored.
+        # Returns True if the profile was applied in full, ie the Rock-on is
+        # not installed. Only then is it's profile recorded as applied, so
+        # the rest is applied by an update after it's uninstalled.
         ro_defaults = {'description': r_d['description'],
                        'website': r_d['website'],
                        'version': r_d['version'],
@@ -334,6 +330,7 @@ class RockOnView(rfc.GenericView):
                 clo.name = cl_d['name']
                 clo.save()
         self._update_cc(ro, r_d)
+        return ro.state in ('available', 'install_failed')
 
     def _sorted_keys(self, cd):
         sorted_keys = [''] * len(cd.keys())
@@ -382,31 +379,19 @@ class RockOnView(rfc.GenericView):
             if (eo.key not in cc_d):
                 eo.delete()
 
-    def _get_available(self):
+    @staticmethod
+    def _metastore():
+        return MetaStore(settings.ROCKONS.get('remote_metastore'),
+                         settings.ROCKONS.get('remote_root'),
+                         cache_dir=settings.ROCKONS.get('metastore_cache'))
+
+    def _get_available(self, metastore):
         if Service.objects.get(name='docker').config is None:
             # don't fetch if service is not configured.
             return {}
 
-        url_root = settings.ROCKONS.get('remote_metastore')
-        remote_root = ('%s/%s' %
-                       (url_root, settings.ROCKONS.get('remote_root')))
-        msg = ('Error while processing remote metastore at %s' % remote_root)
-        with self._handle_exception(self.request, msg=msg):
-            response = requests.get(remote_root, timeout=10)
-            if (response.status_code != 200):
-                response.raise_for_status()
-            root = response.json()
-
-        meta_cfg = {}
-        for k, v in root.items():
-            cur_meta_url = '%s/%s' % (url_root, v)
-            msg = ('Error while processing Rock-on profile at %s' %
-                   cur_meta_url)
-            with self._handle_exception(self.request, msg=msg):
-                cur_res = requests.get(cur_meta_url, timeout=10)
-                if (cur_res.status_code != 200):
-                    cur_res.raise_for_status()
-                meta_cfg.update(cur_res.json())
+        with self._handle_exception(self.request):
+            meta_cfg = metastore.profiles()
 
         local_root = settings.ROCKONS.get('local_metastore')
         if (os.path.isdir(local_root)):
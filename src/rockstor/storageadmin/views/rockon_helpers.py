@@ -27,7 +27,7 @@ from storageadmin.models import (RockOn, DContainer, DVolume, DPort,
                                  DCustomConfig, DContainerLink,
                                  ContainerOption, DContainerEnv)
 from fs.btrfs import mount_share
-from rockon_utils import container_status
+from rockon_utils import (container_status, container_states)
 import logging
 
 DOCKER = '/usr/bin/docker'
@@ -55,6 +55,30 @@ def rockon_status(name):
     return container_status(co.name)
 
 
+def rockon_statuses(rockons):
+    """
+    Status of many rockons from a single docker inspect rather than one per
+    rockon.
+    :param rockons: list of RockOn objects.
+    :return: dict of rockon id: status as returned by rockon_status().
+    """
+    # a rockon's status is that of it's last launched container.
+    containers = {}
+    for co in DContainer.objects.filter(
+            rockon__in=rockons).order_by('-launch_order'):
+        containers.setdefault(co.rockon_id, co.name)
+    states = container_states(containers.values())
+    statuses = {}
+    for ro in rockons:
+        status_func = globals().get('%s_status' % ro.name.lower())
+        if (status_func is not None):
+            statuses[ro.id] = status_func(ro)
+        else:
+            statuses[ro.id] = states.get(containers.get(ro.id),
+                                         'unknown_error')
+    return statuses
+
+
 def rm_container(name):
     o, e, rc = run_command([DOCKER, 'stop', name], throw=False)
     o, e, rc = run_command([DOCKER, 'rm', name], throw=False)
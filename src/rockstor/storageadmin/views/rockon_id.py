@@ -26,6 +26,7 @@ import rest_framework_custom as rfc
 from storageadmin.util import handle_exception
 from rockon_helpers import (docker_status, start, stop, install, uninstall,
                             update)
+from storageadmin.task_handles import (create, send)
 from system.services import superctl
 
 import logging
@@ -54,8 +55,24 @@ class RockOnIdView(rfc.GenericView):
                      'supported. Please try again later.')
             handle_exception(Exception(e_msg), request)
 
-    @transaction.atomic
+    @staticmethod
+    def _queue(calls, rockon, func):
+        # func(rockon.id) with a new handle, sent by post() once committed.
+        th, call = create('rockon', rockon.id, func, rockon.id)
+        calls.append(call)
+
     def post(self, request, rid, command):
+        calls = []
+        response = self._post(request, rid, command, calls)
+        # Django 1.8 has no on_commit hook. The rock-on's task is queued
+        # once it's new state and handle are committed, else ztaskd races
+        # the transaction for them.
+        for call in calls:
+            send(call)
+        return response
+
+    @transaction.atomic
+    def _post(self, request, rid, command, calls):
         with self._handle_exception(request):
 
             if (not docker_status()):
@@ -152,7 +169,7 @@ class RockOnIdView(rfc.GenericView):
                         ceo = DContainerEnv.objects.get(container=co, key=e)
                         ceo.val = env_map[e]
                         ceo.save()
-                install.async(rockon.id)
+                self._queue(calls, rockon, install)
                 rockon.state = 'pending_install'
                 rockon.save()
             elif (command == 'uninstall'):
@@ -167,7 +184,7 @@ class RockOnIdView(rfc.GenericView):
                              'be uninstalled. Stop it and try again' %
                              rockon.name)
                     handle_exception(Exception(e_msg), request)
-                uninstall.async(rockon.id)
+                self._queue(calls, rockon, uninstall)
                 rockon.state = 'pending_uninstall'
                 rockon.save()
                 for co in DContainer.objects.filter(rockon=rockon):
@@ -211,13 +228,13 @@ class RockOnIdView(rfc.GenericView):
                         do.save()
                 rockon.state = 'pending_update'
                 rockon.save()
-                update.async(rockon.id)
+                self._queue(calls, rockon, update)
             elif (command == 'stop'):
-                stop.async(rockon.id)
+                self._queue(calls, rockon, stop)
                 rockon.status = 'pending_stop'
                 rockon.save()
             elif (command == 'start'):
-                start.async(rockon.id)
+                self._queue(calls, rockon, start)
                 rockon.status = 'pending_start'
                 rockon.save()
             elif (command == 'state_update'):
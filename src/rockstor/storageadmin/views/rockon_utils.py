@@ -24,28 +24,63 @@ logger = logging.getLogger(__name__)
 DOCKER = '/usr/bin/docker'
 
 
+STATE_FORMAT = '{{range $key, $value := .State}}{{$key}}:{{$value}},{{ end }}'  # noqa E501
+
+
+def _state(line):
+    state_d = {}
+    for i in line.split(','):
+        fields = i.split(':')
+        if (len(fields) >= 2):
+            state_d[fields[0]] = ':'.join(fields[1:])
+    state = 'unknown_error'
+    if ('Running' in state_d):
+        if (state_d['Running'] == 'true'):
+            state = 'started'
+        else:
+            state = 'stopped'
+            if ('Error' in state_d and 'ExitCode' in state_d):
+                exitcode = int(state_d['ExitCode'])
+                if (exitcode != 0):
+                    state = ('exitcode: %d error: %s' %
+                             (exitcode, state_d['Error']))
+    return state
+
+
 def container_status(name):
     state = 'unknown_error'
     try:
-        o, e, rc = run_command([DOCKER, 'inspect', '-f',
-                                '{{range $key, $value := .State}}{{$key}}:{{$value}},{{ end }}', name])  # noqa E501
-        state_d = {}
-        for i in o[0].split(','):
-            fields = i.split(':')
-            if (len(fields) >= 2):
-                state_d[fields[0]] = ':'.join(fields[1:])
-        if ('Running' in state_d):
-            if (state_d['Running'] == 'true'):
-                state = 'started'
-            else:
-                state = 'stopped'
-                if ('Error' in state_d and 'ExitCode' in state_d):
-                    exitcode = int(state_d['ExitCode'])
-                    if (exitcode != 0):
-                        state = ('exitcode: %d error: %s' %
-                                 (exitcode, state_d['Error']))
+        o, e, rc = run_command([DOCKER, 'inspect', '-f', STATE_FORMAT, name])
+        state = _state(o[0])
         return state
     except Exception as e:
         logger.exception(e)
     finally:
         return state
+
+
+def container_states(names):
+    """
+    Status of many containers from a single docker inspect, for callers that
+    would otherwise run container_status() for each of them.
+    :param names: list of container names.
+    :return: dict of container name: status as returned by
+    container_status(). Containers that don't exist are left out.
+    """
+    states = {}
+    if (len(names) == 0):
+        return states
+    # docker reports containers that don't exist on stderr and carries on
+    # with the others.
+    o, e, rc = run_command([DOCKER, 'inspect', '-f',
+                            '{{.Name}} %s' % STATE_FORMAT] + list(names),
+                           throw=False)
+    for line in o:
+        fields = line.split(' ', 1)
+        if (len(fields) < 2):
+            continue
+        try:
+            states[fields[0].lstrip('/')] = _state(fields[1])
+        except Exception as e:
+            logger.exception(e)
+    return states
@@ -26,7 +26,7 @@ from storageadmin.serializers import SambaShareSerializer
 from storageadmin.util import handle_exception
 import rest_framework_custom as rfc
 from share import ShareMixin
-from system.samba import (refresh_smb_config, status, restart_samba)
+from system.samba import share_config
 from fs.btrfs import mount_share
 
 import logging
@@ -46,12 +46,6 @@ class SambaMixin(object):
     }
     BOOL_OPTS = ('yes', 'no',)
 
-    @staticmethod
-    def _restart_samba():
-        out = status()
-        if (out[2] == 0):
-            restart_samba(hard=True)
-
     @classmethod
     def _validate_input(cls, request, smbo=None):
         options = {}
@@ -126,8 +120,15 @@ class SambaMixin(object):
 class SambaListView(SambaMixin, ShareMixin, rfc.GenericView):
     queryset = SambaShare.objects.all()
 
-    @transaction.atomic
     def post(self, request):
+        smb_share = self._post(request)
+        # Samba exports are applied once committed, see ShareConfig.
+        with self._handle_exception(request):
+            share_config.refresh()
+            return Response(SambaShareSerializer(smb_share).data)
+
+    @transaction.atomic
+    def _post(self, request):
         if ('shares' not in request.data):
             e_msg = ('Must provide share names')
             handle_exception(Exception(e_msg), request)
@@ -159,9 +160,7 @@ class SambaListView(SambaMixin, ShareMixin, rfc.GenericView):
                 if (admin_users is None):
                     admin_users = []
                 self._set_admin_users(admin_users, smb_share)
-            refresh_smb_config(list(SambaShare.objects.all()))
-            self._restart_samba()
-            return Response(SambaShareSerializer(smb_share).data)
+            return smb_share
 
 
 class SambaDetailView(SambaMixin, rfc.GenericView):
@@ -173,8 +172,14 @@ class SambaDetailView(SambaMixin, rfc.GenericView):
         except SambaShare.DoesNotExist:
             raise NotFound(detail=None)
 
-    @transaction.atomic
     def delete(self, request, smb_id):
+        self._delete(request, smb_id)
+        with self._handle_exception(request):
+            share_config.refresh()
+            return Response()
+
+    @transaction.atomic
+    def _delete(self, request, smb_id):
         try:
             smbo = SambaShare.objects.get(id=smb_id)
             SambaCustomConfig.objects.filter(smb_share=smbo).delete()
@@ -183,13 +188,14 @@ class SambaDetailView(SambaMixin, rfc.GenericView):
             e_msg = ('Samba export for the id(%s) does not exist' % smb_id)
             handle_exception(Exception(e_msg), request)
 
+    def put(self, request, smb_id):
+        smbo = self._put(request, smb_id)
         with self._handle_exception(request):
-            refresh_smb_config(list(SambaShare.objects.all()))
-            self._restart_samba()
-            return Response()
+            share_config.refresh()
+            return Response(SambaShareSerializer(smbo).data)
 
     @transaction.atomic
-    def put(self, request, smb_id):
+    def _put(self, request, smb_id):
         with self._handle_exception(request):
             try:
                 smbo = SambaShare.objects.get(id=smb_id)
@@ -228,7 +234,4 @@ class SambaDetailView(SambaMixin, rfc.GenericView):
                             e_msg = ('Failed to mount share(%s) due to a low '
                                      'level error.' % smb_o.share.name)
                             handle_exception(Exception(e_msg), request)
-
-            refresh_smb_config(list(SambaShare.objects.all()))
-            self._restart_samba()
-            return Response(SambaShareSerializer(smbo).data)
+            return smbo
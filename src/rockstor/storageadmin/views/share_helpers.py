@@ -16,14 +16,14 @@ You should have received a copy of the GNU General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
-from datetime import datetime
-from django.utils.timezone import utc
 from django.conf import settings
 from storageadmin.models import (Share, Snapshot, SFTP)
-from smart_manager.models import ShareUsage
+from smart_manager.usage_history import (record as record_usage,
+                                         snapshot_name)
 from fs.btrfs import (mount_share, mount_snap, is_mounted,
-                      umount_root, shares_info, volume_usage, snaps_info,
-                      qgroup_create, update_quota, share_pqgroup_assign)
+                      umount_root, shares_info, snaps_info, qgroup_create,
+                      update_quota, share_pqgroup_assign, volume_usage_map,
+                      volume_usage_lookup)
 from storageadmin.util import handle_exception
 from copy import deepcopy
 
@@ -31,9 +31,6 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-NEW_ENTRY = True
-UPDATE_TS = False
-
 
 def helper_mount_share(share, mnt_pt=None):
     if not share.is_mounted:
@@ -80,10 +77,14 @@ def import_shares(pool, request):
     # Find the actual/current shares/subvols within the given pool:
     # Limited to Rockstor relevant subvols ie shares and clones.
     shares_in_pool = shares_info(pool)
+    # Usage of all volumes in this pool from a single qgroup scan.
+    usage_map = volume_usage_map(pool)
     # List of pool's share.pqgroups so we can remove inadvertent duplication.
     # All pqgroups are removed when quotas are disabled, combined with a part
     # refresh we could have duplicates within the db.
     share_pqgroups_used = []
+    # Usage of each share, recorded in one batch once all are imported.
+    usages = {}
     # Delete db Share object if it is no longer found on disk.
     for s_in_pool_db in shares_in_pool_db:
         if s_in_pool_db not in shares_in_pool:
@@ -121,7 +122,7 @@ def import_shares(pool, request):
                 share.save()
             share.qgroup = shares_in_pool[s_in_pool]
             rusage, eusage, pqgroup_rusage, pqgroup_eusage = \
-                volume_usage(pool, share.qgroup, pqgroup)
+                volume_usage_lookup(usage_map, share.qgroup, pqgroup)
             if (rusage != share.rusage or eusage != share.eusage or
                pqgroup_rusage != share.pqgroup_rusage or
                pqgroup_eusage != share.pqgroup_eusage):
@@ -129,9 +130,7 @@ def import_shares(pool, request):
                 share.eusage = eusage
                 share.pqgroup_rusage = pqgroup_rusage
                 share.pqgroup_eusage = pqgroup_eusage
-                update_shareusage_db(s_in_pool, rusage, eusage)
-            else:
-                update_shareusage_db(s_in_pool, rusage, eusage, UPDATE_TS)
+            usages[s_in_pool] = (rusage, eusage)
             share.save()
             continue
         try:
@@ -160,10 +159,10 @@ def import_shares(pool, request):
                 cshare.size = pool.size
                 cshare.subvol_name = s_in_pool
                 (cshare.rusage, cshare.eusage, cshare.pqgroup_rusage,
-                 cshare.pqgroup_eusage) = volume_usage(pool, cshare.qgroup,
-                                                       cshare.pqgroup)
+                 cshare.pqgroup_eusage) = volume_usage_lookup(
+                    usage_map, cshare.qgroup, cshare.pqgroup)
                 cshare.save()
-                update_shareusage_db(s_in_pool, cshare.rusage, cshare.eusage)
+                usages[s_in_pool] = (cshare.rusage, cshare.eusage)
         except Share.DoesNotExist:
             logger.debug('Db share entry does not exist - creating.')
             # We have a share on disk that has no db counterpart so create one.
@@ -171,18 +170,35 @@ def import_shares(pool, request):
             pqid = qgroup_create(pool)
             update_quota(pool, pqid, pool.size * 1024)
             rusage, eusage, pqgroup_rusage, pqgroup_eusage = \
-                volume_usage(pool, shares_in_pool[s_in_pool], pqid)
+                volume_usage_lookup(usage_map, shares_in_pool[s_in_pool],
+                                    pqid)
             nso = Share(pool=pool, qgroup=shares_in_pool[s_in_pool],
                         pqgroup=pqid, name=s_in_pool, size=pool.size,
                         subvol_name=s_in_pool, rusage=rusage, eusage=eusage,
                         pqgroup_rusage=pqgroup_rusage,
                         pqgroup_eusage=pqgroup_eusage)
             nso.save()
-            update_shareusage_db(s_in_pool, rusage, eusage)
+            usages[s_in_pool] = (rusage, eusage)
             mount_share(nso, '%s%s' % (settings.MNT_PT, s_in_pool))
+    record_usage(usages)
 
 
-def import_snapshots(share):
+def import_snapshots(share, usage_map=None, usages=None):
+    """
+    Import / update the db Snapshot counterparts of the given share.
+    :param share: Share object
+    :param usage_map: optional usage map of the share's pool as returned by
+    volume_usage_map(), allows callers iterating over many shares of the same
+    pool to avoid a qgroup scan per share.
+    :param usages: optional dict the snapshots' usage is added to, for the
+    caller to record in one batch with those of other shares. If None the
+    usage is recorded before returning.
+    """
+    record = usages is None
+    if record:
+        usages = {}
+    if usage_map is None:
+        usage_map = volume_usage_map(share.pool)
     snaps_d = snaps_info('%s%s' % (settings.MNT_PT, share.pool.name),
                          share.name)
     snaps = [s.name for s in Snapshot.objects.filter(share=share)]
@@ -195,39 +211,10 @@ def import_snapshots(share):
         else:
             so = Snapshot(share=share, name=s, real_name=s,
                           writable=snaps_d[s][1], qgroup=snaps_d[s][0])
-        rusage, eusage = volume_usage(share.pool, snaps_d[s][0])
-        if (rusage != so.rusage or eusage != so.eusage):
-            so.rusage = rusage
-            so.eusage = eusage
-            update_shareusage_db(s, rusage, eusage)
-        else:
-            update_shareusage_db(s, rusage, eusage, UPDATE_TS)
+        rusage, eusage = volume_usage_lookup(usage_map, snaps_d[s][0])
+        so.rusage = rusage
+        so.eusage = eusage
+        usages[snapshot_name(share.name, s)] = (rusage, eusage)
         so.save()
-
-
-def update_shareusage_db(subvol_name, rusage, eusage, new_entry=True):
-    """
-    Creates a new share/subvol db usage entry, or updates an existing one with
-    a new time stamp and count increment.
-    The 'create new entry' mode is expected to be faster.
-    :param subvol_name: share/subvol name
-    :param rusage: Referenced/shared usage
-    :param eusage: Exclusive usage
-    :param new_entry: If True create a new entry with the passed params,
-    otherwise attempt to update the latest (by id) entry with time and count.
-    """
-    ts = datetime.utcnow().replace(tzinfo=utc)
-    if new_entry:
-        su = ShareUsage(name=subvol_name, r_usage=rusage, e_usage=eusage,
-                        ts=ts)
-        su.save()
-    else:
-        try:
-            su = ShareUsage.objects.filter(name=subvol_name).latest('id')
-            su.ts = ts
-            su.count += 1
-        except ShareUsage.DoesNotExist:
-            su = ShareUsage(name=subvol_name, r_usage=rusage, e_usage=eusage,
-                            ts=ts)
-        finally:
-            su.save()
+    if record:
+        record_usage(usages)
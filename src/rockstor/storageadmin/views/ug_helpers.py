@@ -17,79 +17,114 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 from storageadmin.models import (User, Group, )
-from system.users import (get_users, get_groups)
-from system.pinmanager import (pincard_states)
+from system.users import (directory, get_groups)
+from system.pinmanager import (pincard_states, pincard_uids,
+                               email_notification_enabled)
 import logging
 logger = logging.getLogger(__name__)
 
 
-def combined_users():
-    users = []
-    sys_users = get_users()
-    uname_list = sys_users.keys()
-    for u in uname_list:
-        try:
-            uo = User.objects.get(username=u)
-            uo.uid = sys_users[u][0]
-            uo.gid = sys_users[u][1]
-            uo.shell = sys_users[u][2]
-            gname = get_groups(uo.gid).keys()[0]
-            create = True
-            if (uo.group is not None):
-                if (uo.group.gid == uo.gid or uo.group.groupname == gname):
-                    uo.group.groupname = gname
-                    uo.group.gid = uo.gid
-                    uo.group.save()
-                    create = False
-            if (create):
-                try:
-                    go = Group.objects.get(groupname=gname)
-                    go.gid = uo.gid
-                    go.save()
-                    uo.group = go
-                except Group.DoesNotExist:
-                    try:
-                        go = Group.objects.get(gid=uo.gid)
-                        go.groupname = gname
-                        go.save()
-                        uo.group = go
-                    except Group.DoesNotExist:
-                        go = Group(groupname=gname, gid=uo.gid)
-                        go.save()
-                        uo.group = go
-            uo.save()
-            uo.pincard_allowed, uo.has_pincard = pincard_states(uo)
-            users.append(uo)
+def _matches(name, search):
+    return search is None or search.lower() in name.lower()
+
+
+def _sync_user(uo, uid, gid, shell, gname, groups_by_name, groups_by_gid):
+    # Bring a managed user and it's group up to date with the system, only
+    # writing to the db what changed.
+    changed = (uo.uid, uo.gid, uo.shell) != (uid, gid, shell)
+    uo.uid, uo.gid, uo.shell = uid, gid, shell
+    go = uo.group
+    if (go is not None and (go.gid == gid or go.groupname == gname)):
+        if ((go.groupname, go.gid) != (gname, gid)):
+            go.groupname = gname
+            go.gid = gid
+            go.save()
+    else:
+        go = groups_by_name.get(gname)
+        if (go is not None):
+            if (go.gid != gid):
+                go.gid = gid
+                go.save()
+        else:
+            go = groups_by_gid.get(gid)
+            if (go is not None):
+                go.groupname = gname
+                go.save()
+            else:
+                go = Group(groupname=gname, gid=gid)
+                go.save()
+                groups_by_name[gname] = go
+                groups_by_gid[gid] = go
+        uo.group = go
+        changed = True
+    if (changed):
+        uo.save()
+
 
-        except User.DoesNotExist:
-            temp_uo = User(username=u, uid=sys_users[u][0],
-                           gid=sys_users[u][1], shell=sys_users[u][2],
-                           admin=False)
-            temp_uo.managed_user = False
-            temp_uo.pincard_allowed, temp_uo.has_pincard = pincard_states(temp_uo)  # noqa E501
-            users.append(temp_uo)
+def combined_users(search=None):
+    """
+    System users, from the directory cache, merged with the users in the db.
+    Groups are resolved from the cached group index and the db users, groups
+    and pincards are each read with a single query.
+    :param search: only users whose username contains it, ignoring case.
+    :return: list of User objects sorted by username.
+    """
+    users = []
+    sys_users = directory.users()
+    gid_names = dict((gid, name) for name, gid in
+                     directory.groups().items())
+    db_users = dict((u.username, u) for u in
+                    User.objects.select_related('group'))
+    db_groups = list(Group.objects.all())
+    groups_by_name = dict((g.groupname, g) for g in db_groups)
+    groups_by_gid = dict((g.gid, g) for g in db_groups)
+    uids_with_pincard = pincard_uids()
+    has_mail = email_notification_enabled()
+    for u, (uid, gid, shell) in sys_users.items():
+        if (not _matches(u, search)):
+            continue
+        gname = gid_names.get(gid)
+        uo = db_users.get(u)
+        if (uo is not None):
+            if (gname is None):
+                gname = get_groups(gid).keys()[0]
+            _sync_user(uo, uid, gid, shell, gname, groups_by_name,
+                       groups_by_gid)
+        else:
+            uo = User(username=u, uid=uid, gid=gid, shell=shell, admin=False)
+            uo.managed_user = False
+            uo.groupname = gname
+        uo.pincard_allowed, uo.has_pincard = pincard_states(
+            uo, uids_with_pincard, has_mail)
+        users.append(uo)
 
-    for u in User.objects.all():
-        if (u.username not in uname_list):
+    for u in db_users.values():
+        if (u.username not in sys_users and _matches(u.username, search)):
             users.append(u)
-    return sorted(users, cmp=lambda x, y: cmp(x.username.lower(),  # noqa F821
-                                              y.username.lower()))
+    return sorted(users, key=lambda u: u.username.lower())
 
 
-def combined_groups():
+def combined_groups(search=None):
+    """
+    System groups, from the directory cache, merged with the groups in the
+    db.
+    :param search: only groups whose name contains it, ignoring case.
+    :return: list of Group objects sorted by groupname.
+    """
     groups = []
-    sys_groups = get_groups()
-    gname_list = sys_groups.keys()
-    for g in gname_list:
-        try:
-            go = Group.objects.get(groupname=g)
-            go.gid = sys_groups[g]
+    sys_groups = directory.groups()
+    db_groups = dict((g.groupname, g) for g in Group.objects.all())
+    for g, gid in sys_groups.items():
+        if (not _matches(g, search)):
+            continue
+        go = db_groups.get(g)
+        if (go is None):
+            go = Group(groupname=g, gid=gid)
+        elif (go.gid != gid):
+            go.gid = gid
             go.save()
-            groups.append(go)
-        except Group.DoesNotExist:
-            groups.append(Group(groupname=g, gid=sys_groups[g]))
-    for g in Group.objects.all():
-        if (g.groupname not in gname_list):
+        groups.append(go)
+    for g in db_groups.values():
+        if (g.groupname not in sys_groups and _matches(g.groupname, search)):
             groups.append(g)
-    return sorted(groups, cmp=lambda x, y: cmp(x.groupname.lower(),  # noqa F821
-                                               y.groupname.lower()))
+    return sorted(groups, key=lambda g: g.groupname.lower())
@@ -109,8 +109,11 @@ class UserMixin(object):
 
 class UserListView(UserMixin, rfc.GenericView):
     def get_queryset(self, *args, **kwargs):
+        # paginated, see REST_FRAMEWORK settings. ?search= filters by
+        # username.
         with self._handle_exception(self.request):
-            return combined_users()
+            return combined_users(
+                self.request.query_params.get('search', None))
 
     @transaction.atomic
     def post(self, request):
@@ -0,0 +1,132 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import collections
+import logging
+import os
+import select
+import threading
+
+logger = logging.getLogger(__name__)
+
+MOUNTS = '/proc/self/mounts'
+# gevent's monkey patching removes select.poll, in which case the table is
+# re-read on every lookup.
+_poll = getattr(select, 'poll', None)
+
+MountEntry = collections.namedtuple('MountEntry',
+                                    'dev mnt_pt fstype options')
+
+
+def parse_mounts(data):
+    """
+    :param data: contents of /proc/mounts
+    :return: list of MountEntry in /proc/mounts order.
+    """
+    entries = []
+    for line in data.splitlines():
+        fields = line.split()
+        if len(fields) < 4:
+            # Avoid index issues as we expect >= 4 columns.
+            continue
+        entries.append(MountEntry(*fields[:4]))
+    return entries
+
+
+class MountTable(object):
+    """
+    Process wide parsed copy of /proc/self/mounts indexed by mount point.
+    The kernel flags a mount table change with POLLPRI on any open mounts
+    file, so we keep one open and only re-read it when flagged, which makes
+    lookups dict hits between changes.
+    """
+
+    def __init__(self, path=MOUNTS):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pid = None
+        self.fd = None
+        self.poller = None
+        self._entries = []
+        self._index = {}
+
+    def _open(self):
+        if (self.fd is not None and self.pid == os.getpid()):
+            return True
+        if (self.fd is not None):
+            # inherited from our parent process.
+            os.close(self.fd)
+        self.pid = os.getpid()
+        self.fd = self.poller = None
+        if (_poll is None):
+            return False
+        try:
+            self.fd = os.open(self.path, os.O_RDONLY)
+            self.poller = _poll()
+            self.poller.register(self.fd, select.POLLPRI | select.POLLERR)
+            return True
+        except (OSError, IOError) as e:
+            logger.error('Failed to watch %s, mounts will be re-read on '
+                         'every lookup: %s' % (self.path, e.__str__()))
+            if (self.fd is not None):
+                os.close(self.fd)
+            self.fd = self.poller = None
+            return False
+
+    def _read(self):
+        if (self.fd is None):
+            with open(self.path) as mfo:
+                return mfo.read()
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        chunks = []
+        while (True):
+            data = os.read(self.fd, 65536)
+            if (len(data) == 0):
+                return ''.join(chunks)
+            chunks.append(data)
+
+    def _refresh(self):
+        # A fresh fd has no change pending so read it once up front, after
+        # that only when poll reports a change. Polling acknowledges it.
+        with self.lock:
+            opened = self.fd is not None and self.pid == os.getpid()
+            if (self._open() and opened and
+                    len(self.poller.poll(0)) == 0):
+                return
+            entries = parse_mounts(self._read())
+            index = {}
+            for e in entries:
+                index.setdefault(e.mnt_pt, []).append(e)
+            self._entries, self._index = entries, index
+
+    def entries(self):
+        """
+        :return: list of MountEntry for all current mounts.
+        """
+        self._refresh()
+        return self._entries
+
+    def get(self, mnt_pt):
+        """
+        :return: list of MountEntry mounted at mnt_pt, in /proc/mounts order.
+        """
+        self._refresh()
+        return self._index.get(mnt_pt, [])
+
+
+mount_table = MountTable()
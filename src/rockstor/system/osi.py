@@ -34,6 +34,8 @@ import uuid
 from django.conf import settings
 
 from exceptions import CommandException, NonBTRFSRootException
+from mounts import mount_table
+from udev import disk_index
 
 
 logger = logging.getLogger(__name__)
@@ -44,6 +46,7 @@ CHATTR = '/usr/bin/chattr'
 DD = '/bin/dd'
 DEFAULT_MNT_DIR = '/mnt2/'
 EXPORTFS = '/usr/sbin/exportfs'
+EXPORTS = '/etc/exports'
 GRUBBY = '/usr/sbin/grubby'
 HDPARM = '/usr/sbin/hdparm'
 HOSTID = '/usr/bin/hostid'
@@ -62,6 +65,9 @@ UMOUNT = '/bin/umount'
 WIPEFS = '/usr/sbin/wipefs'
 RTC_WAKE_FILE = '/sys/class/rtc/rtc0/wakealarm'
 RETURN_BOOLEAN = True
+# KEY="value" pairs of lsblk -P output. A value ends at the quote that is
+# followed by the next key or the end of the line.
+LSBLK_PAIR = re.compile(r'([A-Z:-]+)="(.*?)"(?= [A-Z:-]+="|$)')
 EXCLUDED_MOUNT_DEVS = ['sysfs', 'proc', 'devtmpfs', 'securityfs', 'tmpfs',
                          'devpts', 'cgroup', 'pstore', 'configfs', 'systemd-1',
                          'mqueue', 'debugfs', 'hugetlbfs', 'nfsd', 'sunrpc']
@@ -122,7 +128,7 @@ def run_command(cmd, shell=False, stdout=subprocess.PIPE,
     return (out, err, rc)
 
 
-def scan_disks(min_size):
+def scan_disks(min_size, rescan=False):
     """
     Using lsblk we scan all attached disks and categorize them according to
     if they are partitioned, their file system, if the drive hosts our / mount
@@ -131,10 +137,24 @@ def scan_disks(min_size):
     for further analysis / categorization.
     N.B. if a device (partition or whole dev) hosts swap or is of no interest
     then it is ignored.
+    Results are answered from disk_index until udev reports a block device
+    change, see system/udev.py.
     :param min_size: Discount all devices below this size in KB
+    :param rescan: ignore cached results and per device lookups.
     :return: List containing drives of interest
     """
-    base_root_disk = root_disk()
+    if (rescan):
+        disk_index.invalidate()
+    generation, disks = disk_index.scan(min_size)
+    if (disks is not None):
+        return disks
+    disks = _scan_disks(min_size)
+    disk_index.store(min_size, generation, disks)
+    return disks
+
+
+def _scan_disks(min_size):
+    base_root_disk = disk_index.lookup(None, 'root_disk', root_disk)
     cmd = [LSBLK, '-P', '-o',
            'NAME,MODEL,SERIAL,SIZE,TRAN,VENDOR,HCTL,TYPE,FSTYPE,LABEL,UUID']
     o, e, rc = run_command(cmd)
@@ -158,37 +178,9 @@ def scan_disks(min_size):
         # easy read categorization flags, all False until found otherwise.
         is_root_disk = False  # base dev that / is mounted on ie system disk
         is_partition = is_btrfs = False
-        dmap = {}  # to hold line info from lsblk output eg NAME: sda
-        # line parser variables
-        cur_name = ''
-        cur_val = ''
-        name_iter = True
-        val_iter = False
-        sl = line.strip()
-        i = 0
-        while i < len(sl):
-            # We iterate over the line to parse it's information char by char
-            # keeping track of name or value and adding the char accordingly
-            if (name_iter and sl[i] == '=' and sl[i + 1] == '"'):
-                name_iter = False
-                val_iter = True
-                i = i + 2
-            elif (val_iter and sl[i] == '"' and
-                    (i == (len(sl) - 1) or sl[i + 1] == ' ')):
-                val_iter = False
-                name_iter = True
-                i = i + 2
-                dmap[cur_name.strip()] = cur_val.strip()
-                cur_name = ''
-                cur_val = ''
-            elif (name_iter):
-                cur_name = cur_name + sl[i]
-                i = i + 1
-            elif (val_iter):
-                cur_val = cur_val + sl[i]
-                i = i + 1
-            else:
-                raise Exception('Failed to parse lsblk output: %s' % sl)
+        # line info from lsblk output eg NAME: sda
+        dmap = dict((k, v.strip()) for k, v in
+                    LSBLK_PAIR.findall(line.strip()))
         # md devices, such as mdadmin software raid and some hardware raid
         # block devices show up in lsblk's output multiple times with identical
         # info.  Given we only need one copy of this info we remove duplicate
@@ -400,7 +392,9 @@ def scan_disks(min_size):
                     # to populate our MODEL since it is otherwise unused.
                     if (re.match('md', dmap['NAME']) is not None):
                         # cheap way to display our member drives
-                        dmap['MODEL'] = get_md_members(dmap['NAME'])
+                        dmap['MODEL'] = disk_index.lookup(
+                            dmap['NAME'], 'md_members', get_md_members,
+                            dmap['NAME'])
                 else:
                     # We have a non system disk btrfs filesystem.
                     # Ie we are a whole disk or a partition with btrfs on but
@@ -419,7 +413,9 @@ def scan_disks(min_size):
             if (dmap['SERIAL'] == '' or always_use_udev_serial):
                 # lsblk fails to retrieve SERIAL from VirtIO drives and some
                 # sdcard devices and md devices so try specialized function.
-                dmap['SERIAL'] = get_disk_serial(dmap['NAME'], dmap['TYPE'])
+                dmap['SERIAL'] = disk_index.lookup(
+                    dmap['NAME'], 'serial', get_disk_serial, dmap['NAME'],
+                    dmap['TYPE'])
             # Now try specialized serial propogation methods:
             # Bcache virtual block devices get their backing devices uuid
             # We propagate the uuid for a bcache backing device to it's virtual
@@ -427,7 +423,9 @@ def scan_disks(min_size):
             # Note however that we are only interested in the 'backing device'
             # type of bcache as it has the counterpart virtual block device.
             if (dmap['FSTYPE'] == 'bcache'):
-                bcache_dev_type = get_bcache_device_type(dmap['NAME'])
+                bcache_dev_type = disk_index.lookup(
+                    dmap['NAME'], 'bcache_type', get_bcache_device_type,
+                    dmap['NAME'])
                 if bcache_dev_type == 'bdev':
                     bdev_uuid = dmap['UUID']
                     # We set out bdev_flag to inform the next device
@@ -559,7 +557,38 @@ def bind_mount(mnt_pt, export_pt):
     return True
 
 
-def refresh_nfs_exports(exports):
+def parse_exports(data):
+    """
+    :param data: contents of /etc/exports as written by refresh_nfs_exports
+    :return: dict of export point: tuple of (client, options)
+    """
+    exports = {}
+    for line in data.splitlines():
+        fields = line.split()
+        if (len(fields) < 2 or fields[0].startswith('#')):
+            continue
+        entries = []
+        for f in fields[1:]:
+            client, sep, options = f.partition('(')
+            entries.append((client, options.rstrip(')')))
+        exports[fields[0]] = tuple(entries)
+    return exports
+
+
+def _exportfs(clients, options=None):
+    """
+    Export(or unexport when options is None) a batch of client:export_point
+    pairs with one exportfs run.
+    """
+    if (len(clients) == 0):
+        return
+    cmd = [EXPORTFS, '-u']
+    if (options is not None):
+        cmd = [EXPORTFS, '-i', '-o', options]
+    return run_command(cmd + sorted(clients))
+
+
+def refresh_nfs_exports(exports, full=False):
     """
     input format:
 
@@ -569,41 +598,72 @@ def refresh_nfs_exports(exports):
                        ...}
 
     if 'clients' is an empty list, then unmount and cleanup.
-    """
-    fo, npath = mkstemp()
-    with open(npath, 'w') as efo:
-        shares = []
-        for e in exports.keys():
-            if (len(exports[e]) == 0):
-                #  do share tear down at the end, only snaps here
-                if (len(e.split('/')) == 4):
-                    nfs4_mount_teardown(e)
-                else:
-                    shares.append(e)
-                continue
 
-            if (not is_mounted(e)):
-                bind_mount(exports[e][0]['mnt_pt'], e)
-            client_str = ''
-            admin_host = None
-            for c in exports[e]:
-                run_command([EXPORTFS, '-i', '-o', c['option_list'],
-                             '%s:%s' % (c['client_str'], e)])
-                client_str = ('%s%s(%s) ' % (client_str, c['client_str'],
-                                             c['option_list']))
-                if ('admin_host' in c):
-                    admin_host = c['admin_host']
-            if (admin_host is not None):
-                run_command([EXPORTFS, '-i', '-o', 'rw,no_root_squash',
-                             '%s:%s' % (admin_host, e)])
-                client_str = ('%s %s(rw,no_root_squash)' % (client_str,
-                                                            admin_host))
-            export_str = ('%s %s\n' % (e, client_str))
-            efo.write(export_str)
-        for s in shares:
-            nfs4_mount_teardown(s)
-    shutil.move(npath, '/etc/exports')
-    return run_command([EXPORTFS, '-ra'])
+    The input is the complete set of exports. It's compared with the last
+    applied set, ie /etc/exports, and only the clients added, removed or
+    with changed options are (un)exported, in one exportfs run per set of
+    options. With full, all exports are re-applied instead, ie on boot.
+    :return: dict with the number of client exports and unexports done and
+    the seconds taken.
+    """
+    t0 = time.time()
+    current = {}
+    if (not full and os.path.isfile(EXPORTS)):
+        with open(EXPORTS) as efo:
+            current = parse_exports(efo.read())
+    desired = {}
+    teardown = []
+    for e in exports.keys():
+        if (len(exports[e]) == 0):
+            teardown.append(e)
+            continue
+        entries = []
+        admin_host = None
+        for c in exports[e]:
+            entries.append((c['client_str'], c['option_list']))
+            if ('admin_host' in c):
+                admin_host = c['admin_host']
+        if (admin_host is not None):
+            entries.append((admin_host, 'rw,no_root_squash'))
+        desired[e] = tuple(entries)
+    unexports = []
+    for e, entries in current.items():
+        clients = dict(desired.get(e, ()))
+        unexports.extend(['%s:%s' % (c, e) for c, o in entries
+                          if c not in clients])
+    by_options = {}
+    for e, entries in desired.items():
+        clients = dict(current.get(e, ()))
+        # /etc/exports survives the export's bind mount, eg across a
+        # reboot or a share remount, so check every export point.
+        if (not is_mounted(e)):
+            bind_mount(exports[e][0]['mnt_pt'], e)
+            # and re-export all its clients on the new mount.
+            clients = {}
+        for c, o in entries:
+            if (clients.get(c) != o):
+                by_options.setdefault(o, []).append('%s:%s' % (c, e))
+    _exportfs(unexports)
+    for options, clients in by_options.items():
+        _exportfs(clients, options)
+    #  do share tear down at the end, snaps first.
+    for e in sorted(teardown, key=lambda e: len(e.split('/')) != 4):
+        nfs4_mount_teardown(e)
+    if (full or desired != current):
+        fo, npath = mkstemp()
+        with open(npath, 'w') as efo:
+            for e in sorted(desired.keys()):
+                efo.write('%s %s\n' % (e, ' '.join(
+                    ['%s(%s)' % (c, o) for c, o in desired[e]])))
+        shutil.move(npath, EXPORTS)
+    if (full):
+        run_command([EXPORTFS, '-ra'])
+    stats = {'exported': sum([len(c) for c in by_options.values()]),
+             'unexported': len(unexports),
+             'seconds': time.time() - t0, }
+    logger.info('Applied NFS exports: %(exported)d client exports and '
+                '%(unexported)d unexports in %(seconds).2f seconds.' % stats)
+    return stats
 
 
 def config_network_device(name, dtype='ethernet', method='auto', ipaddr=None,
@@ -778,10 +838,9 @@ def is_mounted(mnt_pt):
 
 def mount_status(mnt_pt, return_boolean=False):
     """
-    Parses /proc/mounts to extract the status of a given mount point.
-    Line fields are as follows:
-    dev_name mount_point fstype mount_options dummy_value dummy_value
-    In either mode this function typically takes around 0.05ms without GC.
+    Looks up the status of a given mount point in our parsed /proc/mounts,
+    see system/mounts.py. The table is only re-read after a mount change so
+    this is usually a dict lookup.
     It should be kept light as it is called frequently by Pool and Share
     models via their mount_status and is_mounted properties.
     :param mnt_pt: pool (volume) or subvolume mount point (with full path).
@@ -791,20 +850,14 @@ def mount_status(mnt_pt, return_boolean=False):
     If return_boolean=False (default) then a string is returned of the current
     mount options, or 'unmounted' if no relevant /proc/mounts entry was found.
     """
-    with open('/proc/mounts') as pfo:
-        for each_line in pfo.readlines():
-            line_fields = each_line.split()
-            if len(line_fields) < 4:
-                # Avoid index issues as we expect >= 4 columns.
-                continue
-            if line_fields[0] in EXCLUDED_MOUNT_DEVS:
-                # Skip excluded/special mount devices ie sysfs, proc, etc.
-                continue
-            if line_fields[1] == mnt_pt:
-                # We have an active mount, return according to personality.
-                if return_boolean:
-                    return True
-                return line_fields[3]
+    for entry in mount_table.get(mnt_pt):
+        if entry.dev in EXCLUDED_MOUNT_DEVS:
+            # Skip excluded/special mount devices ie sysfs, proc, etc.
+            continue
+        # We have an active mount, return according to personality.
+        if return_boolean:
+            return True
+        return entry.options
     if return_boolean:
         return False
     return 'unmounted'
@@ -884,60 +937,58 @@ def convert_to_kib(size):
 def root_disk():
     """
     Returns the base drive device name where / mount point is found.
-    Works by parsing /proc/mounts. Eg if the root entry was as follows:
+    Works from our parsed /proc/mounts. Eg if the root entry was as follows:
     /dev/sdc3 / btrfs rw,noatime,ssd,space_cache,subvolid=258,subvol=/root 0 0
     the returned value is sdc
     The assumption with non md devices is that the partition number will be a
     single character.
     :return: sdX type device name (without path) where root is mounted.
     """
-    with open('/proc/mounts') as fo:
-        for line in fo.readlines():
-            fields = line.split()
-            if (fields[1] == '/' and fields[2] == 'btrfs'):
-                # We have found our '/' and it's of fs type btrfs
-                if (re.match('/dev/mapper/luks-', fields[0]) is not None):
-                    # Our root is on a mapped open LUKS container so we need
-                    # not resolve the symlink, ie /dev/dm-0, as we loose info
-                    # and lsblk's name output also uses the luks-<uuid> name.
-                    # So we return the name minus it's /dev/mapper/ component
-                    # as there are no partitions within these devices so it is
-                    # it's own base device. N.B. we do not resolve to the
-                    # parent device hosting the LUKS container itself.
-                    return fields[0][12:]
-                # resolve symbolic links to their targets.
-                disk = os.path.realpath(fields[0])
-                if (re.match('/dev/md', disk) is not None):
-                    # We have an Multi Device naming scheme which is a little
-                    # different ie 3rd partition = md126p3 on the md126 device,
-                    # or md0p3 as third partition on md0 device.  As md devs
-                    # often have 1 to 3 numerical chars we search for one or
-                    # more numeric characters, this assumes our dev name has no
-                    # prior numerical components ie starts /dev/md but then we
-                    # are here due to that match.  Find the indexes of the
-                    # device name without the partition.  Search for where the
-                    # numbers after "md" end.  N.B. the following will also
-                    # work if root is not in a partition ie on md126 directly.
-                    end = re.search('\d+', disk).end()
-                    return disk[5:end]
-                if (re.match('/dev/nvme', disk) is not None):
-                    # We have an nvme device. These have the following naming
-                    # conventions.
-                    # Base device examples: nvme0n1 or nvme1n1
-                    # First partition on the first device would be nvme0n1p1
-                    # The first number after 'nvme' is the device number.
-                    # Partitions are indicated by the p# combination ie 'p1'.
-                    # We need to also account for a root install on the base
-                    # device itself as with the /dev/md parsing just in case,
-                    # so look for the end of the base device name via 'n1'.
-                    end = re.search('n1', disk).end()
-                    return disk[5:end]
-                # catch all that assumes we have eg /dev/sda3 and want "sda"
-                # so start from 6th char and remove the last char
-                # /dev/sda3 = sda
-                # TODO: consider changing to same method as in md devs above
-                # TODO: to cope with more than one numeric in name.
-                return disk[5:-1]
+    for fields in mount_table.entries():
+        if (fields[1] == '/' and fields[2] == 'btrfs'):
+            # We have found our '/' and it's of fs type btrfs
+            if (re.match('/dev/mapper/luks-', fields[0]) is not None):
+                # Our root is on a mapped open LUKS container so we need
+                # not resolve the symlink, ie /dev/dm-0, as we loose info
+                # and lsblk's name output also uses the luks-<uuid> name.
+                # So we return the name minus it's /dev/mapper/ component
+                # as there are no partitions within these devices so it is
+                # it's own base device. N.B. we do not resolve to the
+                # parent device hosting the LUKS container itself.
+                return fields[0][12:]
+            # resolve symbolic links to their targets.
+            disk = os.path.realpath(fields[0])
+            if (re.match('/dev/md', disk) is not None):
+                # We have an Multi Device naming scheme which is a little
+                # different ie 3rd partition = md126p3 on the md126 device,
+                # or md0p3 as third partition on md0 device.  As md devs
+                # often have 1 to 3 numerical chars we search for one or
+                # more numeric characters, this assumes our dev name has no
+                # prior numerical components ie starts /dev/md but then we
+                # are here due to that match.  Find the indexes of the
+                # device name without the partition.  Search for where the
+                # numbers after "md" end.  N.B. the following will also
+                # work if root is not in a partition ie on md126 directly.
+                end = re.search('\d+', disk).end()
+                return disk[5:end]
+            if (re.match('/dev/nvme', disk) is not None):
+                # We have an nvme device. These have the following naming
+                # conventions.
+                # Base device examples: nvme0n1 or nvme1n1
+                # First partition on the first device would be nvme0n1p1
+                # The first number after 'nvme' is the device number.
+                # Partitions are indicated by the p# combination ie 'p1'.
+                # We need to also account for a root install on the base
+                # device itself as with the /dev/md parsing just in case,
+                # so look for the end of the base device name via 'n1'.
+                end = re.search('n1', disk).end()
+                return disk[5:end]
+            # catch all that assumes we have eg /dev/sda3 and want "sda"
+            # so start from 6th char and remove the last char
+            # /dev/sda3 = sda
+            # TODO: consider changing to same method as in md devs above
+            # TODO: to cope with more than one numeric in name.
+            return disk[5:-1]
     msg = ('root filesystem is not BTRFS. During Rockstor installation, '
            'you must select BTRFS instead of LVM and other options for '
            'root filesystem. Please re-install Rockstor properly.')
@@ -24,6 +24,7 @@ from storageadmin.models import (Pincard, EmailClient, User)
 from system.users import (smbpasswd, usermod)
 from system.email_util import email_root
 from django.contrib.auth.models import User as DjangoUser
+from django.db.models import Count
 
 
 def reset_password(uname, uid, pinlist):
@@ -135,20 +136,36 @@ def has_pincard(user):
     return has_pincard
 
 
-def pincard_states(user):
+def pincard_uids():
+
+    # uids of all users with a full Pincard, to get the pincard states of many
+    # users with one query
+    return set(Pincard.objects.values('user').annotate(
+        pins=Count('pin_number')).filter(pins=24).values_list(
+        'user', flat=True))
+
+
+def pincard_states(user, uids_with_pincard=None, has_mail=None):
 
     # If user has a Pincard that means already allowed to have one, so avoid
     # computing If selected user is a managed one allowed to have a
     # pincard_allowed If user is uid 0 (root) and mail notifications enabled ->
     # ok Pincard Otherwise 'otp' third state : allowed to have a Pincard, but
     # mail notifications required
+    # uids_with_pincard(see pincard_uids) and has_mail can be passed in when
+    # listing many users.
     pincard_allowed = 'no'
-    pincard_present = has_pincard(user)
+    if uids_with_pincard is None:
+        pincard_present = has_pincard(user)
+    else:
+        pincard_present = int(user.uid) in uids_with_pincard
     if user.managed_user:
         pincard_allowed = 'yes'
     else:
         if int(user.uid) == 0:
-            pincard_allowed = 'yes' if email_notification_enabled() else 'otp'
+            if has_mail is None:
+                has_mail = email_notification_enabled()
+            pincard_allowed = 'yes' if has_mail else 'otp'
         else:
             pincard_allowed = 'no'
 
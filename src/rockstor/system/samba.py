@@ -18,17 +18,27 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from osi import run_command
 from services import service_status
+import fcntl
 import shutil
 from tempfile import mkstemp
 import re
 import os
-from storageadmin.models import SambaCustomConfig
+import threading
+import time
+from storageadmin.models import SambaShare
 from django.conf import settings
+from django.db import connection
+
+import logging
+logger = logging.getLogger(__name__)
 
 
 TESTPARM = '/usr/bin/testparm'
 SMB_CONFIG = '/etc/samba/smb.conf'
+# serializes applies of the Samba exports across processes.
+SMB_CONFIG_LOCK = '/var/lock/rockstor-smb.conf'
 SYSTEMCTL = '/usr/bin/systemctl'
+SMBCONTROL = '/usr/bin/smbcontrol'
 CHMOD = '/bin/chmod'
 RS_SHARES_HEADER = '####BEGIN: Rockstor SAMBA CONFIG####'
 RS_SHARES_FOOTER = '####END: Rockstor SAMBA CONFIG####'
@@ -72,17 +82,34 @@ def rockstor_smb_config(fo, exports):
             fo.write('    shadow:localtime = yes\n')
             fo.write('    vfs objects = shadow_copy2\n')
             fo.write('    veto files = /.%s*/\n' % e.snapshot_prefix)
-        for cco in SambaCustomConfig.objects.filter(smb_share=e):
+        for cco in e.sambacustomconfig_set.all():
             if (cco.custom_config.strip()):
                     fo.write('    %s\n' % cco.custom_config)
     fo.write('%s\n' % RS_SHARES_FOOTER)
 
 
+def samba_exports():
+    """
+    :return: list of all Samba exports with their shares, admin users and
+    custom config fetched upfront, in a stable order.
+    """
+    return list(SambaShare.objects.select_related('share').prefetch_related(
+        'admin_users', 'sambacustomconfig_set').order_by('id'))
+
+
 def refresh_smb_config(exports):
+    """
+    Re-write the Rockstor section of smb.conf with the given exports.
+    :param exports: list of SambaShare objects, see samba_exports().
+    :return: True if smb.conf was re-written, False if it already had this
+    exact config.
+    """
     fh, npath = mkstemp()
+    os.close(fh)
     with open(SMB_CONFIG) as sfo, open(npath, 'w') as tfo:
+        current = sfo.read()
         rockstor_section = False
-        for line in sfo.readlines():
+        for line in current.splitlines(True):
             if (re.match(RS_SHARES_HEADER, line) is not None):
                 rockstor_section = True
                 rockstor_smb_config(tfo, exports)
@@ -91,8 +118,13 @@ def refresh_smb_config(exports):
                 tfo.write(line)
         if (rockstor_section is False):
             rockstor_smb_config(tfo, exports)
+    with open(npath) as tfo:
+        if (tfo.read() == current):
+            os.remove(npath)
+            return False
     test_parm(npath)
     shutil.move(npath, SMB_CONFIG)
+    return True
 
 
 # write out new [global] section and re-write the existing rockstor section.
@@ -227,6 +259,108 @@ def restart_samba(hard=False):
     return run_command([SYSTEMCTL, mode, 'nmb'])
 
 
+def reload_samba():
+    """
+    Have the running Samba daemons re-read smb.conf without dropping client
+    connections, which is all a change of exports needs. Falls back to a
+    reload of the services.
+    """
+    o, e, rc = run_command([SMBCONTROL, 'all', 'reload-config'], throw=False)
+    if (rc != 0):
+        logger.error('smbcontrol reload-config failed(%d): %s. Reloading '
+                     'the services instead.' % (rc, e))
+        return restart_samba()
+    return o, e, rc
+
+
+class ShareConfig(object):
+    """
+    Applies the Samba exports to smb.conf and reloads Samba. A change is
+    applied right away, so that errors reach the caller, unless another was
+    applied within the last window seconds. Such changes are then coalesced
+    into one apply at the end of the window, eg when a config backup restore
+    adds every export one by one. Nothing is written or reloaded when the
+    config is unchanged. Callers refresh once their changes are committed,
+    as a deferred apply reads the exports from it's own db connection.
+    The window is per process, so changes made through different processes
+    (gunicorn workers) are not coalesced with each other. Applies are
+    serialized across processes by a file lock, and each reads the exports
+    under it, so the last one to run writes the latest committed exports.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.lock = threading.Lock()
+        self.apply_lock = threading.Lock()
+        self.last = 0
+        self.timer = None
+        # error of the last deferred apply, if it failed.
+        self.failure = None
+
+    def refresh(self):
+        """
+        After a failed deferred apply, changes are applied right away until
+        one succeeds, so that the failure reaches a caller.
+        :return: True if applied now, False if deferred to the end of the
+        window.
+        """
+        with self.lock:
+            now = time.time()
+            if (self.failure is None):
+                if (self.timer is not None):
+                    return False
+                wait = self.last + self.window - now
+                if (wait > 0):
+                    self.timer = threading.Timer(wait, self._deferred)
+                    self.timer.daemon = True
+                    self.timer.start()
+                    return False
+            self.last = now
+            failure = self.failure
+        try:
+            self.apply()
+        except Exception as e:
+            if (failure is not None):
+                raise Exception('%s. An earlier deferred apply of the Samba '
+                                'exports also failed: %s' %
+                                (e.__str__(), failure))
+            raise
+        with self.lock:
+            self.failure = None
+        return True
+
+    def _deferred(self):
+        with self.lock:
+            self.timer = None
+            self.last = time.time()
+        try:
+            self.apply()
+            failure = None
+        except Exception as e:
+            logger.error('Failed to apply Samba exports.')
+            logger.exception(e)
+            failure = e.__str__()
+        finally:
+            connection.close()
+        with self.lock:
+            self.failure = failure
+
+    def apply(self):
+        """
+        Write smb.conf from the current exports and, if it changed, reload
+        Samba when it's running.
+        :return: True if smb.conf changed.
+        """
+        with self.apply_lock, open(SMB_CONFIG_LOCK, 'a') as lfo:
+            # released when lfo is closed.
+            fcntl.flock(lfo, fcntl.LOCK_EX)
+            if (not refresh_smb_config(samba_exports())):
+                return False
+            if (status()[2] == 0):
+                reload_samba()
+            return True
+
+
 def update_samba_discovery():
     avahi_smb_config = '/etc/avahi/services/smb.service'
     if (os.path.isfile(avahi_smb_config)):
@@ -236,3 +370,6 @@ def update_samba_discovery():
 
 def status():
     return service_status('smb')
+
+
+share_config = ShareConfig(getattr(settings, 'SMB_CONFIG_WINDOW', 2))
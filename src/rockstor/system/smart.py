@@ -28,6 +28,11 @@ logger = logging.getLogger(__name__)
 
 SMART = '/usr/sbin/smartctl'
 CAT = '/usr/bin/cat'
+NICE = '/usr/bin/nice'
+IONICE = '/usr/bin/ionice'
+# smartctl -n standby,STANDBY_RC exit code when it skips a drive in standby
+# or sleep. Bits 6 and 7 are only set from the logs, which -A doesn't read.
+STANDBY_RC = 192
 # enables reading file dumps of smartctl output instead of running smartctl
 # currently hardwired to read from eg:- /root/smartdumps/smart-H--info.out
 # default setting = False
@@ -48,6 +53,10 @@ def info(device, custom_options='', test_mode=TESTMODE):
             throw=False)
     else:  # we are testing so use a smartctl -H --info file dump instead
         o, e, rc = run_command([CAT, '/root/smartdumps/smart-H--info.out'])
+    return _parse_info(o)
+
+
+def _parse_info(o):
     # List of string matches to look for in smartctrl -H --info output.
     # Note the "|" char allows for defining alternative matches ie A or B
     matches = ('Model Family:|Vendor:', 'Device Model:|Product:',
@@ -96,6 +105,32 @@ def extended_info(device, custom_options='', test_mode=TESTMODE):
             throw=False)
     else:  # we are testing so use a smartctl -a file dump instead
         o, e, rc = run_command([CAT, '/root/smartdumps/smart-a.out'])
+    return _parse_extended_info(o)
+
+
+def sample_attributes(device, custom_options='', test_mode=TESTMODE):
+    """
+    Background counterpart of extended_info: smartctl -A at the lowest cpu
+    and io priority, which leaves drives in standby or sleep spun down.
+    Used by storageadmin/smart_history.py
+    :param device: disk device name
+    :param test_mode: True causes cat from file rather than smartctl command
+    :return: dictionary of smart attributes as per extended_info, or None if
+    the drive was in standby.
+    """
+    if not test_mode:
+        o, e, rc = run_command(
+            [NICE, '-n', '19', IONICE, '-c3', SMART, '-n',
+             'standby,%d' % STANDBY_RC, '-A'] +
+            get_dev_options(device, custom_options), throw=False)
+    else:  # we are testing so use a smartctl -a file dump instead
+        o, e, rc = run_command([CAT, '/root/smartdumps/smart-a.out'])
+    if (rc == STANDBY_RC):
+        return None
+    return _parse_extended_info(o)
+
+
+def _parse_extended_info(o):
     attributes = {}
     for i in range(len(o)):
         if (re.match('Vendor Specific SMART Attributes with Thresholds:',
@@ -132,6 +167,10 @@ def capabilities(device, custom_options='', test_mode=TESTMODE):
             [SMART, '-c'] + get_dev_options(device, custom_options))
     else:  # we are testing so use a smartctl -c file dump instead
         o, e, rc = run_command([CAT, '/root/smartdumps/smart-c.out'])
+    return _parse_capabilities(o)
+
+
+def _parse_capabilities(o):
     cap_d = {}
     for i in range(len(o)):
         if (re.match('=== START OF READ SMART DATA SECTION ===',
@@ -184,6 +223,10 @@ def error_logs(device, custom_options='', test_mode=TESTMODE):
     e_msg = 'Drive %s has logged S.M.A.R.T errors. Please view ' \
             'the Error logs tab for this device.' % local_base_dev
     screen_return_codes(e_msg, overide_rc, o, e, rc, smart_command)
+    return _parse_error_logs(o)
+
+
+def _parse_error_logs(o):
     ecode_map = {
         'ABRT': 'Command ABoRTed',
         'AMNF': 'Address Mark Not Found',
@@ -262,6 +305,10 @@ def test_logs(device, custom_options='', test_mode=TESTMODE):
             'meaning. Please view the Self-Test Logs tab for this device.' \
             % (smart_command, overide_rc)
     screen_return_codes(e_msg, overide_rc, o, e, rc, smart_command)
+    return _parse_test_logs(o)
+
+
+def _parse_test_logs(o):
     test_d = {}
     log_l = []
     for i in range(len(o)):
@@ -301,6 +348,65 @@ def test_logs(device, custom_options='', test_mode=TESTMODE):
     return (test_d, log_l)
 
 
+def _section(o, start, end):
+    """
+    :return: lines of o from the first one matching start up to, but not
+    including, the next one matching end.
+    """
+    for i in range(len(o)):
+        if (re.match(start, o[i]) is not None):
+            for j in range(i + 1, len(o)):
+                if (re.match(end, o[j]) is not None):
+                    return o[i:j]
+            return o[i:]
+    return []
+
+
+def all_info(device, custom_options='', test_mode=TESTMODE):
+    """
+    Retrieve in a single smartctl -a run what info, extended_info,
+    capabilities, error_logs and test_logs each get from their own run, as -a
+    output is the concatenation of theirs. Used by views/disk_smart.py to
+    populate all tabs at once.
+    :param device: disk device name
+    :param test_mode: False causes cat from file rather than smartctl command
+    :return: dictionary of the above function names to their return values
+    """
+    smart_command = [SMART, '-a'] + get_dev_options(device, custom_options)
+    if not test_mode:
+        o, e, rc = run_command(smart_command, throw=False)
+    else:  # we are testing so use a smartctl -a file dump instead
+        o, e, rc = run_command([CAT, '/root/smartdumps/smart-a.out'])
+    # smartctl's return code is a bit mask, see man smartctl. Bits 0 and 1
+    # mean we got nothing from the device, bits 6 and 7 that the error and
+    # self-test logs hold errors, which we report as error_logs() and
+    # test_logs() do.
+    if (rc & 3):
+        e_msg = ('non-zero code(%d) returned by command: %s output: '
+                 '%s error: %s' % (rc, smart_command, o, e))
+        logger.error(e_msg)
+        raise CommandException(('%s' % smart_command), o, e, rc)
+    for bit, e_msg in ((64, 'Drive %s has logged S.M.A.R.T errors. Please '
+                        'view the Error logs tab for this device.'),
+                       (128, 'Drive %s has logged S.M.A.R.T self-test '
+                        'errors. Please view the Self-Test Logs tab for this '
+                        'device.')):
+        if (rc & bit):
+            logger.error(e_msg % device)
+            email_root('S.M.A.R.T error', e_msg % device)
+    # capabilities and error log parsers expect their section to follow the
+    # read smart data section header, as it does when run on their own.
+    header = ['=== START OF READ SMART DATA SECTION ===']
+    cap_lines = _section(o, 'General SMART Values:', '$')
+    error_lines = _section(o, 'SMART Error Log|Error counter log',
+                           'SMART Self-test log|SMART Selective self-test')
+    return {'info': _parse_info(o),
+            'extended_info': _parse_extended_info(o),
+            'capabilities': _parse_capabilities(header + cap_lines),
+            'error_logs': _parse_error_logs(header + error_lines),
+            'test_logs': _parse_test_logs(o), }
+
+
 def run_test(device, test, custom_options=''):
     # start a smart test(short, long or conveyance)
     return run_command(
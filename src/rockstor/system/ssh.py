@@ -21,6 +21,7 @@ from shutil import move
 from tempfile import mkstemp
 from services import systemctl
 from system.osi import run_command
+from system.mounts import mount_table
 import os
 from django.conf import settings
 
@@ -84,13 +85,11 @@ def toggle_sftp_service(switch=True):
 
 def sftp_mount_map(mnt_prefix):
     mnt_map = {}
-    with open('/proc/mounts') as pfo:
-        for line in pfo.readlines():
-            if (re.search(' ' + mnt_prefix, line) is not None):
-                fields = line.split()
-                sname = fields[1].split('/')[-1]
-                editable = fields[3][:2]
-                mnt_map[sname] = editable
+    for entry in mount_table.entries():
+        if (entry.mnt_pt.startswith(mnt_prefix)):
+            sname = entry.mnt_pt.split('/')[-1]
+            editable = entry.options[:2]
+            mnt_map[sname] = editable
     return mnt_map
 
 
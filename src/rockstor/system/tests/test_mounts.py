@@ -0,0 +1,100 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import select
+import tempfile
+import unittest
+from mock import patch
+from system.mounts import (MountTable, MountEntry)
+from system.osi import (mount_status, is_share_mounted)
+
+MOUNTS = ('/dev/sda3 / btrfs'
+          ' rw,noatime,space_cache,subvolid=258,subvol=/root 0 0\n'
+          'proc /proc proc rw,nosuid,nodev,noexec,relatime 0 0\n'
+          'sysfs /mnt2/fake sysfs rw,relatime 0 0\n'
+          '/dev/sdb /mnt2/fake btrfs rw,relatime,space_cache 0 0\n'
+          '/dev/sdb /mnt2/share1 btrfs'
+          ' rw,relatime,subvolid=257,subvol=/share1 0 0\n')
+
+
+class FakePoller(object):
+    """
+    Stands in for select.poll on a regular file, which never reports the
+    POLLPRI that /proc/self/mounts gives on a mount table change.
+    """
+    def __init__(self):
+        self.events = []
+
+    def register(self, fd, mask):
+        self.fd = fd
+
+    def poll(self, timeout):
+        events, self.events = self.events, []
+        return events
+
+
+class MountTableTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_mounts*
+    """
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.write(MOUNTS)
+        self.poller = FakePoller()
+        patch('system.mounts._poll', return_value=self.poller).start()
+        self.table = MountTable(self.path)
+        patch('system.osi.mount_table', self.table).start()
+
+    def tearDown(self):
+        patch.stopall()
+        os.remove(self.path)
+
+    def write(self, data):
+        with open(self.path, 'w') as mfo:
+            mfo.write(data)
+
+    def test_lookup(self):
+        self.assertEqual(len(self.table.entries()), 5)
+        self.assertEqual(self.table.get('/proc'),
+                         [MountEntry('proc', '/proc', 'proc',
+                                     'rw,nosuid,nodev,noexec,relatime')])
+        self.assertEqual(self.table.get('/nowhere'), [])
+        # excluded devices are skipped.
+        self.assertEqual(mount_status('/mnt2/fake'),
+                         'rw,relatime,space_cache')
+        self.assertTrue(is_share_mounted('share1'))
+        self.assertFalse(is_share_mounted('share2'))
+        self.assertEqual(mount_status('/mnt2/share2'), 'unmounted')
+
+    def test_refresh(self):
+        self.assertFalse(is_share_mounted('share2'))
+        self.write(MOUNTS + '/dev/sdb /mnt2/share2 btrfs rw 0 0\n')
+        # only re-read once the kernel flags a change.
+        self.assertFalse(is_share_mounted('share2'))
+        self.poller.events = [(self.poller.fd,
+                               select.POLLPRI | select.POLLERR)]
+        self.assertTrue(is_share_mounted('share2'))
+
+    def test_proc_mounts(self):
+        table = MountTable()
+        self.assertTrue(len(table.get('/')) > 0)
+        self.assertTrue(table.entries() is table.entries())
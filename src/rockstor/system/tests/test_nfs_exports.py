@@ -0,0 +1,128 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import tempfile
+import unittest
+from mock import patch
+from system.osi import (refresh_nfs_exports, parse_exports, EXPORTFS)
+
+EXPORTS = """/export/share1 10.0.0.0/24(rw,async,insecure) *(ro,async,insecure)
+/export/share2 *(ro,async,insecure)
+"""
+
+
+def client(client_str, option_list, share):
+    return {'client_str': client_str, 'option_list': option_list,
+            'mnt_pt': '/mnt2/%s' % share}
+
+
+class NFSExportsTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_nfs_exports*
+    """
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        with open(self.path, 'w') as efo:
+            efo.write(EXPORTS)
+        patch('system.osi.EXPORTS', self.path).start()
+        self.run_command = patch('system.osi.run_command').start()
+        # the export points in /etc/exports are bind mounted.
+        self.mounted = set(['/export/share1', '/export/share2'])
+        self.is_mounted = patch('system.osi.is_mounted',
+                                side_effect=lambda e: e in self.mounted
+                                ).start()
+        self.bind_mount = patch('system.osi.bind_mount',
+                                side_effect=lambda m, e: self.mounted.add(e)
+                                ).start()
+        self.teardown = patch('system.osi.nfs4_mount_teardown').start()
+
+    def tearDown(self):
+        patch.stopall()
+        if (os.path.exists(self.path)):
+            os.remove(self.path)
+
+    def commands(self):
+        return [c[0][0] for c in self.run_command.call_args_list]
+
+    def test_incremental(self):
+        exports = {
+            # one client removed, one with new options.
+            '/export/share1': [client('10.0.0.0/24', 'ro,async,insecure',
+                                      'share1')],
+            '/export/share2': [client('*', 'ro,async,insecure', 'share2')],
+            '/export/share3': [client('*', 'ro,async,insecure', 'share3'),
+                               client('host1', 'ro,async,insecure',
+                                      'share3')],
+            '/export/share4': [],
+        }
+        stats = refresh_nfs_exports(exports)
+        self.assertEqual((stats['exported'], stats['unexported']), (3, 1))
+        self.assertEqual(self.commands(), [
+            [EXPORTFS, '-u', '*:/export/share1'],
+            [EXPORTFS, '-i', '-o', 'ro,async,insecure',
+             '*:/export/share3', '10.0.0.0/24:/export/share1',
+             'host1:/export/share3']])
+        # only the new export point is bind mounted.
+        self.bind_mount.assert_called_once_with('/mnt2/share3',
+                                                '/export/share3')
+        self.teardown.assert_called_once_with('/export/share4')
+        with open(self.path) as efo:
+            self.assertEqual(parse_exports(efo.read()),
+                             {'/export/share1': (('10.0.0.0/24',
+                                                  'ro,async,insecure'),),
+                              '/export/share2': (('*', 'ro,async,insecure'),),
+                              '/export/share3': (('*', 'ro,async,insecure'),
+                                                 ('host1',
+                                                  'ro,async,insecure'))})
+
+        # nothing changed, nothing to do.
+        self.run_command.reset_mock()
+        del exports['/export/share4']
+        stats = refresh_nfs_exports(exports)
+        self.assertEqual((stats['exported'], stats['unexported']), (0, 0))
+        self.assertEqual(self.run_command.call_count, 0)
+
+    def test_unmounted(self):
+        # share2's bind mount is gone, ie the share was remounted.
+        self.mounted.discard('/export/share2')
+        exports = {
+            '/export/share1': [client('10.0.0.0/24', 'rw,async,insecure',
+                                      'share1'),
+                               client('*', 'ro,async,insecure', 'share1')],
+            '/export/share2': [client('*', 'ro,async,insecure', 'share2')],
+        }
+        stats = refresh_nfs_exports(exports)
+        self.bind_mount.assert_called_once_with('/mnt2/share2',
+                                                '/export/share2')
+        self.assertEqual((stats['exported'], stats['unexported']), (1, 0))
+        self.assertEqual(self.commands(), [
+            [EXPORTFS, '-i', '-o', 'ro,async,insecure', '*:/export/share2']])
+
+    def test_full(self):
+        self.mounted.clear()
+        exports = {'/export/share2': [client('*', 'ro,async,insecure',
+                                             'share2')]}
+        refresh_nfs_exports(exports, full=True)
+        self.assertEqual(self.commands(), [
+            [EXPORTFS, '-i', '-o', 'ro,async,insecure', '*:/export/share2'],
+            [EXPORTFS, '-ra']])
+        self.assertEqual(self.bind_mount.call_count, 1)
@@ -0,0 +1,127 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import fcntl
+import os
+import tempfile
+import unittest
+from mock import (patch, MagicMock)
+from system.samba import (refresh_smb_config, ShareConfig, SMBCONTROL)
+
+SMB_CONF = """[global]
+    workgroup = SAMBA
+
+"""
+
+
+def export(name):
+    e = MagicMock(comment=u'samba export', path='/mnt2/%s' % name,
+                  browsable='yes', read_only='no', guest_ok='no',
+                  shadow_copy=False)
+    e.share.name = name
+    e.admin_users.all.return_value = []
+    e.sambacustomconfig_set.all.return_value = []
+    return e
+
+
+class SambaTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_samba*
+    """
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        with open(self.path, 'w') as sfo:
+            sfo.write(SMB_CONF)
+        patch('system.samba.SMB_CONFIG', self.path).start()
+        patch('system.samba.SMB_CONFIG_LOCK', self.path + '.lock').start()
+        self.run_command = patch('system.samba.run_command',
+                                 return_value=([''], [''], 0)).start()
+        self.exports = patch('system.samba.samba_exports',
+                             return_value=[export('share1')]).start()
+        patch('system.samba.status', return_value=([''], [''], 0)).start()
+        patch('system.samba.connection').start()
+
+    def tearDown(self):
+        patch.stopall()
+        for path in (self.path, self.path + '.lock'):
+            if (os.path.exists(path)):
+                os.remove(path)
+
+    def commands(self):
+        return [c[0][0][0] for c in self.run_command.call_args_list]
+
+    def test_refresh_unchanged(self):
+        self.assertTrue(refresh_smb_config([export('share1')]))
+        with open(self.path) as sfo:
+            self.assertTrue('[share1]\n' in sfo.read())
+        self.run_command.reset_mock()
+        self.assertFalse(refresh_smb_config([export('share1')]))
+        # no testparm run when nothing changed.
+        self.assertEqual(self.run_command.call_count, 0)
+
+    def test_coalesce(self):
+        sc = ShareConfig(60)
+        self.assertTrue(sc.refresh())
+        self.assertEqual(self.commands()[-1], SMBCONTROL)
+        # later changes within the window are coalesced into one apply.
+        with patch('system.samba.threading.Timer') as timer:
+            self.assertFalse(sc.refresh())
+            self.assertFalse(sc.refresh())
+            self.assertEqual(timer.call_count, 1)
+            self.exports.return_value = [export('share1'), export('share2')]
+            self.run_command.reset_mock()
+            timer.call_args[0][1]()
+        self.assertEqual(self.commands(), ['/usr/bin/testparm', SMBCONTROL])
+        self.assertTrue(sc.timer is None)
+        # nothing to write nor reload once applied.
+        self.run_command.reset_mock()
+        self.assertFalse(sc.apply())
+        self.assertEqual(self.run_command.call_count, 0)
+
+    def test_deferred_failure(self):
+        sc = ShareConfig(60)
+        sc.refresh()
+        with patch('system.samba.threading.Timer') as timer:
+            self.assertFalse(sc.refresh())
+            with patch.object(sc, 'apply', side_effect=Exception('bad')):
+                timer.call_args[0][1]()
+        self.assertEqual(sc.failure, 'bad')
+        # the next change is applied right away, within the window, and a
+        # failure mentions the deferred one.
+        with patch.object(sc, 'apply', side_effect=Exception('worse')):
+            with self.assertRaises(Exception) as cm:
+                sc.refresh()
+        self.assertTrue('worse' in cm.exception.__str__())
+        self.assertTrue('bad' in cm.exception.__str__())
+        with patch.object(sc, 'apply') as mock_apply:
+            self.assertTrue(sc.refresh())
+            self.assertEqual(mock_apply.call_count, 1)
+        self.assertTrue(sc.failure is None)
+
+    def test_apply_locked(self):
+        # exports are read and written under the lock shared by processes.
+        calls = []
+        self.exports.side_effect = lambda: calls.append('exports') or []
+        with patch('system.samba.fcntl.flock',
+                   side_effect=lambda f, op: calls.append((f.name, op))):
+            ShareConfig(60).apply()
+        self.assertEqual(calls, [(self.path + '.lock', fcntl.LOCK_EX),
+                                 'exports'])
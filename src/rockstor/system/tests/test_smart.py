@@ -0,0 +1,194 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from mock import patch
+from system.exceptions import CommandException
+from system.smart import (all_info, info, extended_info, capabilities,
+                          error_logs, test_logs, sample_attributes,
+                          STANDBY_RC)
+
+HEADER = ('smartctl 6.2 2013-07-26 r3841'
+          ' [x86_64-linux-4.10.6-1.el7.elrepo.x86_64] (local build)\n'
+          'Copyright (C) 2002-13, Bruce Allen, Christian Franke,'
+          ' www.smartmontools.org\n')
+
+INFO = """=== START OF INFORMATION SECTION ===
+Model Family:     Western Digital Red
+Device Model:     WDC WD30EFRX-68EUZN0
+Serial Number:    WD-WCC4N0000000
+LU WWN Device Id: 5 0014ee 000000000
+Firmware Version: 82.00A82
+User Capacity:    3,000,592,982,016 bytes [3.00 TB]
+Sector Sizes:     512 bytes logical, 4096 bytes physical
+Rotation Rate:    5400 rpm
+Device is:        In smartctl database [for details use: -P show]
+ATA Version is:   ACS-2 (minor revision not indicated)
+SATA Version is:  SATA 3.0, 6.0 Gb/s (current: 6.0 Gb/s)
+Local Time is:    Mon May  1 10:00:00 2017 BST
+SMART support is: Available - device has SMART capability.
+SMART support is: Enabled
+
+"""
+
+HEALTH = """=== START OF READ SMART DATA SECTION ===
+SMART overall-health self-assessment test result: PASSED
+
+"""
+
+CAPABILITIES = ('General SMART Values:\n'
+                'Offline data collection status:  (0x00)\tOffline'
+                ' data collection activity\n'
+                '\t\t\t\t\twas never started.\n'
+                '\t\t\t\t\tAuto Offline Data Collection: Disabled.\n'
+                'Self-test execution status:      (   0)\tThe'
+                ' previous self-test routine completed\n'
+                '\t\t\t\t\twithout error or no self-test has ever\n'
+                '\t\t\t\t\tbeen run.\n'
+                'Total time to complete Offline\n'
+                'data collection: \t\t(40080) seconds.\n'
+                'SMART capabilities:            (0x0003)\tSaves SMART'
+                ' data before entering\n'
+                '\t\t\t\t\tpower-saving mode.\n'
+                '\t\t\t\t\tSupports SMART auto save timer.\n'
+                'Short self-test routine\n'
+                'recommended polling time: \t (   2) minutes.\n'
+                'SCT capabilities: \t       (0x703d)\tSCT Status supported.\n'
+                '\t\t\t\t\tSCT Feature Control supported.\n'
+                '\n')
+
+ATTRIBUTES = ('SMART Attributes Data Structure revision number: 16\n'
+              'Vendor Specific SMART Attributes with Thresholds:\n'
+              'ID# ATTRIBUTE_NAME          FLAG     VALUE WORST'
+              ' THRESH TYPE      UPDATED  WHEN_FAILED RAW_VALUE\n'
+              '  1 Raw_Read_Error_Rate     0x002f   200   200   051 '
+              '   Pre-fail  Always       -       0\n'
+              '  5 Reallocated_Sector_Ct   0x0033   200   200   140 '
+              '   Pre-fail  Always       -       0\n'
+              '  9 Power_On_Hours          0x0032   087   087   000 '
+              '   Old_age   Always       -       9868\n'
+              '194 Temperature_Celsius     0x0022   118   106   000 '
+              '   Old_age   Always       -       32\n'
+              '\n')
+
+ERRORS = ('SMART Error Log Version: 1\n'
+          'ATA Error Count: 1\n'
+          '\tCR = Command Register [HEX]\n'
+          '\n'
+          'Error 1 occurred at disk power-on lifetime: 9867 hours'
+          ' (411 days + 3 hours)\n'
+          '  When the command that caused the error occurred, the'
+          ' device was active or idle.\n'
+          '\n'
+          '  After command completion occurred, registers were:\n'
+          '  ER ST SC SN CL CH DH\n'
+          '  -- -- -- -- -- -- --\n'
+          '  40 51 00 00 00 00 00  Error: UNC at LBA = 0x00000000 = 0\n'
+          '\n')
+
+TESTS = ('SMART Self-test log structure revision number 1\n'
+         'Num  Test_Description    Status                  Remaining'
+         '  LifeTime(hours)  LBA_of_first_error\n'
+         '# 1  Short offline       Completed without error       00%'
+         '      9860         -\n'
+         '# 2  Extended offline    Completed without error       00%'
+         '      9500         -\n'
+         '\n'
+         'SMART Selective self-test log data structure revision number 1\n'
+         ' SPAN  MIN_LBA  MAX_LBA  CURRENT_TEST_STATUS\n'
+         '    1        0        0  Not_testing\n'
+         'Selective self-test flags (0x0):\n'
+         '  After scanning selected spans, do NOT read-scan'
+         ' remainder of disk.\n')
+
+
+def lines(*parts):
+    return ''.join(parts).split('\n')
+
+
+class SmartTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_smart*
+    """
+    def setUp(self):
+        self.run_command = patch('system.smart.run_command').start()
+        patch('system.smart.get_dev_options',
+              return_value=['/dev/sda']).start()
+        self.email_root = patch('system.smart.email_root').start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def run_as(self, o, rc=0):
+        self.run_command.return_value = (o, [''], rc)
+
+    def test_all_info(self):
+        """
+        A single smartctl -a run gives the same results as running info,
+        extended_info, capabilities, error_logs and test_logs on their own.
+        """
+        expected = {}
+        self.run_as(lines(HEADER, INFO, HEALTH))
+        expected['info'] = info('sda')
+        self.run_as(lines(HEADER, INFO, HEALTH, CAPABILITIES, ATTRIBUTES,
+                          ERRORS, TESTS))
+        expected['extended_info'] = extended_info('sda')
+        self.run_as(lines(HEADER, HEALTH.split('\n')[0] + '\n',
+                          CAPABILITIES))
+        expected['capabilities'] = capabilities('sda')
+        self.run_as(lines(HEADER, HEALTH.split('\n')[0] + '\n',
+                          ERRORS.rstrip('\n') + '\n'))
+        expected['error_logs'] = error_logs('sda')
+        self.run_as(lines(HEADER, HEALTH.split('\n')[0] + '\n', TESTS))
+        expected['test_logs'] = test_logs('sda')
+        self.email_root.reset_mock()
+
+        self.run_as(lines(HEADER, INFO, HEALTH, CAPABILITIES, ATTRIBUTES,
+                          ERRORS, TESTS), rc=64)
+        self.run_command.reset_mock()
+        self.assertEqual(all_info('sda'), expected)
+        self.assertEqual(self.run_command.call_count, 1)
+        self.assertEqual(self.email_root.call_count, 1)
+        self.assertEqual(expected['info'][1], 'WDC WD30EFRX-68EUZN0')
+        self.assertEqual(len(expected['extended_info']), 4)
+        self.assertEqual(expected['error_logs'][0]['1'][2],
+                         'UNCorrectable Error in Data')
+        self.assertEqual(sorted(expected['test_logs'][0].keys()),
+                         ['1', '2'])
+        self.assertTrue('SCT capabilities' in expected['capabilities'])
+
+    def test_all_info_failure(self):
+        self.run_as(['smartctl: unable to open device'], rc=2)
+        with self.assertRaises(CommandException):
+            all_info('sda')
+
+    def test_sample_attributes(self):
+        self.run_as(lines(HEADER, ATTRIBUTES))
+        expected = extended_info('sda')
+        self.assertEqual(sample_attributes('sda'), expected)
+        self.assertEqual(len(expected), 4)
+        cmd = self.run_command.call_args[0][0]
+        self.assertEqual(cmd[:5], ['/usr/bin/nice', '-n', '19',
+                                   '/usr/bin/ionice', '-c3'])
+        self.assertEqual(cmd[6:], ['-n', 'standby,%d' % STANDBY_RC, '-A',
+                                   '/dev/sda'])
+        # drive in standby, left alone.
+        self.run_as(lines(HEADER), rc=STANDBY_RC)
+        self.assertEqual(sample_attributes('sda'), None)
@@ -0,0 +1,97 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import struct
+import unittest
+from mock import patch
+from system.osi import scan_disks
+from system.udev import (parse_uevent, disk_index, UDEV_MAGIC)
+
+LSBLK_OUT = [
+    'NAME="sda" MODEL="QEMU HARDDISK   " SERIAL="QM00005" SIZE="8G" TRAN="sata" VENDOR="ATA     " HCTL="2:0:0:0" TYPE="disk" FSTYPE="" LABEL="" UUID=""',  # noqa E501
+    'NAME="sda1" MODEL="" SERIAL="" SIZE="500M" TRAN="" VENDOR="" HCTL="" TYPE="part" FSTYPE="ext4" LABEL="" UUID="a7d5"',  # noqa E501
+    'NAME="sda3" MODEL="" SERIAL="" SIZE="6.7G" TRAN="" VENDOR="" HCTL="" TYPE="part" FSTYPE="btrfs" LABEL="rockstor_rockstor" UUID="355f"',  # noqa E501
+    'NAME="vda" MODEL="" SERIAL="" SIZE="5G" TRAN="" VENDOR="0x1af4" HCTL="" TYPE="disk" FSTYPE="btrfs" LABEL="rock pool" UUID="d4f0"',  # noqa E501
+    '']
+
+
+def uevent(props):
+    """
+    Build a message as udev sends it on its netlink group.
+    """
+    body = '\0'.join('%s=%s' % kv for kv in props.items()) + '\0'
+    header = ('libudev\0' + struct.pack('!I', UDEV_MAGIC) +
+              struct.pack('=III', 40, 40, len(body)))
+    header += '\0' * (40 - len(header))
+    return header + body
+
+
+class UdevTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_udev*
+    """
+    def setUp(self):
+        patch.object(disk_index, 'watching', return_value=True).start()
+        disk_index.invalidate()
+        self.run_command = patch('system.osi.run_command').start()
+        self.run_command.return_value = (LSBLK_OUT, [''], 0)
+        patch('system.osi.root_disk', return_value='sda').start()
+        self.serial = patch('system.osi.get_disk_serial',
+                            return_value='virtio-serial').start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_parse_uevent(self):
+        props = {'ACTION': 'change', 'DEVNAME': '/dev/sdb',
+                 'SUBSYSTEM': 'block', 'ID_FS_LABEL': 'a=b', }
+        self.assertEqual(parse_uevent(uevent(props)), props)
+        # kernel events and garbage are ignored.
+        self.assertEqual(parse_uevent('change@/devices/virtual/block/loop0'
+                                      '\0ACTION=change\0'), None)
+        self.assertEqual(parse_uevent('libudev\0' + '\0' * 32), None)
+
+    def test_scan(self):
+        disks = scan_disks(1048576)
+        self.assertEqual(sorted(d.name for d in disks), ['sda3', 'vda'])
+        vda = [d for d in disks if d.name == 'vda'][0]
+        self.assertEqual((vda.serial, vda.label), ('virtio-serial',
+                                                   'rock pool'))
+        self.assertEqual(sorted(scan_disks(1048576)), sorted(disks))
+        self.assertEqual(self.run_command.call_count, 1)
+        # an unrelated device changes: rescan, but reuse vda's serial.
+        disk_index.on_event({'ACTION': 'change', 'DEVNAME': '/dev/sdb', })
+        scan_disks(1048576)
+        self.assertEqual(self.run_command.call_count, 2)
+        self.assertEqual(self.serial.call_count, 1)
+        disk_index.on_event({'ACTION': 'change', 'DEVNAME': '/dev/vda', })
+        scan_disks(1048576)
+        self.assertEqual(self.serial.call_count, 2)
+        # full rescan on request.
+        scan_disks(1048576, rescan=True)
+        self.assertEqual(self.run_command.call_count, 4)
+        self.assertEqual(self.serial.call_count, 3)
+
+    def test_not_watching(self):
+        patch.object(disk_index, 'watching', return_value=False).start()
+        scan_disks(1048576)
+        scan_disks(1048576)
+        self.assertEqual(self.run_command.call_count, 2)
+        self.assertEqual(self.serial.call_count, 2)
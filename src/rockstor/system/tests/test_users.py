@@ -0,0 +1,96 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import tempfile
+import unittest
+from mock import patch
+from system.users import DirectoryCache
+
+PASSWD = """root:x:0:0:root:/root:/bin/bash
+alice:x:1000:1000::/home/alice:/bin/bash
+"""
+
+GROUP = """root:x:0:
+alice:x:1000:
+"""
+
+
+class DirectoryCacheTests(unittest.TestCase):
+    """
+    The tests in this suite can be run via the following command:
+    cd <root dir of rockstor ie /opt/rockstor>
+    ./bin/test --settings=test-settings -v 3 -p test_users*
+    """
+    def setUp(self):
+        self.paths = []
+        for data in (PASSWD, GROUP):
+            fd, path = tempfile.mkstemp()
+            os.close(fd)
+            self.paths.append(path)
+            self.write(path, data)
+        # local users plus one from a directory service.
+        self.get_users = patch('system.users.get_users', return_value={
+            u'root': (0, 0, '/bin/bash'), u'alice': (1000, 1000, '/bin/bash'),
+            u'DOMAIN\\bob': (20000, 20000, '/bin/sh')}).start()
+        self.get_groups = patch('system.users.get_groups', return_value={
+            u'root': 0, u'alice': 1000, u'DOMAIN\\users': 20000}).start()
+        self.thread = patch('system.users.threading.Thread').start()
+        self.now = 1000.0
+        patch('system.users.time.time', side_effect=lambda: self.now).start()
+        self.cache = DirectoryCache(*self.paths)
+
+    def tearDown(self):
+        patch.stopall()
+        for path in self.paths:
+            os.remove(path)
+
+    def write(self, path, data):
+        with open(path, 'w') as fo:
+            fo.write(data)
+
+    def test_local_changes(self):
+        self.assertEqual(len(self.cache.users()), 3)
+        self.assertEqual(sorted(self.cache.groups().keys()),
+                         [u'DOMAIN\\users', u'alice', u'root'])
+        # eg useradd carol; userdel alice
+        self.write(self.paths[0], PASSWD.replace(
+            'alice:x:1000:1000::/home/alice',
+            'carol:x:1001:1001::/home/carol'))
+        self.write(self.paths[1], GROUP + 'carol:x:1001:\n')
+        self.cache.invalidate()
+        users = self.cache.users()
+        self.assertEqual(sorted(users.keys()),
+                         [u'DOMAIN\\bob', u'carol', u'root'])
+        self.assertEqual(users[u'carol'], (1001, 1001, '/bin/bash'))
+        self.assertEqual(self.cache.groups()[u'carol'], 1001)
+        # the directory was only enumerated once.
+        self.assertEqual(self.get_users.call_count, 1)
+        self.assertFalse(self.thread.called)
+
+    def test_background_refresh(self):
+        self.cache.users()
+        self.now += 301
+        # the stale index is served while it's refreshed in the background.
+        self.assertEqual(len(self.cache.users()), 3)
+        self.assertEqual(self.thread.call_count, 1)
+        self.cache.users()
+        self.assertEqual(self.thread.call_count, 1)
+        self.thread.call_args[1]['target']()
+        self.assertEqual(self.get_users.call_count, 2)
+        self.assertFalse(self.cache.refreshing)
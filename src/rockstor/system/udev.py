@@ -0,0 +1,193 @@
+"""
+Copyright (c) 2012-2017 RockStor, Inc. <http://rockstor.com>
+This file is part of RockStor.
+
+RockStor is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published
+by the Free Software Foundation; either version 2 of the License,
+or (at your option) any later version.
+
+RockStor is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import copy
+import errno
+import logging
+import os
+import socket
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+NETLINK_KOBJECT_UEVENT = 15
+# Multicast group of events re-broadcast by udev once its rules have run, ie
+# once blkid/serial properties and /dev/disk/by-id links are in place.
+UDEV_GROUP = 2
+UDEV_PREFIX = 'libudev\0'
+UDEV_MAGIC = 0xfeedcafe
+# struct udev_monitor_netlink_header. Only the magic is in network byte
+# order, the offsets that follow are in host byte order.
+HEADER_MAGIC = struct.Struct('!I')
+HEADER_OFFSETS = struct.Struct('=III')
+RCVBUF_SIZE = 1024 * 1024
+
+
+def parse_uevent(data):
+    """
+    :param data: a message received on the udev netlink group
+    :return: dict of the event's properties eg ACTION, DEVNAME, SUBSYSTEM
+    or None if data is not a udev event.
+    """
+    if (not data.startswith(UDEV_PREFIX) or
+            len(data) < len(UDEV_PREFIX) + 16):
+        return None
+    magic, = HEADER_MAGIC.unpack_from(data, len(UDEV_PREFIX))
+    if (magic != UDEV_MAGIC):
+        return None
+    header_size, props_off, props_len = HEADER_OFFSETS.unpack_from(
+        data, len(UDEV_PREFIX) + HEADER_MAGIC.size)
+    props = {}
+    for field in data[props_off:props_off + props_len].split('\0'):
+        if ('=' in field):
+            key, val = field.split('=', 1)
+            props[key] = val
+    return props
+
+
+class UdevMonitor(threading.Thread):
+    """
+    Listens on the udev netlink group and passes the properties of every
+    event for subsystem to callback. callback(None) means events were lost,
+    eg the socket buffer overflowed, so everything must be assumed changed.
+    Events only ever invalidate cached state, so we don't bother to check
+    the sender's credentials.
+    """
+
+    def __init__(self, callback, subsystem='block'):
+        self.callback = callback
+        self.subsystem = subsystem
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                  NETLINK_KOBJECT_UEVENT)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                             RCVBUF_SIZE)
+        self.sock.bind((0, UDEV_GROUP))
+        super(UdevMonitor, self).__init__()
+        self.daemon = True
+
+    def run(self):
+        while (True):
+            try:
+                data = self.sock.recv(RCVBUF_SIZE)
+            except socket.error as e:
+                if (e.errno == errno.ENOBUFS):
+                    logger.error('udev events lost, receive buffer overrun.')
+                    self.callback(None)
+                    continue
+                logger.exception(e)
+                self.callback(None)
+                return
+            props = parse_uevent(data)
+            if (props is not None and
+                    props.get('SUBSYSTEM') == self.subsystem):
+                self.callback(props)
+
+
+class DiskIndex(object):
+    """
+    Per process cache of scan_disks() results and of the per device lookups
+    (udevadm, bcache-super-show etc) it makes. A UdevMonitor invalidates
+    the scan results on any block device event and the lookups of the
+    device(s) named in the event, so an unchanged system is answered from
+    memory and a changed one only re-runs the lookups of what changed.
+    Without a working monitor nothing is cached.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.pid = None
+        self.monitor = None
+        # min_size -> (generation, disks)
+        self.scans = {}
+        # device name -> {lookup: value}
+        self.devices = {}
+
+    def watching(self):
+        """
+        Start the udev monitor on first use in this process.
+        :return: True if block device events are being received.
+        """
+        if (self.pid == os.getpid()):
+            return self.monitor is not None and self.monitor.is_alive()
+        self.pid = os.getpid()
+        self.monitor = None
+        self.invalidate()
+        try:
+            self.monitor = UdevMonitor(self.on_event)
+            self.monitor.start()
+            return True
+        except Exception as e:
+            logger.error('Failed to start udev monitor, disk scans will not '
+                         'be cached: %s' % e.__str__())
+            self.monitor = None
+            return False
+
+    def on_event(self, props):
+        with self.lock:
+            self.generation += 1
+            self.scans.clear()
+            if (props is None):
+                self.devices.clear()
+                return
+            for key in ('DEVNAME', 'DM_NAME', ):
+                name = os.path.basename(props.get(key, ''))
+                self.devices.pop(name, None)
+
+    def invalidate(self):
+        self.on_event(None)
+
+    def scan(self, min_size):
+        """
+        :return: (generation, disks) where disks is the cached scan for
+        min_size or None when a fresh scan is needed. A fresh scan should be
+        stored against the returned generation.
+        """
+        watching = self.watching()
+        with self.lock:
+            entry = self.scans.get(min_size)
+            if (watching and entry is not None and
+                    entry[0] == self.generation):
+                return self.generation, copy.deepcopy(entry[1])
+            return self.generation, None
+
+    def store(self, min_size, generation, disks):
+        with self.lock:
+            if (generation == self.generation):
+                self.scans[min_size] = (generation, copy.deepcopy(disks))
+
+    def lookup(self, name, key, func, *args):
+        """
+        Memoized func(*args) for device name, until that device changes.
+        """
+        if (not self.watching()):
+            return func(*args)
+        with self.lock:
+            generation = self.generation
+            cached = self.devices.get(name, {})
+            if (key in cached):
+                return cached[key]
+        val = func(*args)
+        with self.lock:
+            if (generation == self.generation):
+                self.devices.setdefault(name, {})[key] = val
+        return val
+
+
+disk_index = DiskIndex()
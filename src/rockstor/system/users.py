@@ -19,7 +19,8 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 from exceptions import CommandException
 from osi import run_command
 import subprocess
-import fcntl
+import select
+import threading
 import time
 import re
 import os
@@ -28,6 +29,7 @@ import grp
 from shutil import move
 from tempfile import mkstemp
 import chardet
+from django.conf import settings
 
 import logging
 logger = logging.getLogger(__name__)
@@ -40,6 +42,24 @@ PASSWD = '/usr/bin/passwd'
 USERMOD = '/usr/sbin/usermod'
 SMBPASSWD = '/usr/bin/smbpasswd'
 CHOWN = '/usr/bin/chown'
+PASSWD_FILE = '/etc/passwd'
+GROUP_FILE = '/etc/group'
+
+
+def _decode(name):
+    # Most names are utf-8(or ascii), only guess the charset of the rest.
+    try:
+        return name.decode('utf-8')
+    except UnicodeDecodeError:
+        return name.decode(chardet.detect(name)['encoding'])
+
+
+def _parse_passwd(lines, users):
+    for u in lines:
+        ufields = u.split(':')
+        if (len(ufields) > 6):
+            users[_decode(ufields[0])] = (int(ufields[2]), int(ufields[3]),
+                                          str(ufields[6]))
 
 
 # this is a hack for AD to get as many users as possible within 90 seconds.  If
@@ -51,34 +71,27 @@ def get_users(max_wait=90):
     users = {}
     p = subprocess.Popen(['/usr/bin/getent', 'passwd'], shell=False,
                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    fcntl.fcntl(p.stdout.fileno(), fcntl.F_SETFL, os.O_NONBLOCK)
-    alive = True
     user_data = ''
-    while (alive):
-        try:
-            if (p.poll() is not None):
-                alive = False
-            user_data += p.stdout.read()
-        except IOError:
-            if (time.time() - t0 < max_wait):
-                continue
-        except Exception as e:
-            logger.exception(e)
+    while (True):
+        remaining = max_wait - (time.time() - t0)
+        if (remaining <= 0):
+            logger.error('getent passwd did not finish in %d seconds, '
+                         'returning the %d users read so far.' %
+                         (max_wait, len(users)))
             p.terminate()
-        uf = user_data.split('\n')
+            break
+        # wait for output rather than busy polling the pipe.
+        if (len(select.select([p.stdout], [], [], remaining)[0]) == 0):
+            continue
+        data = os.read(p.stdout.fileno(), 65536)
+        if (data == ''):
+            break
+        uf = (user_data + data).split('\n')
         # If the feed ends in \n, the last element will be '', if not, it will
         # be a partial line to be processed next time around.
-        user_data = uf[-1]
-        for u in uf[:-1]:
-            ufields = u.split(':')
-            if (len(ufields) > 3):
-                charset = chardet.detect(ufields[0])
-                uname = ufields[0].decode(charset['encoding'])
-                users[uname] = (int(ufields[2]), int(ufields[3]),
-                                str(ufields[6]))
-            if (time.time() - t0 > max_wait):
-                p.terminate()
-                break
+        user_data = uf.pop()
+        _parse_passwd(uf, users)
+    p.wait()
     return users
 
 
@@ -87,17 +100,133 @@ def get_groups(*gids):
     if (len(gids) > 0):
         for g in gids:
             entry = grp.getgrgid(g)
-            charset = chardet.detect(entry.gr_name)
-            gr_name = entry.gr_name.decode(charset['encoding'])
-            groups[gr_name] = entry.gr_gid
+            groups[_decode(entry.gr_name)] = entry.gr_gid
     else:
         for g in grp.getgrall():
-            charset = chardet.detect(g.gr_name)
-            gr_name = g.gr_name.decode(charset['encoding'])
-            groups[gr_name] = g.gr_gid
+            groups[_decode(g.gr_name)] = g.gr_gid
     return groups
 
 
+class DirectoryCache(object):
+    """
+    Process wide index of all users and groups, local and of any directory
+    service(AD, LDAP, NIS), which can take minutes to enumerate. The full
+    enumeration is done once, then redone in a background thread every
+    USER_DIRECTORY_TTL seconds while the stale index keeps being served.
+    Local changes, ie by useradd/usermod/userdel or another process, are
+    picked up incrementally by re-reading /etc/passwd and /etc/group when
+    their mtime changes or the index is invalidated.
+    """
+
+    def __init__(self, passwd_file=PASSWD_FILE, group_file=GROUP_FILE):
+        self.passwd_file = passwd_file
+        self.group_file = group_file
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.loaded = 0
+        self.stamp = None
+        self._users = None
+        self._groups = None
+        self._local_users = set()
+        self._local_groups = set()
+
+    def _ttl(self):
+        return getattr(settings, 'USER_DIRECTORY_TTL', 300)
+
+    def _stamp(self):
+        try:
+            return (os.stat(self.passwd_file).st_mtime,
+                    os.stat(self.group_file).st_mtime)
+        except OSError:
+            return None
+
+    def _read_local(self):
+        users = {}
+        with open(self.passwd_file) as pfo:
+            _parse_passwd(pfo.read().splitlines(), users)
+        groups = {}
+        with open(self.group_file) as gfo:
+            for line in gfo.read().splitlines():
+                gfields = line.split(':')
+                if (len(gfields) > 2):
+                    groups[_decode(gfields[0])] = int(gfields[2])
+        return users, groups
+
+    def _load(self):
+        stamp = self._stamp()
+        users = get_users()
+        groups = get_groups()
+        local_users, local_groups = self._read_local()
+        with self.lock:
+            self._users, self._groups = users, groups
+            self._local_users = set(local_users.keys())
+            self._local_groups = set(local_groups.keys())
+            self.stamp = stamp
+            self.loaded = time.time()
+
+    def _background_load(self):
+        try:
+            self._load()
+        except Exception as e:
+            logger.error('Failed to refresh the users and groups '
+                         'directory: %s' % e.__str__())
+        finally:
+            self.refreshing = False
+
+    def _refresh(self):
+        if (self._users is None):
+            return self._load()
+        stamp = self._stamp()
+        if (stamp is None or stamp != self.stamp):
+            local_users, local_groups = self._read_local()
+            # replace rather than update the dicts, callers may be
+            # iterating over them.
+            with self.lock:
+                users = dict(self._users)
+                for u in self._local_users - set(local_users.keys()):
+                    users.pop(u, None)
+                users.update(local_users)
+                groups = dict(self._groups)
+                for g in self._local_groups - set(local_groups.keys()):
+                    groups.pop(g, None)
+                groups.update(local_groups)
+                self._users, self._groups = users, groups
+                self._local_users = set(local_users.keys())
+                self._local_groups = set(local_groups.keys())
+                self.stamp = stamp
+        if (time.time() - self.loaded > self._ttl() and
+                not self.refreshing):
+            self.refreshing = True
+            t = threading.Thread(target=self._background_load)
+            t.daemon = True
+            t.start()
+
+    def users(self):
+        """
+        :return: dict of username: (uid, gid, shell)
+        """
+        self._refresh()
+        return self._users
+
+    def groups(self):
+        """
+        :return: dict of groupname: gid
+        """
+        self._refresh()
+        return self._groups
+
+    def invalidate(self):
+        """
+        Re-read the local users and groups on the next lookup, even if
+        /etc/passwd and /etc/group were changed within their mtime's
+        granularity.
+        """
+        self.stamp = None
+
+
+directory = DirectoryCache()
+
+
 def userdel(uname):
     try:
         pwd.getpwnam(uname)
@@ -107,7 +236,10 @@ def userdel(uname):
     # Ensure user get deleted from samba pass db
     run_command([SMBPASSWD, '-x', uname])
 
-    return run_command([USERDEL, '-r', uname])
+    try:
+        return run_command([USERDEL, '-r', uname])
+    finally:
+        directory.invalidate()
 
 
 def groupdel(groupname):
@@ -116,6 +248,8 @@ def groupdel(groupname):
     except CommandException as e:
         if (e.rc != 6):
             raise e
+    finally:
+        directory.invalidate()
 
 
 def get_epasswd(username):
@@ -151,7 +285,10 @@ def smbpasswd(username, passwd):
 
 
 def update_shell(username, shell):
-    return run_command([USERMOD, '-s', shell, username])
+    try:
+        return run_command([USERMOD, '-s', shell, username])
+    finally:
+        directory.invalidate()
 
 
 def useradd(username, shell, uid=None, gid=None):
@@ -184,7 +321,10 @@ def useradd(username, shell, uid=None, gid=None):
     if (gid is not None):
         cmd.insert(-1, '-g')
         cmd.insert(-1, str(gid))
-    return run_command(cmd)
+    try:
+        return run_command(cmd)
+    finally:
+        directory.invalidate()
 
 
 def groupadd(groupname, gid=None):
@@ -192,7 +332,10 @@ def groupadd(groupname, gid=None):
     if (gid is not None):
         cmd.insert(-1, '-g')
         cmd.insert(-1, gid)
-    return run_command(cmd)
+    try:
+        return run_command(cmd)
+    finally:
+        directory.invalidate()
 
 
 def add_ssh_key(username, key, old_key=None):